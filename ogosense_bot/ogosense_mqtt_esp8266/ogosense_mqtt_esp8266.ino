@@ -386,6 +386,11 @@ void processCommand(StaticJsonDocument<1024>& doc) {
   response["command"] = command;
   response["success"] = true;
   
+  // ส่ง request_id กลับไปเพื่อให้ bridge จับคู่คำตอบกับคำสั่งได้ถูกต้อง
+  if (doc.containsKey("request_id")) {
+    response["request_id"] = doc["request_id"].as<String>();
+  }
+  
   // Process different commands
   if (command == "status") {
     // Read sensor data
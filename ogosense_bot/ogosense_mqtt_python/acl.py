@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""ACL module สำหรับกำหนดสิทธิ์ของแต่ละแชทต่ออุปกรณ์และกลุ่มอุปกรณ์"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# บทบาทของผู้ใช้ (เรียงจากสิทธิ์น้อยไปมาก)
+ROLE_VIEWER = "viewer"      # ดูสถานะได้อย่างเดียว
+ROLE_OPERATOR = "operator"  # ควบคุมอุปกรณ์ได้
+ROLE_ADMIN = "admin"        # จัดการสิทธิ์และ Chat IDs ได้
+ROLE_RANKS = {ROLE_VIEWER: 1, ROLE_OPERATOR: 2, ROLE_ADMIN: 3}
+
+# บทบาทขั้นต่ำที่ต้องมีสำหรับแต่ละคำสั่ง
+COMMAND_ROLES = {
+    "status": ROLE_VIEWER,
+    "info": ROLE_VIEWER,
+    "history": ROLE_VIEWER,
+    "chart": ROLE_VIEWER,
+    "subscribe": ROLE_VIEWER,
+    "alerts": ROLE_VIEWER,
+    "alert": ROLE_OPERATOR,
+    "delalert": ROLE_OPERATOR,
+    "settemp": ROLE_OPERATOR,
+    "sethum": ROLE_OPERATOR,
+    "setmode": ROLE_OPERATOR,
+    "setoption": ROLE_OPERATOR,
+    "relay": ROLE_OPERATOR,
+    "setname": ROLE_OPERATOR,
+    "setchannel": ROLE_OPERATOR,
+    "setwritekey": ROLE_OPERATOR,
+    "setreadkey": ROLE_OPERATOR,
+    "addchatid": ROLE_ADMIN,
+    "removechatid": ROLE_ADMIN,
+    "updatechatid": ROLE_ADMIN,
+    "listchatids": ROLE_ADMIN,
+    "grant": ROLE_ADMIN,
+    "revoke": ROLE_ADMIN,
+    "acl": ROLE_ADMIN,
+    "setgroup": ROLE_ADMIN,
+    "delgroup": ROLE_ADMIN,
+    "groups": ROLE_VIEWER,
+    "profile": ROLE_ADMIN,
+}
+# คำสั่งที่ไม่ได้ระบุไว้ต้องมีสิทธิ์ควบคุม
+DEFAULT_COMMAND_ROLE = ROLE_OPERATOR
+
+# target ของสิทธิ์: Device ID, "@ชื่อกลุ่ม" หรือ "*" (ทุกอุปกรณ์)
+WILDCARD = "*"
+GROUP_PREFIX = "@"
+
+
+class AccessControl:
+    """จัดการสิทธิ์ของแชทต่ออุปกรณ์
+
+    สิทธิ์ถูกกำหนดเป็น (chat_id, target) -> role โดย target เป็น Device ID, กลุ่มอุปกรณ์ หรือ *
+    ทุกครั้งที่สิทธิ์หรือกลุ่มเปลี่ยน จะคำนวณ index (chat_id, device_id) -> rank ใหม่เฉพาะแชทที่เกี่ยวข้อง
+    ทำให้การตรวจสิทธิ์ (chat_id, device_id, command) เป็น O(1)
+
+    รายการ Chat IDs เดิมใน Storage (/addchatid) ยังใช้ได้ โดยถือว่าเป็น admin ของทุกอุปกรณ์
+    """
+
+    def __init__(self, storage: Storage):
+        """
+        Args:
+            storage: อ็อบเจกต์สำหรับจัดการ Chat IDs และบันทึกข้อมูลสิทธิ์
+        """
+        self.storage = storage
+
+        # ข้อมูลหลัก (บันทึกลงดิสก์)
+        self._grants: Dict[str, Dict[str, str]] = {}
+        self._groups: Dict[str, Set[str]] = {}
+
+        # index สำหรับตรวจสิทธิ์
+        self._effective: Dict[Tuple[str, str], int] = {}
+        self._wildcard: Dict[str, int] = {}
+        self._chat_keys: Dict[str, List[Tuple[str, str]]] = {}
+        self._group_chats: Dict[str, Set[str]] = {}
+
+        self.load()
+
+    def load(self):
+        """โหลดข้อมูลสิทธิ์จาก Storage และสร้าง index ใหม่ทั้งหมด"""
+        data = self.storage.get_document("acl") or {}
+        self._grants = {chat_id: dict(targets) for chat_id, targets in data.get("grants", {}).items()}
+        self._groups = {name: set(devices) for name, devices in data.get("groups", {}).items()}
+
+        self._effective.clear()
+        self._wildcard.clear()
+        self._chat_keys.clear()
+        self._group_chats.clear()
+        for chat_id in self._grants:
+            self._index_chat(chat_id)
+
+        logger.info(f"โหลดสิทธิ์ของ {len(self._grants)} แชท และ {len(self._groups)} กลุ่มอุปกรณ์")
+
+    def _save(self):
+        self.storage.put_document("acl", {
+            "grants": {chat_id: dict(targets) for chat_id, targets in self._grants.items()},
+            "groups": {name: sorted(devices) for name, devices in self._groups.items()},
+        })
+
+    def _unindex_chat(self, chat_id: str):
+        for key in self._chat_keys.pop(chat_id, ()):
+            self._effective.pop(key, None)
+        self._wildcard.pop(chat_id, None)
+        for chats in self._group_chats.values():
+            chats.discard(chat_id)
+
+    def _index_chat(self, chat_id: str):
+        """คำนวณ index ของแชทหนึ่งแชทใหม่จากสิทธิ์ที่กำหนดไว้"""
+        self._unindex_chat(chat_id)
+        keys = []
+
+        for target, role in self._grants.get(chat_id, {}).items():
+            rank = ROLE_RANKS[role]
+            if target == WILDCARD:
+                self._wildcard[chat_id] = max(rank, self._wildcard.get(chat_id, 0))
+                continue
+
+            if target.startswith(GROUP_PREFIX):
+                name = target[len(GROUP_PREFIX):]
+                self._group_chats.setdefault(name, set()).add(chat_id)
+                devices = self._groups.get(name, ())
+            else:
+                devices = (target,)
+
+            for device_id in devices:
+                key = (chat_id, device_id)
+                if rank > self._effective.get(key, 0):
+                    if key not in self._effective:
+                        keys.append(key)
+                    self._effective[key] = rank
+
+        if keys:
+            self._chat_keys[chat_id] = keys
+
+    @staticmethod
+    def required_role(command: str) -> str:
+        """บทบาทขั้นต่ำที่ต้องมีสำหรับคำสั่ง"""
+        return COMMAND_ROLES.get(command, DEFAULT_COMMAND_ROLE)
+
+    def authorize(self, chat_id: str, device_id: Optional[str], command: str) -> bool:
+        """ตรวจสอบว่าแชทมีสิทธิ์ใช้คำสั่งกับอุปกรณ์หรือไม่
+
+        Args:
+            chat_id: Chat ID ที่ต้องการตรวจสอบ
+            device_id: Device ID ของอุปกรณ์ (None สำหรับคำสั่งที่ไม่ผูกกับอุปกรณ์)
+            command: ชื่อคำสั่ง
+
+        Returns:
+            bool: True ถ้าได้รับอนุญาต
+        """
+        if self.storage.is_authorized(chat_id):
+            return True
+
+        need = ROLE_RANKS[COMMAND_ROLES.get(command, DEFAULT_COMMAND_ROLE)]
+        rank = self._wildcard.get(chat_id, 0)
+        if rank >= need:
+            return True
+        if device_id is None:
+            return False
+        return self._effective.get((chat_id, device_id), 0) >= need
+
+    def has_access(self, chat_id: str) -> bool:
+        """ตรวจสอบว่าแชทมีสิทธิ์ใดๆ ในระบบหรือไม่ (ใช้สำหรับคำสั่งทั่วไป เช่น /start, /help)"""
+        return self.storage.is_authorized(chat_id) or chat_id in self._grants
+
+    def grant(self, chat_id: str, target: str, role: str) -> bool:
+        """กำหนดสิทธิ์ให้แชท
+
+        Args:
+            chat_id: Chat ID ที่จะได้รับสิทธิ์
+            target: Device ID, "@ชื่อกลุ่ม" หรือ "*"
+            role: viewer, operator หรือ admin
+
+        Returns:
+            bool: True ถ้ากำหนดสำเร็จ, False ถ้า role ไม่ถูกต้อง
+        """
+        if role not in ROLE_RANKS:
+            return False
+        self._grants.setdefault(chat_id, {})[target] = role
+        self._index_chat(chat_id)
+        self._save()
+        logger.info(f"กำหนดสิทธิ์ {role} ให้ chat ID {chat_id} สำหรับ {target}")
+        return True
+
+    def revoke(self, chat_id: str, target: str) -> bool:
+        """ยกเลิกสิทธิ์ของแชทต่อ target
+
+        Returns:
+            bool: True ถ้ายกเลิกสำเร็จ, False ถ้าไม่มีสิทธิ์นี้อยู่
+        """
+        targets = self._grants.get(chat_id)
+        if not targets or target not in targets:
+            return False
+        del targets[target]
+        if not targets:
+            del self._grants[chat_id]
+        self._index_chat(chat_id)
+        self._save()
+        logger.info(f"ยกเลิกสิทธิ์ของ chat ID {chat_id} สำหรับ {target}")
+        return True
+
+    def get_grants(self, chat_id: str) -> Dict[str, str]:
+        """ดึงสิทธิ์ทั้งหมดของแชท
+
+        Returns:
+            Dict[str, str]: target -> role
+        """
+        return dict(self._grants.get(chat_id, {}))
+
+    def get_all_grants(self) -> Dict[str, Dict[str, str]]:
+        """ดึงสิทธิ์ทั้งหมดของทุกแชท"""
+        return {chat_id: dict(targets) for chat_id, targets in self._grants.items()}
+
+    def set_group(self, name: str, devices: Iterable[str]):
+        """กำหนดรายการอุปกรณ์ของกลุ่ม (สร้างใหม่หรือแทนที่ของเดิม)
+
+        Args:
+            name: ชื่อกลุ่ม
+            devices: รายการ Device ID
+        """
+        self._groups[name] = set(devices)
+        for chat_id in list(self._group_chats.get(name, ())):
+            self._index_chat(chat_id)
+        self._save()
+        logger.info(f"กำหนดกลุ่มอุปกรณ์ {name}: {len(self._groups[name])} อุปกรณ์")
+
+    def delete_group(self, name: str) -> bool:
+        """ลบกลุ่มอุปกรณ์ (สิทธิ์ที่อ้างถึงกลุ่มนี้จะไม่มีผลจนกว่าจะสร้างกลุ่มใหม่)
+
+        Returns:
+            bool: True ถ้าลบสำเร็จ, False ถ้าไม่มีกลุ่มนี้
+        """
+        if name not in self._groups:
+            return False
+        del self._groups[name]
+        for chat_id in list(self._group_chats.get(name, ())):
+            self._index_chat(chat_id)
+        self._save()
+        return True
+
+    def get_group(self, name: str) -> Optional[List[str]]:
+        """ดึงรายการอุปกรณ์ในกลุ่ม
+
+        Returns:
+            Optional[List[str]]: รายการ Device ID เรียงตามลำดับ หรือ None ถ้าไม่มีกลุ่มนี้
+        """
+        devices = self._groups.get(name)
+        if devices is None:
+            return None
+        return sorted(devices, key=lambda d: (len(d), d))
+
+    def get_groups(self) -> Dict[str, int]:
+        """ดึงชื่อกลุ่มทั้งหมดพร้อมจำนวนอุปกรณ์"""
+        return {name: len(devices) for name, devices in self._groups.items()}
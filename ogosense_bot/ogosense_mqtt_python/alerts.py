@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""Alerts module สำหรับแจ้งเตือนเมื่อค่าที่อ่านได้จากอุปกรณ์ผิดปกติ
+
+กฎถูกเก็บเป็น index device_id -> รายการกฎของอุปกรณ์นั้น ทุกคำตอบ status/relay ที่เข้ามาจะตรวจเฉพาะกฎ
+ของอุปกรณ์ที่ตอบ (ไม่ต้องไล่ดูกฎทั้งหมด) และกฎแต่ละข้อเก็บสถานะของตัวเองไว้ (incremental)
+
+ชนิดของกฎ:
+- above / below: ค่าสูงกว่า / ต่ำกว่าเกณฑ์ กลับสู่ปกติเมื่อค่าพ้นเกณฑ์เกินระยะ hysteresis
+- rate: ค่าเปลี่ยนเร็วกว่าเกณฑ์ (หน่วยต่อนาที เทียบกับค่าก่อนหน้า)
+- missing: อุปกรณ์ออฟไลน์ (ข้อความ LWT ของ broker) นานกว่าเกณฑ์ ตรวจตอน housekeeping และกลับสู่ปกติเมื่อออนไลน์
+  (เฟิร์มแวร์ตอบเฉพาะเมื่อได้รับคำสั่ง ช่วงที่ไม่มีใครสั่งงานจึงไม่ได้แปลว่าข้อมูลหายไป)
+
+กฎที่ยังเกินเกณฑ์อยู่จะไม่แจ้งซ้ำจนกว่าจะพ้นช่วง cooldown ของกฎนั้น
+"""
+
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from storage import Storage
+from timeseries import RECORDED_COMMANDS
+
+logger = logging.getLogger(__name__)
+
+KIND_ABOVE = "above"
+KIND_BELOW = "below"
+KIND_RATE = "rate"
+KIND_MISSING = "missing"
+KINDS = (KIND_ABOVE, KIND_BELOW, KIND_RATE, KIND_MISSING)
+
+# ชื่อค่าที่ตั้งกฎได้ -> (ชื่อที่แสดง, หน่วย, hysteresis เริ่มต้นของ above/below)
+METRICS = {
+    "temperature": ("อุณหภูมิ", "°C", 0.5),
+    "humidity": ("ความชื้น", "%", 2.0),
+}
+
+
+def format_duration(seconds: float) -> str:
+    """แปลงจำนวนวินาทีเป็นข้อความ เช่น 45 วินาที, 15 นาที, 2 ชั่วโมง"""
+    if seconds < 60:
+        return f"{seconds:.0f} วินาที"
+    if seconds < 3600 or seconds % 3600:
+        return f"{seconds / 60:.0f} นาที"
+    return f"{seconds / 3600:.0f} ชั่วโมง"
+
+
+class AlertRule:
+    """กฎแจ้งเตือนหนึ่งข้อ พร้อมสถานะของการตรวจ"""
+
+    __slots__ = ("rule_id", "device_id", "chat_id", "kind", "metric", "threshold", "hysteresis", "cooldown",
+                 "active", "notified", "last_fired", "last_value", "last_time")
+
+    def __init__(self, rule_id: int, device_id: str, chat_id: str, kind: str, metric: Optional[str],
+                 threshold: float, hysteresis: float, cooldown: float):
+        self.rule_id = rule_id
+        self.device_id = device_id
+        self.chat_id = chat_id
+        self.kind = kind
+        # metric เป็น None สำหรับกฎ missing, threshold ของกฎ missing คือจำนวนวินาที
+        self.metric = metric
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+
+        # สถานะ (ไม่บันทึกลงดิสก์ เวลาเป็น time.monotonic())
+        self.active = False
+        self.notified = False
+        self.last_fired: Optional[float] = None
+        self.last_value: Optional[float] = None
+        self.last_time: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rule_id": self.rule_id,
+            "device_id": self.device_id,
+            "chat_id": self.chat_id,
+            "kind": self.kind,
+            "metric": self.metric,
+            "threshold": self.threshold,
+            "hysteresis": self.hysteresis,
+            "cooldown": self.cooldown,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AlertRule":
+        kind = data["kind"]
+        if kind not in KINDS:
+            raise ValueError(f"ชนิดกฎไม่ถูกต้อง: {kind}")
+        return cls(int(data["rule_id"]), str(data["device_id"]), str(data["chat_id"]), kind, data.get("metric"),
+                   float(data["threshold"]), float(data["hysteresis"]), float(data["cooldown"]))
+
+    def describe(self) -> str:
+        """ข้อความอธิบายกฎสำหรับ /alerts"""
+        if self.kind == KIND_MISSING:
+            condition = f"ออฟไลน์นานกว่า {format_duration(self.threshold)}"
+        else:
+            label, unit, _ = METRICS[self.metric]
+            if self.kind == KIND_RATE:
+                condition = f"{label} เปลี่ยนเร็วกว่า {self.threshold:g} {unit}/นาที"
+            else:
+                sign = ">" if self.kind == KIND_ABOVE else "<"
+                condition = f"{label} {sign} {self.threshold:g} {unit} (hysteresis {self.hysteresis:g})"
+        state = " [กำลังแจ้งเตือน]" if self.active else ""
+        return f"#{self.rule_id} อุปกรณ์ {self.device_id}: {condition}, cooldown {format_duration(self.cooldown)}{state}"
+
+
+class AlertEngine:
+    """ตรวจกฎแจ้งเตือนของอุปกรณ์ทุกครั้งที่ได้รับค่าใหม่ (ทำงานบน event loop เท่านั้น)"""
+
+    def __init__(self, storage: Optional[Storage] = None, notify: Callable[[str, str], None] = None,
+                 default_cooldown: float = 600.0, max_rules_per_device: int = 20):
+        """
+        Args:
+            storage: ที่บันทึกกฎลงดิสก์ (None คือเก็บในหน่วยความจำเท่านั้น)
+            notify: ฟังก์ชันส่งข้อความแจ้งเตือนไปยังแชท (chat_id, ข้อความ)
+            default_cooldown: เวลา (วินาที) ขั้นต่ำระหว่างการแจ้งเตือนของกฎเดียวกัน เมื่อไม่ได้ระบุ
+            max_rules_per_device: จำนวนกฎสูงสุดต่ออุปกรณ์
+        """
+        self.storage = storage
+        self.notify = notify
+        self.default_cooldown = default_cooldown
+        self.max_rules_per_device = max_rules_per_device
+        self._rules: Dict[int, AlertRule] = {}
+        self._by_device: Dict[str, List[AlertRule]] = {}
+        # กฎ missing แยกไว้ต่างหาก เพราะตรวจตามเวลา ไม่ใช่ตามค่าที่เข้ามา
+        self._missing: Dict[int, AlertRule] = {}
+        # เวลาที่อุปกรณ์เริ่มออฟไลน์ (ตามข้อความ LWT) เก็บทุกอุปกรณ์ เพื่อให้กฎที่เพิ่มภายหลังใช้ได้ทันที
+        self._offline_since: Dict[str, float] = {}
+        self._next_id = 1
+
+        # สถิติ
+        self.evaluated = 0
+        self.fired = 0
+        self.suppressed = 0
+        self.recovered = 0
+
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def load(self):
+        """โหลดกฎจาก Storage และสร้าง index ใหม่"""
+        if self.storage is None:
+            return
+        data = self.storage.get_document("alerts") or {}
+        previous = dict(self._rules)
+        self._rules.clear()
+        self._by_device.clear()
+        self._missing.clear()
+        for item in data.get("rules", []):
+            try:
+                rule = AlertRule.from_dict(item)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"ข้ามกฎแจ้งเตือนที่ไม่ถูกต้อง: {e}")
+                continue
+            # โหลดซ้ำ (เช่น node อื่นใน cluster แก้ไขกฎ): กฎที่ไม่เปลี่ยนคงสถานะเดิมไว้
+            old = previous.get(rule.rule_id)
+            if old is not None and old.to_dict() == rule.to_dict():
+                rule = old
+            self._index(rule)
+        self._next_id = max(int(data.get("next_id", 1)), max(self._rules, default=0) + 1)
+        if self._rules:
+            logger.info(f"โหลดกฎแจ้งเตือน {len(self._rules)} ข้อ ({len(self._by_device)} อุปกรณ์)")
+
+    def _save(self):
+        if self.storage is not None:
+            self.storage.put_document("alerts", {
+                "next_id": self._next_id,
+                "rules": [rule.to_dict() for rule in self._rules.values()],
+            })
+
+    def _index(self, rule: AlertRule):
+        self._rules[rule.rule_id] = rule
+        self._by_device.setdefault(rule.device_id, []).append(rule)
+        if rule.kind == KIND_MISSING:
+            self._missing[rule.rule_id] = rule
+
+    def has_rules(self, device_id: str) -> bool:
+        """ตรวจสอบว่าอุปกรณ์มีกฎแจ้งเตือนหรือไม่"""
+        return device_id in self._by_device
+
+    def is_full(self, device_id: str) -> bool:
+        """ตรวจสอบว่าอุปกรณ์มีกฎครบจำนวนสูงสุดแล้วหรือไม่"""
+        return len(self._by_device.get(device_id, ())) >= self.max_rules_per_device
+
+    def add_rule(self, device_id: str, chat_id: str, kind: str, threshold: float, metric: Optional[str] = None,
+                 hysteresis: Optional[float] = None, cooldown: Optional[float] = None) -> AlertRule:
+        """เพิ่มกฎแจ้งเตือน (ตรวจสอบ is_full() ก่อนเรียก)
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            chat_id: Chat ID ที่รับการแจ้งเตือน
+            kind: above, below, rate หรือ missing
+            threshold: เกณฑ์ (หน่วยของค่า, หน่วยต่อนาทีสำหรับ rate, วินาทีสำหรับ missing)
+            metric: ชื่อค่าใน METRICS (ไม่ใช้กับ missing)
+            hysteresis: ระยะที่ค่าต้องพ้นเกณฑ์ก่อนถือว่ากลับสู่ปกติ (None คือค่าเริ่มต้นของ metric)
+            cooldown: เวลา (วินาที) ขั้นต่ำระหว่างการแจ้งเตือน (None คือ default_cooldown)
+
+        Returns:
+            AlertRule: กฎที่เพิ่ม
+        """
+        if kind not in KINDS:
+            raise ValueError(f"ชนิดกฎไม่ถูกต้อง: {kind}")
+        if kind == KIND_MISSING:
+            metric = None
+        elif metric not in METRICS:
+            raise ValueError(f"ไม่รองรับค่า {metric}")
+        if hysteresis is None:
+            hysteresis = METRICS[metric][2] if kind in (KIND_ABOVE, KIND_BELOW) else 0.0
+
+        rule = AlertRule(self._next_id, device_id, chat_id, kind, metric, float(threshold), float(hysteresis),
+                         self.default_cooldown if cooldown is None else float(cooldown))
+        self._next_id += 1
+        self._index(rule)
+        self._save()
+        logger.info(f"Chat ID {chat_id} เพิ่มกฎแจ้งเตือน {rule.describe()}")
+        return rule
+
+    def remove_rule(self, rule_id: int) -> Optional[AlertRule]:
+        """ลบกฎแจ้งเตือน
+
+        Returns:
+            Optional[AlertRule]: กฎที่ถูกลบ หรือ None ถ้าไม่มีกฎนี้
+        """
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return None
+
+        rules = self._by_device[rule.device_id]
+        rules.remove(rule)
+        if not rules:
+            del self._by_device[rule.device_id]
+        self._missing.pop(rule_id, None)
+        self._save()
+        logger.info(f"ลบกฎแจ้งเตือน #{rule_id} ของอุปกรณ์ {rule.device_id}")
+        return rule
+
+    def get_rule(self, rule_id: int) -> Optional[AlertRule]:
+        """ดึงกฎแจ้งเตือนตามหมายเลข"""
+        return self._rules.get(rule_id)
+
+    def rules(self, device_id: Optional[str] = None, chat_id: Optional[str] = None) -> List[AlertRule]:
+        """ดึงกฎแจ้งเตือน เรียงตามหมายเลขกฎ
+
+        Args:
+            device_id: เฉพาะกฎของอุปกรณ์นี้ (None คือทุกอุปกรณ์)
+            chat_id: เฉพาะกฎที่แจ้งเตือนแชทนี้ (None คือทุกแชท)
+        """
+        rules = self._by_device.get(device_id, ()) if device_id is not None else self._rules.values()
+        return sorted((rule for rule in rules if chat_id is None or rule.chat_id == chat_id),
+                      key=lambda rule: rule.rule_id)
+
+    def record(self, device_id: str, command: str, data: Dict, now: Optional[float] = None) -> int:
+        """ตรวจกฎจากคำตอบ MQTT ของอุปกรณ์ (คำตอบเดียวกับที่ TelemetryStore บันทึก)
+
+        Returns:
+            int: จำนวนการแจ้งเตือนที่ส่ง
+        """
+        if device_id not in self._by_device:
+            return 0
+        if command not in RECORDED_COMMANDS or not data.get("success", False):
+            return 0
+        values = data.get("data")
+        if not isinstance(values, dict):
+            return 0
+        return self.evaluate(device_id, values, now)
+
+    def evaluate(self, device_id: str, values: Dict, now: Optional[float] = None) -> int:
+        """ตรวจกฎของอุปกรณ์กับค่าชุดใหม่
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            values: ชื่อค่า -> ค่า (ค่าที่ไม่มีหรือไม่ใช่ตัวเลขจะถูกข้าม)
+            now: เวลาของค่า (time.monotonic() ค่าเริ่มต้นคือเวลาปัจจุบัน)
+
+        Returns:
+            int: จำนวนการแจ้งเตือนที่ส่ง
+        """
+        rules = self._by_device.get(device_id)
+        if not rules:
+            return 0
+        now = time.monotonic() if now is None else now
+        sent = 0
+
+        for rule in rules:
+            if rule.kind == KIND_MISSING:
+                continue
+            value = values.get(rule.metric)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            self.evaluated += 1
+            label, unit, _ = METRICS[rule.metric]
+
+            if rule.kind == KIND_RATE:
+                previous, previous_time = rule.last_value, rule.last_time
+                rule.last_value, rule.last_time = value, now
+                if previous is None or now <= previous_time:
+                    continue
+                rate = abs(value - previous) * 60 / (now - previous_time)
+                trigger = rate > rule.threshold
+                clear = rate <= rule.threshold - rule.hysteresis
+                detail = f"{label} เปลี่ยนเร็ว {rate:.2f} {unit}/นาที (เกณฑ์ {rule.threshold:g})"
+            elif rule.kind == KIND_ABOVE:
+                trigger = value > rule.threshold
+                clear = value <= rule.threshold - rule.hysteresis
+                detail = f"{label} {value:.2f} {unit} สูงกว่า {rule.threshold:g} {unit}"
+            else:
+                trigger = value < rule.threshold
+                clear = value >= rule.threshold + rule.hysteresis
+                detail = f"{label} {value:.2f} {unit} ต่ำกว่า {rule.threshold:g} {unit}"
+
+            sent += self._transition(rule, trigger, clear, now, detail,
+                                     f"{label} {value:.2f} {unit}")
+
+        return sent
+
+    def set_online(self, device_id: str, online: bool, now: Optional[float] = None):
+        """บันทึกสถานะ online/offline ของอุปกรณ์จากข้อความ LWT (ใช้กับกฎ missing ตอน check_missing)
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            online: True ถ้าอุปกรณ์ออนไลน์
+            now: เวลาที่ได้รับสถานะ (time.monotonic() ค่าเริ่มต้นคือเวลาปัจจุบัน)
+        """
+        if online:
+            self._offline_since.pop(device_id, None)
+        elif device_id not in self._offline_since:
+            self._offline_since[device_id] = time.monotonic() if now is None else now
+
+    def check_missing(self, now: Optional[float] = None, device_id: Optional[str] = None) -> int:
+        """ตรวจกฎ missing (เรียกเป็นระยะจาก housekeeping และเมื่อสถานะ online/offline เปลี่ยน)
+
+        Args:
+            now: เวลาที่ตรวจ (time.monotonic() ค่าเริ่มต้นคือเวลาปัจจุบัน)
+            device_id: ตรวจเฉพาะกฎของอุปกรณ์นี้ (None คือทุกอุปกรณ์)
+
+        Returns:
+            int: จำนวนการแจ้งเตือนที่ส่ง
+        """
+        if not self._missing:
+            return 0
+        now = time.monotonic() if now is None else now
+        if device_id is None:
+            rules = list(self._missing.values())
+        else:
+            rules = [rule for rule in self._by_device.get(device_id, ()) if rule.kind == KIND_MISSING]
+        sent = 0
+        for rule in rules:
+            since = self._offline_since.get(rule.device_id)
+            if since is None:
+                sent += self._transition(rule, False, True, now, "", "กลับมาออนไลน์แล้ว")
+            elif now - since > rule.threshold:
+                sent += self._transition(rule, True, False, now, f"ออฟไลน์นาน {format_duration(now - since)}", "")
+        return sent
+
+    def _transition(self, rule: AlertRule, trigger: bool, clear: bool, now: float, detail: str, recovery: str) -> int:
+        """เปลี่ยนสถานะของกฎ และแจ้งเตือนเมื่อเริ่มเกินเกณฑ์ (หรือยังเกินเกณฑ์หลังพ้น cooldown)
+
+        ค่าที่อยู่ระหว่างเกณฑ์กับระยะ hysteresis ไม่เปลี่ยนสถานะ จึงไม่แจ้งเตือนซ้ำเมื่อค่าแกว่งรอบเกณฑ์
+        """
+        if trigger:
+            rule.active = True
+            if rule.last_fired is not None and now - rule.last_fired < rule.cooldown:
+                if not rule.notified:
+                    self.suppressed += 1
+                return 0
+            prefix = "ยังคงแจ้งเตือน" if rule.notified else "แจ้งเตือน"
+            rule.last_fired = now
+            rule.notified = True
+            self.fired += 1
+            self._announce(rule, f"{prefix} #{rule.rule_id} อุปกรณ์ {rule.device_id}: {detail}")
+            return 1
+
+        if rule.active and clear:
+            rule.active = False
+            if rule.notified:
+                rule.notified = False
+                self.recovered += 1
+                self._announce(rule, f"กลับสู่ปกติ #{rule.rule_id} อุปกรณ์ {rule.device_id}: {recovery}")
+                return 1
+        return 0
+
+    def _announce(self, rule: AlertRule, text: str):
+        logger.info(text)
+        if self.notify is None:
+            return
+        try:
+            self.notify(rule.chat_id, text)
+        except Exception as e:
+            logger.error(f"ไม่สามารถส่งการแจ้งเตือนไปยังแชท {rule.chat_id}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """ดึงสถิติของการแจ้งเตือน"""
+        return {
+            "rules": len(self._rules),
+            "devices": len(self._by_device),
+            "active": sum(1 for rule in self._rules.values() if rule.active),
+            "evaluated": self.evaluated,
+            "fired": self.fired,
+            "suppressed": self.suppressed,
+            "recovered": self.recovered,
+        }
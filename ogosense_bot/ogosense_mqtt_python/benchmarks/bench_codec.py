@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""เปรียบเทียบเวลา parse และ serialize payload ของ ogosense ระหว่าง codec ต่างๆ
+
+วัดทั้งเส้นทางเดิม (decode เป็น str แล้ว json.loads / json.dumps แล้ว encode)
+และ codec ที่ทำงานกับ bytes โดยตรง (json ของ standard library และ orjson ถ้าติดตั้งไว้)
+
+ตัวอย่าง:
+    python benchmarks/bench_codec.py --number 200000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codec import CODECS, get_codec  # noqa: E402
+
+# payload จริงจากเฟิร์มแวร์ ESP8266 (ตอบ status และ info)
+STATUS_RESPONSE = json.dumps({
+    "device_id": "59322",
+    "command": "status",
+    "success": True,
+    "request_id": "9f2c41a0-1a2b",
+    "data": {
+        "temperature": 27.85,
+        "humidity": 63.2,
+        "relay": True,
+        "mode": "auto",
+        "name": "โรงเรือน 1",
+        "option": 2,
+    },
+}, ensure_ascii=False).encode("utf-8")
+
+INFO_RESPONSE = json.dumps({
+    "device_id": "59322",
+    "command": "info",
+    "success": True,
+    "request_id": "9f2c41a0-1a2c",
+    "data": {
+        "name": "โรงเรือน 1",
+        "device_id": "59322",
+        "temp_low": 25.0,
+        "temp_high": 30.0,
+        "humidity_low": 50.0,
+        "humidity_high": 70.0,
+        "mode": "auto",
+        "option": 2,
+        "cool": True,
+        "moisture": False,
+        "thingspeak_channel": 2236742,
+        "write_api_key": "ABCDEFGHIJKLMNOP",
+    },
+}, ensure_ascii=False).encode("utf-8")
+
+# คำสั่งที่บอทส่งไปยังอุปกรณ์
+COMMAND = {
+    "command": "settemp",
+    "device_id": "59322",
+    "request_id": "9f2c41a0-1a2d",
+    "timestamp": 1760000000,
+    "low": 25.0,
+    "high": 30.0,
+}
+
+
+def bench(func, arg, number: int) -> float:
+    """คืนเวลาเฉลี่ยต่อครั้ง (ไมโครวินาที) ที่ดีที่สุดจาก 3 รอบ"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            func(arg)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="เปรียบเทียบ JSON codec")
+    parser.add_argument("--number", type=int, default=100000, help="จำนวนครั้งต่อรอบ")
+    args = parser.parse_args()
+
+    # เส้นทางเดิม: bytes -> str -> json.loads และ json.dumps -> str -> bytes
+    candidates = [("legacy (decode+json.loads / json.dumps+encode)",
+                   lambda data: json.loads(data.decode("utf-8")),
+                   lambda obj: json.dumps(obj).encode("utf-8"))]
+    for name in CODECS:
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            print(f"ข้าม codec {name}: ไม่ได้ติดตั้ง")
+            continue
+        candidates.append((name, codec.loads, codec.dumps))
+
+    print(f"payload: status {len(STATUS_RESPONSE)} bytes, info {len(INFO_RESPONSE)} bytes")
+    print(f"{'codec':<48} {'parse status':>13} {'parse info':>11} {'serialize cmd':>14}  (µs)")
+    for name, loads, dumps in candidates:
+        assert loads(STATUS_RESPONSE)["data"]["name"] == "โรงเรือน 1"
+        print(f"{name:<48} {bench(loads, STATUS_RESPONSE, args.number):>13.2f} "
+              f"{bench(loads, INFO_RESPONSE, args.number):>11.2f} "
+              f"{bench(dumps, COMMAND, args.number):>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
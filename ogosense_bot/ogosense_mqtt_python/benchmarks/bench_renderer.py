@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""วัดเวลาที่ใช้สร้างข้อความตอบกลับหนึ่งข้อความด้วย ResponseRenderer
+
+ตัวอย่าง:
+    python benchmarks/bench_renderer.py --devices 1000 --rounds 20
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from renderer import ResponseRenderer  # noqa: E402
+
+
+def make_responses(devices: int, seed: int = 1):
+    """สร้างคำตอบจำลองของอุปกรณ์จำนวนมาก (ส่วนใหญ่เป็น status เหมือนการใช้งานจริง)"""
+    rng = random.Random(seed)
+    responses = []
+    for i in range(devices):
+        device_id = str(1000 + i)
+        responses.append((device_id, "status", {
+            "command": "status",
+            "success": True,
+            "data": {
+                "temperature": rng.uniform(15, 40),
+                "humidity": rng.randint(30, 90),
+                "relay": rng.random() < 0.5,
+                "mode": rng.choice(("auto", "manual")),
+                "name": f"Device {i}",
+                "option": rng.randint(0, 4),
+            },
+        }, True))
+        if i % 10 == 0:
+            responses.append((device_id, "info", {
+                "command": "info",
+                "success": True,
+                "data": {
+                    "name": f"Device {i}", "device_id": device_id,
+                    "temp_low": 25, "temp_high": 30, "humidity_low": 50, "humidity_high": 70,
+                    "mode": "auto", "option": 2, "cool": True, "moisture": False,
+                    "thingspeak_channel": 123456, "write_api_key": "ABCDEFGHIJ",
+                },
+            }, True))
+        if i % 5 == 0:
+            responses.append((device_id, "settemp", {
+                "command": "settemp", "success": True, "data": {"low": 25, "high": 30},
+            }, True))
+        if i % 20 == 0:
+            responses.append((device_id, "relay", {
+                "command": "relay", "success": False, "message": "Device in auto mode",
+            }, False))
+    return responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="วัดเวลาการสร้างข้อความตอบกลับ")
+    parser.add_argument("--devices", type=int, default=1000, help="จำนวนอุปกรณ์จำลอง")
+    parser.add_argument("--rounds", type=int, default=20, help="จำนวนรอบที่วัด")
+    args = parser.parse_args()
+
+    renderer = ResponseRenderer()
+    responses = make_responses(args.devices)
+    render = renderer.render
+
+    # อุ่นเครื่อง (สร้างแคชหัวข้อความของทุกอุปกรณ์)
+    for device_id, command, data, success in responses:
+        render(device_id, command, data, success)
+
+    best = None
+    total_bytes = 0
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        for device_id, command, data, success in responses:
+            render(device_id, command, data, success)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    for device_id, command, data, success in responses:
+        total_bytes += len(render(device_id, command, data, success).encode("utf-8"))
+
+    count = len(responses)
+    print(f"ข้อความต่อรอบ: {count} ({total_bytes / count:.0f} bytes เฉลี่ย)")
+    print(f"เวลาต่อข้อความ: {best / count * 1e6:.2f} µs")
+    print(f"ข้อความต่อวินาที: {count / best:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,642 @@
+#!/usr/bin/env python3
+"""Benchmark แบบ end-to-end ของ MQTTTelegramBridge โดยไม่ต้องใช้ Telegram และ MQTT broker จริง
+
+องค์ประกอบ:
+    - FakeBotAPI: Bot API จำลอง (HTTP server ใน thread แยก) รองรับ getMe, getUpdates, sendMessage,
+      sendPhoto (อัปโหลดไฟล์หรือ file_id) และ setWebhook (ส่ง update ไปยัง webhook ของ bridge ผ่าน HTTP แบบเดียวกับ Telegram)
+    - LoopbackMQTTClient: MQTT client จำลองที่มีเมธอดแบบเดียวกับ AsyncMQTTClient
+      ส่งคำสั่งไปยังอุปกรณ์จำลอง และส่งคำตอบกลับผ่าน network thread ของตัวเองเหมือน paho
+    - DeviceEmulator: อุปกรณ์จำลองที่ตอบคำสั่งในรูปแบบเดียวกับเฟิร์มแวร์ ESP8266
+
+แต่ละแชทจำลองส่งคำสั่งผ่าน getUpdates หรือ webhook (--mode) ไปยัง handler จริงของ TelegramBot
+แล้วรอคำตอบของอุปกรณ์ก่อนส่งคำสั่งถัดไป (closed loop) จำนวนแชทที่ส่งพร้อมกันกำหนดด้วย --concurrency
+
+ผลลัพธ์ (JSON):
+    - command_to_publish_ms: จากผู้ใช้ส่งคำสั่ง (เข้า getUpdates หรือ webhook) จนถึง publish ไปยังอุปกรณ์
+    - reply_to_delivery_ms: จากอุปกรณ์ส่งคำตอบ จนถึง sendMessage ของคำตอบนั้น
+    - round_trip_ms: จากส่งคำสั่งจนได้รับคำตอบใน Telegram
+    - throughput_cmd_s, memory
+
+ตัวอย่าง:
+    python benchmarks/e2e_bridge.py --devices 1000 --concurrency 50 --duration 20 --output result.json
+    python benchmarks/e2e_bridge.py --mode webhook --concurrent-updates 16
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import asyncio
+import logging
+import argparse
+import email
+import tempfile
+import threading
+import resource
+import socket
+import platform
+import tracemalloc
+from typing import Dict, List, Optional
+
+BRIDGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BRIDGE_DIR)
+
+from http_server import HTTPServer, HTTPResponse  # noqa: E402
+
+BOT_TOKEN = "123456:BENCHMARK"
+BOT_USER = {
+    "id": 123456,
+    "is_bot": True,
+    "first_name": "OGOsense Bench",
+    "username": "ogosense_bench_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+REPLY_PREFIX = "การตอบกลับจากอุปกรณ์ "
+
+# รูปแบบคำสั่งที่แชทจำลองส่ง
+COMMAND_TEMPLATES = {
+    "status": "/status {device_id} refresh",
+    "info": "/info {device_id} bench",
+    "settemp": "/settemp {device_id} 25 30",
+    "sethum": "/sethum {device_id} 50 70",
+    "setmode": "/setmode {device_id} auto",
+    "relay": "/relay {device_id} 1",
+}
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """สรุปค่าเวลา (วินาที) เป็นมิลลิวินาที"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pick(p):
+        return round(ordered[min(n - 1, int(p * n))] * 1000, 3)
+
+    return {
+        "count": n,
+        "mean": round(sum(ordered) / n * 1000, 3),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+class FakeBotAPI:
+    """Bot API จำลองที่ทำงานใน thread และ event loop ของตัวเอง"""
+
+    def __init__(self, token: str = BOT_TOKEN, host: str = "127.0.0.1"):
+        self.token = token
+        self.host = host
+        self.port = None
+        self.on_send = None
+        self.sent_messages = 0
+        # sendPhoto: จำนวนครั้งที่อัปโหลดไฟล์ใหม่ และที่ส่งซ้ำด้วย file_id
+        self.photos_uploaded = 0
+        self.photos_reused = 0
+        self._photos: Dict[str, int] = {}
+        self._updates: List[dict] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._new_updates: Optional[asyncio.Event] = None
+        self._server: Optional[HTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        # webhook ที่ลงทะเบียนด้วย setWebhook (None คือใช้ getUpdates)
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._webhook_queue: Optional[asyncio.Queue] = None
+        self._webhook_client = None
+        self._webhook_tasks: List[asyncio.Task] = []
+        self.webhook_deliveries = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._stop_webhook(), self._loop).result(5)
+            asyncio.run_coroutine_threadsafe(self._server.stop(), self._loop).result(5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._new_updates = asyncio.Event()
+        self._server = HTTPServer(self.host, 0)
+        self._server.route(f"/bot{self.token}/", self._handle, methods=("GET", "POST"), prefix=True)
+        self._loop.run_until_complete(self._server.start())
+        self.port = self._server.port
+        self._ready.set()
+        self._loop.run_forever()
+
+    def inject_command(self, chat_id: int, text: str):
+        """ส่งข้อความจากผู้ใช้จำลองเข้า getUpdates หรือ webhook (เรียกได้จากทุก thread)"""
+        self._loop.call_soon_threadsafe(self._add_update, chat_id, text)
+
+    def _add_update(self, chat_id: int, text: str):
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        command_length = text.find(" ") if " " in text else len(text)
+        update = {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private", "first_name": "bench"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "bench"},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": command_length}],
+            },
+        }
+        if self.webhook_url is not None:
+            self._webhook_queue.put_nowait(update)
+            return
+        self._updates.append(update)
+        self._new_updates.set()
+
+    def _set_webhook(self, params):
+        self.webhook_url = str(params["url"])
+        self.webhook_secret = params.get("secret_token")
+        connections = int(params.get("max_connections") or 40)
+        if self._webhook_queue is None:
+            # httpx เป็น dependency ของ python-telegram-bot อยู่แล้ว (สร้าง client เดียว เพราะสร้างแต่ละครั้งช้า)
+            import httpx
+            self._webhook_queue = asyncio.Queue()
+            self._webhook_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=connections))
+        # Telegram ส่ง update ผ่านการเชื่อมต่อพร้อมกันได้ไม่เกิน max_connections
+        while len(self._webhook_tasks) < connections:
+            self._webhook_tasks.append(asyncio.create_task(self._deliver_webhooks()))
+
+    async def _deliver_webhooks(self):
+        import httpx
+        while True:
+            update = await self._webhook_queue.get()
+            headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+            try:
+                await self._webhook_client.post(self.webhook_url, json=update, headers=headers)
+                self.webhook_deliveries += 1
+            except httpx.HTTPError as e:
+                logging.getLogger(__name__).warning(f"ส่ง webhook ไม่สำเร็จ: {e}")
+
+    async def _stop_webhook(self):
+        # ปลุก getUpdates ที่รออยู่ ให้จบก่อนปิด server
+        self._new_updates.set()
+        for task in self._webhook_tasks:
+            task.cancel()
+        await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        self._webhook_tasks = []
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+            self._webhook_client = None
+
+    @staticmethod
+    def _params(request) -> Dict[str, object]:
+        params: Dict[str, object] = dict(request.query)
+        content_type = request.headers.get("content-type", "")
+        if request.body:
+            if content_type.startswith("application/json"):
+                params.update(request.json())
+            elif content_type.startswith("multipart/form-data"):
+                # อัปโหลดไฟล์ (sendPhoto): ไฟล์เป็น bytes ส่วนค่าอื่นเป็น str
+                message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + request.body)
+                for part in message.get_payload():
+                    name = part.get_param("name", header="content-disposition")
+                    payload = part.get_payload(decode=True)
+                    params[name] = payload if part.get_filename() else payload.decode("utf-8")
+            else:
+                params.update(request.form())
+        return params
+
+    async def _handle(self, request):
+        method = request.path.rsplit("/", 1)[-1]
+        params = self._params(request)
+
+        if method == "getMe":
+            return HTTPResponse.json({"ok": True, "result": BOT_USER})
+        if method == "getUpdates":
+            return HTTPResponse.json({"ok": True, "result": await self._get_updates(params)})
+        if method == "sendMessage":
+            return HTTPResponse.json({"ok": True, "result": self._send_message(params)})
+        if method == "sendPhoto":
+            return HTTPResponse.json({"ok": True, "result": self._send_photo(params)})
+        if method == "setWebhook":
+            self._set_webhook(params)
+        elif method == "deleteWebhook":
+            self.webhook_url = None
+        # setMyCommands, close ฯลฯ
+        return HTTPResponse.json({"ok": True, "result": True})
+
+    async def _get_updates(self, params) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout > 0:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    def _send_message(self, params) -> dict:
+        now = time.perf_counter()
+        chat_id = int(params["chat_id"])
+        text = str(params.get("text", ""))
+        self.sent_messages += 1
+        if self.on_send is not None:
+            self.on_send(now, chat_id, text)
+
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "bench"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+
+    def _send_photo(self, params) -> dict:
+        photo = params["photo"]
+        if isinstance(photo, bytes):
+            self.photos_uploaded += 1
+            file_id = f"photo-{len(self._photos) + 1}"
+            self._photos[file_id] = len(photo)
+        else:
+            file_id = str(photo)
+            if file_id not in self._photos:
+                raise ValueError(f"ไม่พบ file_id {file_id}")
+            self.photos_reused += 1
+
+        message = self._send_message(dict(params, text=str(params.get("caption", ""))))
+        del message["text"]
+        message["caption"] = str(params.get("caption", ""))
+        message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 400,
+                             "file_size": self._photos[file_id]}]
+        return message
+
+
+class DeviceEmulator:
+    """อุปกรณ์จำลองที่ตอบคำสั่งในรูปแบบเดียวกับเฟิร์มแวร์"""
+
+    def __init__(self, device_id: str, rng: random.Random):
+        self.device_id = device_id
+        self.rng = rng
+        self.state = {
+            "temp_low": 25.0, "temp_high": 30.0, "humidity_low": 50.0, "humidity_high": 70.0,
+            "mode": "auto", "option": 2, "relay": False, "name": f"Bench {device_id}",
+            "cool": True, "moisture": False, "thingspeak_channel": 123456, "write_api_key": "BENCHKEY01",
+        }
+
+    def handle(self, command: dict) -> dict:
+        name = command.get("command")
+        response = {"device_id": self.device_id, "command": name, "success": True}
+        if "request_id" in command:
+            response["request_id"] = command["request_id"]
+
+        state = self.state
+        if name == "status":
+            response["data"] = {
+                "temperature": round(self.rng.uniform(20, 35), 2),
+                "humidity": round(self.rng.uniform(40, 80), 1),
+                "relay": state["relay"],
+                "mode": state["mode"],
+                "name": state["name"],
+                "option": state["option"],
+            }
+        elif name == "info":
+            response["data"] = dict(state, device_id=self.device_id)
+        elif name in ("settemp", "sethum"):
+            prefix = "temp" if name == "settemp" else "humidity"
+            state[f"{prefix}_low"] = float(command.get("low", 0))
+            state[f"{prefix}_high"] = float(command.get("high", 0))
+            response["data"] = {"low": state[f"{prefix}_low"], "high": state[f"{prefix}_high"]}
+        elif name == "setmode":
+            state["mode"] = command.get("mode", "auto")
+            response["data"] = {"mode": state["mode"]}
+        elif name == "relay":
+            state["relay"] = bool(int(command.get("state", command.get("relay", 1))))
+            response["data"] = {"relay": state["relay"]}
+        else:
+            response["success"] = False
+            response["message"] = "Unknown command"
+        return response
+
+
+class LoopbackMQTTClient:
+    """MQTT client จำลองที่มีเมธอดแบบเดียวกับ AsyncMQTTClient
+
+    คำสั่งที่ publish ไปยัง topic คำสั่งของอุปกรณ์จะถูกส่งให้ DeviceEmulator
+    ใน network thread ของตัวเอง แล้วส่งคำตอบกลับผ่าน message_callback (เหมือน paho)
+    """
+
+    def __init__(self, devices: Dict[str, DeviceEmulator], topic_cmd: str = "ogosense/cmd/",
+                 topic_resp: str = "ogosense/resp/", reply_delay: float = 0.0):
+        self.devices = devices
+        self.topic_cmd = topic_cmd
+        self.topic_resp = topic_resp
+        self.reply_delay = reply_delay
+        self.message_callback = None
+        self.on_publish = None
+        self.on_reply = None
+        self.published = 0
+        self._connected = False
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    async def connect(self, timeout: Optional[float] = None) -> bool:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._network_loop, name="loopback-mqtt", daemon=True)
+            self._thread.start()
+        self._connected = True
+        return True
+
+    async def reconnect(self, timeout: Optional[float] = None) -> bool:
+        return await self.connect(timeout)
+
+    async def disconnect(self):
+        self._connected = False
+        if self._thread is not None:
+            self._queue.put(None)
+            await asyncio.to_thread(self._thread.join, 5)
+            self._thread = None
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def add_topic(self, topic: str):
+        pass
+
+    async def subscribe(self, topic: str, qos: int = 1, timeout: Optional[float] = None) -> bool:
+        return True
+
+    async def publish(self, topic: str, payload, qos: int = 1, retain: bool = False,
+                      timeout: Optional[float] = None) -> bool:
+        now = time.perf_counter()
+        self.published += 1
+        if topic.startswith(self.topic_cmd):
+            device_id = topic[len(self.topic_cmd):]
+            if self.on_publish is not None:
+                self.on_publish(now, device_id)
+            self._queue.put((now + self.reply_delay, device_id, payload))
+        return True
+
+    def _network_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            due, device_id, payload = item
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            device = self.devices.get(device_id)
+            if device is None:
+                continue
+            # paho ส่ง payload เป็น bytes
+            response = json.dumps(device.handle(json.loads(payload))).encode("utf-8")
+            if self.on_reply is not None:
+                self.on_reply(time.perf_counter(), device_id)
+            if self.message_callback is not None:
+                self.message_callback(None, f"{self.topic_resp}{device_id}", response)
+
+
+class Recorder:
+    """เก็บเวลาแต่ละช่วงของคำสั่ง (เรียกจากหลาย thread)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.measuring = False
+        self.injected: Dict[str, float] = {}
+        self.replied: Dict[str, float] = {}
+        self.command_to_publish: List[float] = []
+        self.reply_to_delivery: List[float] = []
+        self.round_trip: List[float] = []
+        self.completed = 0
+
+    def injected_at(self, device_id: str, now: float):
+        with self.lock:
+            self.injected[device_id] = now
+
+    def published_at(self, now: float, device_id: str):
+        with self.lock:
+            started = self.injected.get(device_id)
+            if started is not None and self.measuring:
+                self.command_to_publish.append(now - started)
+
+    def replied_at(self, now: float, device_id: str):
+        with self.lock:
+            self.replied[device_id] = now
+
+    def delivered_at(self, now: float, device_id: str) -> bool:
+        with self.lock:
+            replied = self.replied.pop(device_id, None)
+            started = self.injected.pop(device_id, None)
+            if replied is None or started is None:
+                return False
+            if self.measuring:
+                self.reply_to_delivery.append(now - replied)
+                self.round_trip.append(now - started)
+                self.completed += 1
+            return True
+
+
+async def run_benchmark(args) -> dict:
+    # ตั้งค่าก่อน import bridge (main.py อ่านค่าเหล่านี้ตอนสร้าง bridge)
+    workdir = tempfile.mkdtemp(prefix="ogosense-bench-")
+    api = FakeBotAPI()
+    api.start()
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_BASE_URL": api.base_url,
+        "STORAGE_PATH": os.path.join(workdir, "storage"),
+        "STORAGE_FILE": os.path.join(workdir, "authorized_chatids.pkl"),
+        "STATUS_CACHE_TTL": "0",
+        "TELEGRAM_WORKERS": str(args.workers),
+        "TELEGRAM_MODE": args.mode,
+        "TELEGRAM_CONCURRENT_UPDATES": str(args.concurrent_updates),
+    })
+    if args.mode == "webhook":
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            webhook_port = sock.getsockname()[1]
+        os.environ.update({
+            "TELEGRAM_WEBHOOK_URL": f"http://127.0.0.1:{webhook_port}/telegram",
+            "TELEGRAM_WEBHOOK_HOST": "127.0.0.1",
+            "TELEGRAM_WEBHOOK_PORT": str(webhook_port),
+        })
+    if not args.telegram_limits:
+        os.environ.update({
+            "TELEGRAM_GLOBAL_RATE": "1000000",
+            "TELEGRAM_CHAT_RATE": "1000000",
+            "TELEGRAM_CHAT_BURST": "1000000",
+        })
+
+    import main as bridge_main
+    from acl import WILDCARD
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    device_ids = [str(100000 + i) for i in range(args.devices)]
+    devices = {device_id: DeviceEmulator(device_id, rng) for device_id in device_ids}
+    mqtt = LoopbackMQTTClient(devices, reply_delay=args.device_delay / 1000.0)
+    bridge = bridge_main.MQTTTelegramBridge(mqtt_client=mqtt)
+
+    # แชทจำลอง: แชท j ควบคุมอุปกรณ์ j, j+C, j+2C, ... ทำให้แต่ละอุปกรณ์มีคำสั่งค้างได้ไม่เกินหนึ่งคำสั่ง
+    concurrency = min(args.concurrency, args.devices)
+    chats = [1000000 + j for j in range(concurrency)]
+    for chat_id in chats:
+        bridge.acl.grant(str(chat_id), WILDCARD, "operator")
+    chat_devices = {chat_id: device_ids[j::concurrency] for j, chat_id in enumerate(chats)}
+    device_chat = {device_id: chat_id for chat_id, ids in chat_devices.items() for device_id in ids}
+    commands = args.commands.split(",")
+
+    recorder = Recorder()
+    mqtt.on_publish = recorder.published_at
+    mqtt.on_reply = recorder.replied_at
+
+    loop = asyncio.get_running_loop()
+    turn = {chat_id: 0 for chat_id in chats}
+
+    def send_next(chat_id: int):
+        ids = chat_devices[chat_id]
+        index = turn[chat_id]
+        turn[chat_id] = index + 1
+        device_id = ids[index % len(ids)]
+        text = COMMAND_TEMPLATES[commands[index % len(commands)]].format(device_id=device_id)
+        recorder.injected_at(device_id, time.perf_counter())
+        api.inject_command(chat_id, text)
+
+    def on_send(now: float, chat_id: int, text: str):
+        # ทำงานใน thread ของ FakeBotAPI: สนใจเฉพาะข้อความที่เป็นคำตอบของอุปกรณ์
+        if not text.startswith(REPLY_PREFIX):
+            return
+        device_id = text[len(REPLY_PREFIX):text.index("\n")]
+        if recorder.delivered_at(now, device_id) and device_chat.get(device_id) == chat_id:
+            loop.call_soon_threadsafe(send_next, chat_id)
+
+    api.on_send = on_send
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    def receiving() -> bool:
+        application = bridge.telegram_bot.application
+        if application is None:
+            return False
+        if args.mode == "webhook":
+            return api.webhook_url is not None
+        return application.updater.running
+
+    bridge_task = asyncio.create_task(bridge.start())
+    while not receiving():
+        if bridge_task.done():
+            raise RuntimeError("bridge หยุดทำงานก่อนเริ่ม benchmark")
+        await asyncio.sleep(0.05)
+
+    for chat_id in chats:
+        send_next(chat_id)
+
+    await asyncio.sleep(args.warmup)
+    recorder.measuring = True
+    started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    recorder.measuring = False
+    elapsed = time.perf_counter() - started
+
+    await bridge.shutdown()
+    await bridge_task
+    api.stop()
+
+    peak_kb = None
+    if args.tracemalloc:
+        peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    return {
+        "config": {
+            "devices": args.devices,
+            "concurrency": concurrency,
+            "commands": commands,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "device_delay_ms": args.device_delay,
+            "workers": args.workers,
+            "telegram_limits": args.telegram_limits,
+            "mode": args.mode,
+            "concurrent_updates": args.concurrent_updates,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "completed": recorder.completed,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_cmd_s": round(recorder.completed / elapsed, 2),
+        "command_to_publish_ms": percentiles(recorder.command_to_publish),
+        "reply_to_delivery_ms": percentiles(recorder.reply_to_delivery),
+        "round_trip_ms": percentiles(recorder.round_trip),
+        "telegram_messages_sent": api.sent_messages,
+        "webhook_deliveries": api.webhook_deliveries,
+        "mqtt_published": mqtt.published,
+        "memory": {
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "tracemalloc_peak_kb": peak_kb,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark แบบ end-to-end ของ MQTT Telegram Bridge")
+    parser.add_argument("--devices", type=int, default=100, help="จำนวนอุปกรณ์จำลอง")
+    parser.add_argument("--concurrency", type=int, default=10, help="จำนวนแชทที่ส่งคำสั่งพร้อมกัน")
+    parser.add_argument("--duration", type=float, default=10.0, help="ระยะเวลาที่วัด (วินาที)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="ระยะเวลาอุ่นเครื่องก่อนวัด (วินาที)")
+    parser.add_argument("--commands", default="status", help=f"คำสั่งที่ใช้ คั่นด้วยจุลภาค ({','.join(COMMAND_TEMPLATES)})")
+    parser.add_argument("--device-delay", type=float, default=0.0, help="เวลาที่อุปกรณ์ใช้ตอบ (มิลลิวินาที)")
+    parser.add_argument("--workers", type=int, default=4, help="จำนวน worker ส่งข้อความ Telegram")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling", help="วิธีรับ update ของบอท")
+    parser.add_argument("--concurrent-updates", type=int, default=1, help="จำนวน update ที่บอทประมวลผลพร้อมกัน")
+    parser.add_argument("--telegram-limits", action="store_true", help="ใช้ขีดจำกัดอัตราการส่งของ Telegram จริง")
+    parser.add_argument("--tracemalloc", action="store_true", help="วัดหน่วยความจำสูงสุดด้วย tracemalloc (ช้าลง)")
+    parser.add_argument("--seed", type=int, default=1, help="seed ของข้อมูลจำลอง")
+    parser.add_argument("--output", help="บันทึกผลลัพธ์ JSON ลงไฟล์ (ค่าเริ่มต้นคือแสดงทางหน้าจอ)")
+    parser.add_argument("--verbose", action="store_true", help="แสดง log ของ bridge")
+    args = parser.parse_args()
+
+    unknown = [command for command in args.commands.split(",") if command not in COMMAND_TEMPLATES]
+    if unknown:
+        parser.error(f"ไม่รู้จักคำสั่ง: {', '.join(unknown)}")
+
+    result = asyncio.run(run_benchmark(args))
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Chart module สำหรับวาดกราฟค่าย้อนหลังของอุปกรณ์เป็นภาพ PNG
+
+การวาดใช้ CPU มาก จึงทำใน process pool แยกจาก event loop (ไม่ทำให้แชทอื่นรอ)
+ภาพที่วาดแล้วถูกเก็บในแคชตาม (อุปกรณ์, ค่า, ช่วงเวลา, เวอร์ชันข้อมูล) โดยเก็บ file_id ของ Telegram
+หลังอัปโหลดครั้งแรก คำขอซ้ำจึงส่ง file_id เดิมโดยไม่ต้องวาดหรืออัปโหลดใหม่
+แคชหมดอายุเองเมื่อได้รับค่าใหม่ของอุปกรณ์ (เวอร์ชันข้อมูลเปลี่ยน)
+
+ตัววาดใช้เฉพาะ standard library (zlib) ไม่ต้องติดตั้งไลบรารีวาดกราฟเพิ่ม
+"""
+
+import time
+import zlib
+import struct
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Hashable, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+WIDTH = 800
+HEIGHT = 400
+MARGIN_LEFT = 90
+MARGIN_RIGHT = 20
+MARGIN_TOP = 20
+MARGIN_BOTTOM = 50
+GRID_LINES = 5
+TIME_LABELS = 5
+
+BACKGROUND = (255, 255, 255)
+GRID = (225, 225, 225)
+AXIS = (120, 120, 120)
+TEXT = (60, 60, 60)
+BAND = (190, 215, 240)
+LINE = (25, 100, 190)
+
+# ตัวอักษรขนาด 5x7 จุด (แต่ละแถวเป็นบิต 5 บิต จากซ้ายไปขวา) สำหรับป้ายแกน
+FONT_SCALE = 2
+GLYPHS = {
+    "0": (0x0E, 0x11, 0x13, 0x15, 0x19, 0x11, 0x0E),
+    "1": (0x04, 0x0C, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "2": (0x0E, 0x11, 0x01, 0x02, 0x04, 0x08, 0x1F),
+    "3": (0x1F, 0x02, 0x04, 0x02, 0x01, 0x11, 0x0E),
+    "4": (0x02, 0x06, 0x0A, 0x12, 0x1F, 0x02, 0x02),
+    "5": (0x1F, 0x10, 0x1E, 0x01, 0x01, 0x11, 0x0E),
+    "6": (0x06, 0x08, 0x10, 0x1E, 0x11, 0x11, 0x0E),
+    "7": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x08, 0x08),
+    "8": (0x0E, 0x11, 0x11, 0x0E, 0x11, 0x11, 0x0E),
+    "9": (0x0E, 0x11, 0x11, 0x0F, 0x01, 0x02, 0x0C),
+    ".": (0x00, 0x00, 0x00, 0x00, 0x00, 0x0C, 0x0C),
+    "-": (0x00, 0x00, 0x00, 0x1F, 0x00, 0x00, 0x00),
+    ":": (0x00, 0x0C, 0x0C, 0x00, 0x0C, 0x0C, 0x00),
+    "/": (0x01, 0x01, 0x02, 0x04, 0x08, 0x10, 0x10),
+    " ": (0x00,) * 7,
+}
+GLYPH_WIDTH = 6 * FONT_SCALE
+GLYPH_HEIGHT = 7 * FONT_SCALE
+
+Color = Tuple[int, int, int]
+
+
+class Canvas:
+    """ภาพ RGB ในหน่วยความจำ"""
+
+    def __init__(self, width: int, height: int, background: Color):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(background) * (width * height))
+
+    def point(self, x: int, y: int, color: Color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            offset = (y * self.width + x) * 3
+            self.pixels[offset:offset + 3] = bytes(color)
+
+    def hline(self, x0: int, x1: int, y: int, color: Color):
+        x0, x1 = max(0, min(x0, x1)), min(self.width - 1, max(x0, x1))
+        if 0 <= y < self.height and x0 <= x1:
+            offset = (y * self.width + x0) * 3
+            self.pixels[offset:offset + (x1 - x0 + 1) * 3] = bytes(color) * (x1 - x0 + 1)
+
+    def vline(self, x: int, y0: int, y1: int, color: Color):
+        for y in range(max(0, min(y0, y1)), min(self.height - 1, max(y0, y1)) + 1):
+            self.point(x, y, color)
+
+    def line(self, x0: int, y0: int, x1: int, y1: int, color: Color, thickness: int = 2):
+        """ลากเส้นตรงด้วยวิธีของ Bresenham"""
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        error = dx + dy
+        while True:
+            for offset in range(thickness):
+                self.point(x0, y0 + offset, color)
+            if x0 == x1 and y0 == y1:
+                return
+            double = 2 * error
+            if double >= dy:
+                error += dy
+                x0 += sx
+            if double <= dx:
+                error += dx
+                y0 += sy
+
+    def text(self, x: int, y: int, text: str, color: Color):
+        """เขียนข้อความด้วยตัวอักษรใน GLYPHS (ตัวอักษรอื่นถูกข้าม)"""
+        for char in text:
+            glyph = GLYPHS.get(char)
+            if glyph is None:
+                continue
+            for row, bits in enumerate(glyph):
+                for column in range(5):
+                    if bits & (0x10 >> column):
+                        for dy in range(FONT_SCALE):
+                            self.hline(x + column * FONT_SCALE, x + column * FONT_SCALE + FONT_SCALE - 1,
+                                       y + row * FONT_SCALE + dy, color)
+            x += GLYPH_WIDTH
+
+    def to_png(self) -> bytes:
+        """แปลงเป็นไฟล์ PNG (RGB 8 บิต)"""
+        stride = self.width * 3
+        raw = bytearray()
+        for y in range(self.height):
+            raw.append(0)
+            raw += self.pixels[y * stride:(y + 1) * stride]
+
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+        header = struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)
+        return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+                + chunk(b"IDAT", zlib.compress(bytes(raw), 6)) + chunk(b"IEND", b""))
+
+
+def _value_label(value: float, step: float) -> str:
+    decimals = 0 if step >= 1 else (1 if step >= 0.1 else 2)
+    return f"{value:.{decimals}f}"
+
+
+def render_chart(times: Sequence[int], minimums: Sequence[float], averages: Sequence[float],
+                 maximums: Sequence[float], start: float, end: float,
+                 width: int = WIDTH, height: int = HEIGHT) -> bytes:
+    """วาดกราฟเส้นค่าเฉลี่ย พร้อมแถบช่วงต่ำสุด-สูงสุด (ทำงานใน process pool)
+
+    Args:
+        times: เวลาเริ่มของแต่ละช่วง (epoch วินาที) เรียงจากเก่าไปใหม่
+        minimums: ค่าต่ำสุดของแต่ละช่วง
+        averages: ค่าเฉลี่ยของแต่ละช่วง
+        maximums: ค่าสูงสุดของแต่ละช่วง
+        start: เวลาเริ่มของแกน x
+        end: เวลาสิ้นสุดของแกน x
+        width: ความกว้างของภาพ
+        height: ความสูงของภาพ
+
+    Returns:
+        bytes: ไฟล์ PNG
+    """
+    canvas = Canvas(width, height, BACKGROUND)
+    left, right = MARGIN_LEFT, width - MARGIN_RIGHT
+    top, bottom = MARGIN_TOP, height - MARGIN_BOTTOM
+
+    low, high = min(minimums), max(maximums)
+    if high - low < 1e-9:
+        low, high = low - 1, high + 1
+    padding = (high - low) * 0.05
+    low, high = low - padding, high + padding
+    span = max(end - start, 1)
+
+    def x_of(timestamp: float) -> int:
+        return left + int((timestamp - start) / span * (right - left))
+
+    def y_of(value: float) -> int:
+        return bottom - int((value - low) / (high - low) * (bottom - top))
+
+    # เส้นตารางและป้ายแกน y
+    step = (high - low) / GRID_LINES
+    for index in range(GRID_LINES + 1):
+        value = low + step * index
+        y = y_of(value)
+        canvas.hline(left, right, y, GRID)
+        label = _value_label(value, step)
+        canvas.text(left - 8 - len(label) * GLYPH_WIDTH, y - GLYPH_HEIGHT // 2, label, TEXT)
+
+    # ป้ายแกน x (ชั่วโมง:นาที หรือ วัน/เดือน ถ้าช่วงเวลายาวกว่า 2 วัน)
+    time_format = "%d/%m" if span > 2 * 86400 else "%H:%M"
+    for index in range(TIME_LABELS + 1):
+        timestamp = start + span * index / TIME_LABELS
+        x = x_of(timestamp)
+        canvas.vline(x, top, bottom, GRID)
+        label = time.strftime(time_format, time.localtime(timestamp))
+        label_x = min(x - len(label) * GLYPH_WIDTH // 2, width - len(label) * GLYPH_WIDTH)
+        canvas.text(label_x, bottom + 12, label, TEXT)
+
+    canvas.hline(left, right, bottom, AXIS)
+    canvas.vline(left, top, bottom, AXIS)
+
+    # แถบต่ำสุด-สูงสุดของแต่ละช่วง แล้วเส้นค่าเฉลี่ย
+    for timestamp, minimum, maximum in zip(times, minimums, maximums):
+        x = x_of(timestamp)
+        for offset in range(3):
+            canvas.vline(x + offset - 1, y_of(maximum), y_of(minimum), BAND)
+    previous = None
+    for timestamp, average in zip(times, averages):
+        point = (x_of(timestamp), y_of(average))
+        if previous is not None:
+            canvas.line(previous[0], previous[1], point[0], point[1], LINE)
+        else:
+            canvas.line(point[0], point[1], point[0], point[1], LINE)
+        previous = point
+
+    return canvas.to_png()
+
+
+class ChartCache:
+    """แคชของภาพกราฟแบบ LRU: เก็บ file_id ของ Telegram (หรือ PNG ถ้ายังอัปโหลดไม่สำเร็จ)"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Union[str, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Union[str, bytes]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, entry: Union[str, bytes]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class ChartService:
+    """วาดกราฟใน process pool พร้อมแคชภาพและ file_id ของ Telegram"""
+
+    def __init__(self, workers: int = 1, cache_size: int = 256):
+        """
+        Args:
+            workers: จำนวน process ที่ใช้วาดกราฟ
+            cache_size: จำนวนภาพสูงสุดในแคช
+        """
+        self.workers = max(1, workers)
+        self.cache = ChartCache(cache_size)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # key -> future ของการวาดที่กำลังทำอยู่ (คำขอเดียวกันพร้อมกันวาดครั้งเดียว)
+        self._rendering: Dict[Hashable, asyncio.Future] = {}
+        self.rendered = 0
+        self.render_time = 0.0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: process ลูกไม่ได้รับสำเนา thread ของ paho หรือ lock ที่ค้างอยู่จาก fork
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"เริ่ม process pool สำหรับวาดกราฟ {self.workers} process")
+        return self._pool
+
+    async def get(self, key: Hashable, render_args: Callable[[], Optional[tuple]]) -> Optional[Union[str, bytes]]:
+        """ดึงภาพจากแคช หรือวาดใหม่ใน process pool
+
+        Args:
+            key: key ของภาพ (ควรมีเวอร์ชันของข้อมูลด้วย)
+            render_args: ฟังก์ชันที่คืน argument ของ render_chart() (None ถ้าไม่มีข้อมูล)
+
+        Returns:
+            Optional[Union[str, bytes]]: file_id ของ Telegram ถ้าเคยอัปโหลดแล้ว, PNG ถ้าวาดใหม่,
+                หรือ None ถ้าไม่มีข้อมูล
+        """
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry
+
+        pending = self._rendering.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        args = render_args()
+        if args is None:
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[key] = future
+        try:
+            started = time.perf_counter()
+            png = await asyncio.get_running_loop().run_in_executor(self._executor(), render_chart, *args)
+            self.rendered += 1
+            self.render_time += time.perf_counter() - started
+            self.cache.put(key, png)
+            future.set_result(png)
+            return png
+        except BaseException as e:
+            future.set_exception(e)
+            # ป้องกันคำเตือน "exception was never retrieved" เมื่อไม่มีคำขออื่นรออยู่
+            future.exception()
+            raise
+        finally:
+            del self._rendering[key]
+
+    def uploaded(self, key: Hashable, file_id: str):
+        """บันทึก file_id หลังอัปโหลดภาพไปยัง Telegram ครั้งแรก (ครั้งต่อไปส่ง file_id แทนไฟล์)"""
+        self.cache.put(key, file_id)
+
+    def close(self):
+        """ปิด process pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, float]:
+        """ดึงสถิติของการวาดกราฟ"""
+        return {
+            "cached": len(self.cache),
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "rendered": self.rendered,
+            "avg_render_ms": self.render_time / self.rendered * 1000 if self.rendered else 0.0,
+        }
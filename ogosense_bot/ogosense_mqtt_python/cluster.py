@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""Cluster module สำหรับรัน bridge หลาย process ร่วมกันผ่าน MQTT v5 shared subscription
+
+แต่ละ node subscribe คำตอบของอุปกรณ์ผ่าน $share/<group>/... ทำให้ broker กระจายคำตอบไปยัง node ต่างๆ
+คำตอบอาจไปถึง node ที่ไม่ได้ส่งคำสั่ง จึงต้องมีที่เก็บข้อมูลร่วม (SQLite โหมด WAL) ซึ่งเก็บ
+    - pending: คำสั่งที่รอคำตอบของทุก node (node ใดได้รับคำตอบก็หา chat ได้)
+    - completions: คำตอบที่ node อื่นจัดการแทน เพื่อให้ node เจ้าของคำสั่งปิดรายการของตัวเอง
+    - leases: สิทธิ์แบบมีเวลาหมดอายุ ใช้เลือก node เดียวที่ทำ Telegram polling
+    - samples: คำตอบที่ node อื่นได้รับ ส่งต่อให้ leader ตรวจกฎแจ้งเตือน (สถานะของกฎอยู่ที่ leader ที่เดียว)
+    - documents: ข้อมูลของ Storage (chat IDs, สิทธิ์, การติดตาม, กฎแจ้งเตือน, outbox) ที่ทุก node ใช้ร่วมกัน
+      แต่ละ node ไม่เขียนไฟล์ STORAGE_PATH ของตัวเอง และโหลดค่าที่ node อื่นเปลี่ยนตาม revision
+"""
+
+import os
+import time
+import json
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from persistence import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# ชื่อ lease ของ node ที่รับ update จาก Telegram
+POLLING_LEASE = "telegram-polling"
+
+
+def default_node_id() -> str:
+    """ชื่อ node เริ่มต้น (hostname-pid)"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SharedStore:
+    """ที่เก็บข้อมูลร่วมของ cluster บน SQLite (ใช้ได้หลาย process บนเครื่องเดียวกัน)
+
+    ทุกเมธอดเป็นแบบ blocking และ thread-safe ควรเรียกผ่าน asyncio.to_thread จาก event loop
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: ไฟล์ฐานข้อมูล SQLite ที่ทุก node ใช้ร่วมกัน
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # isolation_level=None: ควบคุม transaction เอง (BEGIN IMMEDIATE สำหรับการ claim)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pending (
+                request_id TEXT PRIMARY KEY,
+                device_id TEXT NOT NULL,
+                command TEXT NOT NULL,
+                chat_id TEXT,
+                node_id TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pending_device_command ON pending (device_id, command, created_at);
+            CREATE TABLE IF NOT EXISTS completions (
+                request_id TEXT PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                device_id TEXT NOT NULL,
+                command TEXT NOT NULL,
+                data TEXT NOT NULL,
+                completed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS completions_node ON completions (node_id);
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS samples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT NOT NULL,
+                command TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS documents (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                revision INTEGER NOT NULL,
+                node_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS documents_revision ON documents (revision);
+        """)
+
+    def add_pending(self, requests: List[Tuple[str, str, str, Optional[str]]], node_id: str):
+        """บันทึกคำสั่งที่รอคำตอบ (ทั้งชุดใน transaction เดียว)
+
+        Args:
+            requests: รายการ (request_id, device_id, command, chat_id) โดย chat_id เป็น None
+                ถ้าไม่ต้องส่งคำตอบไปยัง Telegram
+            node_id: node ที่ส่งคำสั่ง
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO pending (request_id, device_id, command, chat_id, node_id, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(request_id, device_id, command, chat_id, node_id, now)
+                     for request_id, device_id, command, chat_id in requests])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, device_id: str, command: str, request_id: Optional[str]) -> Optional[Tuple[str, Optional[str], str]]:
+        """ดึงคำสั่งที่ตรงกับคำตอบออกจากตาราง (มีเพียง node เดียวที่ claim ได้)
+
+        Args:
+            device_id: Device ID ของอุปกรณ์ที่ตอบกลับ
+            command: ชื่อคำสั่งที่ตอบกลับ
+            request_id: request_id ในคำตอบ (None คือใช้คำสั่งเก่าสุดของ device_id และ command)
+
+        Returns:
+            Optional[Tuple[str, Optional[str], str]]: (request_id, chat_id, node_id เจ้าของคำสั่ง) หรือ None
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if request_id is not None:
+                    row = conn.execute("SELECT request_id, chat_id, node_id FROM pending WHERE request_id = ?",
+                                       (request_id,)).fetchone()
+                else:
+                    row = conn.execute("SELECT request_id, chat_id, node_id FROM pending "
+                                       "WHERE device_id = ? AND command = ? ORDER BY created_at LIMIT 1",
+                                       (device_id, command)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM pending WHERE request_id = ?", (row[0],))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def discard(self, request_ids: List[str]):
+        """ลบคำสั่งที่ node เจ้าของจัดการเองแล้ว"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending WHERE request_id = ?", [(rid,) for rid in request_ids])
+
+    def add_completion(self, node_id: str, request_id: str, device_id: str, command: str, data: Any):
+        """บันทึกคำตอบที่จัดการแทน node เจ้าของคำสั่ง"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (request_id, node_id, device_id, command, data, completed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (request_id, node_id, device_id, command, json.dumps(data, ensure_ascii=False), time.time()))
+
+    def take_completions(self, node_id: str) -> List[Tuple[str, str, str, Any]]:
+        """ดึงและลบคำตอบของคำสั่งที่ node นี้เป็นเจ้าของ
+
+        Returns:
+            List[Tuple[str, str, str, Any]]: (request_id, device_id, command, data)
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute("SELECT request_id, device_id, command, data FROM completions WHERE node_id = ?",
+                                    (node_id,)).fetchall()
+                if rows:
+                    conn.execute("DELETE FROM completions WHERE node_id = ?", (node_id,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [(request_id, device_id, command, json.loads(data)) for request_id, device_id, command, data in rows]
+
+    def add_samples(self, samples: List[Tuple[str, str, Any]]):
+        """บันทึกคำตอบที่ส่งต่อให้ leader
+
+        Args:
+            samples: รายการ (device_id, command, data)
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT INTO samples (device_id, command, data, created_at) VALUES (?, ?, ?, ?)",
+                    [(device_id, command, json.dumps(data, ensure_ascii=False), now)
+                     for device_id, command, data in samples])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def take_samples(self) -> List[Tuple[str, str, Any]]:
+        """ดึงและลบคำตอบที่ส่งต่อให้ leader ตามลำดับที่ได้รับ
+
+        Returns:
+            List[Tuple[str, str, Any]]: (device_id, command, data)
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute("SELECT id, device_id, command, data FROM samples ORDER BY id").fetchall()
+                if rows:
+                    conn.execute("DELETE FROM samples WHERE id <= ?", (rows[-1][0],))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [(device_id, command, json.loads(data)) for _, device_id, command, data in rows]
+
+    def expire(self, max_age: float) -> int:
+        """ลบคำสั่งและคำตอบที่ค้างนานเกิน max_age วินาที
+
+        Returns:
+            int: จำนวนคำสั่งที่ถูกลบ
+        """
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = self._conn.execute("DELETE FROM pending WHERE created_at < ?", (cutoff,)).rowcount
+            self._conn.execute("DELETE FROM completions WHERE completed_at < ?", (cutoff,))
+            self._conn.execute("DELETE FROM samples WHERE created_at < ?", (cutoff,))
+        return expired
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """ขอหรือต่ออายุ lease
+
+        Returns:
+            bool: True ถ้า owner ถือ lease อยู่หลังการเรียก
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                acquired = row is None or row[0] == owner or row[1] < now
+                if acquired:
+                    conn.execute("INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                                 (name, owner, now + ttl))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return acquired
+
+    def release_lease(self, name: str, owner: str):
+        """คืน lease (ถ้า owner ถืออยู่) ให้ node อื่นรับต่อได้ทันที"""
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def load_documents(self) -> Tuple[Dict[str, Any], int]:
+        """โหลดข้อมูลทั้งหมดของ Storage
+
+        Returns:
+            Tuple[Dict[str, Any], int]: (ข้อมูลตาม key, revision ล่าสุด)
+        """
+        with self._lock:
+            conn = self._conn
+            # อ่านข้อมูลและ revision จาก snapshot เดียวกัน
+            conn.execute("BEGIN")
+            try:
+                rows = conn.execute("SELECT key, value FROM documents WHERE value IS NOT NULL").fetchall()
+                revision = conn.execute("SELECT COALESCE(MAX(revision), 0) FROM documents").fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return {key: json.loads(value) for key, value in rows}, revision
+
+    def write_documents(self, changes: Dict[str, Any], node_id: str):
+        """บันทึกค่าของ key ที่เปลี่ยนแปลงด้วย revision ใหม่ (ค่า None หมายถึงลบ key)
+
+        Args:
+            changes: key และค่าล่าสุด
+            node_id: node ที่เปลี่ยนข้อมูล (node นี้ไม่ต้องโหลดค่าของตัวเองกลับ)
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                revision = conn.execute("SELECT COALESCE(MAX(revision), 0) + 1 FROM documents").fetchone()[0]
+                # key ที่ถูกลบยังคงมีแถวที่ value เป็น NULL เพื่อให้ node อื่นรู้ว่าต้องลบด้วย
+                conn.executemany(
+                    "INSERT OR REPLACE INTO documents (key, value, revision, node_id) VALUES (?, ?, ?, ?)",
+                    [(key, None if value is None else json.dumps(value, ensure_ascii=False), revision, node_id)
+                     for key, value in changes.items()])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def changed_documents(self, since: int, node_id: str) -> Tuple[Dict[str, Any], int]:
+        """ดึงข้อมูลที่ node อื่นเปลี่ยนหลัง revision ที่ระบุ
+
+        Returns:
+            Tuple[Dict[str, Any], int]: (key และค่าล่าสุด โดย None คือถูกลบ, revision ล่าสุดที่อ่านแล้ว)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value, revision, node_id FROM documents WHERE revision > ? ORDER BY revision",
+                (since,)).fetchall()
+        changes = {}
+        for key, value, revision, owner in rows:
+            since = max(since, revision)
+            if owner != node_id:
+                changes[key] = None if value is None else json.loads(value)
+        return changes, since
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ClusterBackend(StorageBackend):
+    """ที่เก็บข้อมูลของ Storage ในโหมด cluster (ตาราง documents ของที่เก็บข้อมูลร่วม)
+
+    ถ้าที่เก็บข้อมูลร่วมยังไม่มีข้อมูล จะย้ายข้อมูลจาก backend เดิมของ node (seed) เข้าไปครั้งแรก
+    """
+
+    def __init__(self, store: SharedStore, node_id: str, seed: Optional[StorageBackend] = None):
+        """
+        Args:
+            store: ที่เก็บข้อมูลร่วม (ใช้ connection แยกจากของ ClusterNode เพราะถูกปิดโดย Storage)
+            node_id: ชื่อ node ที่บันทึกการเปลี่ยนแปลง
+            seed: backend เดิมของ node สำหรับย้ายข้อมูลครั้งแรก
+        """
+        self.store = store
+        self.node_id = node_id
+        self.seed = seed
+        # revision ของข้อมูลที่โหลด ClusterNode ใช้ตรวจการเปลี่ยนแปลงที่เกิดหลังจากนี้
+        self.revision = 0
+
+    def load(self) -> Dict[str, Any]:
+        documents, self.revision = self.store.load_documents()
+        if self.seed is not None:
+            if not documents:
+                documents = self.seed.load()
+                if documents:
+                    logger.info(f"ย้ายข้อมูล {len(documents)} รายการจาก storage ของ node เข้าที่เก็บข้อมูลร่วม")
+                    self.store.write_documents(documents, self.node_id)
+            self.seed.close()
+            self.seed = None
+        return documents
+
+    def write(self, changes: Dict[str, Any]):
+        if changes:
+            self.store.write_documents(changes, self.node_id)
+
+    def close(self):
+        self.store.close()
+
+
+class ClusterNode:
+    """node หนึ่งของ cluster
+
+    - register(): บันทึกคำสั่งลงที่เก็บข้อมูลร่วมก่อน publish
+    - claim(): หา chat ของคำตอบที่ node นี้ไม่ได้เป็นผู้ส่งคำสั่ง
+    - forward_sample(): ส่งต่อคำตอบให้ leader ตรวจกฎแจ้งเตือน
+    - task เบื้องหลังต่ออายุ lease ของ Telegram polling, รับคำตอบที่ node อื่นจัดการแทน,
+      โหลดข้อมูลของ Storage ที่ node อื่นเปลี่ยน, ส่ง/รับคำตอบที่ส่งต่อให้ leader และลบรายการที่หมดอายุ
+    """
+
+    def __init__(self, store: SharedStore, group: str, node_id: str = None, lease_ttl: float = 15.0,
+                 poll_interval: float = 0.5, pending_timeout: float = 60.0):
+        """
+        Args:
+            store: ที่เก็บข้อมูลร่วม
+            group: ชื่อกลุ่มของ shared subscription
+            node_id: ชื่อ node (ค่าเริ่มต้นคือ hostname-pid)
+            lease_ttl: อายุของ lease (วินาที) node ที่หยุดทำงานจะเสีย lease หลังจากนี้
+            poll_interval: ความถี่ในการตรวจคำตอบที่ node อื่นจัดการแทน (วินาที)
+            pending_timeout: อายุสูงสุดของคำสั่งในที่เก็บข้อมูลร่วม (วินาที)
+        """
+        self.store = store
+        self.group = group
+        self.node_id = node_id or default_node_id()
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.pending_timeout = pending_timeout
+        self.is_leader = False
+        self._discarded: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self._on_completion: Optional[Callable[[str, str, str, Any], None]] = None
+        self._on_leadership: Optional[Callable[[bool], Awaitable]] = None
+        self._on_documents: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._on_sample: Optional[Callable[[str, str, Any], None]] = None
+        self._samples: List[Tuple[str, str, Any]] = []
+        self._backend: Optional[ClusterBackend] = None
+        self._document_revision = 0
+
+        # สถิติ
+        self.claimed = 0
+        self.completed_remotely = 0
+        self.forwarded = 0
+
+    def shared_topic(self, topic: str) -> str:
+        """topic filter แบบ shared subscription ของกลุ่มนี้"""
+        return f"$share/{self.group}/{topic}"
+
+    def document_backend(self, seed: Optional[StorageBackend] = None) -> ClusterBackend:
+        """สร้าง backend ของ Storage ที่เก็บข้อมูลในที่เก็บข้อมูลร่วม
+
+        Args:
+            seed: backend เดิมของ node สำหรับย้ายข้อมูลครั้งแรก
+        """
+        self._backend = ClusterBackend(SharedStore(self.store.path), self.node_id, seed)
+        return self._backend
+
+    async def register(self, request_id: str, device_id: str, command: str, chat_id: Optional[str]):
+        """บันทึกคำสั่งลงที่เก็บข้อมูลร่วม (ต้องเรียกก่อน publish)"""
+        await asyncio.to_thread(self.store.add_pending, [(request_id, device_id, command, chat_id)], self.node_id)
+    
+    async def register_many(self, requests: List[Tuple[str, str, str, Optional[str]]]):
+        """บันทึกคำสั่งหลายรายการลงที่เก็บข้อมูลร่วมใน transaction เดียว (เช่น คำสั่งแบบกลุ่ม)
+
+        Args:
+            requests: รายการ (request_id, device_id, command, chat_id)
+        """
+        if requests:
+            await asyncio.to_thread(self.store.add_pending, requests, self.node_id)
+
+    def discard(self, request_id: str):
+        """แจ้งว่าคำสั่งนี้จัดการในเครื่องแล้ว (ลบออกจากที่เก็บข้อมูลร่วมในรอบถัดไป)"""
+        self._discarded.append(request_id)
+
+    def forward_sample(self, device_id: str, command: str, data: Any):
+        """ส่งต่อคำตอบให้ leader (บันทึกลงที่เก็บข้อมูลร่วมในรอบถัดไป)"""
+        self._samples.append((device_id, command, data))
+
+    async def claim(self, device_id: str, command: str, request_id: Optional[str],
+                    data: Any) -> Optional[Tuple[str, Optional[str]]]:
+        """หาคำสั่งของคำตอบนี้จากที่เก็บข้อมูลร่วม และแจ้ง node เจ้าของคำสั่ง
+
+        Returns:
+            Optional[Tuple[str, Optional[str]]]: (request_id, chat_id) หรือ None ถ้าไม่พบ
+        """
+        row = await asyncio.to_thread(self.store.claim, device_id, command, request_id)
+        if row is None:
+            return None
+        claimed_id, chat_id, owner = row
+        self.claimed += 1
+        if owner != self.node_id:
+            await asyncio.to_thread(self.store.add_completion, owner, claimed_id, device_id, command, data)
+        return claimed_id, chat_id
+
+    async def start(self, on_completion: Callable[[str, str, str, Any], None],
+                    on_leadership: Callable[[bool], Awaitable],
+                    on_documents: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    on_sample: Optional[Callable[[str, str, Any], None]] = None):
+        """เริ่ม task เบื้องหลังของ node
+
+        Args:
+            on_completion: เรียกเมื่อ node อื่นจัดการคำตอบของคำสั่งที่ node นี้ส่ง (request_id, device_id, command, data)
+            on_leadership: coroutine function ที่เรียกเมื่อได้หรือเสีย lease ของ Telegram polling
+            on_documents: เรียกเมื่อ node อื่นเปลี่ยนข้อมูลของ Storage (key -> ค่าล่าสุด, None คือถูกลบ)
+            on_sample: เรียกบน leader สำหรับคำตอบที่ node อื่นส่งต่อมา (device_id, command, data)
+        """
+        self._on_completion = on_completion
+        self._on_leadership = on_leadership
+        self._on_documents = on_documents
+        self._on_sample = on_sample
+        if self._backend is not None:
+            self._document_revision = self._backend.revision
+        await self._renew_lease()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"เริ่ม cluster node {self.node_id} ในกลุ่ม {self.group}")
+
+    async def stop(self):
+        """หยุด task เบื้องหลังและคืน lease"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            if self._discarded:
+                await asyncio.to_thread(self.store.discard, self._discarded)
+                self._discarded = []
+            if self._samples:
+                await asyncio.to_thread(self.store.add_samples, self._samples)
+                self._samples = []
+            if self.is_leader:
+                await asyncio.to_thread(self.store.release_lease, POLLING_LEASE, self.node_id)
+                self.is_leader = False
+        except Exception as e:
+            logger.error(f"เกิดข้อผิดพลาดขณะหยุด cluster node: {e}")
+        await asyncio.to_thread(self.store.close)
+
+    async def _renew_lease(self):
+        try:
+            leader = await asyncio.to_thread(self.store.acquire_lease, POLLING_LEASE, self.node_id, self.lease_ttl)
+        except Exception as e:
+            # ต่ออายุไม่ได้: ถือว่าเสีย lease เพื่อไม่ให้มีสอง node ทำ polling พร้อมกัน
+            logger.error(f"ไม่สามารถต่ออายุ lease ได้: {e}")
+            leader = False
+
+        if leader != self.is_leader:
+            self.is_leader = leader
+            logger.info(f"node {self.node_id} {'ได้รับ' if leader else 'เสีย'} lease ของ Telegram polling")
+            await self._on_leadership(leader)
+
+    async def _run(self):
+        renew_every = max(self.lease_ttl / 3, self.poll_interval)
+        expire_every = max(self.pending_timeout / 4, self.poll_interval)
+        next_renew = next_expire = time.monotonic()
+
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if self._discarded:
+                    discarded, self._discarded = self._discarded, []
+                    await asyncio.to_thread(self.store.discard, discarded)
+
+                for request_id, device_id, command, data in await asyncio.to_thread(
+                        self.store.take_completions, self.node_id):
+                    self.completed_remotely += 1
+                    self._on_completion(request_id, device_id, command, data)
+
+                if self._samples:
+                    samples, self._samples = self._samples, []
+                    await asyncio.to_thread(self.store.add_samples, samples)
+                    self.forwarded += len(samples)
+
+                if self.is_leader and self._on_sample is not None:
+                    for device_id, command, data in await asyncio.to_thread(self.store.take_samples):
+                        self._on_sample(device_id, command, data)
+
+                if self._on_documents is not None:
+                    changes, self._document_revision = await asyncio.to_thread(
+                        self.store.changed_documents, self._document_revision, self.node_id)
+                    if changes:
+                        self._on_documents(changes)
+
+                now = time.monotonic()
+                if now >= next_renew:
+                    next_renew = now + renew_every
+                    await self._renew_lease()
+                if now >= next_expire:
+                    next_expire = now + expire_every
+                    expired = await asyncio.to_thread(self.store.expire, self.pending_timeout)
+                    if expired:
+                        logger.warning(f"ลบคำสั่งที่ไม่ได้รับคำตอบ {expired} รายการออกจากที่เก็บข้อมูลร่วม")
+            except Exception as e:
+                logger.error(f"เกิดข้อผิดพลาดใน cluster node: {e}")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Coalesce module สำหรับรวมคำสั่งเขียนค่าที่ถูกสั่งติดๆ กันให้เหลือค่าสุดท้าย
+
+คำสั่งแรกของแต่ละ key (เช่น (device_id, "relay")) ถูกส่งทันที แล้วเปิดช่วงเวลา window วินาที
+คำสั่งที่ตามมาในช่วงนี้จะแทนที่กันเอง (last-write-wins) และถูกส่งเพียงครั้งเดียวเมื่อหมดช่วงเวลา
+ผู้ใช้จึงได้ผลทันทีเมื่อสั่งครั้งเดียว ส่วนการกดซ้ำรัวๆ ส่งถึงอุปกรณ์ไม่เกินหนึ่งคำสั่งต่อช่วงเวลา
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Window:
+    """ช่วงเวลารวมคำสั่งของ key หนึ่ง"""
+
+    __slots__ = ("timer", "item")
+
+    def __init__(self, timer: asyncio.TimerHandle):
+        self.timer = timer
+        self.item: Any = None
+
+
+class LastWriteWins:
+    """รวมคำสั่งเขียนของ key เดียวกันภายในช่วงเวลาให้เหลือคำสั่งสุดท้าย (ทำงานบน event loop เท่านั้น)"""
+
+    def __init__(self, window: float, flush: Callable[[Hashable, Any], Awaitable[None]]):
+        """
+        Args:
+            window: ช่วงเวลา (วินาที) หลังส่งคำสั่งที่คำสั่งถัดไปของ key เดียวกันจะถูกรวม
+            flush: coroutine function ที่ส่งคำสั่งสุดท้ายของ key เมื่อหมดช่วงเวลา (key, item)
+        """
+        self.window = window
+        self.flush = flush
+        self._windows: Dict[Hashable, _Window] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        # สถิติ
+        self.submitted = 0
+        self.sent = 0
+        self.collapsed = 0
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def submit(self, key: Hashable, item: Any) -> Tuple[bool, Optional[Any]]:
+        """ส่งคำสั่งเข้ามารวม
+
+        Args:
+            key: key ของคำสั่ง (คำสั่งที่ key ตรงกันแทนที่กันได้)
+            item: ข้อมูลของคำสั่ง (ส่งให้ flush เมื่อหมดช่วงเวลา)
+
+        Returns:
+            Tuple[bool, Optional[Any]]: (ผู้เรียกต้องส่งคำสั่งนี้ทันทีหรือไม่, item ที่ถูกแทนที่ถ้ามี)
+        """
+        self.submitted += 1
+        window = self._windows.get(key)
+        if window is None:
+            self._open(key)
+            self.sent += 1
+            return True, None
+
+        replaced, window.item = window.item, item
+        if replaced is not None:
+            self.collapsed += 1
+        return False, replaced
+
+    def _open(self, key: Hashable):
+        loop = asyncio.get_running_loop()
+        self._windows[key] = _Window(loop.call_later(self.window, self._close, key))
+
+    def _close(self, key: Hashable):
+        window = self._windows.pop(key, None)
+        if window is None or window.item is None:
+            return
+        # ส่งคำสั่งสุดท้าย และเปิดช่วงเวลาใหม่เพื่อรวมคำสั่งที่ตามมาอีก
+        self._open(key)
+        self._start_flush(key, window.item)
+
+    def _start_flush(self, key: Hashable, item: Any):
+        self.sent += 1
+        task = asyncio.get_running_loop().create_task(self._run_flush(key, item))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_flush(self, key: Hashable, item: Any):
+        try:
+            await self.flush(key, item)
+        except Exception as e:
+            logger.error(f"ไม่สามารถส่งคำสั่งสุดท้ายของ {key} ได้: {e}")
+
+    async def drain(self):
+        """ส่งคำสั่งที่รออยู่ทั้งหมดทันที แล้วรอจนส่งเสร็จ (เช่น ก่อนปิดโปรแกรม)"""
+        windows, self._windows = self._windows, {}
+        for key, window in windows.items():
+            window.timer.cancel()
+            if window.item is not None:
+                self._start_flush(key, window.item)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """ดึงสถิติของการรวมคำสั่ง"""
+        return {
+            "open_windows": len(self._windows),
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "collapsed": self.collapsed,
+        }
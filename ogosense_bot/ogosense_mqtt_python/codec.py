@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Codec module สำหรับแปลง payload ของ MQTT ระหว่าง bytes กับ JSON
+
+ทำงานกับ bytes ตลอดทาง (ไม่ต้อง decode เป็น str ก่อน parse หรือ encode หลัง serialize)
+ใช้ orjson ถ้าติดตั้งไว้ และใช้ json ของ standard library ถ้าไม่มี
+เลือก codec ได้ด้วย environment variable JSON_CODEC (auto, orjson, json)
+"""
+
+import os
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+Payload = Union[bytes, bytearray, memoryview, str]
+
+# ข้อผิดพลาดเมื่อ parse ไม่ได้ (orjson.JSONDecodeError เป็น subclass ของ ValueError เช่นกัน)
+DecodeError = ValueError
+
+
+class JSONCodec(ABC):
+    """Codec สำหรับแปลง JSON กับ bytes"""
+
+    name = "base"
+
+    @abstractmethod
+    def loads(self, data: Payload) -> Any:
+        """แปลง payload เป็นอ็อบเจกต์ Python
+
+        Raises:
+            DecodeError: ถ้า payload ไม่ใช่ JSON ที่ถูกต้อง
+        """
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        """แปลงอ็อบเจกต์เป็น JSON แบบ UTF-8 (ไม่มีช่องว่าง)"""
+
+
+class StdlibCodec(JSONCodec):
+    """Codec ที่ใช้ json ของ standard library"""
+
+    name = "json"
+
+    def __init__(self):
+        self._decode = json.JSONDecoder().decode
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+    def loads(self, data: Payload) -> Any:
+        # payload ของ MQTT เป็น UTF-8 เสมอ จึง decode ตรงๆ โดยไม่ต้องตรวจ encoding แบบ json.loads
+        if not isinstance(data, str):
+            data = str(data, "utf-8")
+        return self._decode(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encode(obj).encode("utf-8")
+
+
+class OrjsonCodec(JSONCodec):
+    """Codec ที่ใช้ orjson (รับ bytes และ memoryview ได้โดยตรง)"""
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("ไม่ได้ติดตั้ง orjson")
+        # ใช้ฟังก์ชันของ orjson แทน loads() ของคลาสโดยตรง ไม่ต้องผ่าน method call อีกชั้น
+        self.loads = orjson.loads
+        self._dumps = orjson.dumps
+
+    def loads(self, data: Payload) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._dumps(obj)
+
+
+# registry ของ codec ตามชื่อ
+CODECS: Dict[str, Callable[[], JSONCodec]] = {
+    "json": StdlibCodec,
+    "orjson": OrjsonCodec,
+}
+
+
+def register_codec(name: str, factory: Callable[[], JSONCodec]):
+    """เพิ่ม codec ใหม่ให้เลือกใช้ได้ผ่าน get_codec() หรือ JSON_CODEC
+
+    Args:
+        name: ชื่อ codec
+        factory: ฟังก์ชันที่สร้าง JSONCodec
+    """
+    CODECS[name] = factory
+
+
+def get_codec(name: str = None) -> JSONCodec:
+    """สร้าง codec ตามชื่อ
+
+    Args:
+        name: ชื่อ codec หรือ auto (ค่าเริ่มต้นอ่านจาก JSON_CODEC)
+
+    Returns:
+        JSONCodec: codec ที่เลือก (auto จะเลือก orjson ถ้าติดตั้งไว้)
+    """
+    name = name or os.getenv("JSON_CODEC", "auto")
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    factory = CODECS.get(name)
+    if factory is None:
+        raise ValueError(f"ไม่รู้จัก JSON codec: {name}")
+    return factory()
+
+
+# codec ที่ใช้ทั้งระบบ
+codec = get_codec()
+logger.debug(f"ใช้ JSON codec: {codec.name}")
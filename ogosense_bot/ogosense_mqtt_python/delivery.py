@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""Delivery module สำหรับส่งข้อความไปยัง Telegram แบบหลาย worker พร้อมจำกัดอัตราการส่ง"""
+
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+from datetime import timedelta
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from health import CircuitBreaker
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# ขีดจำกัดของ Telegram Bot API
+TELEGRAM_GLOBAL_RATE = 30.0         # ข้อความต่อวินาทีทั้งบอท
+TELEGRAM_CHAT_RATE = 1.0            # ข้อความต่อวินาทีต่อแชทส่วนตัว
+TELEGRAM_GROUP_RATE = 20.0 / 60.0   # ข้อความต่อวินาทีต่อกลุ่ม
+
+# ลำดับความสำคัญของแชทใน ready queue (ค่าน้อยส่งก่อน)
+PRIORITY_DIRECT = 0   # คำตอบของคำสั่งที่ผู้ใช้สั่งเอง
+PRIORITY_FANOUT = 1   # ข้อความกระจายไปยังผู้ติดตามอุปกรณ์
+
+
+class TokenBucket:
+    """Token bucket สำหรับจำกัดอัตราการส่ง"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        """
+        Args:
+            rate: จำนวน token ที่เติมต่อวินาที
+            capacity: จำนวน token สูงสุด (ขนาด burst)
+            now: เวลาปัจจุบันของ event loop
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self, now: float) -> float:
+        """ใช้ token หนึ่งอัน
+
+        Returns:
+            float: 0 ถ้าได้ token, หรือจำนวนวินาทีที่ต้องรอก่อนจะมี token
+        """
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        """ตรวจสอบว่า bucket เต็มแล้วหรือไม่ (ไม่มีการใช้งานค้างอยู่)"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class TelegramDelivery:
+    """ระบบส่งข้อความ Telegram แบบหลาย worker
+
+    ข้อความถูกเก็บในคิวแยกตามแชท แต่ละแชทถูกประมวลผลโดย worker ได้ทีละตัว
+    (รักษาลำดับข้อความในแชท) แชทที่ถูกจำกัดอัตรา ได้รับ RetryAfter หรือส่งไม่สำเร็จ
+    จะถูกเลื่อนไปไว้ใน delay queue โดยไม่บล็อก worker ทำให้แชทอื่นยังส่งได้ตามปกติ
+    ready queue เรียงตามความสำคัญของข้อความแรกในคิวของแชท ข้อความกระจายถึงผู้ติดตามจำนวนมาก
+    (submit_many) จึงไม่ทำให้คำตอบของคำสั่งที่ผู้ใช้สั่งเองต้องรอ
+    """
+
+    def __init__(self, send_func: Callable[[str, str], Awaitable], workers: int = 4,
+                 global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 group_rate: float = TELEGRAM_GROUP_RATE, chat_burst: float = 3.0,
+                 max_retries: int = 3, retry_delay: float = 2.0, breaker: Optional[CircuitBreaker] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            send_func: coroutine function สำหรับส่งข้อความ (chat_id, text) ต้อง raise เมื่อส่งไม่สำเร็จ
+            workers: จำนวน worker task
+            global_rate: จำนวนข้อความต่อวินาทีสูงสุดทั้งบอท
+            chat_rate: จำนวนข้อความต่อวินาทีสูงสุดต่อแชทส่วนตัว
+            group_rate: จำนวนข้อความต่อวินาทีสูงสุดต่อกลุ่ม (chat_id ติดลบ)
+            chat_burst: จำนวนข้อความที่ส่งติดกันได้ทันทีต่อแชท
+            max_retries: จำนวนครั้งสูงสุดที่พยายามส่งข้อความหนึ่งข้อความ
+            retry_delay: เวลารอพื้นฐาน (วินาที) ก่อนส่งใหม่ เพิ่มขึ้นตามจำนวนครั้งที่ล้มเหลว
+            breaker: circuit breaker ของการส่งข้อความ (รายงานผลการส่งทุกครั้ง และพักการส่งเมื่อ open)
+            metrics: ทะเบียนตัวชี้วัด สำหรับเวลาที่ใช้ส่งข้อความ จำนวนที่ลองใหม่และที่ส่งไม่สำเร็จ
+        """
+        self.send_func = send_func
+        self.num_workers = max(1, workers)
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.breaker = breaker
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._workers: List[asyncio.Task] = []
+        self._global_bucket: Optional[TokenBucket] = None
+
+        # คิวข้อความแยกตามแชท: แต่ละรายการคือ [text, attempts, priority]
+        self._chats: Dict[str, Deque[list]] = {}
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        # แชทที่อยู่ใน ready queue, delay queue หรือกำลังถูกส่ง
+        self._active = set()
+        # delay queue: แชทที่ถูกเลื่อนเวลาส่ง
+        self._delayed: Dict[str, asyncio.TimerHandle] = {}
+
+        # สถิติ
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.deferred = 0
+        self.held = 0
+
+        # ตัวชี้วัด: child ของแต่ละผลลัพธ์ถูกผูกไว้ล่วงหน้า ตัวนับอ่านจากสถิติด้านบนตอน scrape
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        send_seconds = self.metrics.histogram(
+            "ogosense_telegram_send_seconds", "เวลาที่ใช้เรียก Bot API ส่งข้อความหนึ่งครั้ง แยกตามผลลัพธ์", ("result",))
+        self._send_ok = send_seconds.labels("ok")
+        self._send_rate_limited = send_seconds.labels("rate_limited")
+        self._send_rejected = send_seconds.labels("rejected")
+        self._send_error = send_seconds.labels("error")
+        self.metrics.counter("ogosense_telegram_retries_total",
+                             "จำนวนครั้งที่ข้อความ Telegram ถูกส่งใหม่หลังส่งไม่สำเร็จ").set_function(lambda: self.retried)
+        self.metrics.counter("ogosense_telegram_rate_limited_total",
+                             "จำนวนครั้งที่ Telegram ตอบ RetryAfter").set_function(lambda: self.rate_limited)
+
+    async def start(self):
+        """เริ่ม worker tasks"""
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.PriorityQueue()
+        self._global_bucket = TokenBucket(self.global_rate, self.global_rate, self._loop.time())
+
+        # แชทที่มีข้อความค้างอยู่ก่อนเริ่ม
+        self._active = set(self._chats)
+        for chat_id in self._chats:
+            self._enqueue(chat_id)
+
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.num_workers)]
+        logger.info(f"เริ่มระบบส่งข้อความ Telegram ด้วย {self.num_workers} workers")
+
+    async def stop(self):
+        """หยุด worker tasks และยกเลิกการเลื่อนเวลาที่ค้างอยู่"""
+        for handle in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+        remaining = self.pending()
+        if remaining:
+            logger.warning(f"หยุดระบบส่งข้อความ Telegram โดยมีข้อความค้างอยู่ {remaining} ข้อความ")
+
+    def submit(self, chat_id: str, text: str, priority: int = PRIORITY_DIRECT):
+        """เพิ่มข้อความเข้าคิวของแชท (เรียกจาก event loop เท่านั้น)
+
+        Args:
+            chat_id: Chat ID ปลายทาง
+            text: ข้อความที่จะส่ง
+            priority: ความสำคัญของข้อความ (ค่าน้อยส่งก่อน)
+        """
+        chat_id = str(chat_id)
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = deque()
+        queue.append([text, 0, priority])
+
+        if chat_id not in self._active and self._ready is not None:
+            self._active.add(chat_id)
+            self._enqueue(chat_id)
+
+    def submit_many(self, chat_ids: Iterable[str], text: str, priority: int = PRIORITY_FANOUT):
+        """กระจายข้อความเดียวกันให้หลายแชท (ข้อความเดียวกันถูกใช้ร่วมกัน ไม่คัดลอก)
+
+        แต่ละแชทยังถูกจำกัดอัตราแยกกัน และส่งพร้อมกันได้ตามจำนวน worker และ global_rate
+
+        Args:
+            chat_ids: รายการ Chat ID ปลายทาง
+            text: ข้อความที่จะส่ง
+            priority: ความสำคัญของข้อความ (ค่าเริ่มต้นส่งหลังคำตอบของคำสั่งที่ผู้ใช้สั่งเอง)
+        """
+        for chat_id in chat_ids:
+            self.submit(chat_id, text, priority)
+
+    def _enqueue(self, chat_id: str):
+        """ใส่แชทเข้า ready queue ตามความสำคัญของข้อความแรกในคิว"""
+        queue = self._chats.get(chat_id)
+        priority = queue[0][2] if queue else PRIORITY_DIRECT
+        self._ready.put_nowait((priority, next(self._sequence), chat_id))
+
+    def pending(self) -> int:
+        """จำนวนข้อความที่ยังไม่ได้ส่ง"""
+        return sum(len(queue) for queue in self._chats.values())
+
+    def stats(self) -> Dict[str, int]:
+        """ดึงสถิติของระบบส่งข้อความ"""
+        return {
+            "pending": self.pending(),
+            "chats": len(self._chats),
+            "delayed_chats": len(self._delayed),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+            "deferred": self.deferred,
+            "held": self.held,
+        }
+
+    def _chat_bucket(self, chat_id: str, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if chat_id.startswith("-") else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    def _defer(self, chat_id: str, delay: float):
+        """เลื่อนการส่งของแชทนี้ไปไว้ใน delay queue"""
+        self.deferred += 1
+        self._delayed[chat_id] = self._loop.call_later(delay, self._wake, chat_id)
+
+    def _wake(self, chat_id: str):
+        """นำแชทออกจาก delay queue กลับเข้า ready queue"""
+        self._delayed.pop(chat_id, None)
+        self._enqueue(chat_id)
+
+    def _release(self, chat_id: str):
+        """ส่งแชทกลับเข้า ready queue ถ้ายังมีข้อความ หรือเลิกติดตามถ้าไม่มีแล้ว"""
+        queue = self._chats.get(chat_id)
+        if queue:
+            self._enqueue(chat_id)
+            return
+
+        self._chats.pop(chat_id, None)
+        self._active.discard(chat_id)
+
+        # ลบ bucket ของแชทที่ไม่มีการใช้งานค้างอยู่ เพื่อไม่ให้ใช้หน่วยความจำเพิ่มขึ้นเรื่อยๆ
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is not None and bucket.is_full(self._loop.time()):
+            del self._chat_buckets[chat_id]
+
+    async def _worker(self, worker_id: int):
+        """worker ที่ดึงแชทจาก ready queue แล้วส่งข้อความแรกในคิวของแชทนั้น"""
+        while True:
+            _, _, chat_id = await self._ready.get()
+            try:
+                await self._serve(chat_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"worker {worker_id} เกิดข้อผิดพลาดในการส่งข้อความ: {e}")
+                self._release(chat_id)
+
+    async def _serve(self, chat_id: str):
+        """ส่งข้อความแรกในคิวของแชท"""
+        queue = self._chats.get(chat_id)
+        if not queue:
+            self._release(chat_id)
+            return
+
+        # ขีดจำกัดต่อแชท: เลื่อนเฉพาะแชทนี้
+        wait = self._chat_bucket(chat_id, self._loop.time()).acquire(self._loop.time())
+        if wait > 0:
+            self._defer(chat_id, wait)
+            return
+
+        # ขีดจำกัดรวมทั้งบอท: ทุก worker ต้องรอเหมือนกัน
+        wait = self._global_bucket.acquire(self._loop.time())
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self._global_bucket.acquire(self._loop.time())
+
+        # Telegram ไม่ตอบสนอง: พักแชทนี้ไว้โดยไม่นับเป็นความพยายามส่ง
+        # (เมื่อ breaker เป็น half_open จะมีเพียงหนึ่งข้อความที่ถูกส่งเป็น probe)
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            self.held += 1
+            self._defer(chat_id, max(breaker.retry_in(), 0.1))
+            return
+
+        item = queue[0]
+        started = time.perf_counter()
+        try:
+            await self.send_func(chat_id, item[0])
+        except RetryAfter as e:
+            self._send_rate_limited.observe(time.perf_counter() - started)
+            # Telegram ตอบกลับได้ ถือว่าการเชื่อมต่อปกติ
+            if breaker is not None:
+                breaker.record_success()
+            # Telegram ขอให้รอ: เลื่อนเฉพาะแชทนี้ โดยไม่นับเป็นความล้มเหลว
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            self.rate_limited += 1
+            logger.warning(f"Telegram จำกัดอัตราการส่งไปยัง chat ID {chat_id} รอ {retry_after} วินาที")
+            self._defer(chat_id, float(retry_after))
+            return
+        except (Forbidden, BadRequest) as e:
+            self._send_rejected.observe(time.perf_counter() - started)
+            # ข้อผิดพลาดถาวร (เช่น ถูกบล็อก หรือไม่พบแชท) ไม่ต้องลองใหม่
+            if breaker is not None:
+                breaker.record_success()
+            queue.popleft()
+            self.failed += 1
+            logger.error(f"ไม่สามารถส่งข้อความไปยัง chat ID {chat_id} ได้: {e}")
+            self._release(chat_id)
+            return
+        except Exception as e:
+            self._send_error.observe(time.perf_counter() - started)
+            if breaker is not None:
+                breaker.record_failure()
+            item[1] += 1
+            if item[1] >= self.max_retries:
+                queue.popleft()
+                self.failed += 1
+                logger.error(f"ไม่สามารถส่งข้อความไปยัง Telegram ได้หลังจากลอง {self.max_retries} ครั้ง: {e}")
+                self._release(chat_id)
+            else:
+                self.retried += 1
+                logger.warning(f"ไม่สามารถส่งข้อความไปยัง Telegram ได้ (ครั้งที่ {item[1]}/{self.max_retries}): {e}")
+                self._defer(chat_id, self.retry_delay * item[1])
+            return
+
+        self._send_ok.observe(time.perf_counter() - started)
+        if breaker is not None:
+            breaker.record_success()
+        queue.popleft()
+        self.sent += 1
+        logger.info(f"ส่งข้อความจากคิวไปยัง Telegram: {item[0][:100]}...")
+        self._release(chat_id)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Device state module สำหรับเก็บสถานะล่าสุดของอุปกรณ์ (digital twin) จากคำตอบ MQTT"""
+
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ฟิลด์ในคำตอบของคำสั่งตั้งค่า -> ฟิลด์ในแคช (ชื่อเดียวกับคำตอบของ /info)
+RESPONSE_FIELDS = {
+    "settemp": {"low": "temp_low", "high": "temp_high"},
+    "sethum": {"low": "humidity_low", "high": "humidity_high"},
+    "setmode": {"mode": "mode"},
+    "setoption": {"option": "option"},
+    "relay": {"relay": "relay"},
+    "setname": {"name": "name"},
+    "setchannel": {"channel_id": "thingspeak_channel"},
+}
+
+# ฟิลด์ที่ไม่น่าเชื่อถืออีกต่อไปเมื่อส่งคำสั่ง (ในโหมด auto การตั้งค่าขอบเขตอาจทำให้ relay เปลี่ยน)
+INVALIDATED_FIELDS = {
+    "settemp": ("temp_low", "temp_high", "relay"),
+    "sethum": ("humidity_low", "humidity_high", "relay"),
+    "setmode": ("mode", "relay"),
+    "setoption": ("option", "relay"),
+    "relay": ("relay",),
+    "setname": ("name",),
+    "setchannel": ("thingspeak_channel",),
+}
+
+
+class DeviceState:
+    """สถานะล่าสุดของอุปกรณ์หนึ่งตัว"""
+
+    __slots__ = ("device_id", "fields", "status_keys", "last_seen", "last_seen_wall", "online")
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        # ฟิลด์ -> (ค่า, เวลาที่ได้รับแบบ monotonic)
+        self.fields: Dict[str, Tuple[Any, float]] = {}
+        # ฟิลด์ที่อยู่ในคำตอบ status ล่าสุด
+        self.status_keys: Tuple[str, ...] = ()
+        self.last_seen: Optional[float] = None
+        self.last_seen_wall: Optional[float] = None
+        self.online: Optional[bool] = None
+
+
+class DeviceStateCache:
+    """แคชสถานะของอุปกรณ์ทุกตัว สร้างจากคำตอบ status/info และคำสั่งตั้งค่า
+
+    เมื่อส่งคำสั่งที่เปลี่ยนสถานะ ฟิลด์ที่เกี่ยวข้องจะถูกลบออกจากแคช
+    /status จะตอบจากแคชได้ก็ต่อเมื่อทุกฟิลด์ของคำตอบ status ล่าสุดยังอยู่และอายุไม่เกิน ttl
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        """
+        Args:
+            ttl: อายุสูงสุด (วินาที) ของข้อมูลที่ยังใช้ตอบ /status ได้
+        """
+        self.ttl = ttl
+        self._devices: Dict[str, DeviceState] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def _device(self, device_id: str) -> DeviceState:
+        state = self._devices.get(device_id)
+        if state is None:
+            state = self._devices[device_id] = DeviceState(device_id)
+        return state
+
+    def get(self, device_id: str) -> Optional[DeviceState]:
+        """ดึงสถานะของอุปกรณ์ (None ถ้ายังไม่เคยได้รับข้อมูล)"""
+        return self._devices.get(device_id)
+
+    def update_from_response(self, device_id: str, command: str, data: Dict) -> Optional[DeviceState]:
+        """อัปเดตแคชจากคำตอบ MQTT ของอุปกรณ์
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่งที่ตอบกลับ
+            data: ข้อมูล JSON ทั้งหมดของคำตอบ
+
+        Returns:
+            Optional[DeviceState]: สถานะล่าสุดของอุปกรณ์ หรือ None ถ้าคำตอบไม่มีข้อมูลสถานะ
+        """
+        now = time.monotonic()
+        state = self._device(device_id)
+        state.last_seen = now
+        state.last_seen_wall = time.time()
+        state.online = True
+
+        device_data = data.get("data")
+        if not data.get("success", False) or not isinstance(device_data, dict):
+            return state
+
+        fields = state.fields
+        if command == "status" or command == "info":
+            for key, value in device_data.items():
+                fields[key] = (value, now)
+            if command == "status":
+                state.status_keys = tuple(device_data)
+        else:
+            mapping = RESPONSE_FIELDS.get(command)
+            if mapping:
+                for key, field in mapping.items():
+                    if key in device_data:
+                        fields[field] = (device_data[key], now)
+
+        return state
+
+    def invalidate(self, device_id: str, command: str):
+        """ลบฟิลด์ที่อาจเปลี่ยนไปหลังจากส่งคำสั่งนี้
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่งที่ส่ง
+        """
+        state = self._devices.get(device_id)
+        if state is None:
+            return
+        for field in INVALIDATED_FIELDS.get(command, ()):
+            state.fields.pop(field, None)
+
+    def set_online(self, device_id: str, online: bool):
+        """บันทึกสถานะ online/offline ของอุปกรณ์ (จากข้อความ LWT)"""
+        self._device(device_id).online = online
+
+    def get_status(self, device_id: str, max_age: Optional[float] = None) -> Optional[Tuple[Dict, float]]:
+        """ดึงข้อมูล status จากแคชถ้ายังใหม่พอ
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            max_age: อายุสูงสุดที่ยอมรับ (ค่าเริ่มต้นคือ ttl)
+
+        Returns:
+            Optional[Tuple[Dict, float]]: (ข้อมูล status, อายุของข้อมูลที่เก่าที่สุดเป็นวินาที) หรือ None ถ้าต้องถามอุปกรณ์
+        """
+        state = self._devices.get(device_id)
+        if state is None or not state.status_keys:
+            self.misses += 1
+            return None
+
+        if max_age is None:
+            max_age = self.ttl
+        now = time.monotonic()
+        data = {}
+        oldest = now
+        fields = state.fields
+        for key in state.status_keys:
+            entry = fields.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            data[key] = entry[0]
+            if entry[1] < oldest:
+                oldest = entry[1]
+
+        age = now - oldest
+        if age > max_age:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data, age
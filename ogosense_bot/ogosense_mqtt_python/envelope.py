@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Envelope module สำหรับห่อข้อความ MQTT โดยไม่คัดลอก payload และ parse JSON เมื่อจำเป็นเท่านั้น"""
+
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+from codec import codec, DecodeError
+
+logger = logging.getLogger(__name__)
+
+# ความยาวสูงสุดของ payload ที่แสดงใน log
+PREVIEW_BYTES = 200
+
+_NOT_PARSED = object()
+
+
+class MessageEnvelope:
+    """ข้อความ MQTT หนึ่งข้อความ
+
+    เก็บ topic และ memoryview ของ payload (ไม่คัดลอก) JSON จะถูก parse ครั้งแรกที่มีการเข้าถึงข้อมูล
+    ข้อความที่ไม่มี handler สนใจหรือเป็นข้อความซ้ำจึงไม่เสียเวลา parse เลย
+    """
+
+    __slots__ = ("topic", "payload", "received_at", "dup", "_data")
+
+    def __init__(self, topic: str, payload: Union[bytes, bytearray, memoryview], received_at: float = None,
+                 dup: bool = False):
+        """
+        Args:
+            topic: MQTT topic
+            payload: payload ตามที่ได้รับจาก broker
+            received_at: เวลาที่ได้รับแบบ monotonic (ค่าเริ่มต้นคือเวลาปัจจุบัน)
+            dup: DUP flag ของ PUBLISH (broker ส่งข้อความ QoS 1 นี้ซ้ำ)
+        """
+        self.topic = topic
+        self.dup = bool(dup)
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self.payload = payload if isinstance(payload, memoryview) else memoryview(payload)
+        self.received_at = received_at if received_at is not None else time.monotonic()
+        self._data = _NOT_PARSED
+
+    @property
+    def parsed(self) -> bool:
+        """True ถ้า payload ถูก parse แล้ว"""
+        return self._data is not _NOT_PARSED
+
+    @property
+    def data(self) -> Any:
+        """ข้อมูล JSON ของ payload (parse ครั้งแรกที่เรียก)
+
+        Raises:
+            DecodeError: ถ้า payload ไม่ใช่ JSON ที่ถูกต้อง
+        """
+        data = self._data
+        if data is _NOT_PARSED:
+            data = self._data = codec.loads(self.payload)
+        return data
+
+    def try_data(self) -> Optional[Any]:
+        """เหมือน data แต่คืน None ถ้า parse ไม่ได้"""
+        try:
+            return self.data
+        except DecodeError:
+            return None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """ดึงค่าจาก JSON object ของ payload"""
+        data = self.data
+        return data.get(key, default) if isinstance(data, dict) else default
+
+    def __len__(self) -> int:
+        return self.payload.nbytes
+
+    def raw(self) -> bytes:
+        """คัดลอก payload เป็น bytes"""
+        return self.payload.tobytes()
+
+    def preview(self, limit: int = PREVIEW_BYTES) -> str:
+        """payload บางส่วนสำหรับแสดงใน log"""
+        text = bytes(self.payload[:limit]).decode("utf-8", "replace")
+        return text + "..." if self.payload.nbytes > limit else text
+
+    def __repr__(self) -> str:
+        return f"MessageEnvelope(topic={self.topic!r}, payload={self.preview()!r})"
+
+
+class DuplicateFilter:
+    """ตรวจจับข้อความที่ถูกส่งซ้ำจาก QoS 1 (topic และ payload เหมือนกันทุก byte) ภายในช่วงเวลาที่กำหนด
+
+    payload ที่เหมือนกันไม่ได้แปลว่าเป็นข้อความซ้ำเสมอ: firmware ที่ไม่ส่ง request_id กลับมาจะตอบ /status
+    หรือ /relay 1 สองครั้งติดกันด้วย payload เดียวกัน ข้อความที่เหมือนกันจึงถูกทิ้งเฉพาะเมื่อ
+    - มี DUP flag (broker ส่งซ้ำเพราะไม่ได้รับ PUBACK) หรือ
+    - payload มี request_id (คำตอบของคำสั่งต่างครั้งกันจะมี request_id ต่างกัน)
+    payload จะถูก parse เฉพาะเมื่อเหมือนกับข้อความก่อนหน้าและไม่มี DUP flag เท่านั้น
+    ทำงานบน event loop เท่านั้น (ไม่ thread-safe)
+    """
+
+    def __init__(self, window: float = 2.0, capacity: int = 4096):
+        """
+        Args:
+            window: ช่วงเวลา (วินาที) ที่ถือว่าข้อความเหมือนกันเป็นข้อความซ้ำ (0 คือไม่ตรวจ)
+            capacity: จำนวนข้อความล่าสุดที่จำไว้สูงสุด
+        """
+        self.window = window
+        self.capacity = max(1, capacity)
+        self._seen: "OrderedDict[tuple, float]" = OrderedDict()
+        self.duplicates = 0
+
+    def is_duplicate(self, envelope: MessageEnvelope) -> bool:
+        """ตรวจสอบว่าข้อความนี้ซ้ำกับข้อความที่ได้รับก่อนหน้าภายใน window หรือไม่ แล้วบันทึกไว้"""
+        if self.window <= 0:
+            return False
+
+        now = envelope.received_at
+        seen = self._seen
+
+        # ลบข้อความที่เก่ากว่า window (เรียงตามเวลาที่ได้รับ)
+        cutoff = now - self.window
+        while seen:
+            oldest_key = next(iter(seen))
+            if seen[oldest_key] >= cutoff:
+                break
+            del seen[oldest_key]
+
+        payload = envelope.payload
+        key = (envelope.topic, payload if payload.readonly else payload.tobytes())
+        if key in seen:
+            data = None if envelope.dup else envelope.try_data()
+            if envelope.dup or (isinstance(data, dict) and data.get("request_id") is not None):
+                self.duplicates += 1
+                return True
+            # คำตอบใหม่ที่บังเอิญเหมือนเดิม: เริ่มนับ window ใหม่จากข้อความนี้
+            del seen[key]
+
+        seen[key] = now
+        if len(seen) > self.capacity:
+            seen.popitem(last=False)
+        return False
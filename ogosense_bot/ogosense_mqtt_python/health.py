@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Health module สำหรับติดตามสุขภาพของการเชื่อมต่อจากผลการใช้งานจริง
+
+แต่ละส่วน (MQTT, การส่งข้อความ Telegram, การรับ update) มี CircuitBreaker ของตัวเอง
+ผลสำเร็จ/ล้มเหลวของการใช้งานจริงถูกรายงานเข้า HealthMonitor ซึ่งปลุก task ที่ดูแลการเชื่อมต่อทันที
+แทนการตรวจแบบตั้งเวลาแล้วรีสตาร์ททุกอย่าง
+"""
+
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker ของหนึ่งส่วนของระบบ
+
+    - closed: ทำงานปกติ นับความล้มเหลวติดกัน เมื่อถึง failure_threshold จะเปลี่ยนเป็น open
+    - open: ไม่อนุญาตให้ใช้งานจนกว่าจะครบ reset_timeout แล้วเปลี่ยนเป็น half_open
+    - half_open: อนุญาตให้ทดสอบ (probe) ได้ครั้งละหนึ่งครั้ง สำเร็จจะกลับเป็น closed
+      ล้มเหลวจะกลับเป็น open โดยเพิ่มเวลารอเป็นสองเท่า (ไม่เกิน max_reset_timeout)
+
+    ทำงานบน event loop เท่านั้น (ไม่ thread-safe)
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 5.0,
+                 max_reset_timeout: float = 300.0, on_change: Callable[["CircuitBreaker"], None] = None):
+        """
+        Args:
+            name: ชื่อส่วนของระบบ
+            failure_threshold: จำนวนความล้มเหลวติดกันที่ทำให้เปลี่ยนเป็น open
+            reset_timeout: เวลารอ (วินาที) ก่อนทดสอบครั้งแรกหลังเปลี่ยนเป็น open
+            max_reset_timeout: เวลารอสูงสุด (วินาที) เมื่อทดสอบล้มเหลวติดกัน
+            on_change: ฟังก์ชันที่เรียกเมื่อสถานะเปลี่ยน
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.on_change = on_change
+
+        self._state = CLOSED
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started: Optional[float] = None
+
+        # สถิติ
+        self.successes_total = 0
+        self.failures_total = 0
+        self.opened_total = 0
+        self.last_success: Optional[float] = None
+        self.last_failure: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        """สถานะปัจจุบัน (open จะเปลี่ยนเป็น half_open เมื่อครบเวลารอ)"""
+        if self._state == OPEN and time.monotonic() >= self.opened_at + self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == CLOSED
+
+    def allow(self) -> bool:
+        """ตรวจสอบว่าใช้งานได้หรือไม่ ใน half_open จะอนุญาตครั้งละหนึ่ง probe
+
+        Returns:
+            bool: True ถ้าใช้งานได้ (ต้องรายงานผลด้วย record_success/record_failure)
+        """
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == OPEN:
+            return False
+
+        # half_open: probe ที่ไม่ได้รายงานผลภายใน reset_timeout ถือว่าหายไป ให้ทดสอบใหม่ได้
+        now = time.monotonic()
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+
+    def retry_in(self) -> float:
+        """เวลา (วินาที) ก่อนจะลองใช้งานได้อีกครั้ง (0 ถ้าใช้งานได้ทันที)"""
+        state = self.state
+        if state == CLOSED:
+            return 0.0
+        if state == OPEN:
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+        return min(1.0, self.reset_timeout)
+
+    def record_success(self):
+        """รายงานว่าการใช้งานสำเร็จ"""
+        self.successes_total += 1
+        self.last_success = time.monotonic()
+        self.failures = 0
+        self._probe_started = None
+        if self._state != CLOSED:
+            self.reset_timeout = self.base_reset_timeout
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        """รายงานว่าการใช้งานล้มเหลว"""
+        now = time.monotonic()
+        self.failures_total += 1
+        self.last_failure = now
+        self.failures += 1
+        self._probe_started = None
+
+        state = self.state
+        if state == HALF_OPEN:
+            # probe ล้มเหลว: รอนานขึ้นก่อนทดสอบครั้งถัดไป
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open(now)
+        elif state == CLOSED and self.failures >= self.failure_threshold:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.opened_at = now
+        self.opened_total += 1
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        if state == self._state:
+            return
+        previous, self._state = self._state, state
+        if state == OPEN:
+            logger.warning(f"{self.name}: {previous} -> open (ทดสอบใหม่ใน {self.reset_timeout:g} วินาที)")
+        else:
+            logger.info(f"{self.name}: {previous} -> {state}")
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def stats(self) -> Dict[str, object]:
+        """ดึงสถิติของ breaker"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "successes_total": self.successes_total,
+            "failures_total": self.failures_total,
+            "opened_total": self.opened_total,
+            "reset_timeout": self.reset_timeout,
+        }
+
+
+class HealthMonitor:
+    """รวม circuit breaker ของทุกส่วน และปลุก task ที่ดูแลการเชื่อมต่อเมื่อมีเหตุการณ์"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 5.0, max_reset_timeout: float = 300.0):
+        """
+        Args:
+            failure_threshold: ค่าเริ่มต้นของ failure_threshold ของ breaker ที่สร้างด้วย breaker()
+            reset_timeout: ค่าเริ่มต้นของ reset_timeout
+            max_reset_timeout: ค่าเริ่มต้นของ max_reset_timeout
+        """
+        self.defaults = {
+            "failure_threshold": failure_threshold,
+            "reset_timeout": reset_timeout,
+            "max_reset_timeout": max_reset_timeout,
+        }
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """ผูกกับ event loop (ต้องเรียกก่อน report_threadsafe() และ wait())"""
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    def breaker(self, name: str, **kwargs) -> CircuitBreaker:
+        """ดึง breaker ตามชื่อ (สร้างใหม่ถ้ายังไม่มี)
+
+        Args:
+            name: ชื่อส่วนของระบบ
+            **kwargs: ค่าที่ต่างจากค่าเริ่มต้น (failure_threshold, reset_timeout, max_reset_timeout)
+        """
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            options = dict(self.defaults, **kwargs)
+            breaker = self.breakers[name] = CircuitBreaker(name, on_change=self._on_change, **options)
+        return breaker
+
+    def report(self, name: str, ok: bool):
+        """รายงานผลการใช้งานจริงของส่วนหนึ่ง (เรียกจาก event loop)"""
+        breaker = self.breaker(name)
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def report_threadsafe(self, name: str, ok: bool):
+        """รายงานผลจาก thread อื่น (เช่น network thread ของ paho)"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.report, name, ok)
+
+    def wake(self):
+        """ปลุก task ที่รอใน wait()"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait(self, timeout: float):
+        """รอจนมีเหตุการณ์หรือครบเวลา"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def next_probe_in(self) -> Optional[float]:
+        """เวลา (วินาที) จนถึงการทดสอบครั้งถัดไปของ breaker ที่ไม่ปกติ (None ถ้าทุกส่วนปกติ)"""
+        delays = [breaker.retry_in() for breaker in self.breakers.values() if not breaker.is_closed]
+        return min(delays) if delays else None
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """ดึงสถิติของทุก breaker"""
+        return {name: breaker.stats() for name, breaker in self.breakers.items()}
+
+    def _on_change(self, breaker: CircuitBreaker):
+        self.wake()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""HTTP server module สำหรับ HTTP/1.1 server ขนาดเล็กบน asyncio (ไม่ต้องพึ่งไลบรารีภายนอก)
+
+รองรับ keep-alive, Content-Length และการกำหนด route ตาม path แบบตรงตัวหรือตาม prefix
+"""
+
+import json
+import asyncio
+import logging
+from urllib.parse import parse_qsl, urlsplit
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    411: "Length Required",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+    503: "Service Unavailable",
+}
+
+
+class HTTPRequest:
+    """คำขอ HTTP หนึ่งคำขอ"""
+
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, path: str, query: Dict[str, str], headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        # ชื่อ header เป็นตัวพิมพ์เล็กทั้งหมด
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> Any:
+        """แปลง body เป็น JSON
+
+        Raises:
+            ValueError: ถ้า body ไม่ใช่ JSON ที่ถูกต้อง
+        """
+        return json.loads(self.body or b"null")
+
+    def form(self) -> Dict[str, str]:
+        """แปลง body แบบ application/x-www-form-urlencoded เป็น dict"""
+        return dict(parse_qsl(self.body.decode("utf-8"), keep_blank_values=True))
+
+
+class HTTPResponse:
+    """คำตอบ HTTP"""
+
+    __slots__ = ("status", "body", "content_type", "headers")
+
+    def __init__(self, status: int = 200, body: bytes = b"", content_type: str = "text/plain; charset=utf-8",
+                 headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body if isinstance(body, bytes) else str(body).encode("utf-8")
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    @classmethod
+    def json(cls, data: Any, status: int = 200) -> "HTTPResponse":
+        """สร้างคำตอบแบบ JSON"""
+        return cls(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    @classmethod
+    def error(cls, status: int, message: str = None) -> "HTTPResponse":
+        """สร้างคำตอบข้อผิดพลาดแบบข้อความ"""
+        return cls(status, (message or REASONS.get(status, "Error")).encode("utf-8"))
+
+
+Handler = Callable[[HTTPRequest], Awaitable[HTTPResponse]]
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class HTTPServer:
+    """HTTP/1.1 server ขนาดเล็กบน asyncio"""
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8080, max_body_size: int = 1024 * 1024,
+                 keepalive_timeout: float = 15.0, max_header_count: int = 100):
+        """
+        Args:
+            host: ที่อยู่ที่รับการเชื่อมต่อ
+            port: พอร์ต (0 คือให้ระบบเลือกให้ ดูพอร์ตจริงได้จาก port หลัง start())
+            max_body_size: ขนาด body สูงสุด (bytes)
+            keepalive_timeout: เวลาที่รอคำขอถัดไปบนการเชื่อมต่อเดิม (วินาที)
+            max_header_count: จำนวน header สูงสุดต่อคำขอ
+        """
+        self.host = host
+        self.port = port
+        self.max_body_size = max_body_size
+        self.keepalive_timeout = keepalive_timeout
+        self.max_header_count = max_header_count
+        self._routes: Dict[str, Tuple[Sequence[str], Handler]] = {}
+        self._prefix_routes: List[Tuple[str, Sequence[str], Handler]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+        self.requests = 0
+
+    def route(self, path: str, handler: Handler, methods: Sequence[str] = ("GET",), prefix: bool = False):
+        """ลงทะเบียน handler สำหรับ path
+
+        Args:
+            path: path ที่ตรงตัว หรือ prefix ของ path ถ้า prefix=True
+            handler: coroutine function ที่รับ HTTPRequest และคืน HTTPResponse
+            methods: HTTP methods ที่รับ
+            prefix: True ถ้าให้จับคู่ทุก path ที่ขึ้นต้นด้วย path นี้
+        """
+        methods = tuple(method.upper() for method in methods)
+        if prefix:
+            self._prefix_routes.append((path, methods, handler))
+            # prefix ที่ยาวกว่าต้องถูกตรวจก่อน
+            self._prefix_routes.sort(key=lambda route: len(route[0]), reverse=True)
+        else:
+            self._routes[path] = (methods, handler)
+
+    async def start(self):
+        """เริ่มรับการเชื่อมต่อ"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        sockets = self._server.sockets or ()
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        logger.info(f"เริ่ม HTTP server ที่ {self.host}:{self.port}")
+
+    async def stop(self):
+        """หยุดรับการเชื่อมต่อและปิดการเชื่อมต่อที่ค้างอยู่"""
+        if self._server is None:
+            return
+        self._server.close()
+        # ปิด socket ก่อน การเชื่อมต่อที่รอ request อยู่จะจบเองเมื่ออ่านได้ EOF
+        # ส่วนที่ยังประมวลผล request ค้างอยู่ (เช่น long polling) จะถูกยกเลิกหลังรอสักครู่
+        tasks = list(self._connections.values())
+        for writer in list(self._connections):
+            writer.close()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=1.0)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+        logger.info(f"หยุด HTTP server ที่ {self.host}:{self.port}")
+
+    def _find_route(self, path: str) -> Optional[Tuple[Sequence[str], Handler]]:
+        route = self._routes.get(path)
+        if route is not None:
+            return route
+        for prefix, methods, handler in self._prefix_routes:
+            if path.startswith(prefix):
+                return methods, handler
+        return None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[HTTPRequest]:
+        """อ่านคำขอหนึ่งคำขอ (None ถ้าอีกฝั่งปิดการเชื่อมต่อ)"""
+        line = await asyncio.wait_for(reader.readline(), self.keepalive_timeout)
+        if not line:
+            return None
+        try:
+            method, target, _version = line.decode("latin-1").split()
+        except ValueError:
+            raise _HTTPError(400)
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= self.max_header_count:
+                raise _HTTPError(431)
+            name, sep, value = line.decode("latin-1").partition(":")
+            if not sep:
+                raise _HTTPError(400)
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise _HTTPError(501)
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise _HTTPError(400)
+        if length > self.max_body_size:
+            raise _HTTPError(413)
+        body = await reader.readexactly(length) if length else b""
+
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+        return HTTPRequest(method.upper(), url.path, query, headers, body)
+
+    async def _dispatch(self, request: HTTPRequest) -> HTTPResponse:
+        route = self._find_route(request.path)
+        if route is None:
+            return HTTPResponse.error(404)
+        methods, handler = route
+        if request.method not in methods:
+            return HTTPResponse.error(405)
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"เกิดข้อผิดพลาดในการประมวลผลคำขอ HTTP {request.method} {request.path}: {e}")
+            return HTTPResponse.error(500)
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, response: HTTPResponse, keep_alive: bool):
+        head = [
+            f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'Unknown')}",
+            f"Content-Type: {response.content_type}",
+            f"Content-Length: {len(response.body)}",
+            "Connection: keep-alive" if keep_alive else "Connection: close",
+        ]
+        for name, value in response.headers.items():
+            head.append(f"{name}: {value}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except _HTTPError as e:
+                    self._write_response(writer, HTTPResponse.error(e.status), False)
+                    await writer.drain()
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    break
+                if request is None:
+                    break
+
+                self.requests += 1
+                response = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                self._write_response(writer, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.error(f"เกิดข้อผิดพลาดในการเชื่อมต่อ HTTP: {e}")
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Ingress module สำหรับส่งข้อความ MQTT จาก network thread ของ paho เข้าสู่ asyncio event loop"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# นโยบายเมื่อช่องรับข้อความเต็ม
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+
+class IngressChannel:
+    """ช่องรับข้อความแบบ thread-safe ที่ส่งข้อความเป็นชุด (batch) เข้าสู่ event loop
+
+    ฝั่ง paho thread เรียก push() ซึ่งแค่เพิ่มข้อความลง deque ภายใต้ lock
+    และปลุก event loop ด้วย call_soon_threadsafe เพียงครั้งเดียวต่อหนึ่งชุด
+    ฝั่ง event loop จะดึงข้อความออกทีละไม่เกิน batch_size แล้วส่งให้ handler
+    """
+
+    def __init__(self, capacity: int = 10000, batch_size: int = 256,
+                 overflow_policy: str = OVERFLOW_DROP_OLDEST):
+        """
+        Args:
+            capacity: จำนวนข้อความสูงสุดที่ค้างอยู่ในช่องได้
+            batch_size: จำนวนข้อความสูงสุดที่ประมวลผลต่อการปลุก event loop หนึ่งครั้ง
+            overflow_policy: drop_oldest (ทิ้งข้อความเก่าสุด) หรือ drop_newest (ทิ้งข้อความใหม่)
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy ไม่ถูกต้อง: {overflow_policy}")
+
+        self.capacity = max(1, capacity)
+        self.batch_size = max(1, batch_size)
+        self.overflow_policy = overflow_policy
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wakeup_pending = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handler: Optional[Callable[[List[Any]], None]] = None
+
+        # ตัวนับสำหรับติดตามสถานะ
+        self.received = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.wakeups = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.max_depth = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop, handler: Callable[[List[Any]], None]):
+        """ผูกช่องรับข้อความเข้ากับ event loop และ handler ที่จะรับข้อความเป็นชุด
+
+        Args:
+            loop: event loop ที่ handler ทำงานอยู่
+            handler: ฟังก์ชันที่รับ list ของข้อความ (เรียกบน event loop เท่านั้น)
+        """
+        with self._lock:
+            self._loop = loop
+            self._handler = handler
+            has_backlog = bool(self._buffer)
+            if has_backlog:
+                self._wakeup_pending = True
+
+        # ข้อความที่เข้ามาก่อน bind ให้ประมวลผลทันที
+        if has_backlog:
+            loop.call_soon_threadsafe(self._drain)
+
+    def push(self, item: Any) -> bool:
+        """เพิ่มข้อความเข้าช่อง (เรียกได้จากทุก thread)
+
+        Returns:
+            bool: True ถ้ารับข้อความ, False ถ้าข้อความนี้ถูกทิ้งเพราะช่องเต็ม
+        """
+        accepted = True
+        wakeup = False
+
+        with self._lock:
+            self.received += 1
+
+            if len(self._buffer) >= self.capacity:
+                self.dropped += 1
+                if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                    self._buffer.popleft()
+                else:
+                    accepted = False
+
+            if accepted:
+                self._buffer.append(item)
+                depth = len(self._buffer)
+                if depth > self.max_depth:
+                    self.max_depth = depth
+
+            # ปลุก event loop เฉพาะเมื่อยังไม่มีการปลุกค้างอยู่
+            if self._loop is not None and not self._wakeup_pending and self._buffer:
+                self._wakeup_pending = True
+                wakeup = True
+            loop = self._loop
+
+        if wakeup:
+            try:
+                loop.call_soon_threadsafe(self._drain)
+            except RuntimeError:
+                # event loop ถูกปิดไปแล้ว
+                with self._lock:
+                    self._wakeup_pending = False
+
+        if not accepted:
+            logger.warning("ช่องรับข้อความ MQTT เต็ม ทิ้งข้อความใหม่")
+        return accepted
+
+    def _drain(self):
+        """ดึงข้อความออกหนึ่งชุดและส่งให้ handler (ทำงานบน event loop)"""
+        with self._lock:
+            count = min(len(self._buffer), self.batch_size)
+            batch = [self._buffer.popleft() for _ in range(count)]
+            remaining = len(self._buffer)
+
+            # ถ้ายังเหลือข้อความ ให้คิวรอบถัดไปไว้ เพื่อให้ task อื่นได้ทำงานระหว่างชุด
+            self._wakeup_pending = remaining > 0
+            self.wakeups += 1
+            self.delivered += count
+            self.last_batch_size = count
+            if count > self.max_batch_size:
+                self.max_batch_size = count
+
+        if remaining:
+            self._loop.call_soon(self._drain)
+
+        if batch:
+            try:
+                self._handler(batch)
+            except Exception as e:
+                logger.error(f"เกิดข้อผิดพลาดในการประมวลผลชุดข้อความ MQTT: {e}")
+
+    def depth(self) -> int:
+        """จำนวนข้อความที่ค้างอยู่ในช่อง"""
+        with self._lock:
+            return len(self._buffer)
+
+    def stats(self) -> Dict[str, int]:
+        """ดึงตัวนับทั้งหมดของช่องรับข้อความ
+
+        Returns:
+            Dict[str, int]: depth, received, dropped, delivered, wakeups, last_batch_size, max_batch_size, max_depth
+        """
+        with self._lock:
+            return {
+                "depth": len(self._buffer),
+                "received": self.received,
+                "dropped": self.dropped,
+                "delivered": self.delivered,
+                "wakeups": self.wakeups,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "max_depth": self.max_depth,
+            }
@@ -34,11 +34,30 @@ import json
 import logging
 import asyncio
 import signal
+from typing import Iterable, List
 from dotenv import load_dotenv
 
 from telegram_bot import TelegramBot
-from mqtt_client import MQTTClient
-from storage import Storage, CommandHistory
+from mqtt_client import AsyncMQTTClient, TopicRouter
+from storage import Storage, CommandHistory, PendingRequests
+from persistence import create_backend
+from ingress import IngressChannel
+from acl import AccessControl
+from device_state import DeviceStateCache
+from delivery import TelegramDelivery
+from codec import DecodeError
+from envelope import MessageEnvelope, DuplicateFilter
+from cluster import SharedStore, ClusterNode, default_node_id
+from webhook import TelegramWebhook
+from health import HealthMonitor
+from timeseries import TelemetryStore, RECORDED_COMMANDS
+from chart import ChartService
+from outbox import CommandOutbox
+from subscriptions import SubscriptionRegistry, FANOUT_COMMANDS
+from alerts import AlertEngine
+from metrics import MetricsRegistry
+from http_server import HTTPServer
+from profiling import Profiler
 import logging.config
 
 # คอนฟิกูเรชัน logging
@@ -63,6 +82,20 @@ LOGGING_CONFIG = {
         'mqtt_client': {'level': 'INFO'},
         'telegram_bot': {'level': 'INFO'}, 
         'storage': {'level': 'INFO'},
+        'acl': {'level': 'INFO'},
+        'persistence': {'level': 'INFO'},
+        'ingress': {'level': 'INFO'},
+        'delivery': {'level': 'INFO'},
+        'webhook': {'level': 'INFO'},
+        'health': {'level': 'INFO'},
+        'http_server': {'level': 'INFO'},
+        'cluster': {'level': 'INFO'},
+        'outbox': {'level': 'INFO'},
+        'coalesce': {'level': 'INFO'},
+        'subscriptions': {'level': 'INFO'},
+        'alerts': {'level': 'INFO'},
+        'metrics': {'level': 'INFO'},
+        'profiling': {'level': 'INFO'},
         'main': {'level': 'INFO'},
         # โมดูลจากไลบรารีภายนอก
         'httpx': {'level': 'WARNING'},
@@ -89,8 +122,18 @@ load_dotenv()
 # ตัวแปรเก็บ config ระบบ
 MAX_ALLOWED_CHATIDS = 5
 
+def device_topic_pattern(topic: str) -> str:
+    """แปลง topic จาก .env (เช่น ogosense/resp/# หรือ ogosense/status/+) เป็น pattern ที่มี {device_id}"""
+    base = topic.rstrip("#+").rstrip("/")
+    return f"{base}/{{device_id}}"
+
 class MQTTTelegramBridge:
-    def __init__(self):
+    def __init__(self, mqtt_client=None):
+        """
+        Args:
+            mqtt_client: MQTT client ที่สร้างไว้แล้ว (เช่น client จำลองสำหรับ benchmark)
+                ต้องมีเมธอดแบบเดียวกับ AsyncMQTTClient ถ้าไม่ระบุจะสร้าง AsyncMQTTClient จาก .env
+        """
         # โหลด environment variables
         self.device_id = os.getenv("DEVICE_ID", "59322")
         self.mqtt_broker = os.getenv("MQTT_BROKER")
@@ -99,6 +142,7 @@ class MQTTTelegramBridge:
         self.mqtt_password = os.getenv("MQTT_PASSWORD")
         self.mqtt_topic_cmd = os.getenv("MQTT_TOPIC_CMD", "ogosense/cmd/")
         self.mqtt_topic_resp = os.getenv("MQTT_TOPIC_RESP", "ogosense/resp/#")
+        self.mqtt_topic_status = os.getenv("MQTT_TOPIC_STATUS", "ogosense/status/+")
         self.bot_token = os.getenv("BOT_TOKEN")
         
         # แสดง Chat IDs ที่ได้รับอนุญาต
@@ -107,31 +151,174 @@ class MQTTTelegramBridge:
         logger.info(f"Chat IDs ที่ได้รับอนุญาต: {default_chatid_1}, {default_chatid_2}")
         
         # ตรวจสอบว่าตั้งค่าสำคัญครบถ้วนหรือไม่
-        if not all([self.mqtt_broker, self.mqtt_username, self.mqtt_password, self.bot_token]):
+        if not self.bot_token or (mqtt_client is None and not all([self.mqtt_broker, self.mqtt_username, self.mqtt_password])):
             logger.error("ไม่มีการตั้งค่าที่จำเป็น กรุณาตรวจสอบไฟล์ .env")
             sys.exit(1)
         
+        # ตัวชี้วัดของ bridge (ส่วนต่างๆ ลงทะเบียนตัวชี้วัดของตัวเองในทะเบียนเดียวกัน)
+        self.metrics = MetricsRegistry()
+        
+        # วัดเวลาของ handler และ callback ขณะทำงาน (เปิด/ปิดด้วย /profile หรือ SIGUSR1)
+        self.profiler = Profiler(
+            slow_threshold=float(os.getenv("PROFILE_SLOW_MS", "500")) / 1000,
+            enabled=os.getenv("PROFILE_ENABLED", "0") == "1"
+        )
+        
         # เพิ่มคิวสำหรับข้อความ Telegram
         self.telegram_message_queue = asyncio.Queue()
         
-        # สร้างเก็บข้อมูล chat IDs
-        self.storage = Storage(MAX_ALLOWED_CHATIDS, [default_chatid_1, default_chatid_2])
+        # ช่องรับข้อความ MQTT จาก paho thread เข้าสู่ event loop
+        self.mqtt_ingress = IngressChannel(
+            capacity=int(os.getenv("INGRESS_CAPACITY", "10000")),
+            batch_size=int(os.getenv("INGRESS_BATCH_SIZE", "256")),
+            overflow_policy=os.getenv("INGRESS_OVERFLOW", "drop_oldest")
+        )
+        
+        # ตัวกระจายข้อความ MQTT ตาม topic (แต่ละกลุ่ม topic มี handler ของตัวเอง)
+        self.router = TopicRouter()
+        self.router.add(device_topic_pattern(self.mqtt_topic_resp), self._on_device_response)
+        self.router.add(device_topic_pattern(self.mqtt_topic_status), self._on_device_status)
+        
+        # ตรวจจับข้อความ MQTT ที่ถูกส่งซ้ำ (QoS 1) จาก DUP flag หรือ request_id ที่ซ้ำ
+        self.mqtt_duplicates = DuplicateFilter(float(os.getenv("MQTT_DEDUPE_WINDOW", "2")))
+        
+        # ตารางคำสั่งที่รอการตอบกลับ (จับคู่ด้วย request_id)
+        self.pending_requests = PendingRequests(float(os.getenv("PENDING_REQUEST_TIMEOUT", "60")))
+        
+        # โหมด cluster: หลาย process รับคำตอบผ่าน MQTT shared subscription ($share/<group>/...)
+        # ใช้ที่เก็บข้อมูลร่วมเพื่อหา chat ของคำตอบและเก็บข้อมูลของ Storage และมีเพียง node เดียว (leader)
+        # ที่ทำ Telegram polling และส่งคำสั่งใน outbox
+        # ทุก node อยู่บนเครื่องเดียวกัน (ใช้ไฟล์ SQLite ร่วมกัน) จึงต้องตั้ง METRICS_PORT และ
+        # TELEGRAM_WEBHOOK_PORT ให้ต่างกันในแต่ละ node
+        self.cluster = None
+        self._cluster_tasks = set()
+        cluster_group = os.getenv("CLUSTER_GROUP")
+        if cluster_group:
+            self.cluster = ClusterNode(
+                SharedStore(os.getenv("CLUSTER_STORE_PATH", "ogosense_cluster.db")),
+                cluster_group,
+                node_id=os.getenv("CLUSTER_NODE_ID") or default_node_id(),
+                lease_ttl=float(os.getenv("CLUSTER_LEASE_TTL", "15")),
+                poll_interval=float(os.getenv("CLUSTER_POLL_INTERVAL", "0.5")),
+                pending_timeout=self.pending_requests.timeout
+            )
+            logger.info(f"ทำงานในโหมด cluster กลุ่ม {cluster_group} (node {self.cluster.node_id})")
+        
+        # สร้างเก็บข้อมูล chat IDs (โหมด cluster: เก็บในที่เก็บข้อมูลร่วม ทุก node เห็นข้อมูลเดียวกัน
+        # ข้อมูลใน STORAGE_PATH ของ node ถูกย้ายเข้าไปเฉพาะเมื่อที่เก็บข้อมูลร่วมยังว่างอยู่)
+        storage_backend = None
+        if self.cluster is not None:
+            storage_backend = self.cluster.document_backend(seed=create_backend(
+                os.getenv("STORAGE_BACKEND", "journal"),
+                os.getenv("STORAGE_PATH", "ogosense_storage")
+            ))
+        self.storage = Storage(MAX_ALLOWED_CHATIDS, [default_chatid_1, default_chatid_2], backend=storage_backend)
+        
+        # สิทธิ์ของแต่ละแชทต่ออุปกรณ์และกลุ่มอุปกรณ์
+        self.acl = AccessControl(self.storage)
+        
+        # แชทที่ติดตามคำตอบและสถานะของแต่ละอุปกรณ์ (/subscribe)
+        self.subscriptions = SubscriptionRegistry(
+            self.storage,
+            max_per_chat=int(os.getenv("SUBSCRIPTIONS_PER_CHAT", "100"))
+        )
         
         # ประวัติคำสั่ง
-        self.command_history = CommandHistory()
-        
-        # สร้าง MQTT client
-        logger.info(f"กำลังสร้าง MQTT client สำหรับ broker {self.mqtt_broker}:{self.mqtt_port}")
-        self.mqtt_client = MQTTClient(
-            self.mqtt_broker,
-            self.mqtt_port,
-            self.mqtt_username,
-            self.mqtt_password,
-            self.device_id,
-            self.mqtt_topic_resp,
-            self.on_mqtt_message
+        self.command_history = CommandHistory(int(os.getenv("COMMAND_HISTORY_SIZE", "1000")))
+        
+        # แคชสถานะล่าสุดของอุปกรณ์ ใช้ตอบ /status โดยไม่ต้องถามอุปกรณ์
+        self.device_state = DeviceStateCache(float(os.getenv("STATUS_CACHE_TTL", "30")))
+        
+        # ค่าที่อ่านได้จากอุปกรณ์ (อุณหภูมิ, ความชื้น, relay) สำหรับ /history
+        self.telemetry = TelemetryStore(
+            raw_retention=float(os.getenv("TELEMETRY_RAW_RETENTION", "86400")),
+            retention=float(os.getenv("TELEMETRY_RETENTION", str(35 * 86400)))
         )
         
+        # วาดกราฟสำหรับ /chart ใน process pool แยกจาก event loop
+        self.charts = ChartService(
+            workers=int(os.getenv("CHART_WORKERS", "1")),
+            cache_size=int(os.getenv("CHART_CACHE_SIZE", "256"))
+        )
+        
+        # คำสั่งที่ส่งไม่ได้ระหว่าง MQTT ขาดการเชื่อมต่อ (บันทึกลง Storage แล้วส่งเป็นชุดเมื่อเชื่อมต่อได้)
+        self.outbox = CommandOutbox(
+            self.storage,
+            ttl=float(os.getenv("OUTBOX_TTL", "300")),
+            max_entries=int(os.getenv("OUTBOX_MAX_ENTRIES", "1000")),
+            notify=self._queue_message
+        )
+        
+        # กฎแจ้งเตือนของอุปกรณ์ ตรวจทุกครั้งที่ได้รับค่าใหม่ และแจ้งผ่านคิวข้อความ Telegram
+        self.alerts = AlertEngine(
+            self.storage,
+            notify=self._queue_message,
+            default_cooldown=float(os.getenv("ALERT_COOLDOWN", "600")),
+            max_rules_per_device=int(os.getenv("ALERT_MAX_RULES_PER_DEVICE", "20"))
+        )
+        
+        # ติดตามสุขภาพของการเชื่อมต่อจากผลการใช้งานจริง (circuit breaker แยกตามส่วน)
+        self.health = HealthMonitor(
+            failure_threshold=int(os.getenv("HEALTH_FAILURE_THRESHOLD", "3")),
+            reset_timeout=float(os.getenv("HEALTH_RESET_TIMEOUT", "5")),
+            max_reset_timeout=float(os.getenv("HEALTH_MAX_RESET_TIMEOUT", "300"))
+        )
+        # การขาดการเชื่อมต่อ MQTT เป็นสัญญาณที่แน่นอน จึงเปิด breaker ตั้งแต่ครั้งแรก
+        # paho จะพยายามเชื่อมต่อใหม่เองระหว่างรอ reset_timeout ก่อนที่ bridge จะเข้าไปเชื่อมต่อใหม่
+        self.mqtt_breaker = self.health.breaker("mqtt", failure_threshold=1)
+        self.telegram_breaker = self.health.breaker("telegram")
+        self.receiver_breaker = self.health.breaker("telegram_updates")
+        self.housekeeping_interval = float(os.getenv("HOUSEKEEPING_INTERVAL", "30"))
+        
+        # สร้าง MQTT client (แบบ asyncio เพื่อไม่ให้การเชื่อมต่อบล็อก event loop)
+        if mqtt_client is not None:
+            self.mqtt_client = mqtt_client
+            self.mqtt_client.message_callback = self.on_mqtt_message
+            self.mqtt_client.connection_callback = self.on_mqtt_connection
+        else:
+            logger.info(f"กำลังสร้าง MQTT client สำหรับ broker {self.mqtt_broker}:{self.mqtt_port}")
+            self.mqtt_client = AsyncMQTTClient(
+                self.mqtt_broker,
+                self.mqtt_port,
+                self.mqtt_username,
+                self.mqtt_password,
+                self.device_id,
+                self.cluster.shared_topic(self.mqtt_topic_resp) if self.cluster else self.mqtt_topic_resp,
+                self.on_mqtt_message,
+                connect_timeout=float(os.getenv("MQTT_CONNECT_TIMEOUT", "10")),
+                connection_callback=self.on_mqtt_connection,
+                metrics=self.metrics
+            )
+        
+        # subscribe สถานะ online/offline (LWT) ของอุปกรณ์ด้วย
+        self.mqtt_client.add_topic(TopicRouter.to_filter(device_topic_pattern(self.mqtt_topic_status)))
+        
+        # รับ update ของ Telegram ผ่าน webhook แทน polling (TELEGRAM_MODE=webhook)
+        telegram_webhook = None
+        telegram_mode = os.getenv("TELEGRAM_MODE", "polling").lower()
+        if telegram_mode == "webhook":
+            webhook_url = os.getenv("TELEGRAM_WEBHOOK_URL")
+            if not webhook_url:
+                logger.error("โหมด webhook ต้องตั้งค่า TELEGRAM_WEBHOOK_URL")
+                sys.exit(1)
+            # Telegram จำเฉพาะ secret ที่ลงทะเบียนล่าสุด node ที่สุ่ม secret ของตัวเองจะตอบ 403 ทุก update
+            # ในโหมด cluster จึงต้องใช้ secret เดียวกันทุก node
+            webhook_secret = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+            if self.cluster is not None and not webhook_secret:
+                logger.error("โหมด webhook ร่วมกับ CLUSTER_GROUP ต้องตั้งค่า TELEGRAM_WEBHOOK_SECRET ให้เหมือนกันทุก node")
+                sys.exit(1)
+            telegram_webhook = TelegramWebhook(
+                webhook_url,
+                host=os.getenv("TELEGRAM_WEBHOOK_HOST", "0.0.0.0"),
+                port=int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443")),
+                path=os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram"),
+                secret_token=webhook_secret,
+                max_connections=int(os.getenv("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", "40"))
+            )
+        elif telegram_mode != "polling":
+            logger.error(f"TELEGRAM_MODE ไม่ถูกต้อง: {telegram_mode} (polling หรือ webhook)")
+            sys.exit(1)
+        
         # สร้าง Telegram Bot
         logger.info(f"กำลังสร้าง Telegram Bot")
         self.telegram_bot = TelegramBot(
@@ -140,69 +327,357 @@ class MQTTTelegramBridge:
             self.command_history,
             self.mqtt_client,
             self.device_id,
-            self.mqtt_topic_cmd
+            self.mqtt_topic_cmd,
+            self.pending_requests,
+            self.acl,
+            self.device_state,
+            api_base_url=os.getenv("TELEGRAM_API_BASE_URL"),
+            # ในโหมด cluster จะเริ่ม polling เมื่อได้รับ lease เท่านั้น
+            polling=self.cluster is None,
+            cluster=self.cluster,
+            bulk_max_devices=int(os.getenv("BULK_MAX_DEVICES", "500")),
+            bulk_timeout=float(os.getenv("BULK_REPLY_TIMEOUT", "10")),
+            webhook=telegram_webhook,
+            concurrent_updates=int(os.getenv("TELEGRAM_CONCURRENT_UPDATES", "1")),
+            health=self.health,
+            telemetry=self.telemetry,
+            charts=self.charts,
+            outbox=self.outbox,
+            outbox_batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "50")),
+            read_coalesce_window=float(os.getenv("READ_COALESCE_WINDOW", "5")),
+            write_debounce=float(os.getenv("WRITE_DEBOUNCE", "1")),
+            subscriptions=self.subscriptions,
+            alerts=self.alerts,
+            metrics=self.metrics,
+            profiler=self.profiler
+        )
+        
+        # ระบบส่งข้อความ Telegram แบบหลาย worker พร้อมจำกัดอัตราการส่ง
+        self.delivery = TelegramDelivery(
+            self.telegram_bot.send_message,
+            workers=int(os.getenv("TELEGRAM_WORKERS", "4")),
+            global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")),
+            chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", "1")),
+            chat_burst=float(os.getenv("TELEGRAM_CHAT_BURST", "3")),
+            max_retries=int(os.getenv("TELEGRAM_MAX_RETRIES", "3")),
+            breaker=self.telegram_breaker,
+            metrics=self.metrics
         )
         
+        # จุดที่วัดเวลาได้ (CommandHandler ของแต่ละคำสั่งถูกลงทะเบียนโดย TelegramBot)
+        self.profiler.instrument("on_mqtt_message", self.mqtt_client, "message_callback",
+                                 lambda client, topic, payload, *args: f"topic={topic} bytes={len(payload)}")
+        self.profiler.instrument("_process_message_queue", self, "_dispatch_queued_message",
+                                 lambda chat_id, text: f"chat={chat_id} text={text[:80]!r}")
+        self.profiler.instrument("send_message", self.delivery, "send_func",
+                                 lambda chat_id, text: f"chat={chat_id} text={text[:80]!r}")
+        
+        # ตัวชี้วัดของ bridge และ HTTP endpoint สำหรับ Prometheus (เปิดเมื่อตั้งค่า METRICS_PORT เช่น 9108)
+        self._register_metrics()
+        metrics_port = os.getenv("METRICS_PORT", "")
+        self.metrics_server = None
+        if metrics_port:
+            self.metrics_server = HTTPServer(os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port))
+            self.metrics_server.route("/metrics", self.metrics.handle)
+        
         # สถานะระบบ
         self.is_running = False
     
-    def on_mqtt_message(self, client, topic, payload):
-        """ฟังก์ชันที่ทำงานเมื่อได้รับข้อความ MQTT"""
+    def _register_metrics(self):
+        """ลงทะเบียนตัวชี้วัดของ bridge
+        
+        ค่าที่มีอยู่แล้วในส่วนอื่น (ความยาวคิว, ตัวนับใน stats()) ถูกอ่านตอน scrape ผ่าน set_function
+        ส่วนค่าที่บันทึกบน hot path ผูก child ไว้ที่นี่ครั้งเดียว
+        """
+        metrics = self.metrics
+        
+        self._device_rtt = metrics.histogram(
+            "ogosense_device_rtt_seconds", "เวลาตั้งแต่ส่งคำสั่งจนได้รับคำตอบจากอุปกรณ์")
+        reconnects = metrics.counter(
+            "ogosense_mqtt_reconnects_total", "จำนวนครั้งที่ bridge เชื่อมต่อ MQTT ใหม่ แยกตามผลลัพธ์", ("result",))
+        self._reconnect_ok = reconnects.labels("ok")
+        self._reconnect_failed = reconnects.labels("failed")
+        
+        depth = metrics.gauge("ogosense_queue_depth", "จำนวนรายการที่รออยู่ในแต่ละคิว", ("queue",))
+        depth.labels("telegram_message_queue").set_function(self.telegram_message_queue.qsize)
+        depth.labels("telegram_delivery").set_function(self.delivery.pending)
+        depth.labels("mqtt_ingress").set_function(lambda: self.mqtt_ingress.stats()["depth"])
+        depth.labels("outbox").set_function(self.outbox.__len__)
+        metrics.gauge("ogosense_pending_commands", "จำนวนคำสั่งที่รอคำตอบจากอุปกรณ์").set_function(
+            self.pending_requests.__len__)
+        
+        connected = metrics.gauge(
+            "ogosense_connected", "สถานะการเชื่อมต่อ (1 คือปกติ, 0 คือขาดการเชื่อมต่อหรือ breaker ไม่ได้ปิด)", ("component",))
+        connected.labels("mqtt").set_function(self.mqtt_client.is_connected)
+        connected.labels("telegram").set_function(lambda: self.telegram_breaker.is_closed)
+        connected.labels("telegram_updates").set_function(lambda: self.receiver_breaker.is_closed)
+        
+        dropped = metrics.counter("ogosense_dropped_total", "จำนวนข้อความหรือคำสั่งที่ถูกทิ้ง แยกตามที่มา", ("source",))
+        dropped.labels("mqtt_ingress").set_function(lambda: self.mqtt_ingress.stats()["dropped"])
+        dropped.labels("mqtt_duplicate").set_function(lambda: self.mqtt_duplicates.duplicates)
+        dropped.labels("telegram").set_function(lambda: self.delivery.failed)
+        dropped.labels("outbox_expired").set_function(lambda: self.outbox.expired)
+        dropped.labels("pending_expired").set_function(lambda: self.pending_requests.expired)
+    
+    def _toggle_profiler(self):
+        """สลับเปิด/ปิดการวัดเวลาเมื่อได้รับ SIGUSR1 (แสดงสถิติใน log เมื่อปิด)"""
+        if self.profiler.toggle():
+            logger.info("ได้รับ SIGUSR1: เปิดการวัดเวลา")
+        else:
+            logger.info(f"ได้รับ SIGUSR1: ปิดการวัดเวลา\n{self.profiler.report()}")
+    
+    def on_mqtt_connection(self, connected: bool):
+        """ฟังก์ชันที่ทำงานเมื่อสถานะการเชื่อมต่อ MQTT เปลี่ยน (ทำงานบน network thread ของ paho)"""
+        self.health.report_threadsafe("mqtt", connected)
+    
+    def on_mqtt_message(self, client, topic, payload, dup: bool = False):
+        """ฟังก์ชันที่ทำงานเมื่อได้รับข้อความ MQTT (ทำงานบน network thread ของ paho)
+        
+        ห่อข้อความเป็น MessageEnvelope (ไม่คัดลอก payload) แล้วส่งเข้าช่อง ingress เท่านั้น
+        การ parse และประมวลผลจริงจะทำบน event loop
+        """
+        self.mqtt_ingress.push(MessageEnvelope(topic, payload, dup=dup))
+    
+    def _handle_mqtt_batch(self, batch):
+        """ประมวลผลข้อความ MQTT เป็นชุด (ทำงานบน event loop)"""
+        for envelope in batch:
+            self._handle_mqtt_message(envelope)
+    
+    def _handle_mqtt_message(self, envelope: MessageEnvelope):
+        """ส่งข้อความ MQTT หนึ่งข้อความให้ handler ตาม topic (ทำงานบน event loop)
+        
+        ข้อความที่ไม่มี handler สนใจจะถูกทิ้งโดยไม่ต้อง parse
+        """
         try:
-            logger.debug(f"ได้รับข้อความ MQTT - Topic: {topic}, Payload: {payload}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"ได้รับข้อความ MQTT - {envelope!r}")
             
-            # ตรวจสอบว่าเป็นการตอบกลับจากอุปกรณ์หรือไม่
-            if topic.startswith("ogosense/resp/"):
-                # แยก device ID จาก topic
-                device_id = topic[14:]  # ตัด "ogosense/resp/" ออก
-                logger.debug(f"Device ID จาก topic: {device_id}")
-                
-                # แปลง payload เป็น JSON
-                try:
-                    data = json.loads(payload)
-                    logger.debug(f"ข้อมูล JSON: {data}")
-                except json.JSONDecodeError:
-                    logger.error(f"ไม่สามารถแปลงข้อความ JSON ได้: {payload}")
-                    return
-                
-                # ตรวจสอบว่ามี device_id จาก payload ด้วยหรือไม่
-                if "device_id" in data:
-                    device_id = str(data["device_id"])
-                    logger.debug(f"ใช้ Device ID จาก payload: {device_id}")
-                
-                # ตรวจสอบคำสั่งที่ได้รับการตอบกลับ
-                if "command" in data:
-                    command = data["command"]
-                    logger.debug(f"คำสั่งที่ได้รับตอบกลับ: {command}")
-                    
-                    # ลองดึง chat_id โดยไม่ระบุคำสั่ง
-                    chat_id = self.command_history.get_last_chat_id(device_id)
-                    
-                    # ถ้าไม่พบ ให้ลองดึงโดยระบุคำสั่ง
-                    if not chat_id:
-                        logger.debug(f"ไม่พบ chat_id ทั่วไป ลองดึงด้วยคำสั่งเฉพาะ {command}")
-                        chat_id = self.command_history.get_last_chat_id(device_id, command)
-                    
-                    if chat_id:
-                        logger.debug(f"พบ chat_id: {chat_id}")
-                        success = data.get("success", False)
-                        
-                        # สร้างข้อความตอบกลับไปยัง Telegram
-                        telegram_response = self.telegram_bot.format_mqtt_response(device_id, command, data, success)
-                        
-                        try:
-                            # ใช้ put_nowait เพื่อไม่ให้บล็อก
-                            self.telegram_message_queue.put_nowait((chat_id, telegram_response))
-                            logger.debug(f"เพิ่มข้อความเข้าคิวสำเร็จ")
-                        except Exception as e:
-                            logger.error(f"ไม่สามารถเพิ่มข้อความเข้าคิว: {e}")
-                    else:
-                        logger.warning(f"ไม่พบ chat_id ล่าสุดที่เกี่ยวข้องกับอุปกรณ์ {device_id}")
+            if not self.router.dispatch(envelope.topic, envelope):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"ไม่มี handler สำหรับ topic: {envelope.topic}")
         except Exception as e:
             logger.error(f"เกิดข้อผิดพลาดในการประมวลผลข้อความ MQTT: {e}")
             import traceback
             logger.error(traceback.format_exc())
     
+    @staticmethod
+    def _parse_object(envelope: MessageEnvelope):
+        """parse payload เป็น JSON object (None ถ้าไม่ถูกต้อง)"""
+        try:
+            data = envelope.data
+        except DecodeError:
+            logger.error(f"ไม่สามารถแปลงข้อความ JSON ได้: {envelope.preview()!r}")
+            return None
+        if not isinstance(data, dict):
+            logger.error(f"ข้อความ MQTT ไม่ใช่ JSON object: {envelope.preview()!r}")
+            return None
+        return data
+    
+    def _on_device_response(self, envelope: MessageEnvelope, params):
+        """จัดการคำตอบของอุปกรณ์ (topic ตาม MQTT_TOPIC_RESP)"""
+        # ข้อความที่ถูกส่งซ้ำ (QoS 1) ถูกทิ้งก่อนประมวลผล
+        if self.mqtt_duplicates.is_duplicate(envelope):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"ทิ้งข้อความ MQTT ที่ซ้ำ: {envelope.topic}")
+            return
+        
+        # แปลง payload (bytes) เป็น JSON โดยตรง ไม่ต้อง decode เป็น str ก่อน
+        data = self._parse_object(envelope)
+        if data is None:
+            return
+        
+        # ใช้ device_id จาก payload ถ้ามี ไม่เช่นนั้นใช้จาก topic
+        device_id = str(data["device_id"]) if "device_id" in data else params["device_id"]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Device ID: {device_id}, ข้อมูล JSON: {data}")
+        
+        # ตรวจสอบคำสั่งที่ได้รับการตอบกลับ
+        if "command" not in data:
+            return
+        command = data["command"]
+        
+        # อัปเดตแคชสถานะของอุปกรณ์ บันทึกค่าที่อ่านได้ และตรวจกฎแจ้งเตือนของอุปกรณ์
+        self.device_state.update_from_response(device_id, command, data)
+        self.telemetry.record(device_id, command, data)
+        self._check_alerts(device_id, command, data)
+        
+        # จับคู่กับคำสั่งที่รอคำตอบด้วย request_id (หรือคำสั่งเก่าสุดของอุปกรณ์ถ้าเฟิร์มแวร์ไม่ส่ง request_id)
+        request = self.pending_requests.resolve(device_id, command, data.get("request_id"), data)
+        if request:
+            logger.info(f"ได้รับคำตอบ {command} จากอุปกรณ์ {device_id} ใช้เวลา {request.rtt * 1000:.0f} ms")
+            self._device_rtt.observe(request.rtt)
+            if self.cluster is not None:
+                self.cluster.discard(request.request_id)
+            # chat_id เป็น None: คำสั่งแบบกลุ่ม คำตอบถูกรวมเป็นตารางเดียวโดยผู้ส่งคำสั่ง (ส่งเฉพาะผู้ติดตามอุปกรณ์)
+            self._deliver_response(device_id, command, data, request.chat_id, request.followers or (),
+                                   fallback=request.chat_id is not None)
+        elif self.cluster is not None:
+            # คำสั่งอาจถูกส่งจาก node อื่น ค้นหาจากที่เก็บข้อมูลร่วม (ไม่บล็อก event loop)
+            task = asyncio.create_task(self._claim_response(device_id, command, data))
+            self._cluster_tasks.add(task)
+            task.add_done_callback(self._cluster_tasks.discard)
+        else:
+            self._deliver_response(device_id, command, data, None)
+    
+    def _check_alerts(self, device_id: str, command: str, data: dict):
+        """ตรวจกฎแจ้งเตือนจากคำตอบของอุปกรณ์
+        
+        ในโหมด cluster คำตอบกระจายไปหลาย node แต่สถานะของกฎ (hysteresis, cooldown, ค่าก่อนหน้าของ rate)
+        ต้องอยู่ที่เดียว node อื่นจึงส่งต่อคำตอบของอุปกรณ์ที่มีกฎให้ leader ตรวจ
+        """
+        if self._is_leader():
+            self.alerts.record(device_id, command, data)
+        elif command in RECORDED_COMMANDS and self.alerts.has_rules(device_id):
+            self.cluster.forward_sample(device_id, command, data)
+    
+    async def _claim_response(self, device_id: str, command: str, data: dict):
+        """หาคำสั่งของคำตอบจากที่เก็บข้อมูลร่วมของ cluster แล้วส่งคำตอบไปยัง Telegram"""
+        try:
+            claimed = await self.cluster.claim(device_id, command, data.get("request_id"), data)
+        except Exception as e:
+            logger.error(f"ไม่สามารถค้นหาคำสั่งจากที่เก็บข้อมูลร่วมได้: {e}")
+            claimed = None
+        
+        if claimed:
+            logger.info(f"ได้รับคำตอบ {command} จากอุปกรณ์ {device_id} (คำสั่ง {claimed[0]} จาก node อื่น)")
+            if claimed[1] is not None:
+                self._deliver_response(device_id, command, data, claimed[1])
+        else:
+            self._deliver_response(device_id, command, data, None)
+    
+    def _on_cluster_completion(self, request_id: str, device_id: str, command: str, data: dict):
+        """node อื่นได้รับคำตอบของคำสั่งที่ node นี้ส่ง (และส่งไปยัง Telegram แล้ว)"""
+        self.device_state.update_from_response(device_id, command, data)
+        self.telemetry.record(device_id, command, data)
+        request = self.pending_requests.resolve(device_id, command, request_id, data)
+        
+        # node อื่นส่งคำตอบให้แชทของคำสั่งและผู้ติดตามอุปกรณ์แล้ว เหลือเฉพาะแชทที่รอคำตอบเดียวกันบน node นี้
+        if request and request.followers:
+            text = self.telegram_bot.format_mqtt_response(device_id, command, data, data.get("success", False))
+            for chat_id in request.followers:
+                self._queue_message(chat_id, text)
+    
+    async def _on_cluster_leadership(self, leader: bool):
+        """node นี้ได้รับหรือเสีย lease ของ Telegram polling"""
+        if leader:
+            await self.telegram_bot.start_polling()
+            # รับช่วงคำสั่งใน outbox ที่ leader เดิมยังส่งไม่หมด
+            if len(self.outbox):
+                self.health.wake()
+        else:
+            await self.telegram_bot.stop_polling()
+    
+    def _on_cluster_documents(self, changes: dict):
+        """node อื่นเปลี่ยนข้อมูลของ Storage: ใช้ค่าใหม่และสร้าง index ของส่วนที่เกี่ยวข้องใหม่"""
+        self.storage.apply_documents(changes)
+        reloads = {
+            "acl": self.acl.load,
+            "subscriptions": self.subscriptions.load,
+            "alerts": self.alerts.load,
+            "outbox": self.outbox.load,
+        }
+        for key in changes:
+            reload = reloads.get(key)
+            if reload is not None:
+                reload()
+        logger.info(f"โหลดข้อมูลที่ node อื่นเปลี่ยน: {', '.join(sorted(changes))}")
+    
+    def _is_leader(self) -> bool:
+        """node นี้ทำงานที่ต้องทำเพียงที่เดียวหรือไม่ (True เสมอเมื่อไม่ได้อยู่ในโหมด cluster)"""
+        return self.cluster is None or self.cluster.is_leader
+    
+    def _deliver_response(self, device_id: str, command: str, data: dict, chat_id,
+                          followers: Iterable[str] = (), fallback: bool = True):
+        """สร้างข้อความตอบกลับและเพิ่มเข้าคิวส่งไปยัง Telegram (รวมถึงแชทที่ติดตามอุปกรณ์ สำหรับคำสั่งใน FANOUT_COMMANDS)
+        
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่งที่ตอบกลับ
+            data: ข้อมูลตอบกลับ
+            chat_id: Chat ID ของคำสั่งที่จับคู่ได้ (None คือไม่พบคำสั่ง)
+            followers: แชทอื่นที่รอคำตอบของคำสั่งเดียวกัน
+            fallback: ใช้ประวัติคำสั่งหา chat_id เมื่อไม่พบคำสั่ง (False สำหรับคำสั่งแบบกลุ่ม)
+        """
+        if not chat_id and fallback:
+            # ลองดึง chat_id โดยไม่ระบุคำสั่ง แล้วจึงระบุคำสั่ง
+            chat_id = (self.command_history.get_last_chat_id(device_id)
+                       or self.command_history.get_last_chat_id(device_id, command))
+        
+        recipients = dict.fromkeys([chat_id] if chat_id else [])
+        recipients.update(dict.fromkeys(followers))
+        subscribers = self._subscribers(device_id, recipients) if command in FANOUT_COMMANDS else []
+        
+        if not recipients and not subscribers:
+            if fallback:
+                logger.warning(f"ไม่พบ chat_id ล่าสุดที่เกี่ยวข้องกับอุปกรณ์ {device_id}")
+            return
+        
+        success = data.get("success", False)
+        
+        # สร้างข้อความตอบกลับไปยัง Telegram ครั้งเดียว แล้วใช้ร่วมกันทุกแชท
+        telegram_response = self.telegram_bot.format_mqtt_response(device_id, command, data, success)
+        
+        for recipient in recipients:
+            self._queue_message(recipient, telegram_response)
+        if subscribers:
+            self.delivery.submit_many(subscribers, telegram_response)
+    
+    def _subscribers(self, device_id: str, exclude=()) -> List[str]:
+        """ดึงแชทที่ติดตามอุปกรณ์และยังมีสิทธิ์ดูอุปกรณ์นั้น (ค้นหาจาก index ตาม device_id)
+        
+        ในโหมด cluster ทะเบียนการติดตามและสิทธิ์ถูกโหลดจากที่เก็บข้อมูลร่วม node ที่ได้รับคำตอบ
+        ผ่าน shared subscription จึงส่งต่อให้ผู้ติดตามได้เองโดยไม่ต้องผ่าน leader
+        
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            exclude: แชทที่ได้รับข้อความนี้อยู่แล้ว
+        """
+        chats = self.subscriptions.subscribers(device_id)
+        if not chats:
+            return []
+        authorize = self.acl.authorize
+        return [chat_id for chat_id in chats
+                if chat_id not in exclude and authorize(chat_id, device_id, "subscribe")]
+    
+    def _queue_message(self, chat_id: str, text: str):
+        """เพิ่มข้อความเข้าคิวส่งไปยัง Telegram (ไม่บล็อก)"""
+        try:
+            # ใช้ put_nowait เพื่อไม่ให้บล็อก
+            self.telegram_message_queue.put_nowait((chat_id, text))
+        except Exception as e:
+            logger.error(f"ไม่สามารถเพิ่มข้อความเข้าคิว: {e}")
+    
+    def _on_device_status(self, envelope: MessageEnvelope, params):
+        """จัดการสถานะ online/offline ของอุปกรณ์ (ข้อความ LWT ที่ topic ตาม MQTT_TOPIC_STATUS)"""
+        data = self._parse_object(envelope)
+        if data is None:
+            return
+        
+        status = data.get("status")
+        if status not in ("online", "offline"):
+            return
+        
+        device_id = params["device_id"]
+        online = status == "online"
+        state = self.device_state.get(device_id)
+        previous = state.online if state is not None else None
+        if previous != online:
+            logger.info(f"อุปกรณ์ {device_id} {'ออนไลน์' if online else 'ออฟไลน์'}")
+        self.device_state.set_online(device_id, online)
+        
+        # กฎ missing ใช้สถานะจาก LWT ทุก node บันทึกสถานะไว้ (พร้อมรับช่วงเป็น leader) แต่แจ้งเตือนจาก leader เท่านั้น
+        self.alerts.set_online(device_id, online)
+        if self._is_leader():
+            self.alerts.check_missing(device_id=device_id)
+        
+        # แจ้งผู้ติดตามเมื่อสถานะเปลี่ยน (ไม่แจ้งสถานะแรกที่ได้รับ เช่น retained message ตอนเริ่มโปรแกรม)
+        # topic สถานะไม่ใช่ shared subscription ทุก node ได้รับข้อความเดียวกัน จึงแจ้งจาก leader เท่านั้น
+        if previous is not None and previous != online and self._is_leader():
+            subscribers = self._subscribers(device_id)
+            if subscribers:
+                self.delivery.submit_many(
+                    subscribers, f"อุปกรณ์ {device_id} {'กลับมาออนไลน์แล้ว' if online else 'ออฟไลน์'}")
+    
     # ใน main.py - ที่เมธอด start ของ MQTTTelegramBridge
     async def start(self):
         """เริ่มการทำงานของ bridge"""
@@ -212,21 +687,47 @@ class MQTTTelegramBridge:
         loop = asyncio.get_event_loop()
         for sig in (signal.SIGINT, signal.SIGTERM):
             loop.add_signal_handler(sig, lambda: asyncio.create_task(self.shutdown()))
+        # SIGUSR1 สลับเปิด/ปิดการวัดเวลา (ไม่มีบน Windows)
+        if hasattr(signal, "SIGUSR1"):
+            loop.add_signal_handler(signal.SIGUSR1, self._toggle_profiler)
+        
+        # ผูกช่องรับข้อความ MQTT และตัวติดตามสุขภาพกับ event loop ก่อนเริ่มเชื่อมต่อ
+        self.mqtt_ingress.bind(loop, self._handle_mqtt_batch)
+        self.health.bind(loop)
+        
+        # เปิด endpoint ของตัวชี้วัด (ถ้าเปิดไม่ได้ bridge ยังทำงานต่อได้)
+        if self.metrics_server is not None:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"ไม่สามารถเปิด metrics endpoint ได้: {e}")
+                self.metrics_server = None
+        
+        # เข้าร่วม cluster ก่อนเริ่ม Telegram Bot เพื่อให้รู้ว่า node นี้ต้องทำ polling หรือไม่
+        if self.cluster is not None:
+            await self.cluster.start(self._on_cluster_completion, self._on_cluster_leadership,
+                                     self._on_cluster_documents, self.alerts.record)
         
         # เริ่มการเชื่อมต่อ MQTT
         logger.info("กำลังเชื่อมต่อกับ MQTT Broker...")
-        if not self.mqtt_client.connect():
+        if not await self.mqtt_client.connect():
             logger.error("ไม่สามารถเชื่อมต่อ MQTT ได้ จะลองเชื่อมต่อใหม่ในลูป...")
+            self.mqtt_breaker.record_failure()
         
         logger.info("เริ่มต้น Telegram Bot...")
         # เริ่ม Telegram Bot
         await self.telegram_bot.start()
         
-        # เริ่ม task สำหรับประมวลผลคิวข้อความ
+        # เริ่ม workers สำหรับส่งข้อความ Telegram และ task สำหรับประมวลผลคิวข้อความ
+        await self.delivery.start()
         message_processor = asyncio.create_task(self._process_message_queue())
         
-        # เริ่ม task สำหรับตรวจสอบการเชื่อมต่อ
-        connection_checker = asyncio.create_task(self._check_connections())
+        # เริ่ม task สำหรับดูแลการเชื่อมต่อ
+        connection_checker = asyncio.create_task(self._supervise_connections())
+        
+        # มีคำสั่งค้างใน outbox จากก่อนรีสตาร์ท: ให้ task ดูแลการเชื่อมต่อส่งทันทีโดยไม่ต้องรอรอบถัดไป
+        if len(self.outbox):
+            self.health.wake()
         
         try:
             # แสดงข้อความเมื่อเริ่มทำงาน
@@ -250,64 +751,101 @@ class MQTTTelegramBridge:
             
             await self.shutdown()
 
-    # เพิ่มเมธอดใหม่สำหรับตรวจสอบและรักษาการเชื่อมต่อ
-    # ในเมธอด _check_connections ของคลาส MQTTTelegramBridge
-    async def _check_connections(self):
-        """ตรวจสอบและรักษาการเชื่อมต่อทั้งหมด"""
-        logger.info("เริ่มตรวจสอบการเชื่อมต่อ")
-        reconnect_delay = 5
-        max_reconnect_delay = 300
+    async def _supervise_connections(self):
+        """ดูแลการเชื่อมต่อตามเหตุการณ์จากตัวติดตามสุขภาพ
+        
+        ตื่นทันทีเมื่อ breaker เปลี่ยนสถานะ (เช่น MQTT ขาดการเชื่อมต่อ หรือส่งข้อความ Telegram ล้มเหลวติดกัน)
+        หรือเมื่อถึงเวลาทดสอบของ breaker ที่เปิดอยู่ แล้วแก้ไขเฉพาะส่วนที่มีปัญหา
+        ไม่มีการเรียก Bot API เพื่อตรวจสอบขณะที่ทุกส่วนทำงานปกติ
+        """
+        logger.info("เริ่มดูแลการเชื่อมต่อ")
+        last_ingress_dropped = 0
+        next_housekeeping = time.monotonic() + self.housekeeping_interval
         
         while self.is_running:
+            timeout = next_housekeeping - time.monotonic()
+            probe_in = self.health.next_probe_in()
+            if probe_in is not None:
+                timeout = min(timeout, probe_in)
+            await self.health.wait(max(timeout, 0.05))
+            if not self.is_running:
+                break
+            
             try:
-                # ตรวจสอบการเชื่อมต่อ MQTT
-                if not self.mqtt_client.is_connected():
-                    logger.warning(f"MQTT ขาดการเชื่อมต่อ กำลังเชื่อมต่อใหม่...")
-                    
-                    # ทดสอบเชื่อมต่อใหม่ด้วย exponential backoff
-                    if self.mqtt_client.reconnect():
-                        logger.info("เชื่อมต่อ MQTT ใหม่สำเร็จ")
-                        reconnect_delay = 5  # รีเซ็ตเวลารอ
-                    else:
-                        logger.error(f"ไม่สามารถเชื่อมต่อ MQTT ใหม่ได้ จะลองอีกครั้งใน {reconnect_delay} วินาที")
-                        reconnect_delay = min(reconnect_delay * 2, max_reconnect_delay)
+                await self._recover_mqtt()
+                await self._recover_telegram()
                 
-                # ตรวจสอบการเชื่อมต่อ Telegram
-                telegram_connected = False
-                try:
-                    # ทดสอบการเชื่อมต่อ Telegram
-                    if self.telegram_bot.bot:
-                        me = await self.telegram_bot.bot.get_me()
-                        if me:
-                            telegram_connected = True
-                            logger.debug("การเชื่อมต่อ Telegram ปกติ")
-                except Exception as e:
-                    logger.error(f"การเชื่อมต่อ Telegram มีปัญหา: {e}")
+                # ส่งคำสั่งที่ค้างใน outbox ทันทีที่ MQTT เชื่อมต่อได้ (outbox ใช้ร่วมกันทั้ง cluster จึงส่งจาก leader เท่านั้น)
+                if len(self.outbox) and self.mqtt_client.is_connected() and self._is_leader():
+                    await self.telegram_bot.replay_outbox()
                 
-                # หากไม่สามารถเชื่อมต่อ Telegram ได้ ลองรีสตาร์ท
-                if not telegram_connected:
-                    logger.warning("กำลังพยายามรีสตาร์ท Telegram Bot...")
-                    try:
-                        # หยุด bot ก่อน
-                        await self.telegram_bot.stop()
-                        await asyncio.sleep(2)
-                        
-                        # เริ่ม bot ใหม่
-                        success = await self.telegram_bot.start()
-                        
-                        # ตรวจสอบว่าเริ่มสำเร็จจริงๆ
-                        if success:
-                            logger.info("รีสตาร์ท Telegram Bot สำเร็จ")
-                        else:
-                            logger.error("รีสตาร์ท Telegram Bot ไม่สำเร็จ")
-                    except Exception as restart_error:
-                        logger.error(f"เกิดข้อผิดพลาดขณะรีสตาร์ท Telegram Bot: {restart_error}")
+                if time.monotonic() >= next_housekeeping:
+                    next_housekeeping = time.monotonic() + self.housekeeping_interval
+                    
+                    # ลบคำสั่งใน outbox ที่หมดอายุ (แจ้งแชทที่สั่ง)
+                    if self._is_leader():
+                        self.outbox.expire()
+                    
+                    # แจ้งเตือนอุปกรณ์ที่ออฟไลน์นานเกินกฎ missing
+                    if self._is_leader():
+                        self.alerts.check_missing()
+                    
+                    # ลบคำสั่งที่รอคำตอบนานเกินไป
+                    expired = self.pending_requests.expire()
+                    if expired:
+                        logger.warning(f"คำสั่ง {len(expired)} รายการไม่ได้รับคำตอบภายใน {self.pending_requests.timeout} วินาที")
+                    
+                    # ตรวจสอบว่ามีข้อความ MQTT ถูกทิ้งเพราะช่องรับข้อความเต็มหรือไม่
+                    ingress_stats = self.mqtt_ingress.stats()
+                    if ingress_stats["dropped"] > last_ingress_dropped:
+                        logger.warning(f"ช่องรับข้อความ MQTT ทิ้งข้อความไป {ingress_stats['dropped'] - last_ingress_dropped} ข้อความ (สถิติ: {ingress_stats})")
+                        last_ingress_dropped = ingress_stats["dropped"]
             
             except Exception as e:
-                logger.error(f"เกิดข้อผิดพลาดในการตรวจสอบการเชื่อมต่อ: {e}")
-            
-            # รอก่อนตรวจสอบรอบถัดไป
-            await asyncio.sleep(30)
+                logger.error(f"เกิดข้อผิดพลาดในการดูแลการเชื่อมต่อ: {e}")
+    
+    async def _recover_mqtt(self):
+        """เชื่อมต่อ MQTT ใหม่เมื่อ breaker อนุญาตให้ทดสอบ (เวลารอเพิ่มขึ้นเมื่อล้มเหลวติดกัน)"""
+        if self.mqtt_client.is_connected() or not self.mqtt_breaker.allow():
+            return
+        
+        logger.warning("MQTT ขาดการเชื่อมต่อ กำลังเชื่อมต่อใหม่...")
+        if await self.mqtt_client.reconnect():
+            logger.info("เชื่อมต่อ MQTT ใหม่สำเร็จ")
+            self._reconnect_ok.inc()
+            self.mqtt_breaker.record_success()
+        else:
+            self._reconnect_failed.inc()
+            self.mqtt_breaker.record_failure()
+            logger.error(f"ไม่สามารถเชื่อมต่อ MQTT ใหม่ได้ จะลองอีกครั้งใน {self.mqtt_breaker.reset_timeout:.0f} วินาที")
+    
+    async def _recover_telegram(self):
+        """ทดสอบ Bot API เมื่อ breaker เป็น half_open และเริ่มใหม่เฉพาะส่วนของ Telegram ที่หยุดทำงาน"""
+        bot = self.telegram_bot
+        
+        # Application ยังไม่เริ่มทำงาน (เช่น Telegram ไม่ตอบสนองตอนเปิดโปรแกรม): start() เป็นการทดสอบในตัว
+        if not bot.is_running():
+            if self.telegram_breaker.allow():
+                logger.warning("Telegram Bot ยังไม่ทำงาน กำลังเริ่มใหม่...")
+                await bot.start()
+            return
+        
+        # ไม่มีข้อความให้ส่งเป็น probe: ทดสอบด้วย getMe ครั้งเดียว
+        if not self.telegram_breaker.is_closed and self.telegram_breaker.allow():
+            try:
+                await bot.bot.get_me()
+                self.telegram_breaker.record_success()
+            except Exception as e:
+                logger.error(f"การเชื่อมต่อ Telegram ยังมีปัญหา: {e}")
+                self.telegram_breaker.record_failure()
+        
+        # ตัวรับ update หยุดทำงาน หรือ polling ล้มเหลวติดกันทั้งที่ Bot API ใช้งานได้: เริ่มเฉพาะตัวรับใหม่
+        receiver_failing = not self.receiver_breaker.is_closed and self.telegram_breaker.is_closed
+        if (not bot.receiver_running() or receiver_failing) and self.receiver_breaker.allow():
+            if await bot.restart_receiver():
+                self.receiver_breaker.record_success()
+            else:
+                self.receiver_breaker.record_failure()
     
     async def shutdown(self):
         """หยุดการทำงานของ bridge"""
@@ -317,48 +855,44 @@ class MQTTTelegramBridge:
         logger.info("กำลังปิดโปรแกรม...")
         self.is_running = False
         
+        # หยุดการส่งข้อความ Telegram
+        await self.delivery.stop()
+        
         # หยุด Telegram Bot
         await self.telegram_bot.stop()
         
         # หยุด MQTT Client
-        self.mqtt_client.disconnect()
+        await self.mqtt_client.disconnect()
+        
+        # ปิด process pool ของการวาดกราฟ
+        self.charts.close()
+        
+        # ปิด endpoint ของตัวชี้วัด
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        
+        # ออกจาก cluster และคืน lease ของ polling ให้ node อื่นรับต่อทันที
+        if self.cluster is not None:
+            await self.cluster.stop()
+        
+        # บันทึกข้อมูลที่ค้างอยู่ลงดิสก์ (ทำใน thread แยกเพื่อไม่บล็อก event loop)
+        await asyncio.to_thread(self.storage.close)
         
         logger.info("ปิดโปรแกรมเรียบร้อย")
 
-    # ปรับปรุงเมธอด _process_message_queue
     async def _process_message_queue(self):
-        """ประมวลผลคิวข้อความ Telegram"""
-        logger.info("เริ่มการประมวลผลคิวข้อความ Telegram")
+        """ประมวลผลคิวข้อความ Telegram
         
-        # จำนวนความพยายามสูงสุดในการส่งข้อความ
-        max_retries = 3
+        ส่งต่อข้อความให้ระบบส่งข้อความ (TelegramDelivery) ซึ่งจัดการ workers,
+        การจำกัดอัตราการส่งต่อแชท และการลองส่งใหม่ผ่าน delay queue
+        """
+        logger.info("เริ่มการประมวลผลคิวข้อความ Telegram")
         
         while self.is_running:
             try:
-                # รอข้อความจากคิว
+                # รอข้อความจากคิว แล้วส่งต่อให้ระบบส่งข้อความ
                 chat_id, message = await self.telegram_message_queue.get()
-                
-                # ส่งข้อความไปยัง Telegram พร้อมลอง retry
-                success = False
-                retry_count = 0
-                last_error = None
-                
-                while not success and retry_count < max_retries:
-                    try:
-                        await self.telegram_bot.send_message(chat_id, message)
-                        success = True
-                        logger.info(f"ส่งข้อความจากคิวไปยัง Telegram: {message[:100]}...")
-                    except Exception as e:
-                        retry_count += 1
-                        last_error = e
-                        logger.warning(f"ไม่สามารถส่งข้อความไปยัง Telegram ได้ (ครั้งที่ {retry_count}/{max_retries}): {e}")
-                        await asyncio.sleep(2 * retry_count)  # รอนานขึ้นในแต่ละครั้ง
-                
-                if not success:
-                    logger.error(f"ไม่สามารถส่งข้อความไปยัง Telegram ได้หลังจากลอง {max_retries} ครั้ง: {last_error}")
-                
-                # บอกว่าได้ประมวลผลข้อความนี้แล้ว
-                self.telegram_message_queue.task_done()
+                self._dispatch_queued_message(chat_id, message)
                 
             except asyncio.CancelledError:
                 # task ถูกยกเลิก
@@ -368,6 +902,13 @@ class MQTTTelegramBridge:
                 logger.error(f"เกิดข้อผิดพลาดในการประมวลผลคิวข้อความ: {e}")
                 await asyncio.sleep(5)  # รอสักครู่ก่อนลองใหม่
 
+    def _dispatch_queued_message(self, chat_id: str, message: str):
+        """ส่งต่อข้อความหนึ่งข้อความจากคิวให้ระบบส่งข้อความ (จุดวัดเวลา _process_message_queue)"""
+        self.delivery.submit(chat_id, message)
+        
+        # บอกว่าได้ประมวลผลข้อความนี้แล้ว
+        self.telegram_message_queue.task_done()
+
 async def main():
     """ฟังก์ชันหลักของโปรแกรม"""
     # แสดงข้อมูลโปรแกรม
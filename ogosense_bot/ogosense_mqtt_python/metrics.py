@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Metrics module สำหรับเก็บตัวชี้วัดของ bridge และแสดงผลในรูปแบบ Prometheus text format
+
+ตัวชี้วัดแต่ละตัวมี label children ที่สร้างไว้ล่วงหน้าด้วย labels() ตอนเริ่มต้น โค้ดที่ถูกเรียกบ่อย
+จึงเรียกแค่ inc() / set() / observe() ของ child ที่เก็บไว้ (ไม่ต้องสร้าง dict หรือค้นหา label ทุกครั้ง)
+ค่าที่มีอยู่แล้วในอ็อบเจกต์อื่น (เช่น ความยาวคิว หรือตัวนับใน stats()) ใช้ set_function() ให้อ่านตอน scrape แทน
+"""
+
+import math
+import logging
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from http_server import HTTPRequest, HTTPResponse
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ขอบบนของ bucket เริ่มต้น (วินาที) ครอบคลุมตั้งแต่ publish ในเครื่องจนถึงคำตอบของอุปกรณ์ที่ช้า
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+class _Child:
+    """ค่าของตัวชี้วัดหนึ่งชุด label (counter หรือ gauge)"""
+
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set_function(self, function: Callable[[], float]):
+        """อ่านค่าจากฟังก์ชันตอน scrape แทนค่าที่เก็บไว้"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            return float(self.function())
+        return self.value
+
+
+class _GaugeChild(_Child):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class _HistogramChild:
+    """ค่าของ histogram หนึ่งชุด label (เก็บจำนวนต่อ bucket แบบไม่สะสม รวมเป็นค่าสะสมตอน scrape)"""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # ช่องสุดท้ายคือ +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric(ABC):
+    """ตัวชี้วัดหนึ่งชื่อ และ children แยกตามค่า label"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._unlabelled = self._new_child()
+            self._children[()] = self._unlabelled
+
+    @abstractmethod
+    def _new_child(self):
+        """สร้าง child ของชุด label ใหม่"""
+
+    def labels(self, *values: str):
+        """ดึง child ของชุด label (สร้างใหม่ถ้ายังไม่มี) ควรเรียกครั้งเดียวแล้วเก็บ child ไว้ใช้"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} ต้องมี label {len(self.labelnames)} ค่า: {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {_escape_help(self.documentation)}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for key, child in self._children.items():
+            lines.append(f"{self.name}{self._label_text(key)} {_format_value(child.get())}")
+
+
+class Counter(_Metric):
+    """ตัวนับที่เพิ่มขึ้นอย่างเดียว"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Child()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled.inc(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._unlabelled.set_function(function)
+
+
+class Gauge(_Metric):
+    """ค่าที่เพิ่มหรือลดได้"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._unlabelled.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._unlabelled.dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._unlabelled.set_function(function)
+
+
+class Histogram(_Metric):
+    """การกระจายของค่า (เช่น เวลาที่ใช้) แบ่งตาม bucket"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(float(bound) for bound in buckets if bound != math.inf))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._unlabelled.observe(value)
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {_escape_help(self.documentation)}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), child.counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            labels = self._label_text(key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+
+
+class MetricsRegistry:
+    """ทะเบียนตัวชี้วัดทั้งหมดของ process (ทำงานบน event loop เท่านั้น)"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self.scrapes = 0
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"มีตัวชี้วัดชื่อ {metric.name} อยู่แล้ว")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """สร้างตัวนับ (ชื่อควรลงท้ายด้วย _total)"""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """สร้าง gauge"""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """สร้าง histogram (ค่าเวลาใช้หน่วยวินาที ชื่อควรลงท้ายด้วย _seconds)"""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        """ดึงตัวชี้วัดตามชื่อ"""
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """แสดงตัวชี้วัดทั้งหมดในรูปแบบ Prometheus text format (version 0.0.4)"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            # ตัวชี้วัดที่อ่านค่าไม่ได้ถูกข้ามทั้งตัว ไม่ให้ผลลัพธ์มีเพียงบางส่วน
+            metric_lines: List[str] = []
+            try:
+                metric.render(metric_lines)
+            except Exception as e:
+                logger.error(f"ไม่สามารถอ่านค่าตัวชี้วัด {metric.name}: {e}")
+                continue
+            lines.extend(metric_lines)
+        lines.append("")
+        return "\n".join(lines)
+
+    async def handle(self, request: HTTPRequest) -> HTTPResponse:
+        """handler ของ HTTPServer สำหรับ GET /metrics"""
+        self.scrapes += 1
+        return HTTPResponse(200, self.render().encode("utf-8"), CONTENT_TYPE)
@@ -6,16 +6,160 @@ import time
 import json
 import logging
 import ssl
+import asyncio
+import threading
+from collections import OrderedDict
 import paho.mqtt.client as mqtt
-from typing import Callable, Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List, Tuple
 from dotenv import load_dotenv
+
+from metrics import MetricsRegistry
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+
+class _TopicNode:
+    """โหนดหนึ่งระดับของ trie ของ topic"""
+
+    __slots__ = ("children", "wildcard", "routes", "multi_routes")
+
+    def __init__(self):
+        self.children: Dict[str, "_TopicNode"] = {}
+        # โหนดสำหรับ + และ {name} (ใช้ร่วมกันทุกชื่อ)
+        self.wildcard: Optional["_TopicNode"] = None
+        # handler ที่ filter จบที่โหนดนี้พอดี: (handler, ชื่อของ wildcard ตามลำดับ)
+        self.routes: List[Tuple[Callable, Tuple[Optional[str], ...]]] = []
+        # handler ของ filter ที่ลงท้ายด้วย # ที่โหนดนี้
+        self.multi_routes: List[Tuple[Callable, Tuple[Optional[str], ...]]] = []
+
+
+class TopicRouter:
+    """ตัวกระจายข้อความ MQTT ไปยัง handler ตาม topic filter
+
+    filter ถูก compile เป็น trie ตอนลงทะเบียน การจับคู่จึงใช้เวลาตามความลึกของ topic
+    ไม่ขึ้นกับจำนวน filter รองรับ wildcard ของ MQTT (+ และ #) และ segment ที่มีชื่อ
+    เช่น ogosense/resp/{device_id} ซึ่งทำงานเหมือน + แต่ส่งค่าของ segment ให้ handler ด้วย
+    ส่วนที่ตรงกับ # จะส่งให้ handler ในชื่อ "#"
+    """
+
+    def __init__(self):
+        self._root = _TopicNode()
+        self._filters: List[str] = []
+        self.dispatched = 0
+        self.unmatched = 0
+
+    @staticmethod
+    def to_filter(pattern: str) -> str:
+        """แปลง pattern ที่มี {name} เป็น MQTT topic filter สำหรับ subscribe"""
+        return "/".join("+" if level.startswith("{") and level.endswith("}") else level
+                        for level in pattern.split("/"))
+
+    def add(self, pattern: str, handler: Callable[[Any, Dict[str, str]], None]):
+        """ลงทะเบียน handler สำหรับ topic pattern
+
+        Args:
+            pattern: MQTT topic filter ที่ใช้ {name} แทน + ได้ เช่น ogosense/status/{device_id}
+            handler: ฟังก์ชันที่รับ (message, params) โดย params คือค่าของ segment ที่มีชื่อ
+
+        Raises:
+            ValueError: ถ้า pattern ไม่ถูกต้อง (เช่น # ไม่ได้อยู่ท้ายสุด)
+        """
+        levels = pattern.split("/")
+        node = self._root
+        names: List[Optional[str]] = []
+        for index, level in enumerate(levels):
+            if level == "#":
+                if index != len(levels) - 1:
+                    raise ValueError(f"# ต้องอยู่ท้ายสุดของ topic filter: {pattern}")
+                node.multi_routes.append((handler, tuple(names)))
+                break
+            if level == "+" or (level.startswith("{") and level.endswith("}")):
+                names.append(level[1:-1] if level != "+" else None)
+                if node.wildcard is None:
+                    node.wildcard = _TopicNode()
+                node = node.wildcard
+            elif "+" in level or "#" in level:
+                raise ValueError(f"wildcard ต้องอยู่เต็มระดับของ topic filter: {pattern}")
+            else:
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = _TopicNode()
+                node = child
+        else:
+            node.routes.append((handler, tuple(names)))
+
+        topic_filter = self.to_filter(pattern)
+        if topic_filter not in self._filters:
+            self._filters.append(topic_filter)
+
+    def filters(self) -> List[str]:
+        """MQTT topic filter ของทุก pattern ที่ลงทะเบียน (สำหรับ subscribe)"""
+        return list(self._filters)
+
+    def match(self, topic: str) -> List[Tuple[Callable, Dict[str, str]]]:
+        """หา handler ทั้งหมดที่ตรงกับ topic
+
+        Returns:
+            List[Tuple[Callable, Dict[str, str]]]: (handler, params) ของทุก filter ที่ตรงกัน
+        """
+        levels = topic.split("/")
+        depth = len(levels)
+        matches: List[Tuple[Callable, Dict[str, str]]] = []
+        # topic ที่ขึ้นต้นด้วย $ (เช่น $SYS) ไม่ตรงกับ wildcard ที่ระดับแรกตามมาตรฐาน MQTT
+        system_topic = topic.startswith("$")
+
+        # ค้นหาแบบ depth-first: (โหนด, ระดับ, ค่าของ wildcard ที่ผ่านมา)
+        stack = [(self._root, 0, ())]
+        while stack:
+            node, index, values = stack.pop()
+            wildcards_allowed = index > 0 or not system_topic
+
+            if node.multi_routes and wildcards_allowed:
+                rest = "/".join(levels[index:])
+                for handler, names in node.multi_routes:
+                    params = {name: value for name, value in zip(names, values) if name}
+                    params["#"] = rest
+                    matches.append((handler, params))
+
+            if index == depth:
+                for handler, names in node.routes:
+                    matches.append((handler, {name: value for name, value in zip(names, values) if name}))
+                continue
+
+            level = levels[index]
+            if node.wildcard is not None and wildcards_allowed:
+                stack.append((node.wildcard, index + 1, values + (level,)))
+            child = node.children.get(level)
+            if child is not None:
+                stack.append((child, index + 1, values))
+
+        return matches
+
+    def dispatch(self, topic: str, message: Any) -> int:
+        """ส่งข้อความให้ทุก handler ที่ตรงกับ topic
+
+        Args:
+            topic: MQTT topic ของข้อความ
+            message: ข้อความที่ส่งให้ handler
+
+        Returns:
+            int: จำนวน handler ที่ได้รับข้อความ
+        """
+        matches = self.match(topic)
+        if not matches:
+            self.unmatched += 1
+            return 0
+        for handler, params in matches:
+            handler(message, params)
+        self.dispatched += 1
+        return len(matches)
+
 class MQTTClient:
     def __init__(self, broker: str, port: int, username: str, password: str, 
-                 device_id: str, topic_resp: str, message_callback: Callable = None):
+                 device_id: str, topic_resp: str, message_callback: Callable = None,
+                 connection_callback: Callable[[bool], None] = None):
         """สร้าง MQTT Client
         
         Args:
@@ -26,6 +170,7 @@ class MQTTClient:
             device_id: Device ID สำหรับใช้ในการสร้าง client ID
             topic_resp: Topic สำหรับรับข้อความตอบกลับ
             message_callback: ฟังก์ชันที่จะถูกเรียกเมื่อได้รับข้อความ
+            connection_callback: ฟังก์ชันที่จะถูกเรียกเมื่อเชื่อมต่อสำเร็จ (True) หรือล้มเหลว/ขาดการเชื่อมต่อ (False)
         """
         self.broker = broker
         self.port = port
@@ -33,7 +178,10 @@ class MQTTClient:
         self.password = password
         self.device_id = device_id
         self.topic_resp = topic_resp
+        # topic ทั้งหมดที่ต้อง subscribe ทุกครั้งที่เชื่อมต่อ
+        self.topics: List[str] = [topic_resp]
         self.message_callback = message_callback
+        self.connection_callback = connection_callback
         self.client = None
         self._connected = False
         self.ca_cert_path = os.getenv("CA_CERT_PATH", "emqxsl-ca.crt")
@@ -43,7 +191,8 @@ class MQTTClient:
     
     def _setup_mqtt_client(self):
         """ตั้งค่า MQTT Client"""
-        client_id = f"python-telegram-broker-{self.device_id}-{int(time.time())}"
+        # ใส่ pid ด้วย เพื่อไม่ให้ client ID ชนกันเมื่อรันหลาย process (โหมด cluster)
+        client_id = f"python-telegram-broker-{self.device_id}-{int(time.time())}-{os.getpid()}"
         
         # เลือกใช้โปรโตคอลตามเวอร์ชัน
         try:
@@ -95,29 +244,39 @@ class MQTTClient:
             })
             client.publish(status_topic, status_message, qos=1, retain=True)
             
-            # Subscribe ไปยัง topic สำหรับรับข้อความตอบกลับ
-            client.subscribe(self.topic_resp, qos=1)
-            logger.info(f"Subscribe topic: {self.topic_resp}")
+            # Subscribe ไปยังทุก topic (ข้อความตอบกลับ และ topic อื่นที่เพิ่มด้วย add_topic)
+            for topic in self.topics:
+                client.subscribe(topic, qos=1)
+                logger.info(f"Subscribe topic: {topic}")
         else:
             logger.error(f"เชื่อมต่อ MQTT ล้มเหลว ด้วยรหัส {rc}")
             self._connected = False
             self._print_mqtt_error(rc)
+        
+        if self.connection_callback:
+            self.connection_callback(rc == 0)
     
     # แก้ไขเมธอด _on_disconnect ในคลาส MQTTClient ใน mqtt_client.py
     def _on_disconnect(self, client, userdata, rc, properties=None):
         """ฟังก์ชันที่ทำงานเมื่อขาดการเชื่อมต่อ MQTT"""
         logger.warning(f"ขาดการเชื่อมต่อ MQTT (รหัส {rc})")
-        self._connected = False 
+        self._connected = False
+        
+        # แจ้งทันทีที่ขาดการเชื่อมต่อ แทนการรอตรวจสอบรอบถัดไป
+        if self.connection_callback:
+            self.connection_callback(False)
     
     def _on_message(self, client, userdata, msg):
         """ฟังก์ชันที่ทำงานเมื่อได้รับข้อความ MQTT"""
         topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        logger.debug(f"ได้รับข้อความ MQTT จาก topic: {topic}, ข้อความ: {payload}")
+        # ส่ง payload เป็น bytes ตามที่ได้รับ (codec จะ parse จาก bytes โดยตรง)
+        payload = msg.payload
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"ได้รับข้อความ MQTT จาก topic: {topic}, ข้อความ: {payload!r}")
         
-        # เรียกใช้ callback ถ้ามี
+        # เรียกใช้ callback ถ้ามี (ส่ง DUP flag ไปด้วย ใช้แยกข้อความที่ broker ส่งซ้ำ)
         if self.message_callback:
-            self.message_callback(client, topic, payload)
+            self.message_callback(client, topic, payload, msg.dup)
     
     def _print_mqtt_error(self, error_code):
         """แสดงข้อความอธิบายรหัสข้อผิดพลาด MQTT"""
@@ -250,10 +409,333 @@ class MQTTClient:
             logger.error(f"เกิดข้อผิดพลาดขณะส่งข้อความ MQTT: {e}")
             return False
     
+    def add_topic(self, topic: str):
+        """เพิ่ม topic ที่ต้อง subscribe (มีผลตั้งแต่การเชื่อมต่อครั้งถัดไป)
+
+        Args:
+            topic: MQTT topic หรือ filter
+        """
+        if topic not in self.topics:
+            self.topics.append(topic)
+    
     def is_connected(self) -> bool:
         """ตรวจสอบว่ากำลังเชื่อมต่ออยู่หรือไม่
         
         Returns:
             bool: True ถ้าเชื่อมต่ออยู่, False ถ้าไม่ได้เชื่อมต่อ
         """
-        return self._connected
\ No newline at end of file
+        return self._connected
+
+class AsyncMQTTClient(MQTTClient):
+    """MQTT Client สำหรับใช้งานบน asyncio event loop
+
+    การเชื่อมต่อ (DNS, socket, TLS handshake) ทำใน network thread ของ paho ผ่าน connect_async()
+    ส่วน connect(), publish() และ subscribe() เป็น coroutine ที่รอ CONNACK, PUBACK และ SUBACK จริง
+    จึงไม่มีการบล็อก event loop ระหว่างเชื่อมต่อหรือเชื่อมต่อใหม่
+    """
+
+    # จำนวน mid ที่ได้รับ ACK ก่อนลงทะเบียนรอ ที่เก็บไว้สูงสุด
+    MAX_EARLY_ACKS = 1024
+
+    def __init__(self, broker: str, port: int, username: str, password: str,
+                 device_id: str, topic_resp: str, message_callback: Callable = None,
+                 connect_timeout: float = 10.0, ack_timeout: float = 10.0,
+                 connection_callback: Callable[[bool], None] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        """สร้าง MQTT Client แบบ asyncio
+
+        Args:
+            broker: MQTT broker host
+            port: MQTT broker port
+            username: MQTT username
+            password: MQTT password
+            device_id: Device ID สำหรับใช้ในการสร้าง client ID
+            topic_resp: Topic สำหรับรับข้อความตอบกลับ
+            message_callback: ฟังก์ชันที่จะถูกเรียกเมื่อได้รับข้อความ (เรียกจาก network thread)
+            connect_timeout: เวลาสูงสุดที่รอ CONNACK (วินาที)
+            ack_timeout: เวลาสูงสุดที่รอ PUBACK/SUBACK (วินาที)
+            connection_callback: ฟังก์ชันที่จะถูกเรียกเมื่อสถานะการเชื่อมต่อเปลี่ยน (เรียกจาก network thread)
+            metrics: ทะเบียนตัวชี้วัด สำหรับเวลาที่ใช้ publish (จนได้รับ PUBACK)
+        """
+        self.connect_timeout = connect_timeout
+        self.ack_timeout = ack_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connack_waiters: List[asyncio.Future] = []
+        self._ack_lock = threading.Lock()
+        self._ack_waiters: Dict[int, asyncio.Future] = {}
+        # mid -> เวลาที่ได้รับ ACK (time.monotonic()) ของ ACK ที่มาถึงก่อนลงทะเบียนรอ
+        self._early_acks: "OrderedDict[int, float]" = OrderedDict()
+        self.last_connect_latency: Optional[float] = None
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        publish_seconds = self.metrics.histogram(
+            "ogosense_mqtt_publish_seconds", "เวลาที่ใช้ publish ข้อความ MQTT จนได้รับ PUBACK แยกตามผลลัพธ์", ("result",))
+        self._publish_ok = publish_seconds.labels("ok")
+        self._publish_failed = publish_seconds.labels("failed")
+        super().__init__(broker, port, username, password, device_id, topic_resp, message_callback,
+                         connection_callback)
+
+    def _setup_mqtt_client(self):
+        """ตั้งค่า MQTT Client พร้อม callback สำหรับ PUBACK/SUBACK"""
+        super()._setup_mqtt_client()
+        self.client.on_publish = self._on_publish
+        self.client.on_subscribe = self._on_subscribe
+        # client ใหม่เริ่มนับ mid จาก 1 ใหม่ ACK ของ client เดิมใช้ไม่ได้แล้ว
+        self._clear_early_acks()
+
+    def _clear_early_acks(self):
+        with self._ack_lock:
+            self._early_acks.clear()
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        """ฟังก์ชันที่ทำงานเมื่อได้รับ CONNACK (ทำงานบน network thread)"""
+        # เชื่อมต่อใหม่ (รวมถึง auto-reconnect ของ paho): ล้าง ACK ของการเชื่อมต่อก่อนหน้า
+        self._clear_early_acks()
+        super()._on_connect(client, userdata, flags, rc, properties)
+        self._resolve_connack(rc)
+
+    def _on_publish(self, client, userdata, mid, *args):
+        """ฟังก์ชันที่ทำงานเมื่อได้รับ PUBACK (ทำงานบน network thread)"""
+        self._resolve_ack(mid)
+
+    def _on_subscribe(self, client, userdata, mid, *args):
+        """ฟังก์ชันที่ทำงานเมื่อได้รับ SUBACK (ทำงานบน network thread)"""
+        self._resolve_ack(mid)
+
+    def _resolve_connack(self, rc):
+        """แจ้งผล CONNACK ไปยัง coroutine ที่รออยู่"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._set_connack_result, rc)
+
+    def _set_connack_result(self, rc):
+        """ตั้งค่าผลลัพธ์ให้ future ที่รอ CONNACK (ทำงานบน event loop)"""
+        waiters, self._connack_waiters = self._connack_waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(rc)
+
+    def _resolve_ack(self, mid: int):
+        """แจ้งผล PUBACK/SUBACK ไปยัง coroutine ที่รอ mid นี้อยู่"""
+        with self._ack_lock:
+            future = self._ack_waiters.pop(mid, None)
+            if future is None:
+                # ACK มาถึงก่อนที่ publish()/subscribe() จะลงทะเบียนรอ (หรือไม่มีใครรอ เช่น publish ใน
+                # _on_connect หรือ ACK ที่มาหลังหมดเวลารอ) เก็บเวลาไว้ให้ _wait_ack แยก ACK เก่าที่ mid ซ้ำ
+                self._early_acks[mid] = time.monotonic()
+                while len(self._early_acks) > self.MAX_EARLY_ACKS:
+                    self._early_acks.popitem(last=False)
+                return
+
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._set_future_result, future, True)
+
+    @staticmethod
+    def _set_future_result(future: asyncio.Future, result):
+        if not future.done():
+            future.set_result(result)
+
+    async def _wait_ack(self, mid: int, timeout: float, issued_at: float) -> bool:
+        """รอ ACK ของ mid ที่ระบุ
+
+        Args:
+            mid: message id ที่ paho กำหนดให้
+            timeout: เวลาสูงสุดที่รอ (วินาที)
+            issued_at: เวลา (time.monotonic()) ก่อนเรียก publish()/subscribe() ของ paho
+                ACK ของ mid เดียวกันที่มาถึงก่อนหน้านี้เป็นของข้อความอื่น (mid ถูกใช้ซ้ำ)
+
+        Returns:
+            bool: True ถ้าได้รับ ACK ภายในเวลาที่กำหนด
+        """
+        with self._ack_lock:
+            acked_at = self._early_acks.pop(mid, None)
+            if acked_at is not None and acked_at >= issued_at:
+                return True
+            future = self._loop.create_future()
+            self._ack_waiters[mid] = future
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"ไม่ได้รับ ACK สำหรับข้อความ MQTT mid={mid} ภายใน {timeout} วินาที")
+            return False
+        finally:
+            with self._ack_lock:
+                self._ack_waiters.pop(mid, None)
+
+    async def _wait_connack(self, timeout: float) -> bool:
+        """เริ่ม network thread แล้วรอ CONNACK
+
+        Returns:
+            bool: True ถ้าเชื่อมต่อสำเร็จ
+        """
+        future = self._loop.create_future()
+        self._connack_waiters.append(future)
+        started = time.monotonic()
+
+        try:
+            # network thread จะเชื่อมต่อ (DNS, socket, TLS) เองหลัง connect_async()
+            self.client.loop_start()
+            rc = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"ไม่ได้รับ CONNACK จาก MQTT broker ภายใน {timeout} วินาที")
+            return False
+        finally:
+            if future in self._connack_waiters:
+                self._connack_waiters.remove(future)
+
+        self.last_connect_latency = time.monotonic() - started
+        if rc == 0:
+            logger.info(f"ได้รับ CONNACK ใน {self.last_connect_latency * 1000:.0f} ms")
+        return rc == 0 and self.is_connected()
+
+    async def _stop_network_loop(self):
+        """หยุด network thread ของ paho โดยไม่บล็อก event loop"""
+        if self.client and self.client._thread is not None:
+            try:
+                logger.debug("กำลังหยุด MQTT client loop")
+                await asyncio.to_thread(self.client.loop_stop)
+            except Exception as e:
+                logger.warning(f"ไม่สามารถหยุด loop เดิมได้: {e}")
+
+    async def connect(self, timeout: Optional[float] = None) -> bool:
+        """เชื่อมต่อไปยัง MQTT Broker และรอจนได้รับ CONNACK
+
+        Args:
+            timeout: เวลาสูงสุดที่รอ CONNACK (ค่าเริ่มต้นคือ connect_timeout)
+
+        Returns:
+            bool: True ถ้าเชื่อมต่อสำเร็จ, False ถ้าเชื่อมต่อล้มเหลว
+        """
+        self._loop = asyncio.get_running_loop()
+        try:
+            logger.info(f"กำลังเชื่อมต่อ MQTT broker: {self.broker}:{self.port}")
+            self.client.connect_async(self.broker, self.port, keepalive=60)
+            return await self._wait_connack(timeout or self.connect_timeout)
+        except Exception as e:
+            logger.error(f"ไม่สามารถเชื่อมต่อ MQTT broker ได้: {e}")
+            return False
+
+    async def reconnect(self, timeout: Optional[float] = None) -> bool:
+        """เชื่อมต่อใหม่ไปยัง MQTT Broker
+
+        Returns:
+            bool: True ถ้าเชื่อมต่อสำเร็จ, False ถ้าเชื่อมต่อล้มเหลว
+        """
+        self._loop = asyncio.get_running_loop()
+        timeout = timeout or self.connect_timeout
+        try:
+            # หยุด loop เดิมก่อน (ถ้ากำลังทำงานอยู่)
+            await self._stop_network_loop()
+
+            logger.info(f"กำลังเชื่อมต่อใหม่ไปยัง MQTT broker: {self.broker}:{self.port}")
+            try:
+                self.client.connect_async(self.broker, self.port, keepalive=60)
+                if await self._wait_connack(timeout):
+                    return True
+            except Exception as reconnect_error:
+                logger.warning(f"ไม่สามารถใช้ reconnect ได้: {reconnect_error}")
+
+            # ถ้า reconnect ไม่ได้ ให้สร้าง client ใหม่และเชื่อมต่อใหม่
+            await self._stop_network_loop()
+            logger.info("กำลังสร้าง MQTT client ใหม่...")
+            self._setup_mqtt_client()
+            try:
+                self.client.connect_async(self.broker, self.port, keepalive=60)
+                return await self._wait_connack(timeout)
+            except Exception as connect_error:
+                logger.error(f"ไม่สามารถเชื่อมต่อใหม่กับ MQTT broker ได้: {connect_error}")
+                return False
+
+        except Exception as e:
+            logger.error(f"เกิดข้อผิดพลาดในการเชื่อมต่อใหม่: {e}")
+            return False
+
+    async def disconnect(self):
+        """ยกเลิกการเชื่อมต่อจาก MQTT Broker"""
+        if self.client:
+            try:
+                # ส่งข้อความ offline status และรอ PUBACK แทนการรอเวลาคงที่
+                status_topic = f"ogosense/status/{self.device_id}"
+                status_message = json.dumps({
+                    "device_id": self.device_id,
+                    "status": "offline",
+                    "timestamp": int(time.time())
+                })
+                await self.publish(status_topic, status_message, qos=1, retain=True, timeout=2.0)
+
+                # ตัดการเชื่อมต่อ
+                self.client.disconnect()
+                await self._stop_network_loop()
+                logger.info("ยกเลิกการเชื่อมต่อ MQTT เรียบร้อย")
+            except Exception as e:
+                logger.error(f"เกิดข้อผิดพลาดขณะยกเลิกการเชื่อมต่อ MQTT: {e}")
+
+    async def publish(self, topic: str, payload: str, qos: int = 1, retain: bool = False,
+                      timeout: Optional[float] = None) -> bool:
+        """ส่งข้อความไปยัง MQTT Topic และรอ PUBACK (สำหรับ QoS > 0)
+
+        Args:
+            topic: MQTT topic
+            payload: ข้อความที่จะส่ง
+            qos: Quality of Service
+            retain: ตั้งค่า retain flag
+            timeout: เวลาสูงสุดที่รอ PUBACK (ค่าเริ่มต้นคือ ack_timeout)
+
+        Returns:
+            bool: True ถ้าส่งสำเร็จ, False ถ้าส่งล้มเหลว
+        """
+        if not self.is_connected():
+            logger.warning("ไม่สามารถส่งข้อความ MQTT ได้: ไม่ได้เชื่อมต่อ")
+            return False
+
+        self._loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        issued_at = time.monotonic()
+        try:
+            result = self.client.publish(topic, payload, qos=qos, retain=retain)
+            if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                logger.error(f"ส่งข้อความ MQTT ล้มเหลว: {topic}, รหัสข้อผิดพลาด: {result.rc}")
+                self._publish_failed.observe(time.perf_counter() - started)
+                return False
+            if qos > 0 and not await self._wait_ack(result.mid, timeout or self.ack_timeout, issued_at):
+                self._publish_failed.observe(time.perf_counter() - started)
+                return False
+            self._publish_ok.observe(time.perf_counter() - started)
+            logger.debug(f"ส่งข้อความ MQTT สำเร็จ: {topic}")
+            return True
+        except Exception as e:
+            self._publish_failed.observe(time.perf_counter() - started)
+            logger.error(f"เกิดข้อผิดพลาดขณะส่งข้อความ MQTT: {e}")
+            return False
+
+    async def subscribe(self, topic: str, qos: int = 1, timeout: Optional[float] = None) -> bool:
+        """Subscribe ไปยัง MQTT Topic และรอ SUBACK
+
+        Args:
+            topic: MQTT topic หรือ filter
+            qos: Quality of Service
+            timeout: เวลาสูงสุดที่รอ SUBACK (ค่าเริ่มต้นคือ ack_timeout)
+
+        Returns:
+            bool: True ถ้า subscribe สำเร็จ, False ถ้าล้มเหลว
+        """
+        if not self.is_connected():
+            logger.warning(f"ไม่สามารถ subscribe {topic} ได้: ไม่ได้เชื่อมต่อ")
+            return False
+
+        self._loop = asyncio.get_running_loop()
+        try:
+            issued_at = time.monotonic()
+            rc, mid = self.client.subscribe(topic, qos=qos)
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                logger.error(f"Subscribe {topic} ล้มเหลว, รหัสข้อผิดพลาด: {rc}")
+                return False
+            success = await self._wait_ack(mid, timeout or self.ack_timeout, issued_at)
+            if success:
+                logger.info(f"Subscribe topic: {topic}")
+            return success
+        except Exception as e:
+            logger.error(f"เกิดข้อผิดพลาดขณะ subscribe MQTT: {e}")
+            return False
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Outbox module สำหรับเก็บคำสั่งที่ส่งไม่ได้ระหว่าง MQTT ขาดการเชื่อมต่อ
+
+คำสั่งถูกบันทึกลง Storage (อยู่รอดหลังรีสตาร์ท) พร้อมเวลาหมดอายุ
+คำสั่งชนิดเดียวกันของอุปกรณ์เดียวกันเก็บไว้เพียงรายการล่าสุด (คำสั่งใหม่แทนที่คำสั่งเก่า)
+เมื่อเชื่อมต่อได้อีกครั้ง bridge จะดึงคำสั่งออกไปส่งเป็นชุด แทนที่ผู้ใช้แต่ละคนจะส่งซ้ำเอง
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# จำนวนคำสั่งสูงสุดที่แสดงในข้อความแจ้งผลหนึ่งข้อความ (ข้อความ Telegram ยาวได้ไม่เกิน 4096 ตัวอักษร)
+NOTIFY_MAX_LINES = 30
+
+
+class OutboxEntry:
+    """คำสั่งหนึ่งรายการที่รอส่ง"""
+
+    __slots__ = ("device_id", "command", "params", "chat_id", "created", "expires")
+
+    def __init__(self, device_id: str, command: str, params: Optional[Dict[str, Any]], chat_id: str,
+                 created: float, expires: float):
+        self.device_id = device_id
+        self.command = command
+        self.params = params
+        self.chat_id = chat_id
+        # เวลาแบบ epoch (time.time()) เพราะต้องใช้ต่อได้หลังรีสตาร์ท
+        self.created = created
+        self.expires = expires
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.device_id, self.command
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "device_id": self.device_id,
+            "command": self.command,
+            "params": self.params,
+            "chat_id": self.chat_id,
+            "created": self.created,
+            "expires": self.expires,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OutboxEntry":
+        return cls(str(data["device_id"]), data["command"], data.get("params"), str(data["chat_id"]),
+                   float(data["created"]), float(data["expires"]))
+
+
+def describe_entries(entries: List[OutboxEntry], waited: bool = False) -> str:
+    """สร้างรายการคำสั่งสำหรับข้อความแจ้งผล (แสดงไม่เกิน NOTIFY_MAX_LINES รายการ)
+
+    Args:
+        entries: คำสั่งที่จะแสดง
+        waited: แสดงเวลาที่คำสั่งรอส่งด้วยหรือไม่
+    """
+    now = time.time()
+    lines = []
+    for entry in entries[:NOTIFY_MAX_LINES]:
+        line = f"- {entry.command} -> {entry.device_id}"
+        if waited:
+            line += f" (รอ {now - entry.created:.0f} วินาที)"
+        lines.append(line)
+    if len(entries) > NOTIFY_MAX_LINES:
+        lines.append(f"... และอีก {len(entries) - NOTIFY_MAX_LINES} รายการ")
+    return "\n".join(lines)
+
+
+class CommandOutbox:
+    """คิวคำสั่งที่รอส่งระหว่าง MQTT ขาดการเชื่อมต่อ เรียงตามเวลาที่สั่ง (ทำงานบน event loop เท่านั้น)"""
+
+    def __init__(self, storage: Optional[Storage] = None, ttl: float = 300.0, max_entries: int = 1000,
+                 notify: Callable[[str, str], None] = None):
+        """
+        Args:
+            storage: ที่บันทึกคำสั่งลงดิสก์ (None คือเก็บในหน่วยความจำเท่านั้น)
+            ttl: เวลา (วินาที) ที่คำสั่งรอส่งได้ก่อนหมดอายุ
+            max_entries: จำนวนคำสั่งสูงสุดที่เก็บได้
+            notify: ฟังก์ชันส่งข้อความแจ้งผลไปยังแชท (chat_id, ข้อความ)
+        """
+        self.storage = storage
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.notify = notify
+        self._entries: "OrderedDict[Tuple[str, str], OutboxEntry]" = OrderedDict()
+
+        # สถิติ
+        self.queued = 0
+        self.replaced = 0
+        self.replayed = 0
+        self.expired = 0
+
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        """โหลดคำสั่งที่ค้างอยู่จาก Storage"""
+        if self.storage is None:
+            return
+        self._entries.clear()
+        for data in self.storage.get_document("outbox") or []:
+            try:
+                entry = OutboxEntry.from_dict(data)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"ข้ามคำสั่งใน outbox ที่ไม่ถูกต้อง: {e}")
+                continue
+            self._entries[entry.key] = entry
+        if self._entries:
+            logger.info(f"โหลดคำสั่งที่รอส่ง {len(self._entries)} รายการจาก outbox")
+
+    def _save(self):
+        if self.storage is not None:
+            self.storage.put_document("outbox", [entry.to_dict() for entry in self._entries.values()])
+
+    def accepts(self, device_id: str, command: str) -> bool:
+        """ตรวจสอบว่าเก็บคำสั่งนี้ได้หรือไม่ (แทนที่คำสั่งเดิมได้เสมอ แม้ outbox เต็ม)"""
+        return (device_id, command) in self._entries or len(self._entries) < self.max_entries
+
+    def add(self, device_id: str, command: str, params: Optional[Dict[str, Any]], chat_id: str) -> Optional[OutboxEntry]:
+        """เก็บคำสั่งไว้ส่งภายหลัง (ตรวจสอบ accepts() ก่อนเรียก)
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่ง
+            params: พารามิเตอร์เพิ่มเติมของคำสั่ง (ต้องแปลงเป็น JSON ได้)
+            chat_id: Chat ID ที่สั่ง (ได้รับแจ้งผลเมื่อส่งแล้วหรือหมดอายุ)
+
+        Returns:
+            Optional[OutboxEntry]: คำสั่งเดิมของ (device_id, command) ที่ถูกแทนที่ (ถ้ามี)
+        """
+        now = time.time()
+        key = (device_id, command)
+        previous = self._entries.pop(key, None)
+        self._entries[key] = OutboxEntry(device_id, command, dict(params) if params else None, chat_id,
+                                         now, now + self.ttl)
+        self.queued += 1
+        if previous is not None:
+            self.replaced += 1
+            self._notify_replaced(previous, chat_id)
+        self._save()
+        return previous
+
+    def remove(self, device_id: str, command: str, chat_id: Optional[str] = None) -> Optional[OutboxEntry]:
+        """ลบคำสั่งที่รอส่ง เพราะมีคำสั่งใหม่กว่าของ (device_id, command) ถูกส่งไปโดยตรงแล้ว
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่ง
+            chat_id: Chat ID ของคำสั่งใหม่ (ไม่แจ้งซ้ำถ้าเป็นแชทเดียวกัน)
+
+        Returns:
+            Optional[OutboxEntry]: คำสั่งที่ถูกลบ (ถ้ามี)
+        """
+        previous = self._entries.pop((device_id, command), None)
+        if previous is not None:
+            self.replaced += 1
+            self._notify_replaced(previous, chat_id)
+            self._save()
+        return previous
+
+    def take(self, limit: int) -> List[OutboxEntry]:
+        """ดึงคำสั่งที่ยังไม่หมดอายุออกจาก outbox เพื่อส่ง (เก่าสุดก่อน)
+
+        คำสั่งที่ส่งไม่สำเร็จต้องคืนด้วย restore()
+
+        Args:
+            limit: จำนวนคำสั่งสูงสุด
+        """
+        self.expire()
+        batch = []
+        while self._entries and len(batch) < limit:
+            batch.append(self._entries.popitem(last=False)[1])
+        if batch:
+            self._save()
+        return batch
+
+    def restore(self, entries: Iterable[OutboxEntry]):
+        """คืนคำสั่งที่ส่งไม่สำเร็จไว้ต้นคิวตามลำดับเดิม (ยกเว้นมีคำสั่งใหม่กว่าของ key เดียวกันแล้ว)"""
+        restored = False
+        for entry in reversed(list(entries)):
+            if entry.key in self._entries:
+                continue
+            self._entries[entry.key] = entry
+            self._entries.move_to_end(entry.key, last=False)
+            restored = True
+        if restored:
+            self._save()
+
+    def mark_replayed(self, count: int):
+        """บันทึกจำนวนคำสั่งที่ส่งสำเร็จจาก outbox"""
+        self.replayed += count
+
+    def expire(self, now: Optional[float] = None) -> List[OutboxEntry]:
+        """ลบคำสั่งที่หมดอายุ และแจ้งแชทที่สั่ง (รวมเป็นข้อความเดียวต่อแชท)
+
+        Returns:
+            List[OutboxEntry]: คำสั่งที่หมดอายุ
+        """
+        now = time.time() if now is None else now
+        expired = [entry for entry in self._entries.values() if entry.expires <= now]
+        if not expired:
+            return expired
+
+        for entry in expired:
+            del self._entries[entry.key]
+        self.expired += len(expired)
+        self._save()
+        logger.warning(f"คำสั่งใน outbox หมดอายุ {len(expired)} รายการ (MQTT ยังเชื่อมต่อไม่ได้)")
+
+        by_chat: Dict[str, List[OutboxEntry]] = {}
+        for entry in expired:
+            by_chat.setdefault(entry.chat_id, []).append(entry)
+        for chat_id, entries in by_chat.items():
+            self.announce(chat_id, "ไม่สามารถเชื่อมต่อ MQTT ได้ภายในเวลาที่กำหนด คำสั่งต่อไปนี้ถูกยกเลิก:\n"
+                                   + describe_entries(entries))
+        return expired
+
+    def stats(self) -> Dict[str, int]:
+        """ดึงสถิติของ outbox"""
+        return {
+            "waiting": len(self._entries),
+            "queued": self.queued,
+            "replaced": self.replaced,
+            "replayed": self.replayed,
+            "expired": self.expired,
+        }
+
+    def _notify_replaced(self, entry: OutboxEntry, chat_id: Optional[str]):
+        if entry.chat_id != chat_id:
+            self.announce(entry.chat_id, f"คำสั่ง {entry.command} ที่รอส่งไปยังอุปกรณ์ {entry.device_id} "
+                                        f"ถูกแทนที่ด้วยคำสั่งใหม่กว่าจากแชทอื่น")
+
+    def announce(self, chat_id: str, text: str):
+        """ส่งข้อความแจ้งผลของคำสั่งใน outbox ไปยังแชท (ถ้ามี notify)"""
+        if self.notify is None:
+            return
+        try:
+            self.notify(chat_id, text)
+        except Exception as e:
+            logger.error(f"ไม่สามารถแจ้งผลของคำสั่งใน outbox ไปยังแชท {chat_id}: {e}")
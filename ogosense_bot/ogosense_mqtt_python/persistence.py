@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""Persistence module สำหรับบันทึกข้อมูลลงดิสก์อย่างปลอดภัยเมื่อไฟดับ และไม่บล็อก event loop"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync_directory(path: str):
+    """fsync โฟลเดอร์ที่เก็บไฟล์ เพื่อให้การเปลี่ยนชื่อไฟล์ถูกบันทึกถาวร"""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, data: bytes):
+    """เขียนไฟล์แบบ atomic: เขียนไฟล์ชั่วคราว, fsync แล้วเปลี่ยนชื่อทับไฟล์เดิม
+
+    Args:
+        path: ไฟล์ปลายทาง
+        data: ข้อมูลที่จะเขียน
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(path)
+
+
+class StorageBackend(ABC):
+    """ที่เก็บข้อมูลแบบ key-value โดยแต่ละ key เก็บค่าที่แปลงเป็น JSON ได้"""
+
+    @abstractmethod
+    def load(self) -> Dict[str, Any]:
+        """โหลดข้อมูลทั้งหมด
+
+        Returns:
+            Dict[str, Any]: ข้อมูลทั้งหมดตาม key
+        """
+
+    @abstractmethod
+    def write(self, changes: Dict[str, Any]):
+        """บันทึกค่าของ key ที่เปลี่ยนแปลง (ค่า None หมายถึงลบ key)
+
+        Args:
+            changes: key และค่าล่าสุดที่ต้องบันทึก
+        """
+
+    def close(self):
+        """ปิดที่เก็บข้อมูล"""
+
+
+class JournalBackend(StorageBackend):
+    """ที่เก็บข้อมูลแบบ append-only journal พร้อม snapshot
+
+    การเปลี่ยนแปลงแต่ละครั้งถูกต่อท้าย journal หนึ่งบรรทัด (JSON) แล้ว fsync
+    เมื่อ journal ยาวเกิน compact_after บรรทัด จะเขียน snapshot ใหม่แบบ atomic แล้วเริ่ม journal ใหม่
+    บรรทัดสุดท้ายที่เขียนไม่ครบ (เช่น ไฟดับระหว่างเขียน) จะถูกตัดทิ้งตอนโหลด
+    """
+
+    def __init__(self, path: str, compact_after: int = 1000):
+        """
+        Args:
+            path: ชื่อไฟล์หลัก (จะใช้ <path>.snapshot และ <path>.journal)
+            compact_after: จำนวนบรรทัดใน journal ก่อนทำ compaction
+        """
+        self.snapshot_path = f"{path}.snapshot"
+        self.journal_path = f"{path}.journal"
+        self.compact_after = compact_after
+        self._state: Dict[str, Any] = {}
+        self._journal_lines = 0
+        self._journal = None
+
+    def load(self) -> Dict[str, Any]:
+        state: Dict[str, Any] = {}
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                state = json.loads(f.read() or b"{}")
+
+        lines = 0
+        if os.path.exists(self.journal_path):
+            valid_end = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"ข้ามบรรทัดที่เสียหายใน journal {self.journal_path}")
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    self._apply(state, record)
+                    valid_end += len(line)
+                    lines += 1
+                size = f.tell()
+
+            # ตัดส่วนที่เขียนไม่ครบทิ้ง เพื่อไม่ให้บรรทัดถัดไปต่อท้ายข้อมูลที่เสียหาย
+            if size > valid_end:
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(valid_end)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        self._state = state
+        self._journal_lines = lines
+        return dict(state)
+
+    @staticmethod
+    def _apply(state: Dict[str, Any], changes: Dict[str, Any]):
+        for key, value in changes.items():
+            if value is None:
+                state.pop(key, None)
+            else:
+                state[key] = value
+
+    def write(self, changes: Dict[str, Any]):
+        if not changes:
+            return
+
+        self._apply(self._state, changes)
+
+        if self._journal is None:
+            self._journal = open(self.journal_path, "ab")
+        self._journal.write(json.dumps(changes, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_lines += 1
+
+        if self._journal_lines >= self.compact_after:
+            self.compact()
+
+    def compact(self):
+        """เขียน snapshot ใหม่จากข้อมูลปัจจุบันและเริ่ม journal ใหม่"""
+        atomic_write(self.snapshot_path, json.dumps(self._state, ensure_ascii=False).encode("utf-8"))
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        # snapshot ถูกบันทึกถาวรแล้ว จึงล้าง journal ได้อย่างปลอดภัย
+        atomic_write(self.journal_path, b"")
+        self._journal_lines = 0
+        logger.debug(f"compact journal {self.journal_path} เรียบร้อย")
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+class SQLiteBackend(StorageBackend):
+    """ที่เก็บข้อมูลแบบ SQLite ในโหมด WAL"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: ไฟล์ฐานข้อมูล SQLite
+        """
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # ใช้งานจาก writer thread ได้ (การเข้าถึงทั้งหมดผ่าน CoalescingWriter ทีละ thread)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.commit()
+        return self._conn
+
+    def load(self) -> Dict[str, Any]:
+        rows = self._connection().execute("SELECT key, value FROM kv").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def write(self, changes: Dict[str, Any]):
+        if not changes:
+            return
+        conn = self._connection()
+        with conn:
+            for key, value in changes.items():
+                if value is None:
+                    conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+                else:
+                    conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                                 (key, json.dumps(value, ensure_ascii=False)))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def create_backend(kind: str, path: str) -> StorageBackend:
+    """สร้างที่เก็บข้อมูลตามชนิดที่ระบุ
+
+    Args:
+        kind: journal หรือ sqlite
+        path: ชื่อไฟล์หลัก (ไม่รวมนามสกุล)
+
+    Returns:
+        StorageBackend: ที่เก็บข้อมูลที่สร้างขึ้น
+    """
+    if kind == "sqlite":
+        return SQLiteBackend(f"{path}.db")
+    if kind == "journal":
+        return JournalBackend(path)
+    raise ValueError(f"ไม่รู้จัก storage backend: {kind}")
+
+
+class CoalescingWriter:
+    """รวมการเขียนหลายครั้งเป็นครั้งเดียว แล้วเขียนลงดิสก์ใน thread แยกจาก event loop
+
+    ถ้ามีการเปลี่ยนค่า key เดิมหลายครั้งภายใน delay วินาที จะบันทึกเฉพาะค่าล่าสุด
+    """
+
+    def __init__(self, backend: StorageBackend, delay: float = 0.2):
+        """
+        Args:
+            backend: ที่เก็บข้อมูลปลายทาง
+            delay: เวลารอ (วินาที) เพื่อรวมการเขียนก่อนบันทึกจริง
+        """
+        self.backend = backend
+        self.delay = delay
+        self._pending: Dict[str, Any] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._writing = False
+        self._flush_requested = False
+        self.writes = 0
+        self.coalesced = 0
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, key: str, value: Any):
+        """ส่งค่าใหม่ของ key ให้บันทึก (ไม่บล็อก)
+
+        Args:
+            key: key ที่เปลี่ยนแปลง
+            value: ค่าใหม่ (ต้องแปลงเป็น JSON ได้ และไม่ควรถูกแก้ไขหลังส่ง) หรือ None เพื่อลบ
+        """
+        with self._cond:
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = value
+            self._cond.notify()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """รอจนข้อมูลที่ค้างอยู่ถูกบันทึกทั้งหมด
+
+        Returns:
+            bool: True ถ้าบันทึกครบภายในเวลาที่กำหนด
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify()
+            while self._pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """บันทึกข้อมูลที่ค้างอยู่แล้วหยุด writer thread"""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5.0)
+        self.backend.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+
+                # รอสักครู่เพื่อรวมการเขียนที่ตามมาติดๆ (ยกเว้นมีการสั่ง flush หรือปิด)
+                deadline = time.monotonic() + self.delay
+                while not self._closed and not self._flush_requested:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._flush_requested = False
+                changes, self._pending = self._pending, {}
+                self._writing = True
+
+            try:
+                self.backend.write(changes)
+                self.writes += 1
+            except Exception as e:
+                logger.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูลลงดิสก์: {e}")
+                # เก็บการเปลี่ยนแปลงไว้ลองใหม่ โดยไม่ทับค่าที่ใหม่กว่า
+                with self._cond:
+                    for key, value in changes.items():
+                        self._pending.setdefault(key, value)
+                time.sleep(1.0)
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""Profiling module สำหรับวัดเวลาที่ handler และ callback ใช้ โดยเปิด/ปิดได้ขณะทำงาน
+
+จุดที่ต้องการวัดถูกลงทะเบียนด้วย instrument(ชื่อ, อ็อบเจกต์, ชื่อ attribute) เมื่อเปิดการวัด
+attribute นั้นจะถูกแทนที่ด้วยฟังก์ชันที่วัดเวลา และเมื่อปิดจะคืนฟังก์ชันเดิมกลับไป
+ขณะปิดอยู่จึงไม่มีโค้ดของการวัดอยู่ในเส้นทางการเรียกเลย
+
+sample() เก็บตัวอย่าง stack ของ event loop thread เป็นระยะจาก thread แยก (ไม่ต้องรีสตาร์ทใต้ profiler)
+"""
+
+import os
+import sys
+import time
+import asyncio
+import inspect
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# จำนวนตัวอักษรสูงสุดของอาร์กิวเมนต์ที่แสดงใน log ของการเรียกที่ช้า
+MAX_ARGS_LENGTH = 300
+
+# จำนวนฟังก์ชันที่แสดงในรายงานของ sample()
+REPORT_TOP = 15
+
+Describe = Callable[..., str]
+
+
+def _describe_default(*args, **kwargs) -> str:
+    parts = [repr(arg) for arg in args]
+    parts.extend(f"{key}={value!r}" for key, value in kwargs.items())
+    return ", ".join(parts)
+
+
+class CallStats:
+    """สถิติของจุดที่วัดหนึ่งจุด"""
+
+    __slots__ = ("calls", "wall", "cpu", "wall_max", "slow", "errors")
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.wall_max = 0.0
+        self.slow = 0
+        self.errors = 0
+
+
+class _Target:
+    """จุดที่ลงทะเบียนไว้: attribute ของอ็อบเจกต์ที่ถูกแทนที่เมื่อเปิดการวัด"""
+
+    __slots__ = ("owner", "attr", "original", "own", "describe")
+
+    def __init__(self, owner: Any, attr: str, describe: Describe):
+        self.owner = owner
+        self.attr = attr
+        self.original = getattr(owner, attr)
+        # เมธอดของ class ถูกบังด้วย attribute ของอ็อบเจกต์ระหว่างวัด และคืนค่าด้วยการลบ attribute นั้น
+        # ส่วน attribute ที่เก็บในอ็อบเจกต์อยู่แล้ว (รวมถึง __slots__) คืนค่าด้วยการกำหนดค่าเดิม
+        self.own = not (inspect.ismethod(self.original) and self.original.__self__ is owner
+                        and attr not in getattr(owner, "__dict__", ()))
+        self.describe = describe
+
+    def install(self, wrapper: Callable):
+        setattr(self.owner, self.attr, wrapper)
+
+    def restore(self):
+        if self.own:
+            setattr(self.owner, self.attr, self.original)
+        else:
+            delattr(self.owner, self.attr)
+
+
+class Profiler:
+    """วัดเวลา wall และ CPU ของจุดที่ลงทะเบียนไว้ และเก็บตัวอย่าง stack แบบจำกัดเวลา"""
+
+    def __init__(self, slow_threshold: float = 0.5, enabled: bool = False, sample_interval: float = 0.005):
+        """
+        Args:
+            slow_threshold: การเรียกที่ใช้เวลา (วินาที) มากกว่านี้จะถูกบันทึกลง log พร้อมอาร์กิวเมนต์
+            enabled: เปิดการวัดตั้งแต่เริ่มต้นหรือไม่
+            sample_interval: ช่วงเวลา (วินาที) ระหว่างการเก็บตัวอย่าง stack ของ sample()
+        """
+        self.slow_threshold = slow_threshold
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        self._targets: Dict[str, _Target] = {}
+        self._stats: Dict[str, CallStats] = {}
+        self._sampling = False
+        self.started: Optional[float] = time.monotonic() if enabled else None
+
+    def instrument(self, name: str, owner: Any, attr: str, describe: Optional[Describe] = None):
+        """ลงทะเบียนจุดที่ต้องการวัด (ลงทะเบียนชื่อเดิมซ้ำจะแทนที่ของเดิม เช่น หลังสร้าง Application ใหม่)
+
+        Args:
+            name: ชื่อที่แสดงในรายงาน
+            owner: อ็อบเจกต์ที่มี attribute ที่จะถูกแทนที่
+            attr: ชื่อ attribute (ฟังก์ชันธรรมดาหรือ coroutine function)
+            describe: ฟังก์ชันสร้างข้อความอธิบายอาร์กิวเมนต์สำหรับ log ของการเรียกที่ช้า
+        """
+        previous = self._targets.pop(name, None)
+        if previous is not None and self.enabled:
+            previous.restore()
+
+        target = _Target(owner, attr, describe or _describe_default)
+        self._targets[name] = target
+        self._stats.setdefault(name, CallStats())
+        if self.enabled:
+            target.install(self._wrap(name, target))
+
+    def enable(self, slow_threshold: Optional[float] = None) -> bool:
+        """เปิดการวัด
+
+        Returns:
+            bool: True ถ้าเปลี่ยนจากปิดเป็นเปิด
+        """
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+        if self.enabled:
+            return False
+        self.enabled = True
+        self.started = time.monotonic()
+        for name, target in self._targets.items():
+            target.install(self._wrap(name, target))
+        logger.info(f"เปิดการวัดเวลา {len(self._targets)} จุด (บันทึกการเรียกที่นานกว่า {self.slow_threshold * 1000:.0f} ms)")
+        return True
+
+    def disable(self) -> bool:
+        """ปิดการวัดและคืนฟังก์ชันเดิม (สถิติยังอยู่จนกว่าจะ reset())
+
+        Returns:
+            bool: True ถ้าเปลี่ยนจากเปิดเป็นปิด
+        """
+        if not self.enabled:
+            return False
+        self.enabled = False
+        for target in self._targets.values():
+            target.restore()
+        logger.info("ปิดการวัดเวลา")
+        return True
+
+    def toggle(self) -> bool:
+        """สลับเปิด/ปิดการวัด
+
+        Returns:
+            bool: สถานะหลังสลับ (True คือเปิด)
+        """
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def reset(self):
+        """ล้างสถิติทั้งหมด"""
+        for stats in self._stats.values():
+            stats.clear()
+        self.started = time.monotonic() if self.enabled else None
+
+    def _wrap(self, name: str, target: _Target) -> Callable:
+        func = target.original
+        stats = self._stats[name]
+        record = self._record
+
+        # CPU time คือเวลา CPU ของ thread ระหว่างการเรียก สำหรับ coroutine จึงรวม task อื่นที่ทำงานระหว่าง await ด้วย
+        if asyncio.iscoroutinefunction(func):
+            async def profiled(*args, **kwargs):
+                wall, cpu = time.perf_counter(), time.thread_time()
+                failed = True
+                try:
+                    result = await func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    record(name, target, stats, time.perf_counter() - wall, time.thread_time() - cpu, failed, args, kwargs)
+        else:
+            def profiled(*args, **kwargs):
+                wall, cpu = time.perf_counter(), time.thread_time()
+                failed = True
+                try:
+                    result = func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    record(name, target, stats, time.perf_counter() - wall, time.thread_time() - cpu, failed, args, kwargs)
+
+        profiled.__wrapped__ = func
+        return profiled
+
+    def _record(self, name: str, target: _Target, stats: CallStats, wall: float, cpu: float, failed: bool,
+                args: Tuple, kwargs: Dict):
+        stats.calls += 1
+        stats.wall += wall
+        stats.cpu += cpu
+        if wall > stats.wall_max:
+            stats.wall_max = wall
+        if failed:
+            stats.errors += 1
+        if wall > self.slow_threshold:
+            stats.slow += 1
+            try:
+                described = target.describe(*args, **kwargs)
+            except Exception as e:
+                described = f"<ไม่สามารถแสดงอาร์กิวเมนต์: {e}>"
+            if len(described) > MAX_ARGS_LENGTH:
+                described = described[:MAX_ARGS_LENGTH] + "..."
+            logger.warning(f"{name} ใช้เวลา {wall * 1000:.1f} ms (CPU {cpu * 1000:.1f} ms): {described}")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """ดึงสถิติของจุดที่ถูกเรียกแล้ว (เวลาเป็นวินาที)"""
+        return {
+            name: {"calls": s.calls, "wall": s.wall, "cpu": s.cpu, "wall_max": s.wall_max,
+                   "slow": s.slow, "errors": s.errors}
+            for name, s in self._stats.items() if s.calls
+        }
+
+    def report(self, limit: int = 20) -> str:
+        """สร้างรายงานสถิติเรียงตามเวลา wall รวม"""
+        state = "เปิด" if self.enabled else "ปิด"
+        lines = [f"การวัดเวลา: {state} ({len(self._targets)} จุด, เกณฑ์การเรียกที่ช้า {self.slow_threshold * 1000:.0f} ms)"]
+        if self.enabled and self.started is not None:
+            lines[0] += f" วัดมา {time.monotonic() - self.started:.0f} วินาที"
+
+        called = sorted(((name, s) for name, s in self._stats.items() if s.calls),
+                        key=lambda item: item[1].wall, reverse=True)
+        if not called:
+            lines.append("ยังไม่มีการเรียกที่ถูกวัด")
+            return "\n".join(lines)
+
+        lines.append("ชื่อ: จำนวนครั้ง | wall เฉลี่ย/สูงสุด | CPU เฉลี่ย | ช้า")
+        for name, s in called[:limit]:
+            lines.append(f"{name}: {s.calls} | {s.wall / s.calls * 1000:.2f}/{s.wall_max * 1000:.1f} ms"
+                         f" | {s.cpu / s.calls * 1000:.2f} ms | {s.slow}")
+        if len(called) > limit:
+            lines.append(f"... และอีก {len(called) - limit} จุด")
+        return "\n".join(lines)
+
+    @property
+    def sampling(self) -> bool:
+        return self._sampling
+
+    async def sample(self, duration: float, thread_id: Optional[int] = None) -> str:
+        """เก็บตัวอย่าง stack ของ thread เป็นระยะตลอดช่วงเวลา แล้วสรุปฟังก์ชันที่ใช้เวลามากที่สุด
+
+        การเก็บตัวอย่างทำใน thread แยก event loop จึงทำงานตามปกติระหว่างนี้
+
+        Args:
+            duration: ระยะเวลาที่เก็บตัวอย่าง (วินาที)
+            thread_id: thread ที่ต้องการดู (ค่าเริ่มต้นคือ thread ของ event loop ที่เรียก)
+
+        Returns:
+            str: รายงานผล
+
+        Raises:
+            RuntimeError: ถ้ากำลังเก็บตัวอย่างอยู่แล้ว
+        """
+        if self._sampling:
+            raise RuntimeError("กำลังเก็บตัวอย่างอยู่แล้ว")
+        self._sampling = True
+        try:
+            thread_id = thread_id if thread_id is not None else threading.get_ident()
+            logger.info(f"เริ่มเก็บตัวอย่าง stack {duration:.0f} วินาที")
+            samples, own, cumulative = await asyncio.to_thread(self._collect, thread_id, duration)
+        finally:
+            self._sampling = False
+        return self._format_samples(duration, samples, own, cumulative)
+
+    def _collect(self, thread_id: int, duration: float) -> Tuple[int, Counter, Counter]:
+        """เก็บตัวอย่าง stack (ทำงานใน thread แยก)"""
+        own: Counter = Counter()
+        cumulative: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + duration
+        interval = self.sample_interval
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            samples += 1
+            own[self._frame_key(frame)] += 1
+            seen = set()
+            while frame is not None:
+                key = self._frame_key(frame)
+                if key not in seen:
+                    seen.add(key)
+                    cumulative[key] += 1
+                frame = frame.f_back
+            time.sleep(interval)
+        return samples, own, cumulative
+
+    @staticmethod
+    def _frame_key(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    @staticmethod
+    def _format_samples(duration: float, samples: int, own: Counter, cumulative: Counter) -> str:
+        if not samples:
+            return "ไม่ได้ตัวอย่าง stack"
+        lines = [f"ตัวอย่าง stack {samples} ครั้งใน {duration:.0f} วินาที "
+                 f"(รวมเวลาที่ event loop รอ I/O ใน select/poll)", "", "ใช้เวลาในฟังก์ชันเอง:"]
+        for key, count in own.most_common(REPORT_TOP):
+            lines.append(f"{count * 100 / samples:5.1f}% {key}")
+        lines.extend(["", "รวมฟังก์ชันที่เรียกต่อ:"])
+        for key, count in cumulative.most_common(REPORT_TOP):
+            lines.append(f"{count * 100 / samples:5.1f}% {key}")
+        return "\n".join(lines)
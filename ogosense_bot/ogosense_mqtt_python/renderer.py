@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""Renderer module สำหรับสร้างข้อความตอบกลับไปยัง Telegram จากคำตอบ MQTT ของอุปกรณ์
+
+รูปแบบข้อความของแต่ละคำสั่งถูกกำหนดเป็นรายการฟิลด์ (FieldSpec) ใน registry เดียว
+แล้วถูก compile ครั้งเดียวตอนสร้าง ResponseRenderer เป็นฟังก์ชันที่ต่อข้อความด้วย join
+"""
+
+import time
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Sequence
+
+from timeseries import HistorySummary, format_window
+
+logger = logging.getLogger(__name__)
+
+# ข้อความของตัวเลือกโหมดควบคุม (option 0-4)
+OPTION_TEXT = {
+    0: "Humidity only",
+    1: "Temperature only",
+    2: "Temperature & Humidity",
+    3: "Soil Moisture mode",
+    4: "Additional mode",
+}
+
+STATUS_SUCCESS = "สถานะ: สำเร็จ\n"
+STATUS_FAILED = "สถานะ: ไม่สำเร็จ\n"
+
+# ความยาวสูงสุดของข้อความ Telegram หนึ่งข้อความ
+MAX_MESSAGE_LENGTH = 4096
+
+
+def option_text(option: Any) -> str:
+    """แปลงค่า option เป็นข้อความ"""
+    return OPTION_TEXT.get(option, "Unknown")
+
+
+def relay_text(relay: Any) -> str:
+    """แปลงสถานะ relay เป็นข้อความ"""
+    return "เปิด" if relay else "ปิด"
+
+
+def cool_text(cool: Any) -> str:
+    """แปลงโหมดทำความเย็นเป็นข้อความ"""
+    return "COOL mode: Relay ON เมื่อ Temp >= High" if cool else "HEAT mode: Relay ON เมื่อ Temp <= Low"
+
+
+def moisture_text(moisture: Any) -> str:
+    """แปลงโหมดความชื้นเป็นข้อความ"""
+    return "Moisture mode: Relay ON เมื่อ Humidity <= Low" if moisture else "Dehumidifier mode: Relay ON เมื่อ Humidity >= High"
+
+
+def mask_api_key(api_key: str) -> str:
+    """ปกปิด API key ให้เห็นเฉพาะ 4 ตัวแรก"""
+    return api_key[:4] + "****" if len(api_key) > 4 else api_key
+
+
+class FieldSpec:
+    """ข้อกำหนดของหนึ่งบรรทัดในข้อความตอบกลับ
+
+    บรรทัดจะถูกแสดงเมื่อข้อมูลมีครบทุก key ที่ระบุ ค่าจะถูกแปลงด้วย transform (ถ้ามี)
+    แล้วใส่ลงใน template ตามลำดับของ keys
+    """
+
+    __slots__ = ("keys", "template", "transform")
+
+    def __init__(self, keys: Sequence[str], template: str, transform: Callable[[Any], Any] = None):
+        """
+        Args:
+            keys: key ที่ต้องมีในข้อมูล (string เดียวหรือหลาย key)
+            template: รูปแบบข้อความสำหรับ str.format โดยใช้ {} ตามลำดับของ keys
+            transform: ฟังก์ชันแปลงค่าก่อนใส่ template (ใช้กับ key เดียวเท่านั้น)
+        """
+        self.keys = (keys,) if isinstance(keys, str) else tuple(keys)
+        self.template = template
+        self.transform = transform
+        if transform is not None and len(self.keys) != 1:
+            raise ValueError("transform ใช้ได้กับฟิลด์ที่มี key เดียวเท่านั้น")
+
+
+class CommandSpec:
+    """ข้อกำหนดของข้อความตอบกลับสำหรับหนึ่งคำสั่ง"""
+
+    __slots__ = ("fields", "preamble", "requires_data")
+
+    def __init__(self, fields: Sequence[FieldSpec] = (), preamble: str = "", requires_data: bool = True):
+        """
+        Args:
+            fields: รายการฟิลด์ตามลำดับที่จะแสดง
+            preamble: ข้อความคงที่ที่แสดงก่อนฟิลด์
+            requires_data: True ถ้าต้องมี "data" ในคำตอบจึงจะแสดง preamble และฟิลด์
+        """
+        self.fields = tuple(fields)
+        self.preamble = preamble
+        self.requires_data = requires_data
+
+
+# registry ของรูปแบบข้อความตามคำสั่ง
+RESPONSE_SPECS: Dict[str, CommandSpec] = {
+    "status": CommandSpec([
+        FieldSpec("temperature", "อุณหภูมิ: {:.2f} °C\n"),
+        FieldSpec("humidity", "ความชื้น: {} %\n"),
+        FieldSpec("relay", "สถานะ Relay: {}\n", relay_text),
+        FieldSpec("mode", "โหมด: {}\n"),
+        FieldSpec("name", "ชื่ออุปกรณ์: {}\n"),
+        FieldSpec("option", "ตัวเลือก: {}\n", option_text),
+    ]),
+    "settemp": CommandSpec([
+        FieldSpec(("low", "high"), "ตั้งค่าอุณหภูมิ:\nต่ำสุด: {} °C\nสูงสุด: {} °C\n"),
+    ]),
+    "sethum": CommandSpec([
+        FieldSpec(("low", "high"), "ตั้งค่าความชื้น:\nต่ำสุด: {} %\nสูงสุด: {} %\n"),
+    ]),
+    "setmode": CommandSpec([
+        FieldSpec("mode", "ตั้งค่าโหมด: {}\n"),
+    ]),
+    "setoption": CommandSpec([
+        FieldSpec("option", "ตั้งค่าตัวเลือก: {}\n"),
+    ]),
+    "relay": CommandSpec([
+        FieldSpec("relay", "ตั้งค่า Relay: {}\n", relay_text),
+    ]),
+    "setname": CommandSpec([
+        FieldSpec("name", "ตั้งชื่ออุปกรณ์: {}\n"),
+    ]),
+    "setchannel": CommandSpec([
+        FieldSpec("channel_id", "ตั้งค่า ThingSpeak Channel ID: {}\n"),
+    ]),
+    "setwritekey": CommandSpec(preamble="ตั้งค่า Write API Key สำเร็จ\n", requires_data=False),
+    "setreadkey": CommandSpec(preamble="ตั้งค่า Read API Key สำเร็จ\n", requires_data=False),
+    "info": CommandSpec([
+        FieldSpec("name", "ชื่อ: {}\n"),
+        FieldSpec("device_id", "Device ID: {}\n"),
+        FieldSpec(("temp_low", "temp_high"), "อุณหภูมิ: {}-{} °C\n"),
+        FieldSpec(("humidity_low", "humidity_high"), "ความชื้น: {}-{} %\n"),
+        FieldSpec("mode", "โหมด: {}\n"),
+        FieldSpec("option", "ตัวเลือก: {}\n", option_text),
+        FieldSpec("cool", "โหมดทำความเย็น: {}\n", cool_text),
+        FieldSpec("moisture", "โหมดความชื้น: {}\n", moisture_text),
+        FieldSpec("thingspeak_channel", "ThingSpeak Channel: {}\n"),
+        FieldSpec("write_api_key", "ThingSpeak Write API Key: {}\n", mask_api_key),
+    ], preamble="ข้อมูลอุปกรณ์:\n"),
+}
+
+
+# คอลัมน์ของตารางสรุปคำสั่งแบบกลุ่ม (หนึ่งบรรทัดต่ออุปกรณ์)
+SUMMARY_SPECS: Dict[str, Sequence[FieldSpec]] = {
+    "status": [
+        FieldSpec("temperature", "{:.2f} °C"),
+        FieldSpec("humidity", "{} %"),
+        FieldSpec("relay", "Relay {}", relay_text),
+        FieldSpec("mode", "{}"),
+    ],
+    "settemp": [FieldSpec(("low", "high"), "{}-{} °C")],
+    "sethum": [FieldSpec(("low", "high"), "{}-{} %")],
+    "setmode": [FieldSpec("mode", "{}")],
+    "setoption": [FieldSpec("option", "{}", option_text)],
+    "relay": [FieldSpec("relay", "Relay {}", relay_text)],
+}
+
+
+# ชื่อและหน่วยของค่าในผลสรุปย้อนหลัง
+HISTORY_METRICS = (
+    ("temperature", "อุณหภูมิ", "°C", "{:.2f}"),
+    ("humidity", "ความชื้น", "%", "{:.1f}"),
+)
+CHART_TITLES = {"temperature": "อุณหภูมิ", "humidity": "ความชื้น", "relay": "สถานะ Relay"}
+
+
+def split_message(lines: Iterable[str], limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """รวมบรรทัดเป็นข้อความ โดยแบ่งเป็นหลายข้อความเมื่อยาวเกินที่ Telegram รับได้
+
+    Args:
+        lines: บรรทัดที่ลงท้ายด้วย \n แล้ว
+        limit: ความยาวสูงสุดต่อข้อความ
+
+    Returns:
+        List[str]: ข้อความที่แต่ละข้อความยาวไม่เกิน limit
+    """
+    messages = []
+    parts: List[str] = []
+    size = 0
+    for line in lines:
+        if len(line) > limit:
+            line = line[:limit - 4] + "...\n"
+        if parts and size + len(line) > limit:
+            messages.append("".join(parts))
+            parts = []
+            size = 0
+        parts.append(line)
+        size += len(line)
+    if parts:
+        messages.append("".join(parts))
+    return messages
+
+
+def _compile_field(field: FieldSpec) -> Callable[[Dict, Callable[[str], None]], None]:
+    """สร้างฟังก์ชันสำหรับแสดงหนึ่งฟิลด์ โดยเลือกรูปแบบที่เร็วที่สุดตามจำนวน key และ transform"""
+    fmt = field.template.format
+    transform = field.transform
+
+    if len(field.keys) == 1:
+        key = field.keys[0]
+        if transform is None:
+            def render(data, out):
+                if key in data:
+                    out(fmt(data[key]))
+        else:
+            def render(data, out):
+                if key in data:
+                    out(fmt(transform(data[key])))
+        return render
+
+    keys = field.keys
+
+    def render(data, out):
+        for key in keys:
+            if key not in data:
+                return
+        out(fmt(*[data[key] for key in keys]))
+    return render
+
+
+def _compile_command(spec: CommandSpec) -> Callable[[Dict, Callable[[str], None]], None]:
+    """สร้างฟังก์ชันสำหรับแสดงส่วนข้อมูลของคำสั่งหนึ่งคำสั่ง"""
+    fields = tuple(_compile_field(field) for field in spec.fields)
+    preamble = spec.preamble
+
+    if not spec.requires_data:
+        def render(data, out):
+            out(preamble)
+        return render
+
+    def render(data, out):
+        if "data" not in data:
+            return
+        device_data = data["data"]
+        if preamble:
+            out(preamble)
+        for field in fields:
+            field(device_data, out)
+    return render
+
+
+class ResponseRenderer:
+    """สร้างข้อความตอบกลับไปยัง Telegram จากคำตอบ MQTT ตามรูปแบบใน registry"""
+
+    # จำนวนหัวข้อความของอุปกรณ์ที่เก็บในแคชสูงสุด
+    MAX_CACHED_HEADERS = 10000
+
+    # จำนวน Device ID ต่อบรรทัดในรายการอุปกรณ์ที่ไม่ตอบของตารางสรุป
+    IDS_PER_LINE = 20
+
+    def __init__(self, specs: Dict[str, CommandSpec] = None):
+        """
+        Args:
+            specs: รูปแบบข้อความตามคำสั่ง (ค่าเริ่มต้นคือ RESPONSE_SPECS)
+        """
+        self._compiled: Dict[str, Callable] = {}
+        self._summaries: Dict[str, tuple] = {}
+        self._headers: Dict[str, str] = {}
+        for command, spec in (specs if specs is not None else RESPONSE_SPECS).items():
+            self.register(command, spec)
+        for command, fields in SUMMARY_SPECS.items():
+            self.register_summary(command, fields)
+
+    def register(self, command: str, spec: CommandSpec):
+        """เพิ่มหรือแทนที่รูปแบบข้อความของคำสั่ง
+
+        Args:
+            command: ชื่อคำสั่ง
+            spec: รูปแบบข้อความ
+        """
+        self._compiled[command] = _compile_command(spec)
+
+    def register_summary(self, command: str, fields: Sequence[FieldSpec]):
+        """เพิ่มหรือแทนที่คอลัมน์ของตารางสรุปคำสั่งแบบกลุ่ม
+
+        Args:
+            command: ชื่อคำสั่ง
+            fields: คอลัมน์ตามลำดับ (ค่าจาก "data" ของคำตอบ)
+        """
+        self._summaries[command] = tuple(_compile_field(field) for field in fields)
+
+    def commands(self) -> List[str]:
+        """รายชื่อคำสั่งที่มีรูปแบบข้อความ"""
+        return list(self._compiled)
+
+    def header(self, device_id: str) -> str:
+        """หัวข้อความของอุปกรณ์ (เก็บในแคช เพราะใช้ซ้ำทุกคำตอบ)"""
+        header = self._headers.get(device_id)
+        if header is None:
+            if len(self._headers) >= self.MAX_CACHED_HEADERS:
+                self._headers.clear()
+            header = self._headers[device_id] = f"การตอบกลับจากอุปกรณ์ {device_id}\n"
+        return header
+
+    def render_body(self, command: str, data: Dict, out: Callable[[str], None]):
+        """แสดงเฉพาะส่วนข้อมูลของคำตอบ
+
+        Args:
+            command: ชื่อคำสั่ง
+            data: ข้อมูล JSON ทั้งหมดของคำตอบ
+            out: ฟังก์ชันที่รับข้อความแต่ละส่วน (เช่น list.append)
+        """
+        render = self._compiled.get(command)
+        if render is not None:
+            render(data, out)
+
+    def render(self, device_id: str, command: str, data: Dict, success: bool) -> str:
+        """สร้างข้อความตอบกลับไปยัง Telegram
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่ง
+            data: ข้อมูลจาก MQTT
+            success: สถานะความสำเร็จ
+
+        Returns:
+            str: ข้อความสำหรับส่งกลับไปยัง Telegram
+        """
+        parts = [self.header(device_id)]
+        if success:
+            parts.append(STATUS_SUCCESS)
+        else:
+            parts.append(STATUS_FAILED)
+            if "message" in data:
+                parts.append(f"ข้อความ: {data['message']}\n")
+
+        render = self._compiled.get(command)
+        if render is not None:
+            render(data, parts.append)
+        return "".join(parts)
+
+    def summary_line(self, device_id: str, command: str, data: Dict) -> str:
+        """สร้างหนึ่งบรรทัดของตารางสรุปจากคำตอบของอุปกรณ์
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่ง
+            data: ข้อมูล JSON ทั้งหมดของคำตอบ
+
+        Returns:
+            str: บรรทัดที่ลงท้ายด้วย \n
+        """
+        if not data.get("success", False):
+            if "message" in data:
+                return f"{device_id}: ไม่สำเร็จ ({data['message']})\n"
+            return f"{device_id}: ไม่สำเร็จ\n"
+
+        columns: List[str] = []
+        device_data = data.get("data")
+        if isinstance(device_data, dict):
+            for field in self._summaries.get(command, ()):
+                field(device_data, columns.append)
+        if not columns:
+            return f"{device_id}: สำเร็จ\n"
+        return f"{device_id}: {' | '.join(columns)}\n"
+
+    def render_bulk(self, command: str, devices: Sequence[str], replies: Dict[str, Dict],
+                    failed: Sequence[str] = (), denied: Sequence[str] = (),
+                    elapsed: float = None) -> List[str]:
+        """สร้างตารางสรุปผลของคำสั่งแบบกลุ่ม
+
+        Args:
+            command: ชื่อคำสั่ง
+            devices: อุปกรณ์ที่ส่งคำสั่งไป ตามลำดับที่จะแสดง
+            replies: Device ID -> ข้อมูลคำตอบ ของอุปกรณ์ที่ตอบกลับ
+            failed: อุปกรณ์ที่ส่งคำสั่งไม่สำเร็จ
+            denied: อุปกรณ์ที่ไม่มีสิทธิ์ (ไม่ได้ส่งคำสั่ง)
+            elapsed: เวลาที่ใช้ (วินาที)
+
+        Returns:
+            List[str]: ข้อความสำหรับส่งไปยัง Telegram (แบ่งหลายข้อความถ้ายาวเกิน)
+        """
+        failed_set = set(failed)
+        missing = [device_id for device_id in devices if device_id not in replies and device_id not in failed_set]
+
+        head = f"ผลคำสั่ง {command} กับ {len(devices)} อุปกรณ์: ตอบกลับ {len(replies)}, ไม่ตอบ {len(missing)}"
+        if elapsed is not None:
+            head += f" ({elapsed:.1f} วินาที)"
+        lines = [head + "\n"]
+
+        summary_line = self.summary_line
+        for device_id in devices:
+            reply = replies.get(device_id)
+            if reply is not None:
+                lines.append(summary_line(device_id, command, reply))
+
+        for title, ids in (("ไม่ได้รับคำตอบ", missing), ("ส่งคำสั่งไม่สำเร็จ", failed), ("ไม่มีสิทธิ์", denied)):
+            if ids:
+                lines.append(f"{title} ({len(ids)}):\n")
+                # แบ่งรายการยาวเป็นหลายบรรทัด เพื่อให้แบ่งข้อความได้
+                for start in range(0, len(ids), self.IDS_PER_LINE):
+                    lines.append(", ".join(ids[start:start + self.IDS_PER_LINE]) + "\n")
+        return split_message(lines)
+
+    def render_history(self, summary: HistorySummary) -> str:
+        """สร้างข้อความสรุปค่าย้อนหลังของอุปกรณ์
+
+        Args:
+            summary: ผลสรุปจาก TelemetryStore.summary()
+
+        Returns:
+            str: ข้อความสำหรับส่งไปยัง Telegram
+        """
+        since = time.strftime("%d/%m %H:%M", time.localtime(summary.first_time))
+        parts = [
+            f"ข้อมูลย้อนหลัง {format_window(summary.window)} ของอุปกรณ์ {summary.device_id}\n",
+            f"(ตั้งแต่ {since} ความละเอียด {format_window(summary.resolution)})\n",
+        ]
+        metrics = summary.metrics
+        for name, title, unit, number in HISTORY_METRICS:
+            metric = metrics.get(name)
+            if metric is None:
+                continue
+            values = " / ".join(number.format(value) for value in
+                                (metric.minimum, metric.maximum, metric.average, metric.last))
+            parts.append(f"{title} (ต่ำสุด / สูงสุด / เฉลี่ย / ล่าสุด): {values} {unit} ({metric.count} ค่า)\n")
+
+        relay = metrics.get("relay")
+        if relay is not None:
+            parts.append(f"Relay: เปิด {relay.average * 100:.0f}% ของค่าที่อ่านได้, ล่าสุด {relay_text(relay.last)} "
+                         f"({relay.count} ค่า)\n")
+        return "".join(parts)
+
+    def render_chart_caption(self, summary: HistorySummary, metric: str) -> str:
+        """สร้างคำอธิบายภาพกราฟของค่าหนึ่งค่า
+
+        Args:
+            summary: ผลสรุปจาก TelemetryStore.summary() ของช่วงเวลาเดียวกับกราฟ
+            metric: ชื่อค่าที่วาด
+
+        Returns:
+            str: คำอธิบายภาพสำหรับ Telegram
+        """
+        caption = (f"กราฟ{CHART_TITLES.get(metric, metric)}ของอุปกรณ์ {summary.device_id} "
+                   f"ย้อนหลัง {format_window(summary.window)} (ความละเอียด {format_window(summary.resolution)})\n"
+                   "เส้น: ค่าเฉลี่ย, แถบ: ต่ำสุด-สูงสุด ของแต่ละช่วง\n")
+        values = summary.metrics.get(metric)
+        if values is None:
+            return caption
+        if metric == "relay":
+            return caption + f"เปิด {values.average * 100:.0f}% ของค่าที่อ่านได้ ({values.count} ค่า)"
+        for name, _, unit, number in HISTORY_METRICS:
+            if name == metric:
+                numbers = " / ".join(number.format(value) for value in
+                                     (values.minimum, values.maximum, values.average, values.last))
+                return caption + f"ต่ำสุด / สูงสุด / เฉลี่ย / ล่าสุด: {numbers} {unit} ({values.count} ค่า)"
+        return caption
@@ -4,27 +4,48 @@
 import os
 import time
 import pickle
+import asyncio
+import secrets
 import logging
-from typing import List, Dict, Any, Optional
+import itertools
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
+
+from persistence import StorageBackend, CoalescingWriter, create_backend
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 class Storage:
-    """คลาสสำหรับจัดการการเก็บข้อมูล Chat IDs ที่ได้รับอนุญาต"""
+    """คลาสสำหรับจัดการการเก็บข้อมูล Chat IDs ที่ได้รับอนุญาต
+    
+    ข้อมูลถูกเก็บในหน่วยความจำ (ตรวจสิทธิ์ด้วย set แบบ O(1)) และบันทึกลงดิสก์ผ่าน
+    storage backend (journal หรือ SQLite WAL) โดย writer thread ที่รวมการเขียนหลายครั้งเข้าด้วยกัน
+    """
     
-    def __init__(self, max_chat_ids: int, default_chat_ids: List[str] = None):
+    def __init__(self, max_chat_ids: int, default_chat_ids: List[str] = None,
+                 backend: StorageBackend = None):
         """
         Args:
             max_chat_ids: จำนวนสูงสุดของ Chat IDs ที่สามารถเก็บได้
             default_chat_ids: รายการเริ่มต้นของ Chat IDs
+            backend: ที่เก็บข้อมูล (ค่าเริ่มต้นเลือกจาก STORAGE_BACKEND และ STORAGE_PATH)
         """
         # ดึงค่าจาก environment variable หรือใช้ค่าเริ่มต้น
         self.storage_file = os.getenv("STORAGE_FILE", "authorized_chatids.pkl")
+        if backend is None:
+            backend = create_backend(
+                os.getenv("STORAGE_BACKEND", "journal"),
+                os.getenv("STORAGE_PATH", "ogosense_storage")
+            )
+        self.backend = backend
+        self.writer = CoalescingWriter(backend, float(os.getenv("STORAGE_WRITE_DELAY", "0.2")))
         self.max_chat_ids = max_chat_ids
         self.authorized_chatids = []
         self.num_authorized_chatids = 0
+        self._authorized_set = frozenset()
+        self._documents: Dict[str, Any] = {}
         
         # ถ้ามีข้อมูลเริ่มต้น
         if default_chat_ids:
@@ -38,53 +59,123 @@ class Storage:
         # โหลดข้อมูลจากไฟล์ (ถ้ามี)
         self.load()
     
+    def _refresh_snapshot(self):
+        """สร้าง set ของ Chat IDs ที่ได้รับอนุญาตใหม่หลังมีการเปลี่ยนแปลง"""
+        self._authorized_set = frozenset(self.authorized_chatids[:self.num_authorized_chatids])
+    
     def save(self) -> bool:
-        """บันทึกข้อมูลลงไฟล์
+        """บันทึกข้อมูล (ส่งให้ writer thread บันทึกลงดิสก์ ไม่บล็อกผู้เรียก)
         
         Returns:
-            bool: True ถ้าบันทึกสำเร็จ, False ถ้าบันทึกไม่สำเร็จ
+            bool: True ถ้าส่งข้อมูลให้บันทึกสำเร็จ, False ถ้าไม่สำเร็จ
         """
         try:
-            data = {
-                "chatids": self.authorized_chatids,
+            self.put_document("chatids", {
+                "chatids": list(self.authorized_chatids),
                 "num_chatids": self.num_authorized_chatids
-            }
-            with open(self.storage_file, "wb") as f:
-                pickle.dump(data, f)
-            logger.info(f"บันทึกข้อมูล Chat ID ลงไฟล์แล้ว: {self.authorized_chatids[:self.num_authorized_chatids]}")
+            })
+            logger.info(f"บันทึกข้อมูล Chat ID: {self.authorized_chatids[:self.num_authorized_chatids]}")
             return True
         except Exception as e:
             logger.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูล Chat ID: {e}")
             return False
     
+    def _load_legacy_file(self) -> Optional[Dict]:
+        """โหลดข้อมูลจากไฟล์ pickle รุ่นเก่า (ถ้ามี) เพื่อย้ายเข้า backend ใหม่"""
+        if not os.path.exists(self.storage_file):
+            return None
+        with open(self.storage_file, "rb") as f:
+            data = pickle.load(f)
+        logger.info(f"ย้ายข้อมูล Chat ID จากไฟล์เดิม {self.storage_file}")
+        return data
+    
     def load(self) -> bool:
-        """โหลดข้อมูลจากไฟล์
+        """โหลดข้อมูลจาก backend
         
         Returns:
-            bool: True ถ้าโหลดสำเร็จ, False ถ้าโหลดไม่สำเร็จหรือไม่มีไฟล์
+            bool: True ถ้าโหลดสำเร็จ, False ถ้าโหลดไม่สำเร็จหรือไม่มีข้อมูล
         """
         try:
-            if os.path.exists(self.storage_file):
-                with open(self.storage_file, "rb") as f:
-                    data = pickle.load(f)
-                
-                self.authorized_chatids = data.get("chatids", self.authorized_chatids)
-                self.num_authorized_chatids = data.get("num_chatids", self.num_authorized_chatids)
-                
-                # เพิ่มช่องว่างให้ครบตามจำนวนสูงสุด (กรณีที่ไฟล์เก่ามีจำนวนน้อยกว่า)
-                while len(self.authorized_chatids) < self.max_chat_ids:
-                    self.authorized_chatids.append("")
-                
-                logger.info(f"โหลดข้อมูล Chat ID จากไฟล์แล้ว: {self.authorized_chatids[:self.num_authorized_chatids]}")
+            self._documents = self.backend.load()
+            data = self._documents.get("chatids")
+            migrated = False
+            if data is None:
+                data = self._load_legacy_file()
+                migrated = data is not None
+            
+            if data is not None:
+                self._apply_chatids(data)
+                if migrated:
+                    self.save()
+                logger.info(f"โหลดข้อมูล Chat ID แล้ว: {self.authorized_chatids[:self.num_authorized_chatids]}")
                 return True
             else:
-                logger.info("ไม่พบไฟล์เก็บข้อมูล Chat ID ใช้ค่าเริ่มต้น")
+                logger.info("ไม่พบข้อมูล Chat ID ที่บันทึกไว้ ใช้ค่าเริ่มต้น")
+                self._refresh_snapshot()
                 self.save()  # บันทึกข้อมูลเริ่มต้น
                 return False
         except Exception as e:
             logger.error(f"เกิดข้อผิดพลาดในการโหลดข้อมูล Chat ID: {e}")
+            self._refresh_snapshot()
             return False
     
+    def _apply_chatids(self, data: Dict):
+        """ใช้ข้อมูล Chat ID ที่โหลดได้"""
+        self.authorized_chatids = list(data.get("chatids", self.authorized_chatids))
+        self.num_authorized_chatids = data.get("num_chatids", self.num_authorized_chatids)
+        
+        # เพิ่มช่องว่างให้ครบตามจำนวนสูงสุด (กรณีที่ไฟล์เก่ามีจำนวนน้อยกว่า)
+        while len(self.authorized_chatids) < self.max_chat_ids:
+            self.authorized_chatids.append("")
+        
+        self._refresh_snapshot()
+    
+    def apply_documents(self, changes: Dict[str, Any]):
+        """ใช้ข้อมูลที่ process อื่นบันทึกลง backend เดียวกัน (โหมด cluster) โดยไม่บันทึกซ้ำ
+        
+        Args:
+            changes: key และค่าล่าสุด (ค่า None หมายถึงถูกลบ)
+        """
+        for key, value in changes.items():
+            if value is None:
+                self._documents.pop(key, None)
+            else:
+                self._documents[key] = value
+        
+        data = changes.get("chatids")
+        if data is not None:
+            self._apply_chatids(data)
+            logger.info(f"โหลดข้อมูล Chat ID ที่เปลี่ยนแปลง: {self.authorized_chatids[:self.num_authorized_chatids]}")
+    
+    def close(self):
+        """บันทึกข้อมูลที่ค้างอยู่ลงดิสก์และปิด backend"""
+        self.writer.close()
+    
+    def get_document(self, key: str, default: Any = None) -> Any:
+        """ดึงข้อมูลที่บันทึกไว้ตาม key (สำหรับโมดูลอื่นที่ใช้ backend เดียวกัน)
+        
+        Args:
+            key: ชื่อข้อมูล
+            default: ค่าที่คืนเมื่อไม่มีข้อมูล
+            
+        Returns:
+            Any: ข้อมูลที่บันทึกไว้ หรือ default
+        """
+        return self._documents.get(key, default)
+    
+    def put_document(self, key: str, value: Any):
+        """บันทึกข้อมูลตาม key (ค่า None หมายถึงลบ) โดยไม่บล็อกผู้เรียก
+        
+        Args:
+            key: ชื่อข้อมูล
+            value: ข้อมูลที่แปลงเป็น JSON ได้ (ไม่ควรถูกแก้ไขหลังบันทึก)
+        """
+        if value is None:
+            self._documents.pop(key, None)
+        else:
+            self._documents[key] = value
+        self.writer.submit(key, value)
+    
     def add_chat_id(self, chat_id: str) -> bool:
         """เพิ่ม Chat ID ใหม่
         
@@ -95,7 +186,7 @@ class Storage:
             bool: True ถ้าเพิ่มสำเร็จ, False ถ้าเพิ่มไม่สำเร็จ (เช่น มีอยู่แล้ว หรือเต็ม)
         """
         # ตรวจสอบว่ามีอยู่แล้วหรือไม่
-        if chat_id in self.authorized_chatids[:self.num_authorized_chatids]:
+        if chat_id in self._authorized_set:
             return False
         
         # ตรวจสอบว่าเต็มหรือไม่
@@ -105,6 +196,7 @@ class Storage:
         # เพิ่ม Chat ID
         self.authorized_chatids[self.num_authorized_chatids] = chat_id
         self.num_authorized_chatids += 1
+        self._refresh_snapshot()
         
         # บันทึกลงไฟล์
         self.save()
@@ -138,6 +230,7 @@ class Storage:
         # ตั้งค่าตำแหน่งสุดท้ายเป็นค่าว่าง
         self.authorized_chatids[self.num_authorized_chatids - 1] = ""
         self.num_authorized_chatids -= 1
+        self._refresh_snapshot()
         
         # บันทึกลงไฟล์
         self.save()
@@ -167,6 +260,7 @@ class Storage:
         
         # อัปเดต Chat ID
         self.authorized_chatids[array_index] = new_chat_id
+        self._refresh_snapshot()
         
         # บันทึกลงไฟล์
         self.save()
@@ -181,7 +275,7 @@ class Storage:
         Returns:
             bool: True ถ้าได้รับอนุญาต, False ถ้าไม่ได้รับอนุญาต
         """
-        return chat_id in self.authorized_chatids[:self.num_authorized_chatids]
+        return chat_id in self._authorized_set
     
     def get_all_chat_ids(self) -> List[str]:
         """ดึงรายการ Chat IDs ทั้งหมดที่ได้รับอนุญาต
@@ -193,57 +287,79 @@ class Storage:
 
 
 class CommandHistory:
-    """คลาสสำหรับจัดการประวัติคำสั่ง"""
+    """คลาสสำหรับจัดการประวัติคำสั่ง
+    
+    เก็บประวัติไว้ใน ring buffer ขนาดคงที่ พร้อม index ตาม device_id และ (device_id, command)
+    ทำให้การบันทึกและการค้นหา chat_id ล่าสุดเป็น O(1) โดยไม่ต้องคัดลอกรายการ
+    """
     
     def __init__(self, max_history: int = 20):
         """
         Args:
             max_history: จำนวนสูงสุดของประวัติคำสั่งที่จะเก็บ
         """
-        self.max_history = max_history
-        self.history = []
+        self.max_history = max(1, max_history)
+        self._ring: List[Optional[Dict]] = [None] * self.max_history
+        self._next_seq = 0
+        
+        # index ชี้ไปยังลำดับ (seq) ของรายการล่าสุด
+        self._by_device: Dict[str, int] = {}
+        self._by_device_command: Dict[Tuple[str, str], int] = {}
+    
+    def __len__(self) -> int:
+        return min(self._next_seq, self.max_history)
+    
+    @property
+    def history(self) -> List[Dict]:
+        """ประวัติทั้งหมดเรียงจากเก่าไปใหม่"""
+        start = max(0, self._next_seq - self.max_history)
+        return [self._ring[seq % self.max_history] for seq in range(start, self._next_seq)]
     
-    # ในเมธอด record_command ของคลาส CommandHistory
     def record_command(self, device_id: str, command: str, chat_id: str):
         """บันทึกคำสั่งลงในประวัติ"""
-        command_info = {
+        seq = self._next_seq
+        slot = seq % self.max_history
+        
+        # ลบ index ของรายการเก่าที่กำลังจะถูกเขียนทับ (ถ้ายังเป็นรายการล่าสุดของอุปกรณ์นั้น)
+        old = self._ring[slot]
+        if old is not None:
+            old_seq = seq - self.max_history
+            if self._by_device.get(old["device_id"]) == old_seq:
+                del self._by_device[old["device_id"]]
+            old_key = (old["device_id"], old["command"])
+            if self._by_device_command.get(old_key) == old_seq:
+                del self._by_device_command[old_key]
+        
+        self._ring[slot] = {
             "device_id": device_id,
             "command": command,
             "chat_id": chat_id,
             "timestamp": time.time()
         }
-        
-        # เพิ่มข้อมูลลงในประวัติ
-        self.history.append(command_info)
+        self._by_device[device_id] = seq
+        self._by_device_command[(device_id, command)] = seq
+        self._next_seq = seq + 1
         
         # แสดง logging
-        logger.debug(f"บันทึกคำสั่ง: device_id={device_id}, command={command}, chat_id={chat_id}")
-        
-        # ตัดข้อมูลเก่าออกถ้าเกินจำนวนสูงสุด
-        if len(self.history) > self.max_history:
-            self.history = self.history[-self.max_history:]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"บันทึกคำสั่ง: device_id={device_id}, command={command}, chat_id={chat_id}")
     
     def get_last_chat_id(self, device_id: str, command: str = None) -> Optional[str]:
         """ค้นหา chat_id ล่าสุดที่ส่งคำสั่งไปยังอุปกรณ์"""
-        newest_time = 0
-        best_match = None
-        
-        logger.debug(f"กำลังค้นหา chat_id สำหรับ device_id={device_id}, command={command}")
-        logger.debug(f"ประวัติทั้งหมด: {self.history}")
+        if command is None:
+            seq = self._by_device.get(device_id)
+        else:
+            seq = self._by_device_command.get((device_id, command))
         
-        for cmd_info in self.history:
-            if cmd_info["device_id"] == device_id:
-                if command is None or cmd_info["command"] == command:
-                    if cmd_info["timestamp"] > newest_time:
-                        newest_time = cmd_info["timestamp"]
-                        best_match = cmd_info
+        if seq is None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"ไม่พบ chat_id สำหรับ device_id={device_id}, command={command}")
+            return None
         
-        if best_match:
-            logger.debug(f"พบ chat_id={best_match['chat_id']} สำหรับ device_id={device_id}")
-            return best_match["chat_id"]
-        
-        logger.debug(f"ไม่พบ chat_id สำหรับ device_id={device_id}")
-        return None
+        chat_id = self._ring[seq % self.max_history]["chat_id"]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"พบ chat_id={chat_id} สำหรับ device_id={device_id}, command={command}")
+        return chat_id
     
     def get_device_history(self, device_id: str) -> List[Dict]:
         """ดึงประวัติทั้งหมดที่เกี่ยวข้องกับอุปกรณ์
@@ -254,4 +370,189 @@ class CommandHistory:
         Returns:
             List[Dict]: รายการประวัติทั้งหมดของอุปกรณ์
         """
-        return [cmd for cmd in self.history if cmd["device_id"] == device_id]
\ No newline at end of file
+        if device_id not in self._by_device:
+            return []
+        return [cmd for cmd in self.history if cmd["device_id"] == device_id]
+
+
+class PendingRequest:
+    """ข้อมูลของคำสั่งที่ส่งไปแล้วและกำลังรอการตอบกลับจากอุปกรณ์"""
+    
+    __slots__ = ("request_id", "device_id", "command", "chat_id", "sent_at", "future", "rtt", "followers")
+    
+    def __init__(self, request_id: str, device_id: str, command: str, chat_id: Optional[str],
+                 sent_at: float, future: Optional[asyncio.Future] = None):
+        self.request_id = request_id
+        self.device_id = device_id
+        self.command = command
+        self.chat_id = chat_id
+        self.sent_at = sent_at
+        self.future = future
+        self.rtt: Optional[float] = None
+        # แชทอื่นที่สั่งคำสั่งเดียวกันระหว่างรอคำตอบ (ได้รับคำตอบเดียวกันโดยไม่ต้องส่งคำสั่งซ้ำ)
+        self.followers: Optional[List[str]] = None
+
+
+class PendingRequests:
+    """ตารางคำสั่งที่รอการตอบกลับ จับคู่คำตอบกับคำสั่งด้วย request_id แบบ O(1)
+    
+    สำหรับเฟิร์มแวร์รุ่นเก่าที่ไม่ส่ง request_id กลับมา จะจับคู่กับคำสั่งเก่าสุด
+    ที่ยังรออยู่ของ (device_id, command) เดียวกัน เพราะอุปกรณ์ตอบกลับตามลำดับ
+    """
+    
+    def __init__(self, timeout: float = 60.0):
+        """
+        Args:
+            timeout: เวลาสูงสุด (วินาที) ที่คำสั่งจะรอคำตอบก่อนถูกลบออกจากตาราง
+        """
+        self.timeout = timeout
+        self._prefix = secrets.token_hex(3)
+        self._counter = itertools.count(1)
+        
+        # เรียงตามเวลาที่ส่ง (dict รักษาลำดับการเพิ่ม)
+        self._by_id: Dict[str, PendingRequest] = {}
+        self._by_device_command: Dict[Tuple[str, str], Dict[str, PendingRequest]] = {}
+        
+        # สถิติ
+        self.resolved = 0
+        self.resolved_by_fallback = 0
+        self.expired = 0
+        self.followed = 0
+        self.last_rtt: Optional[float] = None
+    
+    def __len__(self) -> int:
+        return len(self._by_id)
+    
+    def new_request_id(self) -> str:
+        """สร้าง request_id ที่ไม่ซ้ำกันภายใน process นี้"""
+        return f"{self._prefix}{next(self._counter):x}"
+    
+    def add(self, request_id: str, device_id: str, command: str, chat_id: Optional[str],
+            future: Optional[asyncio.Future] = None) -> PendingRequest:
+        """เพิ่มคำสั่งที่กำลังจะส่งเข้าตาราง
+        
+        Args:
+            request_id: รหัสคำสั่งที่แนบไปกับ payload
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่ง
+            chat_id: Chat ID ที่ส่งคำสั่ง (None คือไม่ต้องส่งคำตอบไปยัง Telegram เช่น คำสั่งแบบกลุ่มที่รวมคำตอบเอง)
+            future: future ที่จะได้รับข้อมูลตอบกลับ (ถ้ามี)
+            
+        Returns:
+            PendingRequest: รายการที่เพิ่มเข้าตาราง
+        """
+        request = PendingRequest(request_id, device_id, command, chat_id, time.monotonic(), future)
+        self._by_id[request_id] = request
+        self._by_device_command.setdefault((device_id, command), {})[request_id] = request
+        return request
+    
+    def find(self, device_id: str, command: str, max_age: float) -> Optional[PendingRequest]:
+        """ค้นหาคำสั่งล่าสุดของ (device_id, command) ที่ส่งไปไม่เกิน max_age วินาทีและยังรอคำตอบ
+        
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่ง
+            max_age: อายุสูงสุดของคำสั่ง (วินาที)
+            
+        Returns:
+            Optional[PendingRequest]: คำสั่งที่พบ หรือ None
+        """
+        waiting = self._by_device_command.get((device_id, command))
+        if not waiting:
+            return None
+        request = waiting[next(reversed(waiting))]
+        if time.monotonic() - request.sent_at > max_age:
+            return None
+        return request
+    
+    def follow(self, request: PendingRequest, chat_id: str) -> bool:
+        """ให้แชทได้รับคำตอบของคำสั่งที่กำลังรออยู่ด้วย (single-flight)
+        
+        Returns:
+            bool: True ถ้าเพิ่มแชทแล้ว, False ถ้าแชทนี้จะได้รับคำตอบอยู่แล้ว
+        """
+        if chat_id == request.chat_id or (request.followers and chat_id in request.followers):
+            return False
+        if request.followers is None:
+            request.followers = []
+        request.followers.append(chat_id)
+        self.followed += 1
+        return True
+    
+    def discard(self, request_id: str) -> Optional[PendingRequest]:
+        """ลบคำสั่งออกจากตารางโดยไม่ถือว่าได้รับคำตอบ (เช่น ส่ง MQTT ไม่สำเร็จ)"""
+        request = self._pop(request_id)
+        if request and request.future and not request.future.done():
+            request.future.cancel()
+        return request
+    
+    def resolve(self, device_id: str, command: str, request_id: Optional[str] = None,
+                data: Any = None) -> Optional[PendingRequest]:
+        """จับคู่คำตอบจากอุปกรณ์กับคำสั่งที่รออยู่
+        
+        Args:
+            device_id: Device ID ของอุปกรณ์ที่ตอบกลับ
+            command: ชื่อคำสั่งที่ตอบกลับ
+            request_id: request_id ที่อุปกรณ์ส่งกลับมา (ถ้ามี)
+            data: ข้อมูลตอบกลับ ส่งต่อให้ future
+            
+        Returns:
+            Optional[PendingRequest]: คำสั่งที่จับคู่ได้ หรือ None ถ้าไม่พบ
+        """
+        if request_id is not None:
+            request = self._pop(request_id)
+        else:
+            # เฟิร์มแวร์รุ่นเก่า: ใช้คำสั่งเก่าสุดที่ยังรอของ (device_id, command)
+            waiting = self._by_device_command.get((device_id, command))
+            request = self._pop(next(iter(waiting))) if waiting else None
+            if request:
+                self.resolved_by_fallback += 1
+        
+        if request is None:
+            return None
+        
+        request.rtt = time.monotonic() - request.sent_at
+        self.last_rtt = request.rtt
+        self.resolved += 1
+        
+        if request.future and not request.future.done():
+            request.future.set_result(data)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"จับคู่คำตอบ request_id={request.request_id} ({device_id}/{command}) ใช้เวลา {request.rtt * 1000:.0f} ms")
+        return request
+    
+    def expire(self) -> List[PendingRequest]:
+        """ลบคำสั่งที่รอคำตอบนานเกิน timeout
+        
+        Returns:
+            List[PendingRequest]: รายการคำสั่งที่หมดเวลา
+        """
+        deadline = time.monotonic() - self.timeout
+        expired = []
+        
+        # รายการเรียงตามเวลาส่ง หยุดเมื่อเจอรายการแรกที่ยังไม่หมดเวลา
+        for request in self._by_id.values():
+            if request.sent_at > deadline:
+                break
+            expired.append(request)
+        
+        for request in expired:
+            self._pop(request.request_id)
+            if request.future and not request.future.done():
+                request.future.cancel()
+        
+        self.expired += len(expired)
+        return expired
+    
+    def _pop(self, request_id: str) -> Optional[PendingRequest]:
+        request = self._by_id.pop(request_id, None)
+        if request is None:
+            return None
+        key = (request.device_id, request.command)
+        waiting = self._by_device_command.get(key)
+        if waiting is not None:
+            waiting.pop(request_id, None)
+            if not waiting:
+                del self._by_device_command[key]
+        return request
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Subscriptions module สำหรับเก็บว่าแชทใดติดตามอุปกรณ์ใด
+
+index หลักคือ device_id -> set ของ chat_id ทำให้การหาผู้ติดตามของอุปกรณ์หนึ่งเครื่องเป็น O(1)
+(ไม่ต้องไล่ดูทุกแชท) และมี index ย้อนกลับ chat_id -> set ของ device_id สำหรับ /subscriptions
+"""
+
+import logging
+from typing import AbstractSet, Dict, FrozenSet, List, Set
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+_EMPTY: FrozenSet[str] = frozenset()
+
+# คำตอบที่ส่งต่อให้ผู้ติดตาม: เฉพาะสถานะและรีเลย์ ไม่รวมคำสั่งที่ต้องใช้ secret (เช่น info)
+# หรือคำตอบที่อาจมีค่าตั้งค่า/คีย์ของอุปกรณ์
+FANOUT_COMMANDS = frozenset({"status", "relay"})
+
+
+class SubscriptionRegistry:
+    """ทะเบียนการติดตามอุปกรณ์ของแต่ละแชท (ทำงานบน event loop เท่านั้น)"""
+
+    def __init__(self, storage: Storage, max_per_chat: int = 100):
+        """
+        Args:
+            storage: อ็อบเจกต์สำหรับบันทึกข้อมูลการติดตาม
+            max_per_chat: จำนวนอุปกรณ์สูงสุดที่แชทหนึ่งติดตามได้
+        """
+        self.storage = storage
+        self.max_per_chat = max_per_chat
+        self._by_device: Dict[str, Set[str]] = {}
+        self._by_chat: Dict[str, Set[str]] = {}
+        self.load()
+
+    def load(self):
+        """โหลดข้อมูลการติดตามจาก Storage และสร้าง index ใหม่"""
+        data = self.storage.get_document("subscriptions") or {}
+        self._by_device.clear()
+        self._by_chat.clear()
+        for chat_id, devices in data.items():
+            for device_id in devices:
+                self._add(chat_id, device_id)
+        logger.info(f"โหลดการติดตามอุปกรณ์ของ {len(self._by_chat)} แชท ({len(self._by_device)} อุปกรณ์)")
+
+    def _save(self):
+        self.storage.put_document("subscriptions", {
+            chat_id: sorted(devices) for chat_id, devices in self._by_chat.items()
+        })
+
+    def _add(self, chat_id: str, device_id: str):
+        self._by_device.setdefault(device_id, set()).add(chat_id)
+        self._by_chat.setdefault(chat_id, set()).add(device_id)
+
+    def is_full(self, chat_id: str) -> bool:
+        """ตรวจสอบว่าแชทติดตามอุปกรณ์ครบจำนวนสูงสุดแล้วหรือไม่"""
+        return len(self._by_chat.get(chat_id, _EMPTY)) >= self.max_per_chat
+
+    def subscribe(self, chat_id: str, device_id: str) -> bool:
+        """เริ่มติดตามอุปกรณ์
+
+        Returns:
+            bool: True ถ้าเพิ่มการติดตามใหม่, False ถ้าติดตามอยู่แล้ว
+        """
+        if chat_id in self._by_device.get(device_id, _EMPTY):
+            return False
+        self._add(chat_id, device_id)
+        self._save()
+        logger.info(f"Chat ID {chat_id} ติดตามอุปกรณ์ {device_id}")
+        return True
+
+    def unsubscribe(self, chat_id: str, device_id: str) -> bool:
+        """เลิกติดตามอุปกรณ์
+
+        Returns:
+            bool: True ถ้าลบการติดตาม, False ถ้าไม่ได้ติดตามอยู่
+        """
+        chats = self._by_device.get(device_id)
+        if not chats or chat_id not in chats:
+            return False
+
+        chats.discard(chat_id)
+        if not chats:
+            del self._by_device[device_id]
+        devices = self._by_chat[chat_id]
+        devices.discard(device_id)
+        if not devices:
+            del self._by_chat[chat_id]
+        self._save()
+        logger.info(f"Chat ID {chat_id} เลิกติดตามอุปกรณ์ {device_id}")
+        return True
+
+    def subscribers(self, device_id: str) -> AbstractSet[str]:
+        """ดึงแชทที่ติดตามอุปกรณ์ (ห้ามแก้ไขค่าที่ได้)"""
+        return self._by_device.get(device_id, _EMPTY)
+
+    def devices(self, chat_id: str) -> List[str]:
+        """ดึงรายการอุปกรณ์ที่แชทติดตาม เรียงตาม Device ID"""
+        return sorted(self._by_chat.get(chat_id, _EMPTY), key=lambda device_id: (len(device_id), device_id))
+
+    def stats(self) -> Dict[str, int]:
+        """ดึงสถิติของทะเบียนการติดตาม"""
+        return {
+            "chats": len(self._by_chat),
+            "devices": len(self._by_device),
+            "subscriptions": sum(len(chats) for chats in self._by_device.values()),
+        }
@@ -3,6 +3,7 @@
 
 import json
 import time
+import asyncio
 import logging
 from typing import Dict, List, Any, Optional, Union, Tuple
 
@@ -12,14 +13,58 @@ from telegram.ext import (
     CommandHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters
 )
+from telegram.error import BadRequest, NetworkError, TelegramError
 
-from storage import Storage, CommandHistory
-from mqtt_client import MQTTClient
+from storage import Storage, CommandHistory, PendingRequests
+from mqtt_client import AsyncMQTTClient
+from acl import AccessControl, ROLE_RANKS, WILDCARD, GROUP_PREFIX
+from device_state import DeviceStateCache
+from renderer import ResponseRenderer
+from codec import codec
+from cluster import ClusterNode
+from webhook import TelegramWebhook
+from health import HealthMonitor
+from timeseries import TelemetryStore, parse_window
+from chart import ChartService
+from outbox import CommandOutbox, OutboxEntry, describe_entries
+from coalesce import LastWriteWins
+from subscriptions import SubscriptionRegistry
+from metrics import MetricsRegistry
+from profiling import Profiler
+from alerts import AlertEngine, KIND_ABOVE, KIND_BELOW, KIND_RATE, KIND_MISSING, METRICS as ALERT_METRICS
 
 logger = logging.getLogger(__name__)
 
+# คำสั่งอ่านค่า: คำสั่งเดียวกันที่ยังรอคำตอบอยู่จะใช้คำตอบร่วมกัน (single-flight)
+# ไม่รวม info เพราะคำตอบขึ้นกับรหัส secret ของแต่ละคำขอ (ใช้คำตอบร่วมกันจะข้ามการตรวจ secret)
+READ_COMMANDS = frozenset({"status"})
+# คำสั่งเขียนค่า: คำสั่งที่ถูกสั่งติดๆ กันของอุปกรณ์เดียวกันถูกรวมให้เหลือค่าสุดท้าย
+WRITE_COMMANDS = frozenset({"settemp", "sethum", "setmode", "setoption", "relay", "setname",
+                            "setchannel", "setwritekey", "setreadkey"})
+
+# ชื่อค่าที่ใช้กับ /chart -> ชื่อค่าใน TelemetryStore
+CHART_METRICS = {
+    "temp": "temperature",
+    "temperature": "temperature",
+    "hum": "humidity",
+    "humidity": "humidity",
+    "relay": "relay",
+}
+
+# ระยะเวลาสูงสุด (วินาที) ของ /profile sample
+PROFILE_SAMPLE_MAX = 60
+
+
+def _describe_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """อาร์กิวเมนต์ของ handler สำหรับ log ของการเรียกที่ช้า (แชทและข้อความคำสั่ง)"""
+    chat = update.effective_chat.id if update.effective_chat else None
+    text = update.effective_message.text if update.effective_message else None
+    return f"chat={chat} text={text!r}"
+
+
 # ข้อความช่วยเหลือ
 HELP_MESSAGE = """
 Available Commands (คำสั่งที่สามารถใช้ได้):
@@ -27,7 +72,7 @@ Available Commands (คำสั่งที่สามารถใช้ได
 /help - แสดงรายการคำสั่งทั้งหมด
 
 คำสั่งสำหรับควบคุมอุปกรณ์ ESP8266:
-/status <id> - ตรวจสอบสถานะอุปกรณ์
+/status <id> [refresh] - ตรวจสอบสถานะอุปกรณ์ (refresh = อ่านค่าใหม่จากอุปกรณ์)
 /settemp <id> <lowTemp> <highTemp> - ตั้งค่าขอบเขต Temperature
 /sethum <id> <lowHumidity> <highHumidity> - ตั้งค่าขอบเขต Humidity
 /setmode <id> <auto/manual> - ตั้งค่าโหมด Auto หรือ Manual
@@ -38,6 +83,15 @@ Available Commands (คำสั่งที่สามารถใช้ได
 /setwritekey <id> <api_key> - ตั้งค่า ThingSpeak Write API Key
 /setreadkey <id> <api_key> - ตั้งค่า ThingSpeak Read API Key
 /info <id> <secret> - แสดงข้อมูลอุปกรณ์ (Device Info)
+/history <id> [window] - สรุปค่าย้อนหลัง เช่น 30m, 6h, 7d (ค่าเริ่มต้น 24h)
+/chart <id> <temp/hum/relay> [window] - กราฟค่าย้อนหลัง (ค่าเริ่มต้น 24h)
+/subscribe <id> - รับคำตอบ /status, /relay และการเปลี่ยนสถานะออนไลน์/ออฟไลน์ของอุปกรณ์
+/unsubscribe <id> - เลิกติดตามอุปกรณ์
+/subscriptions - แสดงอุปกรณ์ที่ติดตาม
+/alert <id> <temp/hum> <above/below/rate> <value> [hysteresis] [cooldown] - ตั้งกฎแจ้งเตือน
+/alert <id> missing <time> [cooldown] - แจ้งเตือนเมื่ออุปกรณ์ออฟไลน์นานกว่า time เช่น 30m
+/alerts [id] - แสดงกฎแจ้งเตือน
+/delalert <rule_id> - ลบกฎแจ้งเตือน
 
 คำสั่งสำหรับจัดการ ESP32 MQTT Bridge (ต้องใช้ Device ID ของ ESP32):
 /addchatid <esp32_id> <chat_id> - เพิ่ม Chat ID
@@ -45,15 +99,37 @@ Available Commands (คำสั่งที่สามารถใช้ได
 /updatechatid <esp32_id> <index(3-5)> <old_id> <new_id> - แก้ไข Chat ID
 /listchatids <esp32_id> - แสดงรายการ Chat IDs ทั้งหมด
 
+คำสั่งสำหรับจัดการสิทธิ์ต่ออุปกรณ์ (admin):
+/grant <chat_id> <id|@group|*> <viewer/operator/admin> - กำหนดสิทธิ์
+/revoke <chat_id> <id|@group|*> - ยกเลิกสิทธิ์
+/acl [chat_id] - แสดงสิทธิ์
+/setgroup <name> <id> [id...] - กำหนดกลุ่มอุปกรณ์
+/delgroup <name> - ลบกลุ่มอุปกรณ์
+/groups - แสดงกลุ่มอุปกรณ์ทั้งหมด
+/profile <on [slow_ms]/off/stats/reset/sample [seconds]> - วัดเวลาที่ bridge ใช้ขณะทำงาน
+
 หมายเหตุ: <id> คือ Device ID ของอุปกรณ์ ESP8266
 <esp32_id> คือ Device ID ของอุปกรณ์ ESP32 MQTT Bridge
+/status, /settemp, /sethum, /setmode, /setoption และ /relay สั่งหลายอุปกรณ์พร้อมกันได้
+โดยใช้ <id> แบบ 1001,1002 หรือ 1001-1040 หรือ @group แล้วจะได้ตารางสรุปผลหนึ่งข้อความ
 """
 
 class TelegramBot:
     """คลาสสำหรับจัดการ Telegram Bot"""
     
     def __init__(self, token: str, storage: Storage, command_history: CommandHistory, 
-                 mqtt_client: MQTTClient, esp32_device_id: str, mqtt_topic_cmd: str):
+                 mqtt_client: AsyncMQTTClient, esp32_device_id: str, mqtt_topic_cmd: str,
+                 pending_requests: PendingRequests = None, acl: AccessControl = None,
+                 device_state: DeviceStateCache = None, api_base_url: Optional[str] = None,
+                 polling: bool = True, cluster: Optional[ClusterNode] = None,
+                 bulk_max_devices: int = 500, bulk_timeout: float = 10.0,
+                 webhook: Optional[TelegramWebhook] = None, concurrent_updates: int = 1,
+                 health: Optional[HealthMonitor] = None, telemetry: Optional[TelemetryStore] = None,
+                 charts: Optional[ChartService] = None, outbox: Optional[CommandOutbox] = None,
+                 outbox_batch_size: int = 50, read_coalesce_window: float = 5.0,
+                 write_debounce: float = 1.0, subscriptions: Optional[SubscriptionRegistry] = None,
+                 alerts: Optional[AlertEngine] = None, metrics: Optional[MetricsRegistry] = None,
+                 profiler: Optional[Profiler] = None):
         """
         Args:
             token: Telegram Bot token
@@ -62,6 +138,27 @@ class TelegramBot:
             mqtt_client: อ็อบเจกต์สำหรับส่งข้อความ MQTT
             esp32_device_id: Device ID ของ ESP32 MQTT Bridge
             mqtt_topic_cmd: MQTT Topic สำหรับส่งคำสั่ง
+            pending_requests: ตารางคำสั่งที่รอการตอบกลับ (ใช้ร่วมกับ bridge)
+            acl: อ็อบเจกต์สำหรับตรวจสิทธิ์ของแชทต่ออุปกรณ์
+            device_state: แคชสถานะของอุปกรณ์ (ใช้ร่วมกับ bridge)
+            api_base_url: URL ของ Bot API (เช่น Local Bot API Server) ค่าเริ่มต้นคือ api.telegram.org
+            polling: รับข้อความจาก Telegram ด้วย polling หรือไม่ (ในโหมด cluster มีเพียง node เดียวที่ทำ polling)
+            cluster: cluster node สำหรับบันทึกคำสั่งลงที่เก็บข้อมูลร่วม (None คือทำงานแบบ process เดียว)
+            bulk_max_devices: จำนวนอุปกรณ์สูงสุดต่อคำสั่งแบบกลุ่ม
+            bulk_timeout: เวลารอคำตอบของคำสั่งแบบกลุ่ม (วินาที) ก่อนสรุปผล
+            webhook: รับ update ผ่าน webhook แทน polling (None คือใช้ polling)
+            concurrent_updates: จำนวน update ที่ประมวลผลพร้อมกันได้ (1 คือทีละรายการตามลำดับ)
+            health: ตัวติดตามสุขภาพ สำหรับรายงานผลการเรียก Bot API และการรับ update
+            telemetry: ที่เก็บค่าที่อ่านได้จากอุปกรณ์ (ใช้ร่วมกับ bridge) สำหรับ /history และ /chart
+            charts: ตัววาดกราฟ (process pool และแคชภาพ) สำหรับ /chart
+            outbox: ที่เก็บคำสั่งที่ส่งไม่ได้ระหว่าง MQTT ขาดการเชื่อมต่อ (None คือแจ้งข้อผิดพลาดทันที)
+            outbox_batch_size: จำนวนคำสั่งจาก outbox ที่ publish พร้อมกันในแต่ละชุด
+            read_coalesce_window: คำสั่งอ่านค่าที่ซ้ำกับคำสั่งที่ส่งไปไม่เกินกี่วินาทีจะรอคำตอบเดียวกัน (0 คือปิด)
+            write_debounce: ช่วงเวลา (วินาที) ที่คำสั่งเขียนค่าของอุปกรณ์เดียวกันถูกรวมเหลือค่าสุดท้าย (0 คือปิด)
+            subscriptions: ทะเบียนการติดตามอุปกรณ์ (ใช้ร่วมกับ bridge) สำหรับ /subscribe
+            alerts: กฎแจ้งเตือน (ใช้ร่วมกับ bridge) สำหรับ /alert
+            metrics: ทะเบียนตัวชี้วัด สำหรับบันทึกเวลาที่ handler ของแต่ละคำสั่งใช้
+            profiler: ตัววัดเวลาที่เปิด/ปิดได้ขณะทำงาน (ใช้ร่วมกับ bridge) สำหรับ /profile
         """
         self.token = token
         self.storage = storage
@@ -69,6 +166,32 @@ class TelegramBot:
         self.mqtt_client = mqtt_client
         self.esp32_device_id = esp32_device_id
         self.mqtt_topic_cmd = mqtt_topic_cmd
+        self.pending_requests = pending_requests if pending_requests is not None else PendingRequests()
+        self.acl = acl if acl is not None else AccessControl(storage)
+        self.device_state = device_state if device_state is not None else DeviceStateCache()
+        # รูปแบบข้อความตอบกลับถูก compile ครั้งเดียวตอนเริ่มต้น
+        self.renderer = ResponseRenderer()
+        self.api_base_url = api_base_url
+        self.polling_enabled = polling
+        self.cluster = cluster
+        self.bulk_max_devices = bulk_max_devices
+        self.bulk_timeout = bulk_timeout
+        self.webhook = webhook
+        self.concurrent_updates = max(1, concurrent_updates)
+        self.health = health
+        self.telemetry = telemetry if telemetry is not None else TelemetryStore()
+        self.charts = charts if charts is not None else ChartService()
+        self.outbox = outbox
+        self.outbox_batch_size = max(1, outbox_batch_size)
+        self.read_coalesce_window = read_coalesce_window
+        self.writes = LastWriteWins(write_debounce, self._flush_write) if write_debounce > 0 else None
+        self.coalesced_reads = 0
+        self.subscriptions = subscriptions if subscriptions is not None else SubscriptionRegistry(storage)
+        self.alerts = alerts if alerts is not None else AlertEngine(storage)
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._handler_seconds = self.metrics.histogram(
+            "ogosense_telegram_handler_seconds", "เวลาที่ใช้ประมวลผลคำสั่ง Telegram แยกตามคำสั่ง", ("command",))
+        self.profiler = profiler if profiler is not None else Profiler()
         self.application = None
         self.bot = None
     
@@ -81,11 +204,21 @@ class TelegramBot:
         """
         try:
             # สร้าง Bot และ Application
-            self.application = Application.builder().token(self.token).build()
+            builder = Application.builder().token(self.token)
+            if self.api_base_url:
+                builder = builder.base_url(self.api_base_url)
+            if self.concurrent_updates > 1:
+                builder = builder.concurrent_updates(self.concurrent_updates)
+            self.application = builder.build()
             self.bot = self.application.bot
             
             # ทดสอบการเชื่อมต่อก่อน
-            await self.bot.get_me()
+            try:
+                await self.bot.get_me()
+            except Exception:
+                self._report("telegram", False)
+                raise
+            self._report("telegram", True)
             
             # ลงทะเบียนคำสั่ง
             self._register_commands()
@@ -95,7 +228,13 @@ class TelegramBot:
             # เริ่มการ polling เพื่อรับข้อความจาก Telegram
             await self.application.initialize()
             await self.application.start()
-            await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+            if self.webhook is not None:
+                # ทุก node รับ webhook ได้ จึงไม่ขึ้นกับ lease ของ polling
+                await self.webhook.start(self.application)
+            elif self.polling_enabled:
+                await self._start_updater(drop_pending_updates=True)
+            else:
+                logger.info("ไม่ได้เริ่ม polling (node อื่นเป็นผู้รับข้อความจาก Telegram) ใช้ส่งข้อความอย่างเดียว")
             
             # แสดงข้อความว่า Bot เริ่มทำงานแล้ว
             logger.info("Telegram Bot เริ่มทำงานแล้ว")
@@ -111,7 +250,13 @@ class TelegramBot:
             try:
                 logger.info("กำลังหยุด Telegram Bot...")
                 
-                # หยุดการ polling ก่อน
+                # ส่งคำสั่งเขียนค่าที่รอรวมอยู่ก่อนปิด
+                if self.writes is not None:
+                    await self.writes.drain()
+                
+                # หยุดการรับ update ก่อน
+                if self.webhook is not None:
+                    await self.webhook.stop()
                 if hasattr(self.application, 'updater') and self.application.updater.running:
                     await self.application.updater.stop()
                 
@@ -123,39 +268,169 @@ class TelegramBot:
             except Exception as e:
                 logger.error(f"เกิดข้อผิดพลาดขณะหยุด Telegram Bot: {e}")
     
-    async def send_message(self, chat_id: str, text: str):
-        """ส่งข้อความไปยัง Telegram"""
-        if self.bot:
+    async def start_polling(self):
+        """เริ่มรับข้อความจาก Telegram (เช่น เมื่อ node นี้ได้รับ lease ของ polling)
+        
+        ถ้า Bot ยังไม่เริ่มทำงาน จะเริ่ม polling ตอนเรียก start()
+        ไม่ทิ้งข้อความที่ค้างอยู่ เพราะอาจเป็นข้อความที่ส่งมาระหว่างเปลี่ยน node
+        """
+        self.polling_enabled = True
+        if self.webhook is not None:
+            return
+        if self.application and self.application.running and not self.application.updater.running:
             try:
-                await self.bot.send_message(chat_id=chat_id, text=text)
-                logger.debug(f"ส่งข้อความไปยัง chat ID {chat_id} สำเร็จ")
+                await self._start_updater()
+                logger.info("เริ่ม polling ข้อความจาก Telegram")
             except Exception as e:
-                logger.error(f"เกิดข้อผิดพลาดในการส่งข้อความไปยัง Telegram: {e}")
+                logger.error(f"ไม่สามารถเริ่ม polling ได้: {e}")
+    
+    async def stop_polling(self):
+        """หยุดรับข้อความจาก Telegram แต่ยังส่งข้อความได้ (เช่น เมื่อ node นี้เสีย lease ของ polling)"""
+        self.polling_enabled = False
+        if self.application and self.application.updater.running:
+            try:
+                await self.application.updater.stop()
+                logger.info("หยุด polling ข้อความจาก Telegram")
+            except Exception as e:
+                logger.error(f"เกิดข้อผิดพลาดขณะหยุด polling: {e}")
+    
+    def is_running(self) -> bool:
+        """ตรวจสอบว่า Application เริ่มทำงานแล้วหรือไม่"""
+        return self.application is not None and self.application.running
+    
+    def receiver_running(self) -> bool:
+        """ตรวจสอบว่าตัวรับ update (polling หรือ webhook) ทำงานอยู่ตามที่ควรหรือไม่"""
+        if not self.is_running():
+            return False
+        if self.webhook is not None:
+            return self.webhook.running
+        if self.polling_enabled:
+            return self.application.updater.running
+        return True
+    
+    async def restart_receiver(self) -> bool:
+        """เริ่มตัวรับ update ใหม่ โดยไม่หยุด Application และไม่กระทบการส่งข้อความ
+        
+        Returns:
+            bool: True ถ้าเริ่มใหม่สำเร็จ
+        """
+        if not self.is_running():
+            return False
+        try:
+            if self.webhook is not None:
+                await self.webhook.stop()
+                # ไม่ทิ้ง update ที่ Telegram เก็บไว้ระหว่างที่ webhook ไม่ทำงาน
+                await self.webhook.start(self.application, drop_pending_updates=False)
+            elif self.polling_enabled:
+                if self.application.updater.running:
+                    await self.application.updater.stop()
+                await self._start_updater()
+            logger.info("เริ่มตัวรับ update ของ Telegram ใหม่แล้ว")
+            return True
+        except Exception as e:
+            logger.error(f"ไม่สามารถเริ่มตัวรับ update ของ Telegram ใหม่ได้: {e}")
+            return False
+    
+    async def _start_updater(self, drop_pending_updates: bool = False):
+        """เริ่ม polling โดยรายงานความล้มเหลวของ getUpdates เข้าตัวติดตามสุขภาพ"""
+        await self.application.updater.start_polling(
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=drop_pending_updates,
+            error_callback=self._on_polling_error if self.health is not None else None
+        )
+    
+    def _on_polling_error(self, error: TelegramError):
+        """ฟังก์ชันที่ทำงานเมื่อ getUpdates ล้มเหลว (updater ลองใหม่เองอยู่แล้ว)"""
+        logger.warning(f"polling ข้อความจาก Telegram ล้มเหลว: {error}")
+        self._report("telegram_updates", False)
+    
+    async def _on_update_received(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """ได้รับ update แสดงว่าทั้งการรับ update และ Bot API ทำงานปกติ"""
+        self._report("telegram_updates", True)
+        self._report("telegram", True)
+    
+    def _report(self, name: str, ok: bool):
+        if self.health is not None:
+            self.health.report(name, ok)
+    
+    async def send_message(self, chat_id: str, text: str):
+        """ส่งข้อความไปยัง Telegram
+        
+        Raises:
+            RuntimeError: ถ้า Bot ยังไม่เริ่มทำงาน
+            telegram.error.TelegramError: ถ้าส่งไม่สำเร็จ (ให้ผู้เรียกตัดสินใจว่าจะลองใหม่หรือไม่)
+        """
+        if not self.bot:
+            raise RuntimeError("Telegram Bot ยังไม่เริ่มทำงาน")
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text)
+            logger.debug(f"ส่งข้อความไปยัง chat ID {chat_id} สำเร็จ")
+        except Exception as e:
+            logger.debug(f"เกิดข้อผิดพลาดในการส่งข้อความไปยัง Telegram: {e}")
+            raise
+    
+    def _add_command(self, command: str, callback):
+        """ลงทะเบียนคำสั่ง พร้อมบันทึกเวลาที่ handler ใช้ (ผูก child ของ histogram ไว้ครั้งเดียว)"""
+        observe = self._handler_seconds.labels(command).observe
+        
+        async def timed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            started = time.perf_counter()
+            try:
+                await callback(update, context)
+            finally:
+                observe(time.perf_counter() - started)
+        
+        handler = CommandHandler(command, timed)
+        self.profiler.instrument(f"/{command}", handler, "callback", _describe_update)
+        self.application.add_handler(handler)
     
     def _register_commands(self):
         """ลงทะเบียนคำสั่งทั้งหมดของ Bot"""
+        # ติดตามการรับ update (group -1 ทำงานก่อน handler อื่นโดยไม่ขัดขวางการประมวลผล)
+        if self.health is not None:
+            self.application.add_handler(TypeHandler(Update, self._on_update_received), group=-1)
+        
         # คำสั่งพื้นฐาน
-        self.application.add_handler(CommandHandler("start", self._cmd_start))
-        self.application.add_handler(CommandHandler("help", self._cmd_help))
+        self._add_command("start", self._cmd_start)
+        self._add_command("help", self._cmd_help)
         
         # คำสั่งควบคุมอุปกรณ์
-        self.application.add_handler(CommandHandler("status", self._cmd_status))
-        self.application.add_handler(CommandHandler("settemp", self._cmd_settemp))
-        self.application.add_handler(CommandHandler("sethum", self._cmd_sethum))
-        self.application.add_handler(CommandHandler("setmode", self._cmd_setmode))
-        self.application.add_handler(CommandHandler("setoption", self._cmd_setoption))
-        self.application.add_handler(CommandHandler("relay", self._cmd_relay))
-        self.application.add_handler(CommandHandler("setname", self._cmd_setname))
-        self.application.add_handler(CommandHandler("setchannel", self._cmd_setchannel))
-        self.application.add_handler(CommandHandler("setwritekey", self._cmd_setwritekey))
-        self.application.add_handler(CommandHandler("setreadkey", self._cmd_setreadkey))
-        self.application.add_handler(CommandHandler("info", self._cmd_info))
+        self._add_command("status", self._cmd_status)
+        self._add_command("settemp", self._cmd_settemp)
+        self._add_command("sethum", self._cmd_sethum)
+        self._add_command("setmode", self._cmd_setmode)
+        self._add_command("setoption", self._cmd_setoption)
+        self._add_command("relay", self._cmd_relay)
+        self._add_command("setname", self._cmd_setname)
+        self._add_command("setchannel", self._cmd_setchannel)
+        self._add_command("setwritekey", self._cmd_setwritekey)
+        self._add_command("setreadkey", self._cmd_setreadkey)
+        self._add_command("info", self._cmd_info)
+        self._add_command("history", self._cmd_history)
+        self._add_command("chart", self._cmd_chart)
+        self._add_command("subscribe", self._cmd_subscribe)
+        self._add_command("unsubscribe", self._cmd_unsubscribe)
+        self._add_command("subscriptions", self._cmd_subscriptions)
+        self._add_command("alert", self._cmd_alert)
+        self._add_command("alerts", self._cmd_alerts)
+        self._add_command("delalert", self._cmd_delalert)
         
         # คำสั่งจัดการ Chat IDs
-        self.application.add_handler(CommandHandler("addchatid", self._cmd_addchatid))
-        self.application.add_handler(CommandHandler("removechatid", self._cmd_removechatid))
-        self.application.add_handler(CommandHandler("updatechatid", self._cmd_updatechatid))
-        self.application.add_handler(CommandHandler("listchatids", self._cmd_listchatids))
+        self._add_command("addchatid", self._cmd_addchatid)
+        self._add_command("removechatid", self._cmd_removechatid)
+        self._add_command("updatechatid", self._cmd_updatechatid)
+        self._add_command("listchatids", self._cmd_listchatids)
+        
+        # คำสั่งจัดการสิทธิ์ต่ออุปกรณ์
+        self._add_command("grant", self._cmd_grant)
+        self._add_command("revoke", self._cmd_revoke)
+        self._add_command("acl", self._cmd_acl)
+        self._add_command("setgroup", self._cmd_setgroup)
+        self._add_command("delgroup", self._cmd_delgroup)
+        self._add_command("groups", self._cmd_groups)
+        
+        # คำสั่งวัดประสิทธิภาพ
+        self._add_command("profile", self._cmd_profile)
         
         # ข้อความที่ไม่ใช่คำสั่ง
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self._handle_text))
@@ -171,6 +446,10 @@ class TelegramBot:
         err = context.error
         logger.error(f"เกิดข้อผิดพลาด: {err}")
         
+        # ข้อผิดพลาดของเครือข่ายระหว่างเรียก Bot API (BadRequest แสดงว่า Telegram ยังตอบกลับได้)
+        if isinstance(err, NetworkError) and not isinstance(err, BadRequest):
+            self._report("telegram", False)
+        
         # ตรวจสอบกรณี NoneType error ที่เกิดจากการแก้ไขข้อความ
         if isinstance(err, AttributeError) and "'NoneType' object has no attribute 'reply_text'" in str(err):
             # ตรวจสอบว่ามีการแก้ไขข้อความหรือไม่
@@ -194,11 +473,28 @@ class TelegramBot:
             logger.error(f"ไม่สามารถส่งข้อความแจ้งเตือนได้: {e}")
     
     def _is_authorized(self, chat_id: str) -> bool:
-        """ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่"""
-        is_auth = self.storage.is_authorized(str(chat_id))
+        """ตรวจสอบว่า Chat ID ได้รับอนุญาตให้ใช้งานระบบหรือไม่ (มีสิทธิ์อย่างน้อยหนึ่งอุปกรณ์)"""
+        is_auth = self.acl.has_access(str(chat_id))
         logger.debug(f"ตรวจสอบสิทธิ์ chat ID {chat_id}: {'ได้รับอนุญาต' if is_auth else 'ไม่ได้รับอนุญาต'}")
         return is_auth
     
+    async def _check_permission(self, update: Update, chat_id: str, device_id: Optional[str], command: str) -> bool:
+        """ตรวจสอบสิทธิ์ของแชทต่ออุปกรณ์และคำสั่ง แล้วแจ้งผู้ใช้ถ้าไม่มีสิทธิ์
+        
+        Returns:
+            bool: True ถ้ามีสิทธิ์
+        """
+        if self.acl.authorize(chat_id, device_id, command):
+            return True
+        
+        role = self.acl.required_role(command)
+        if device_id is None:
+            await update.message.reply_text(f"คุณไม่มีสิทธิ์ใช้คำสั่ง /{command} (ต้องเป็น {role})")
+        else:
+            await update.message.reply_text(f"คุณไม่มีสิทธิ์ใช้คำสั่ง /{command} กับอุปกรณ์ {device_id} (ต้องเป็น {role})")
+        logger.warning(f"Chat ID: {chat_id} ไม่มีสิทธิ์ใช้คำสั่ง /{command} กับอุปกรณ์ {device_id}")
+        return False
+    
     def _check_device_id(self, device_id: str) -> bool:
         """ตรวจสอบว่า Device ID ตรงกับ ESP32 หรือไม่"""
         return device_id == self.esp32_device_id
@@ -269,15 +565,23 @@ class TelegramBot:
         await update.message.reply_text(HELP_MESSAGE)
     
     # ฟังก์ชันเตรียมคำสั่ง MQTT ทั่วไป
-    def _prepare_mqtt_command(self, command: str, device_id: str, params: Dict = None) -> Tuple[str, str]:
+    def _prepare_mqtt_command(self, command: str, device_id: str, params: Dict = None,
+                              request_id: str = None) -> Tuple[str, bytes]:
         """เตรียมข้อมูลสำหรับส่งคำสั่ง MQTT
         
+        Args:
+            command: ชื่อคำสั่ง
+            device_id: Device ID ของอุปกรณ์
+            params: พารามิเตอร์เพิ่มเติม
+            request_id: รหัสคำสั่งสำหรับจับคู่คำตอบ (สร้างใหม่ถ้าไม่ระบุ)
+        
         Returns:
-            Tuple[str, str]: (topic, payload)
+            Tuple[str, bytes]: (topic, payload แบบ JSON UTF-8)
         """
         data = {
             "command": command,
             "device_id": device_id,
+            "request_id": request_id or self.pending_requests.new_request_id(),
             "timestamp": int(time.time())
         }
         
@@ -286,7 +590,7 @@ class TelegramBot:
             data.update(params)
         
         topic = f"{self.mqtt_topic_cmd}{device_id}"
-        payload = json.dumps(data)
+        payload = codec.dumps(data)
         
         return topic, payload
     
@@ -301,23 +605,311 @@ class TelegramBot:
             params: พารามิเตอร์เพิ่มเติม
             success_msg: ข้อความตอบกลับเมื่อส่งสำเร็จ
         """
-        """ส่งคำสั่ง MQTT และตอบกลับไปยัง Telegram"""
+        # หลายอุปกรณ์ (1001,1002 / 1001-1040 / @group): ส่งพร้อมกันแล้วสรุปผลเป็นตารางเดียว
+        if self._is_bulk_target(device_id):
+            await self._send_bulk_command(update, command, device_id, params)
+            return
+        
         chat_id = str(update.effective_chat.id)
         
-        # บันทึกประวัติก่อนส่งคำสั่ง
+        # ตรวจสิทธิ์ของแชทต่ออุปกรณ์และคำสั่ง
+        if not await self._check_permission(update, chat_id, device_id, command):
+            return
+        
+        # MQTT ขาดการเชื่อมต่อ: เก็บคำสั่งไว้ส่งเมื่อเชื่อมต่อได้อีกครั้ง
+        if not self.mqtt_client.is_connected() and await self._queue_in_outbox(update, command, device_id, params):
+            return
+        
+        # คำสั่งอ่านค่าเดียวกันกำลังรอคำตอบอยู่: รอคำตอบเดียวกันแทนการส่งซ้ำ
+        if command in READ_COMMANDS and self.read_coalesce_window > 0:
+            request = self.pending_requests.find(device_id, command, self.read_coalesce_window)
+            if request is not None:
+                self.pending_requests.follow(request, chat_id)
+                self.coalesced_reads += 1
+                await update.message.reply_text(
+                    f"คำสั่ง {command} ของอุปกรณ์ {device_id} กำลังรอคำตอบอยู่แล้ว จะส่งคำตอบให้เมื่ออุปกรณ์ตอบกลับ")
+                return
+        
+        # คำสั่งเขียนค่าที่ตามมาติดๆ: เก็บไว้ส่งเฉพาะค่าสุดท้ายเมื่อหมดช่วงเวลา
+        if command in WRITE_COMMANDS and self.writes is not None:
+            send_now, replaced = self.writes.submit((device_id, command), (update, params, success_msg))
+            if replaced is not None:
+                await replaced[0].message.reply_text(
+                    f"คำสั่ง {command} ของอุปกรณ์ {device_id} ถูกแทนที่ด้วยคำสั่งที่สั่งหลังสุด")
+            if not send_now:
+                await update.message.reply_text(
+                    f"ได้รับคำสั่ง {command} แล้ว จะส่งค่าล่าสุดไปยังอุปกรณ์ {device_id} ภายใน {self.writes.window:g} วินาที")
+                return
+        
+        await self._publish_command(update, command, device_id, params, success_msg)
+    
+    async def _flush_write(self, key: Tuple[str, str], item: Tuple[Update, Optional[Dict], Optional[str]]):
+        """ส่งคำสั่งเขียนค่าสุดท้ายของ (device_id, command) เมื่อหมดช่วงเวลารวมคำสั่ง"""
+        device_id, command = key
+        update, params, success_msg = item
+        await self._publish_command(update, command, device_id, params, success_msg)
+    
+    async def _publish_command(self, update: Update, command: str, device_id: str, params: Dict = None,
+                               success_msg: str = None):
+        """ลงทะเบียนคำสั่งในตารางรอคำตอบ แล้ว publish ไปยังอุปกรณ์หนึ่งเครื่อง"""
+        chat_id = str(update.effective_chat.id)
+        
+        # บันทึกประวัติก่อนส่งคำสั่ง (ใช้เป็นทางสำรองเมื่อจับคู่ด้วย request_id ไม่ได้)
         self.command_history.record_command(device_id, command, chat_id)
         
+        # ลงทะเบียนคำสั่งในตารางรอคำตอบก่อนส่ง เพราะคำตอบอาจมาถึงก่อน publish() จะคืนค่า
+        request_id = self.pending_requests.new_request_id()
+        self.pending_requests.add(request_id, device_id, command, chat_id, asyncio.get_running_loop().create_future())
+        if self.cluster is not None:
+            # คำตอบอาจไปถึง node อื่นผ่าน shared subscription
+            try:
+                await self.cluster.register(request_id, device_id, command, chat_id)
+            except Exception as e:
+                logger.error(f"ไม่สามารถบันทึกคำสั่งลงที่เก็บข้อมูลร่วมได้ (node อื่นจะหา chat ของคำตอบไม่พบ): {e}")
+        
         # เตรียมข้อมูลสำหรับส่ง MQTT
-        topic, payload = self._prepare_mqtt_command(command, device_id, params)
+        topic, payload = self._prepare_mqtt_command(command, device_id, params, request_id)
         
         # ส่งผ่าน MQTT
-        if self.mqtt_client.publish(topic, payload):
+        if await self.mqtt_client.publish(topic, payload):
+            # ค่าที่คำสั่งนี้อาจเปลี่ยนไม่น่าเชื่อถือแล้ว ลบออกจากแคช
+            self.device_state.invalidate(device_id, command)
+            # คำสั่งเดียวกันที่ยังค้างใน outbox ถูกแทนที่ด้วยคำสั่งนี้
+            if self.outbox is not None:
+                self.outbox.remove(device_id, command, chat_id)
             await update.message.reply_text(success_msg or f"ส่งคำสั่ง {command} ไปยังอุปกรณ์ {device_id} สำเร็จ")
-            logger.info(f"ส่งคำสั่ง {command} ไปยัง MQTT สำเร็จ: {payload}")
+            logger.info(f"ส่งคำสั่ง {command} ไปยัง MQTT สำเร็จ: {payload.decode('utf-8')}")
         else:
+            self.pending_requests.discard(request_id)
+            if await self._queue_in_outbox(update, command, device_id, params):
+                return
             await update.message.reply_text("เกิดข้อผิดพลาดในการส่งคำสั่ง")
             logger.error(f"ส่งคำสั่ง {command} ไปยัง MQTT ล้มเหลว")
     
+    async def _queue_in_outbox(self, update: Update, command: str, device_id: str, params: Dict = None) -> bool:
+        """เก็บคำสั่งที่ส่งไม่ได้ไว้ใน outbox และแจ้งผู้ใช้
+        
+        Returns:
+            bool: True ถ้าเก็บคำสั่งแล้ว, False ถ้าไม่มี outbox หรือ outbox เต็ม
+        """
+        if self.outbox is None or not self.outbox.accepts(device_id, command):
+            return False
+        
+        chat_id = str(update.effective_chat.id)
+        replaced = self.outbox.add(device_id, command, params, chat_id)
+        note = " (แทนที่คำสั่งเดิมที่รอส่งอยู่)" if replaced is not None else ""
+        await update.message.reply_text(
+            f"MQTT ขาดการเชื่อมต่อ เก็บคำสั่ง {command} ไว้ส่งไปยังอุปกรณ์ {device_id} "
+            f"ทันทีที่เชื่อมต่อได้ (ภายใน {self.outbox.ttl / 60:g} นาที){note}"
+        )
+        logger.warning(f"MQTT ขาดการเชื่อมต่อ เก็บคำสั่ง {command} ของอุปกรณ์ {device_id} ไว้ใน outbox ({len(self.outbox)} รายการ)")
+        return True
+    
+    async def replay_outbox(self) -> int:
+        """ส่งคำสั่งที่ค้างใน outbox เป็นชุดหลัง MQTT เชื่อมต่อได้อีกครั้ง
+        
+        แต่ละชุด publish พร้อมกัน ถ้ามีคำสั่งที่ส่งไม่สำเร็จ (เช่น ขาดการเชื่อมต่ออีกครั้ง)
+        จะคืนคำสั่งเหล่านั้นเข้า outbox แล้วหยุด แชทที่สั่งได้รับแจ้งหนึ่งข้อความต่อแชท
+        คำตอบของอุปกรณ์ถูกส่งไปยังแชทตามปกติผ่านตารางคำสั่งที่รอคำตอบ
+        
+        Returns:
+            int: จำนวนคำสั่งที่ส่งสำเร็จ
+        """
+        if self.outbox is None or not len(self.outbox):
+            return 0
+        
+        sent: Dict[str, List[OutboxEntry]] = {}
+        total = 0
+        while self.mqtt_client.is_connected():
+            batch = self.outbox.take(self.outbox_batch_size)
+            if not batch:
+                break
+            
+            results = await asyncio.gather(*(self._publish_outbox_entry(entry) for entry in batch))
+            failed = [entry for entry, ok in zip(batch, results) if not ok]
+            for entry, ok in zip(batch, results):
+                if ok:
+                    sent.setdefault(entry.chat_id, []).append(entry)
+            total += len(batch) - len(failed)
+            if failed:
+                self.outbox.restore(failed)
+                break
+        
+        if total:
+            self.outbox.mark_replayed(total)
+            logger.info(f"ส่งคำสั่งจาก outbox {total} รายการ (เหลือ {len(self.outbox)} รายการ)")
+        for chat_id, entries in sent.items():
+            self.outbox.announce(chat_id, "MQTT เชื่อมต่อได้แล้ว ส่งคำสั่งที่รอไว้สำเร็จ:\n"
+                                 + describe_entries(entries, waited=True))
+        return total
+    
+    async def _publish_outbox_entry(self, entry: OutboxEntry) -> bool:
+        """publish คำสั่งหนึ่งรายการจาก outbox (ลงทะเบียนรอคำตอบก่อนส่งเหมือนคำสั่งปกติ)"""
+        self.command_history.record_command(entry.device_id, entry.command, entry.chat_id)
+        request_id = self.pending_requests.new_request_id()
+        self.pending_requests.add(request_id, entry.device_id, entry.command, entry.chat_id,
+                                  asyncio.get_running_loop().create_future())
+        if self.cluster is not None:
+            try:
+                await self.cluster.register(request_id, entry.device_id, entry.command, entry.chat_id)
+            except Exception as e:
+                logger.error(f"ไม่สามารถบันทึกคำสั่งลงที่เก็บข้อมูลร่วมได้ (node อื่นจะหา chat ของคำตอบไม่พบ): {e}")
+        
+        topic, payload = self._prepare_mqtt_command(entry.command, entry.device_id, entry.params, request_id)
+        if await self.mqtt_client.publish(topic, payload):
+            self.device_state.invalidate(entry.device_id, entry.command)
+            return True
+        self.pending_requests.discard(request_id)
+        return False
+    
+    def _is_bulk_target(self, target: str) -> bool:
+        """ตรวจสอบว่า <id> ระบุหลายอุปกรณ์หรือไม่ (1001,1002 หรือ 1001-1040 หรือ @group)"""
+        return target.startswith(GROUP_PREFIX) or "," in target or "-" in target[1:]
+    
+    def _is_device_target(self, target: str) -> bool:
+        """ตรวจสอบรูปแบบของ <id> (Device ID ตัวเลข หรือรายการอุปกรณ์สำหรับคำสั่งแบบกลุ่ม)"""
+        if target.startswith(GROUP_PREFIX):
+            return len(target) > len(GROUP_PREFIX)
+        for part in target.split(","):
+            bounds = part.split("-")
+            if len(bounds) > 2 or not all(bound.isdigit() for bound in bounds):
+                return False
+        return True
+    
+    def _resolve_targets(self, target: str) -> Tuple[List[str], Optional[str]]:
+        """แปลง <id> แบบหลายอุปกรณ์เป็นรายการ Device ID
+        
+        Args:
+            target: รายการคั่นด้วย comma ที่แต่ละส่วนเป็น Device ID, ช่วง (1001-1040) หรือ @group
+        
+        Returns:
+            Tuple[List[str], Optional[str]]: (รายการ Device ID ไม่ซ้ำตามลำดับ, ข้อความผิดพลาดหรือ None)
+        """
+        devices: Dict[str, None] = {}
+        for part in target.split(","):
+            if part.startswith(GROUP_PREFIX):
+                name = part[len(GROUP_PREFIX):]
+                members = self.acl.get_group(name)
+                if members is None:
+                    return [], f"ไม่พบกลุ่มอุปกรณ์ {name}"
+                devices.update(dict.fromkeys(members))
+            elif "-" in part:
+                low, high = (int(bound) for bound in part.split("-"))
+                if low > high:
+                    return [], f"ช่วง Device ID ไม่ถูกต้อง: {part}"
+                if high - low + 1 > self.bulk_max_devices:
+                    return [], f"สั่งได้ครั้งละไม่เกิน {self.bulk_max_devices} อุปกรณ์"
+                devices.update(dict.fromkeys(str(device_id) for device_id in range(low, high + 1)))
+            elif part:
+                devices[part] = None
+            
+            if len(devices) > self.bulk_max_devices:
+                return [], f"สั่งได้ครั้งละไม่เกิน {self.bulk_max_devices} อุปกรณ์"
+        
+        if not devices:
+            return [], "ไม่พบอุปกรณ์ที่ต้องการสั่ง"
+        return list(devices), None
+    
+    async def _send_bulk_command(self, update: Update, command: str, target: str, params: Dict = None,
+                                 use_cache: bool = False):
+        """ส่งคำสั่งเดียวกันไปยังหลายอุปกรณ์พร้อมกัน แล้วสรุปคำตอบเป็นตารางเดียว
+        
+        คำตอบของแต่ละอุปกรณ์จะไม่ถูกส่งแยก (ลงทะเบียนด้วย chat_id เป็น None)
+        การรอคำตอบทำใน task แยก เพื่อไม่ให้บล็อกการรับคำสั่งอื่น
+        
+        Args:
+            update: Telegram update object
+            command: ชื่อคำสั่ง
+            target: <id> แบบหลายอุปกรณ์
+            params: พารามิเตอร์เพิ่มเติม (เหมือนกันทุกอุปกรณ์)
+            use_cache: ใช้สถานะในแคชแทนการถามอุปกรณ์ถ้าข้อมูลยังใหม่พอ (เฉพาะ status)
+        """
+        chat_id = str(update.effective_chat.id)
+        
+        devices, error = self._resolve_targets(target)
+        if error:
+            await update.message.reply_text(error)
+            return
+        
+        # ตรวจสิทธิ์ทีละอุปกรณ์ อุปกรณ์ที่ไม่มีสิทธิ์จะแสดงในตารางสรุป
+        allowed = [device_id for device_id in devices if self.acl.authorize(chat_id, device_id, command)]
+        if not allowed:
+            await self._check_permission(update, chat_id, devices[0], command)
+            return
+        allowed_set = set(allowed)
+        denied = [device_id for device_id in devices if device_id not in allowed_set]
+        
+        # อุปกรณ์ที่มีสถานะในแคชไม่ต้องส่งคำสั่ง
+        replies: Dict[str, Dict] = {}
+        if use_cache:
+            for device_id in allowed:
+                cached = self.device_state.get_status(device_id)
+                if cached:
+                    replies[device_id] = {"success": True, "data": cached[0]}
+        
+        # ลงทะเบียนคำสั่งทั้งหมดก่อนส่ง
+        loop = asyncio.get_running_loop()
+        futures: Dict[str, asyncio.Future] = {}
+        requests = []
+        for device_id in allowed:
+            if device_id in replies:
+                continue
+            request_id = self.pending_requests.new_request_id()
+            future = loop.create_future()
+            self.pending_requests.add(request_id, device_id, command, None, future)
+            futures[device_id] = future
+            requests.append((request_id, device_id))
+        
+        if self.cluster is not None and requests:
+            try:
+                await self.cluster.register_many([(request_id, device_id, command, None)
+                                                  for request_id, device_id in requests])
+            except Exception as e:
+                logger.error(f"ไม่สามารถบันทึกคำสั่งลงที่เก็บข้อมูลร่วมได้: {e}")
+        
+        started = time.monotonic()
+        if requests:
+            await update.message.reply_text(
+                f"กำลังส่งคำสั่ง {command} ไปยัง {len(requests)} อุปกรณ์ (รอคำตอบไม่เกิน {self.bulk_timeout:.0f} วินาที)")
+        
+        # publish พร้อมกันทั้งหมด (paho จัดคิวและจำกัดจำนวนที่รอ PUBACK เอง)
+        results = await asyncio.gather(*(
+            self.mqtt_client.publish(*self._prepare_mqtt_command(command, device_id, params, request_id))
+            for request_id, device_id in requests
+        ), return_exceptions=True)
+        
+        failed = []
+        for (request_id, device_id), ok in zip(requests, results):
+            if ok is True:
+                self.device_state.invalidate(device_id, command)
+            else:
+                self.pending_requests.discard(request_id)
+                del futures[device_id]
+                failed.append(device_id)
+        logger.info(f"ส่งคำสั่ง {command} แบบกลุ่มไปยัง {len(requests) - len(failed)}/{len(allowed)} อุปกรณ์")
+        
+        # รอคำตอบใน task แยก (ตัวจัดการคำสั่งคืนทันที)
+        self.application.create_task(
+            self._collect_bulk_replies(update, command, allowed, futures, replies, failed, denied, started),
+            update=update
+        )
+    
+    async def _collect_bulk_replies(self, update: Update, command: str, devices: List[str],
+                                    futures: Dict[str, asyncio.Future], replies: Dict[str, Dict],
+                                    failed: List[str], denied: List[str], started: float):
+        """รอคำตอบของคำสั่งแบบกลุ่มจนถึงเวลาที่กำหนด แล้วส่งตารางสรุปผล"""
+        if futures:
+            await asyncio.wait(futures.values(), timeout=self.bulk_timeout)
+        
+        # คำตอบที่มาหลังจากนี้ยังจับคู่ได้ (ไม่ส่งไปยัง Telegram) จนกว่าคำสั่งจะหมดเวลาในตาราง
+        for device_id, future in futures.items():
+            if future.done() and not future.cancelled() and future.result() is not None:
+                replies[device_id] = future.result()
+        
+        for message in self.renderer.render_bulk(command, devices, replies, failed, denied,
+                                                 time.monotonic() - started):
+            await update.message.reply_text(message)
+    
     # คำสั่ง /status
     async def _cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """คำสั่ง /status - ตรวจสอบสถานะอุปกรณ์"""
@@ -330,16 +922,34 @@ class TelegramBot:
         
         # ตรวจสอบจำนวนพารามิเตอร์
         if not context.args or len(context.args) < 1:
-            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /status <id>")
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /status <id> [refresh]")
             return
         
         device_id = context.args[0]
+        force_refresh = len(context.args) > 1 and context.args[1].lower() == "refresh"
         
         # ตรวจสอบว่า Device ID เป็นตัวเลขหรือไม่
-        if not self._is_numeric(device_id):
+        if not self._is_device_target(device_id):
             await update.message.reply_text("Device ID ต้องเป็นตัวเลขเท่านั้น")
             return
         
+        # หลายอุปกรณ์: อุปกรณ์ที่มีข้อมูลในแคชไม่ต้องถามใหม่ (ยกเว้น refresh)
+        if self._is_bulk_target(device_id):
+            await self._send_bulk_command(update, "status", device_id, use_cache=not force_refresh)
+            return
+        
+        # ตอบจากแคชถ้าข้อมูลยังใหม่พอ (ไม่ต้องถามอุปกรณ์)
+        if not force_refresh:
+            cached = self.device_state.get_status(device_id)
+            if cached:
+                if not await self._check_permission(update, chat_id, device_id, "status"):
+                    return
+                data, age = cached
+                response = self.format_mqtt_response(device_id, "status", {"success": True, "data": data}, True)
+                response += f"(ข้อมูลเมื่อ {age:.0f} วินาทีที่แล้ว ใช้ /status {device_id} refresh เพื่ออ่านค่าใหม่)"
+                await update.message.reply_text(response)
+                return
+        
         # ส่งคำสั่ง
         await self._send_mqtt_command(
             update, 
@@ -368,7 +978,7 @@ class TelegramBot:
         high_temp_str = context.args[2]
         
         # ตรวจสอบว่า Device ID และค่าอุณหภูมิเป็นตัวเลขหรือไม่
-        if not self._is_numeric(device_id) or not self._is_numeric(low_temp_str) or not self._is_numeric(high_temp_str):
+        if not self._is_device_target(device_id) or not self._is_numeric(low_temp_str) or not self._is_numeric(high_temp_str):
             await update.message.reply_text("Device ID และค่าอุณหภูมิต้องเป็นตัวเลขเท่านั้น")
             return
         
@@ -414,7 +1024,7 @@ class TelegramBot:
         high_hum_str = context.args[2]
         
         # ตรวจสอบว่า Device ID และค่าความชื้นเป็นตัวเลขหรือไม่
-        if not self._is_numeric(device_id) or not self._is_numeric(low_hum_str) or not self._is_numeric(high_hum_str):
+        if not self._is_device_target(device_id) or not self._is_numeric(low_hum_str) or not self._is_numeric(high_hum_str):
             await update.message.reply_text("Device ID และค่าความชื้นต้องเป็นตัวเลขเท่านั้น")
             return
         
@@ -459,7 +1069,7 @@ class TelegramBot:
         mode = context.args[1].lower()
         
         # ตรวจสอบว่า Device ID เป็นตัวเลขหรือไม่
-        if not self._is_numeric(device_id):
+        if not self._is_device_target(device_id):
             await update.message.reply_text("Device ID ต้องเป็นตัวเลขเท่านั้น")
             return
         
@@ -496,7 +1106,7 @@ class TelegramBot:
         option_str = context.args[1]
         
         # ตรวจสอบว่า Device ID และ option เป็นตัวเลขหรือไม่
-        if not self._is_numeric(device_id) or not self._is_numeric(option_str):
+        if not self._is_device_target(device_id) or not self._is_numeric(option_str):
             await update.message.reply_text("Device ID และ option ต้องเป็นตัวเลขเท่านั้น")
             return
         
@@ -535,7 +1145,7 @@ class TelegramBot:
         state_str = context.args[1]
         
         # ตรวจสอบว่า Device ID เป็นตัวเลขหรือไม่
-        if not self._is_numeric(device_id):
+        if not self._is_device_target(device_id):
             await update.message.reply_text("Device ID ต้องเป็นตัวเลขเท่านั้น")
             return
         
@@ -709,6 +1319,320 @@ class TelegramBot:
             success_msg=f"กำลังเรียกข้อมูลของอุปกรณ์ {device_id}"
         )
     
+    async def _cmd_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /history - สรุปค่าที่อ่านได้จากอุปกรณ์ย้อนหลัง (ไม่ต้องถามอุปกรณ์)"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args or len(context.args) > 2:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /history <id> [window] เช่น /history 1001 6h")
+            return
+        
+        device_id = context.args[0]
+        window_text = context.args[1] if len(context.args) > 1 else "24h"
+        
+        # ตรวจสอบว่า Device ID เป็นตัวเลขหรือไม่
+        if not self._is_numeric(device_id):
+            await update.message.reply_text("Device ID ต้องเป็นตัวเลขเท่านั้น")
+            return
+        
+        window = parse_window(window_text)
+        if window is None:
+            await update.message.reply_text("ช่วงเวลาไม่ถูกต้อง ใช้ตัวเลขตามด้วย m, h, d หรือ w เช่น 30m, 6h, 7d")
+            return
+        window = min(window, self.telemetry.retention)
+        
+        if not await self._check_permission(update, chat_id, device_id, "history"):
+            return
+        
+        summary = self.telemetry.summary(device_id, window)
+        if summary is None:
+            await update.message.reply_text(
+                f"ยังไม่มีข้อมูลของอุปกรณ์ {device_id} ในช่วงเวลานี้ (ข้อมูลถูกบันทึกจากคำตอบของ /status)"
+            )
+            return
+        await update.message.reply_text(self.renderer.render_history(summary))
+    
+    async def _cmd_chart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /chart - ส่งกราฟค่าย้อนหลังของอุปกรณ์"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args or len(context.args) < 2 or len(context.args) > 3:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /chart <id> <temp/hum/relay> [window] เช่น /chart 1001 temp 24h")
+            return
+        
+        device_id = context.args[0]
+        metric = CHART_METRICS.get(context.args[1].lower())
+        window_text = context.args[2] if len(context.args) > 2 else "24h"
+        
+        # ตรวจสอบว่า Device ID เป็นตัวเลขหรือไม่
+        if not self._is_numeric(device_id):
+            await update.message.reply_text("Device ID ต้องเป็นตัวเลขเท่านั้น")
+            return
+        
+        if metric is None:
+            await update.message.reply_text("ค่าที่ใช้วาดกราฟต้องเป็น temp, hum หรือ relay")
+            return
+        
+        window = parse_window(window_text)
+        if window is None:
+            await update.message.reply_text("ช่วงเวลาไม่ถูกต้อง ใช้ตัวเลขตามด้วย m, h, d หรือ w เช่น 30m, 6h, 7d")
+            return
+        window = min(window, self.telemetry.retention)
+        
+        if not await self._check_permission(update, chat_id, device_id, "chart"):
+            return
+        
+        # ภาพเดิมใช้ได้จนกว่าจะได้รับค่าใหม่ของอุปกรณ์ (เวอร์ชันของข้อมูลเปลี่ยน)
+        key = (device_id, metric, window, self.telemetry.version(device_id))
+        
+        def render_args():
+            points = self.telemetry.points(device_id, metric, window)
+            if points is None:
+                return None
+            now = time.time()
+            return (points.times, points.minimums, points.averages, points.maximums, now - window, now)
+        
+        try:
+            photo = await self.charts.get(key, render_args)
+        except Exception as e:
+            logger.error(f"ไม่สามารถวาดกราฟของอุปกรณ์ {device_id} ได้: {e}")
+            await update.message.reply_text("ไม่สามารถสร้างกราฟได้ กรุณาลองใหม่อีกครั้ง")
+            return
+        
+        summary = self.telemetry.summary(device_id, window)
+        if photo is None or summary is None:
+            await update.message.reply_text(
+                f"ยังไม่มีข้อมูลของอุปกรณ์ {device_id} ในช่วงเวลานี้ (ข้อมูลถูกบันทึกจากคำตอบของ /status)"
+            )
+            return
+        
+        message = await update.message.reply_photo(photo=photo, caption=self.renderer.render_chart_caption(summary, metric))
+        
+        # อัปโหลดครั้งแรก: เก็บ file_id ไว้ส่งซ้ำโดยไม่ต้องอัปโหลดไฟล์อีก
+        if isinstance(photo, bytes) and message is not None and message.photo:
+            self.charts.uploaded(key, message.photo[-1].file_id)
+    
+    async def _cmd_subscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /subscribe - รับคำตอบและการเปลี่ยนสถานะของอุปกรณ์"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args or len(context.args) != 1:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /subscribe <id>")
+            return
+        
+        device_id = context.args[0]
+        
+        # ตรวจสอบว่า Device ID เป็นตัวเลขหรือไม่
+        if not self._is_numeric(device_id):
+            await update.message.reply_text("Device ID ต้องเป็นตัวเลขเท่านั้น")
+            return
+        
+        if not await self._check_permission(update, chat_id, device_id, "subscribe"):
+            return
+        
+        if chat_id in self.subscriptions.subscribers(device_id):
+            await update.message.reply_text(f"ติดตามอุปกรณ์ {device_id} อยู่แล้ว")
+            return
+        
+        if self.subscriptions.is_full(chat_id):
+            await update.message.reply_text(f"ติดตามได้ไม่เกิน {self.subscriptions.max_per_chat} อุปกรณ์ต่อแชท")
+            return
+        
+        self.subscriptions.subscribe(chat_id, device_id)
+        await update.message.reply_text(
+            f"ติดตามอุปกรณ์ {device_id} แล้ว จะได้รับคำตอบ /status, /relay และการเปลี่ยนสถานะออนไลน์/ออฟไลน์")
+    
+    async def _cmd_unsubscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /unsubscribe - เลิกติดตามอุปกรณ์"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args or len(context.args) != 1:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /unsubscribe <id>")
+            return
+        
+        device_id = context.args[0]
+        
+        # เลิกติดตามได้เสมอ แม้สิทธิ์ต่ออุปกรณ์จะถูกยกเลิกไปแล้ว
+        if self.subscriptions.unsubscribe(chat_id, device_id):
+            await update.message.reply_text(f"เลิกติดตามอุปกรณ์ {device_id} แล้ว")
+        else:
+            await update.message.reply_text(f"ไม่ได้ติดตามอุปกรณ์ {device_id}")
+    
+    async def _cmd_subscriptions(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /subscriptions - แสดงอุปกรณ์ที่แชทนี้ติดตาม"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        devices = self.subscriptions.devices(chat_id)
+        if not devices:
+            await update.message.reply_text("ยังไม่ได้ติดตามอุปกรณ์ใด ใช้ /subscribe <id> เพื่อเริ่มติดตาม")
+            return
+        
+        await update.message.reply_text(f"อุปกรณ์ที่ติดตาม ({len(devices)}): {', '.join(devices)}")
+    
+    async def _cmd_alert(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /alert - ตั้งกฎแจ้งเตือนของอุปกรณ์"""
+        chat_id = str(update.effective_chat.id)
+        usage = ("รูปแบบคำสั่งไม่ถูกต้อง:\n"
+                 "/alert <id> <temp/hum> <above/below/rate> <value> [hysteresis] [cooldown] เช่น /alert 1001 temp above 35\n"
+                 "/alert <id> missing <time> [cooldown] เช่น /alert 1001 missing 30m")
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        args = context.args or []
+        if len(args) < 3:
+            await update.message.reply_text(usage)
+            return
+        
+        device_id = args[0]
+        
+        # ตรวจสอบว่า Device ID เป็นตัวเลขหรือไม่
+        if not self._is_numeric(device_id):
+            await update.message.reply_text("Device ID ต้องเป็นตัวเลขเท่านั้น")
+            return
+        
+        metric = None
+        hysteresis = None
+        if args[1].lower() == KIND_MISSING:
+            if len(args) > 4:
+                await update.message.reply_text(usage)
+                return
+            kind = KIND_MISSING
+            threshold = parse_window(args[2])
+            cooldown_text = args[3] if len(args) > 3 else None
+            if threshold is None:
+                await update.message.reply_text("ช่วงเวลาไม่ถูกต้อง ใช้ตัวเลขตามด้วย m, h, d หรือ w เช่น 30m, 6h")
+                return
+        else:
+            if len(args) < 4 or len(args) > 6:
+                await update.message.reply_text(usage)
+                return
+            metric = CHART_METRICS.get(args[1].lower())
+            kind = args[2].lower()
+            if metric not in ALERT_METRICS:
+                await update.message.reply_text("ตั้งกฎแจ้งเตือนได้เฉพาะ temp หรือ hum")
+                return
+            if kind not in (KIND_ABOVE, KIND_BELOW, KIND_RATE):
+                await update.message.reply_text("ชนิดกฎต้องเป็น above, below, rate หรือ missing")
+                return
+            if not self._is_numeric(args[3]) or (len(args) > 4 and not self._is_numeric(args[4])):
+                await update.message.reply_text("เกณฑ์และ hysteresis ต้องเป็นตัวเลขเท่านั้น")
+                return
+            threshold = float(args[3])
+            if len(args) > 4:
+                hysteresis = float(args[4])
+            cooldown_text = args[5] if len(args) > 5 else None
+            if (kind == KIND_RATE and threshold <= 0) or (hysteresis is not None and hysteresis < 0):
+                await update.message.reply_text("เกณฑ์ของ rate ต้องมากกว่า 0 และ hysteresis ต้องไม่ติดลบ")
+                return
+        
+        cooldown = None
+        if cooldown_text is not None:
+            cooldown = parse_window(cooldown_text)
+            if cooldown is None:
+                await update.message.reply_text("cooldown ไม่ถูกต้อง ใช้ตัวเลขตามด้วย m, h, d หรือ w เช่น 10m")
+                return
+        
+        if not await self._check_permission(update, chat_id, device_id, "alert"):
+            return
+        
+        if self.alerts.is_full(device_id):
+            await update.message.reply_text(f"อุปกรณ์หนึ่งเครื่องมีกฎแจ้งเตือนได้ไม่เกิน {self.alerts.max_rules_per_device} ข้อ")
+            return
+        
+        rule = self.alerts.add_rule(device_id, chat_id, kind, threshold, metric=metric,
+                                    hysteresis=hysteresis, cooldown=cooldown)
+        await update.message.reply_text(f"เพิ่มกฎแจ้งเตือนแล้ว\n{rule.describe()}")
+    
+    async def _cmd_alerts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /alerts - แสดงกฎแจ้งเตือนของแชทนี้ หรือของอุปกรณ์ที่ระบุ"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if context.args and len(context.args) > 1:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /alerts [id]")
+            return
+        
+        if context.args:
+            device_id = context.args[0]
+            if not await self._check_permission(update, chat_id, device_id, "alerts"):
+                return
+            rules = self.alerts.rules(device_id=device_id)
+        else:
+            rules = self.alerts.rules(chat_id=chat_id)
+        
+        if not rules:
+            await update.message.reply_text("ไม่มีกฎแจ้งเตือน ใช้ /alert เพื่อเพิ่มกฎ")
+            return
+        
+        lines = [f"กฎแจ้งเตือน ({len(rules)}):"]
+        lines.extend(rule.describe() for rule in rules)
+        await update.message.reply_text("\n".join(lines))
+    
+    async def _cmd_delalert(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /delalert - ลบกฎแจ้งเตือน"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args or len(context.args) != 1 or not context.args[0].lstrip("#").isdigit():
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /delalert <rule_id> (ดูหมายเลขกฎได้จาก /alerts)")
+            return
+        
+        rule_id = int(context.args[0].lstrip("#"))
+        rule = self.alerts.get_rule(rule_id)
+        if rule is None:
+            await update.message.reply_text(f"ไม่พบกฎแจ้งเตือน #{rule_id}")
+            return
+        
+        # ลบกฎของแชทตัวเองได้เสมอ กฎของแชทอื่นต้องมีสิทธิ์ควบคุมอุปกรณ์
+        if rule.chat_id != chat_id and not await self._check_permission(update, chat_id, rule.device_id, "delalert"):
+            return
+        
+        self.alerts.remove_rule(rule_id)
+        await update.message.reply_text(f"ลบกฎแจ้งเตือน #{rule_id} แล้ว")
+    
     # คำสั่ง Chat ID
     async def _cmd_addchatid(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """คำสั่ง /addchatid - เพิ่ม Chat ID"""
@@ -719,6 +1643,10 @@ class TelegramBot:
             await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
             return
         
+        # ต้องเป็น admin จึงจัดการ Chat IDs ได้
+        if not await self._check_permission(update, chat_id, None, "addchatid"):
+            return
+        
         # ตรวจสอบจำนวนพารามิเตอร์
         if not context.args or len(context.args) < 2:
             await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /addchatid <esp32_id> <chat_id>")
@@ -754,6 +1682,10 @@ class TelegramBot:
             await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
             return
         
+        # ต้องเป็น admin จึงจัดการ Chat IDs ได้
+        if not await self._check_permission(update, chat_id, None, "removechatid"):
+            return
+        
         # ตรวจสอบจำนวนพารามิเตอร์
         if not context.args or len(context.args) < 3:
             await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /removechatid <esp32_id> <index(3-5)> <old_id>")
@@ -797,6 +1729,10 @@ class TelegramBot:
             await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
             return
         
+        # ต้องเป็น admin จึงจัดการ Chat IDs ได้
+        if not await self._check_permission(update, chat_id, None, "updatechatid"):
+            return
+        
         # ตรวจสอบจำนวนพารามิเตอร์
         if not context.args or len(context.args) < 4:
             await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /updatechatid <esp32_id> <index(3-5)> <old_id> <new_id>")
@@ -842,6 +1778,10 @@ class TelegramBot:
             await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
             return
         
+        # ต้องเป็น admin จึงจัดการ Chat IDs ได้
+        if not await self._check_permission(update, chat_id, None, "listchatids"):
+            return
+        
         # ตรวจสอบจำนวนพารามิเตอร์
         if not context.args or len(context.args) < 1:
             await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /listchatids <esp32_id>")
@@ -869,6 +1809,226 @@ class TelegramBot:
         
         await update.message.reply_text(msg)
     
+    # คำสั่งจัดการสิทธิ์ต่ออุปกรณ์
+    def _is_valid_target(self, target: str) -> bool:
+        """ตรวจสอบว่า target ของสิทธิ์เป็น Device ID, @กลุ่ม หรือ * หรือไม่"""
+        if target == WILDCARD:
+            return True
+        if target.startswith(GROUP_PREFIX):
+            return len(target) > len(GROUP_PREFIX)
+        return self._is_numeric(target)
+    
+    async def _cmd_grant(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /grant - กำหนดสิทธิ์ให้แชทต่ออุปกรณ์"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        if not await self._check_permission(update, chat_id, None, "grant"):
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args or len(context.args) < 3:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /grant <chat_id> <id|@group|*> <viewer/operator/admin>")
+            return
+        
+        target_chat_id = context.args[0]
+        target = context.args[1]
+        role = context.args[2].lower()
+        
+        if not self._is_numeric(target_chat_id) or not self._is_valid_target(target):
+            await update.message.reply_text("Chat ID ต้องเป็นตัวเลข และอุปกรณ์ต้องเป็น Device ID, @ชื่อกลุ่ม หรือ *")
+            return
+        
+        if role not in ROLE_RANKS:
+            await update.message.reply_text("บทบาทต้องเป็น viewer, operator หรือ admin เท่านั้น")
+            return
+        
+        self.acl.grant(target_chat_id, target, role)
+        await update.message.reply_text(f"กำหนดสิทธิ์ {role} ให้ Chat ID {target_chat_id} สำหรับ {target} สำเร็จ")
+    
+    async def _cmd_revoke(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /revoke - ยกเลิกสิทธิ์ของแชทต่ออุปกรณ์"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        if not await self._check_permission(update, chat_id, None, "revoke"):
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args or len(context.args) < 2:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /revoke <chat_id> <id|@group|*>")
+            return
+        
+        target_chat_id = context.args[0]
+        target = context.args[1]
+        
+        if self.acl.revoke(target_chat_id, target):
+            await update.message.reply_text(f"ยกเลิกสิทธิ์ของ Chat ID {target_chat_id} สำหรับ {target} สำเร็จ")
+        else:
+            await update.message.reply_text("ไม่พบสิทธิ์ที่ต้องการยกเลิก")
+    
+    async def _cmd_acl(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /acl - แสดงสิทธิ์ของแชท"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        if not await self._check_permission(update, chat_id, None, "acl"):
+            return
+        
+        if context.args:
+            grants = {context.args[0]: self.acl.get_grants(context.args[0])}
+        else:
+            grants = self.acl.get_all_grants()
+        
+        lines = ["สิทธิ์ต่ออุปกรณ์:"]
+        for grant_chat_id, targets in grants.items():
+            for target, role in targets.items():
+                lines.append(f"{grant_chat_id}: {target} = {role}")
+        if len(lines) == 1:
+            lines.append("(ไม่มี)")
+        
+        lines.append("")
+        lines.append("Chat IDs ที่มีสิทธิ์ admin ทุกอุปกรณ์ (/listchatids):")
+        lines.extend(self.storage.get_all_chat_ids())
+        
+        await update.message.reply_text("\n".join(lines))
+    
+    async def _cmd_setgroup(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /setgroup - กำหนดกลุ่มอุปกรณ์"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        if not await self._check_permission(update, chat_id, None, "setgroup"):
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args or len(context.args) < 2:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /setgroup <name> <id> [id...]")
+            return
+        
+        name = context.args[0].lstrip(GROUP_PREFIX)
+        devices = [d for arg in context.args[1:] for d in arg.split(",") if d]
+        
+        if not name or not devices or not all(self._is_numeric(d) for d in devices):
+            await update.message.reply_text("ต้องระบุชื่อกลุ่ม และ Device ID ต้องเป็นตัวเลขเท่านั้น")
+            return
+        
+        self.acl.set_group(name, devices)
+        await update.message.reply_text(f"กำหนดกลุ่ม {GROUP_PREFIX}{name} ({len(set(devices))} อุปกรณ์) สำเร็จ")
+    
+    async def _cmd_delgroup(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /delgroup - ลบกลุ่มอุปกรณ์"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        if not await self._check_permission(update, chat_id, None, "delgroup"):
+            return
+        
+        # ตรวจสอบจำนวนพารามิเตอร์
+        if not context.args:
+            await update.message.reply_text("รูปแบบคำสั่งไม่ถูกต้อง: /delgroup <name>")
+            return
+        
+        name = context.args[0].lstrip(GROUP_PREFIX)
+        if self.acl.delete_group(name):
+            await update.message.reply_text(f"ลบกลุ่ม {GROUP_PREFIX}{name} สำเร็จ")
+        else:
+            await update.message.reply_text(f"ไม่พบกลุ่ม {GROUP_PREFIX}{name}")
+    
+    async def _cmd_groups(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /groups - แสดงกลุ่มอุปกรณ์ทั้งหมด"""
+        chat_id = str(update.effective_chat.id)
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        groups = self.acl.get_groups()
+        if not groups:
+            await update.message.reply_text("ยังไม่มีกลุ่มอุปกรณ์")
+            return
+        
+        msg = "กลุ่มอุปกรณ์:\n"
+        for name, count in sorted(groups.items()):
+            msg += f"{GROUP_PREFIX}{name}: {', '.join(self.acl.get_group(name))} ({count} อุปกรณ์)\n"
+        
+        await update.message.reply_text(msg)
+    
+    async def _cmd_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """คำสั่ง /profile - เปิด/ปิดการวัดเวลา แสดงสถิติ หรือเก็บตัวอย่าง stack (admin)"""
+        chat_id = str(update.effective_chat.id)
+        usage = "รูปแบบคำสั่งไม่ถูกต้อง: /profile <on [slow_ms]/off/stats/reset/sample [seconds]>"
+        
+        # ตรวจสอบว่า Chat ID ได้รับอนุญาตหรือไม่
+        if not self._is_authorized(chat_id):
+            await update.message.reply_text("คุณไม่มีสิทธิ์ใช้งานระบบนี้")
+            return
+        
+        if not await self._check_permission(update, chat_id, None, "profile"):
+            return
+        
+        args = context.args or ["stats"]
+        action = args[0].lower()
+        
+        if action == "on" and len(args) <= 2:
+            if len(args) > 1 and not args[1].isdigit():
+                await update.message.reply_text("slow_ms ต้องเป็นจำนวนเต็ม (มิลลิวินาที)")
+                return
+            self.profiler.enable(int(args[1]) / 1000 if len(args) > 1 else None)
+            await update.message.reply_text(
+                f"เปิดการวัดเวลาแล้ว บันทึกการเรียกที่นานกว่า {self.profiler.slow_threshold * 1000:.0f} ms ลง log")
+        elif action == "off" and len(args) == 1:
+            self.profiler.disable()
+            await update.message.reply_text("ปิดการวัดเวลาแล้ว\n" + self.profiler.report())
+        elif action == "stats" and len(args) == 1:
+            await update.message.reply_text(self.profiler.report())
+        elif action == "reset" and len(args) == 1:
+            self.profiler.reset()
+            await update.message.reply_text("ล้างสถิติการวัดเวลาแล้ว")
+        elif action == "sample" and len(args) <= 2:
+            if len(args) > 1 and not args[1].isdigit():
+                await update.message.reply_text("seconds ต้องเป็นจำนวนเต็ม")
+                return
+            duration = min(int(args[1]) if len(args) > 1 else 10, PROFILE_SAMPLE_MAX)
+            if duration <= 0 or self.profiler.sampling:
+                await update.message.reply_text("กำลังเก็บตัวอย่างอยู่แล้ว" if self.profiler.sampling else usage)
+                return
+            await update.message.reply_text(f"เริ่มเก็บตัวอย่าง stack {duration} วินาที...")
+            # เก็บตัวอย่างใน task แยก (ตัวจัดการคำสั่งคืนทันที ไม่บล็อก update อื่น)
+            self.application.create_task(self._run_profile_sample(update, duration), update=update)
+        else:
+            await update.message.reply_text(usage)
+    
+    async def _run_profile_sample(self, update: Update, duration: int):
+        """เก็บตัวอย่าง stack ของ event loop แล้วส่งรายงานกลับไปยังแชทที่สั่ง"""
+        try:
+            report = await self.profiler.sample(duration)
+        except RuntimeError as e:
+            report = str(e)
+        logger.info(f"ผลการเก็บตัวอย่าง stack:\n{report}")
+        await update.message.reply_text(report)
+    
     def format_mqtt_response(self, device_id: str, command: str, data: Dict, success: bool) -> str:
         """สร้างข้อความตอบกลับไปยัง Telegram จากข้อมูล MQTT
         
@@ -881,148 +2041,4 @@ class TelegramBot:
         Returns:
             str: ข้อความสำหรับส่งกลับไปยัง Telegram
         """
-        telegram_response = f"การตอบกลับจากอุปกรณ์ {device_id}\n"
-        
-        # ตรวจสอบสถานะความสำเร็จ
-        if success:
-            telegram_response += "สถานะ: สำเร็จ\n"
-        else:
-            telegram_response += "สถานะ: ไม่สำเร็จ\n"
-            if "message" in data:
-                telegram_response += f"ข้อความ: {data['message']}\n"
-        
-        # เพิ่มข้อมูลตามประเภทคำสั่ง
-        if command == "status" and "data" in data:
-            device_data = data["data"]
-            if "temperature" in device_data:
-                telegram_response += f"อุณหภูมิ: {device_data['temperature']:.2f} °C\n"
-            
-            if "humidity" in device_data:
-                telegram_response += f"ความชื้น: {device_data['humidity']} %\n"
-            
-            if "relay" in device_data:
-                relay_status = "เปิด" if device_data["relay"] else "ปิด"
-                telegram_response += f"สถานะ Relay: {relay_status}\n"
-            
-            if "mode" in device_data:
-                telegram_response += f"โหมด: {device_data['mode']}\n"
-            
-            if "name" in device_data:
-                telegram_response += f"ชื่ออุปกรณ์: {device_data['name']}\n"
-                
-            if "option" in device_data:
-                option = device_data["option"]
-                option_text = "Unknown"
-                if option == 0:
-                    option_text = "Humidity only"
-                elif option == 1:
-                    option_text = "Temperature only"
-                elif option == 2:
-                    option_text = "Temperature & Humidity"
-                elif option == 3:
-                    option_text = "Soil Moisture mode"
-                elif option == 4:
-                    option_text = "Additional mode"
-                
-                telegram_response += f"ตัวเลือก: {option_text}\n"
-                
-        elif (command == "settemp" or command == "sethum") and "data" in data:
-            device_data = data["data"]
-            if "low" in device_data and "high" in device_data:
-                low = device_data["low"]
-                high = device_data["high"]
-                
-                if command == "settemp":
-                    telegram_response += "ตั้งค่าอุณหภูมิ:\n"
-                    telegram_response += f"ต่ำสุด: {low} °C\n"
-                    telegram_response += f"สูงสุด: {high} °C\n"
-                else:
-                    telegram_response += "ตั้งค่าความชื้น:\n"
-                    telegram_response += f"ต่ำสุด: {low} %\n"
-                    telegram_response += f"สูงสุด: {high} %\n"
-                    
-        elif command == "setmode" and "data" in data:
-            device_data = data["data"]
-            if "mode" in device_data:
-                telegram_response += f"ตั้งค่าโหมด: {device_data['mode']}\n"
-                
-        elif command == "setoption" and "data" in data:
-            device_data = data["data"]
-            if "option" in device_data:
-                telegram_response += f"ตั้งค่าตัวเลือก: {device_data['option']}\n"
-                
-        elif command == "relay" and "data" in data:
-            device_data = data["data"]
-            if "relay" in device_data:
-                relay_status = "เปิด" if device_data["relay"] else "ปิด"
-                telegram_response += f"ตั้งค่า Relay: {relay_status}\n"
-                
-        elif command == "setname" and "data" in data:
-            device_data = data["data"]
-            if "name" in device_data:
-                telegram_response += f"ตั้งชื่ออุปกรณ์: {device_data['name']}\n"
-                
-        elif command == "setchannel" and "data" in data:
-            device_data = data["data"]
-            if "channel_id" in device_data:
-                telegram_response += f"ตั้งค่า ThingSpeak Channel ID: {device_data['channel_id']}\n"
-                
-        elif command == "setwritekey" or command == "setreadkey":
-            key_type = "Write API Key" if command == "setwritekey" else "Read API Key"
-            telegram_response += f"ตั้งค่า {key_type} สำเร็จ\n"
-    
-        elif command == "info" and "data" in data:
-            device_data = data["data"]
-            telegram_response += "ข้อมูลอุปกรณ์:\n"
-            
-            if "name" in device_data:
-                telegram_response += f"ชื่อ: {device_data['name']}\n"
-            
-            if "device_id" in device_data:
-                telegram_response += f"Device ID: {device_data['device_id']}\n"
-            
-            if "temp_low" in device_data and "temp_high" in device_data:
-                telegram_response += f"อุณหภูมิ: {device_data['temp_low']}-{device_data['temp_high']} °C\n"
-            
-            if "humidity_low" in device_data and "humidity_high" in device_data:
-                telegram_response += f"ความชื้น: {device_data['humidity_low']}-{device_data['humidity_high']} %\n"
-            
-            if "mode" in device_data:
-                telegram_response += f"โหมด: {device_data['mode']}\n"
-            
-            if "option" in device_data:
-                option = device_data["option"]
-                option_text = "Unknown"
-                if option == 0:
-                    option_text = "Humidity only"
-                elif option == 1:
-                    option_text = "Temperature only"
-                elif option == 2:
-                    option_text = "Temperature & Humidity"
-                elif option == 3:
-                    option_text = "Soil Moisture mode"
-                elif option == 4:
-                    option_text = "Additional mode"
-                
-                telegram_response += f"ตัวเลือก: {option_text}\n"
-            
-            if "cool" in device_data:
-                cool_mode = device_data["cool"]
-                cool_text = "COOL mode: Relay ON เมื่อ Temp >= High" if cool_mode else "HEAT mode: Relay ON เมื่อ Temp <= Low"
-                telegram_response += f"โหมดทำความเย็น: {cool_text}\n"
-            
-            if "moisture" in device_data:
-                moisture_mode = device_data["moisture"]
-                moisture_text = "Moisture mode: Relay ON เมื่อ Humidity <= Low" if moisture_mode else "Dehumidifier mode: Relay ON เมื่อ Humidity >= High"
-                telegram_response += f"โหมดความชื้น: {moisture_text}\n"
-            
-            if "thingspeak_channel" in device_data:
-                telegram_response += f"ThingSpeak Channel: {device_data['thingspeak_channel']}\n"
-            
-            # แสดง write_api_key แบบปกปิดบางส่วน
-            if "write_api_key" in device_data:
-                api_key = device_data["write_api_key"]
-                masked_key = api_key[:4] + "****" if len(api_key) > 4 else api_key
-                telegram_response += f"ThingSpeak Write API Key: {masked_key}\n"
-
-        return telegram_response
\ No newline at end of file
+        return self.renderer.render(device_id, command, data, success)
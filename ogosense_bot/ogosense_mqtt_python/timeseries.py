@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""Time-series module สำหรับเก็บค่าที่อ่านได้จากอุปกรณ์ (อุณหภูมิ, ความชื้น, relay) แบบประหยัดหน่วยความจำ
+
+ค่าของแต่ละอุปกรณ์ถูกเก็บเป็นคอลัมน์ตัวเลขความกว้างคงที่ (array) ใน segment แบบ append-only
+- ค่าดิบ: เวลาเป็น offset 2 ไบต์จากเวลาเริ่มของ segment, อุณหภูมิ/ความชื้นเป็นจำนวนเต็ม 2 ไบต์
+  (คูณ 100 และ 10) และ relay 1 ไบต์ รวม 7 ไบต์ต่อค่า
+- rollup รายนาที รายชั่วโมง และรายวัน: min/max/sum/count/last ต่อช่วงเวลา ถูกอัปเดตทันทีที่ได้รับค่า
+  การสรุปผลย้อนหลังจึงอ่านเพียงไม่กี่ช่วงจาก rollup ที่เหมาะสม ไม่ขึ้นกับระยะเวลาที่เก็บข้อมูล
+
+ข้อมูลเก่ากว่าระยะเวลาที่เก็บถูกลบทีละ segment เมื่อเริ่ม segment ใหม่
+"""
+
+import re
+import time
+import logging
+from array import array
+from collections import deque
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Metric(NamedTuple):
+    """ค่าที่เก็บจากคำตอบของอุปกรณ์"""
+    name: str         # ชื่อฟิลด์ใน "data" ของคำตอบ
+    typecode: str     # ชนิดของ array ที่เก็บค่า
+    scale: int        # ตัวคูณก่อนเก็บเป็นจำนวนเต็ม
+
+
+METRICS: Tuple[Metric, ...] = (
+    Metric("temperature", "h", 100),
+    Metric("humidity", "h", 10),
+    Metric("relay", "b", 1),
+)
+
+# ค่าที่หมายถึงไม่มีข้อมูล (ค่าต่ำสุดของแต่ละชนิด)
+MISSING = {"h": -(1 << 15), "b": -(1 << 7)}
+LIMITS = {"h": (-(1 << 15) + 1, (1 << 15) - 1), "b": (-(1 << 7) + 1, (1 << 7) - 1)}
+
+METRIC_NAMES = tuple(metric.name for metric in METRICS)
+
+# คำสั่งที่คำตอบมีค่าที่อ่านได้จากอุปกรณ์
+RECORDED_COMMANDS = ("status", "relay")
+
+# offset ของเวลาใน segment เก็บเป็น unsigned 16 บิต
+MAX_OFFSET = (1 << 16) - 1
+
+# จำนวนช่วงเวลาสูงสุดที่อ่านต่อการสรุปผลหนึ่งครั้ง (เลือกความละเอียดให้ไม่เกินนี้)
+MAX_QUERY_BUCKETS = 120
+
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+WINDOW_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([smhdw]?)$")
+
+
+def parse_window(text: str) -> Optional[float]:
+    """แปลงช่วงเวลาแบบ 30m, 6h, 7d, 2w (ไม่มีหน่วยคือชั่วโมง) เป็นวินาที
+
+    Returns:
+        Optional[float]: จำนวนวินาที หรือ None ถ้ารูปแบบไม่ถูกต้อง
+    """
+    match = WINDOW_PATTERN.match(text.strip().lower())
+    if not match:
+        return None
+    seconds = float(match.group(1)) * WINDOW_UNITS[match.group(2) or "h"]
+    return seconds if seconds > 0 else None
+
+
+def format_window(seconds: float) -> str:
+    """แปลงจำนวนวินาทีเป็นข้อความสั้นๆ เช่น 6h, 7d"""
+    for unit in ("w", "d", "h", "m"):
+        size = WINDOW_UNITS[unit]
+        if seconds >= size and seconds % size == 0:
+            return f"{int(seconds // size)}{unit}"
+    return f"{int(seconds)}s"
+
+
+class Segment:
+    """กลุ่มข้อมูลแบบ append-only: เวลาเป็น offset (หน่วยละ step วินาที) จาก base และคอลัมน์ตัวเลข"""
+
+    __slots__ = ("base", "step", "offsets", "columns")
+
+    def __init__(self, base: int, step: int, typecodes: Sequence[str]):
+        self.base = base
+        self.step = step
+        self.offsets = array("H")
+        self.columns = tuple(array(typecode) for typecode in typecodes)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def time_at(self, index: int) -> int:
+        return self.base + self.offsets[index] * self.step
+
+    def last_time(self) -> int:
+        return self.base + self.offsets[-1] * self.step
+
+    def nbytes(self) -> int:
+        return sum(len(column) * column.itemsize for column in self.columns) + len(self.offsets) * 2
+
+
+class SegmentedSeries:
+    """ลำดับของ segment ตามเวลา ข้อมูลเก่าถูกลบทีละ segment"""
+
+    def __init__(self, step: int, typecodes: Sequence[str], retention: float, segment_size: int):
+        """
+        Args:
+            step: หน่วยของเวลา (วินาที) เช่น 1 สำหรับค่าดิบ หรือความละเอียดของ rollup
+            typecodes: ชนิดของแต่ละคอลัมน์
+            retention: ระยะเวลาที่เก็บข้อมูล (วินาที)
+            segment_size: จำนวนรายการสูงสุดต่อ segment
+        """
+        self.step = step
+        self.typecodes = tuple(typecodes)
+        self.retention = retention
+        self.segment_size = segment_size
+        self.segments: Deque[Segment] = deque()
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def last(self) -> Optional[Segment]:
+        return self.segments[-1] if self.segments else None
+
+    def append(self, timestamp: int, values: Sequence[int]):
+        """เพิ่มรายการใหม่ท้าย series (timestamp ต้องไม่น้อยกว่ารายการสุดท้าย)"""
+        segment = self.segments[-1] if self.segments else None
+        if segment is not None:
+            offset = (timestamp - segment.base) // self.step
+        if segment is None or len(segment) >= self.segment_size or offset > MAX_OFFSET:
+            segment = Segment(timestamp, self.step, self.typecodes)
+            self.segments.append(segment)
+            offset = 0
+            self._trim(timestamp - self.retention)
+
+        segment.offsets.append(offset)
+        for column, value in zip(segment.columns, values):
+            column.append(value)
+
+    def _trim(self, cutoff: float):
+        """ลบ segment ที่ข้อมูลทั้งหมดเก่ากว่า cutoff"""
+        segments = self.segments
+        while len(segments) > 1 and segments[0].last_time() < cutoff:
+            segments.popleft()
+
+    def nbytes(self) -> int:
+        return sum(segment.nbytes() for segment in self.segments)
+
+
+class MetricSummary(NamedTuple):
+    """ผลสรุปของค่าหนึ่งค่าในช่วงเวลา"""
+    minimum: float
+    maximum: float
+    average: float
+    last: float
+    count: int
+
+
+class HistorySummary(NamedTuple):
+    """ผลสรุปของอุปกรณ์ในช่วงเวลา"""
+    device_id: str
+    window: float
+    resolution: int
+    first_time: int
+    last_time: int
+    metrics: Dict[str, MetricSummary]
+
+
+class SeriesPoints(NamedTuple):
+    """ค่าหนึ่งค่าของอุปกรณ์ในช่วงเวลา แยกตามช่วงของ rollup (เรียงจากเก่าไปใหม่)"""
+    device_id: str
+    metric: str
+    window: float
+    resolution: int
+    times: List[int]
+    minimums: List[float]
+    averages: List[float]
+    maximums: List[float]
+
+
+class DeviceSeries:
+    """ค่าดิบและ rollup ของอุปกรณ์หนึ่งตัว"""
+
+    __slots__ = ("raw", "rollups", "version")
+
+    def __init__(self, raw: SegmentedSeries, rollups: List[SegmentedSeries]):
+        self.raw = raw
+        self.rollups = rollups
+        # เพิ่มขึ้นทุกครั้งที่ได้รับค่าใหม่ (ใช้เป็น key ของแคชที่สร้างจากข้อมูลนี้)
+        self.version = 0
+
+
+def _rollup_typecodes() -> List[str]:
+    """คอลัมน์ของ rollup: ต่อหนึ่งค่าคือ min, max, sum, count, last"""
+    typecodes = []
+    for metric in METRICS:
+        typecodes.extend((metric.typecode, metric.typecode, "i", "I", metric.typecode))
+    return typecodes
+
+
+class TelemetryStore:
+    """ที่เก็บค่าที่อ่านได้จากอุปกรณ์ทุกตัว พร้อม rollup สำหรับสรุปผลย้อนหลัง
+
+    ทำงานบน event loop เท่านั้น (ไม่ thread-safe)
+    """
+
+    # ความละเอียดของ rollup (วินาที)
+    RESOLUTIONS = (60, 3600, 86400)
+
+    def __init__(self, raw_retention: float = 86400.0, retention: float = 35 * 86400.0,
+                 segment_size: int = 256):
+        """
+        Args:
+            raw_retention: ระยะเวลาที่เก็บค่าดิบและ rollup รายนาที (วินาที)
+            retention: ระยะเวลาที่เก็บ rollup รายชั่วโมงและรายวัน (วินาที)
+            segment_size: จำนวนรายการสูงสุดต่อ segment (ข้อมูลเก่าถูกลบทีละ segment)
+        """
+        self.raw_retention = raw_retention
+        self.retention = max(retention, raw_retention)
+        self.segment_size = segment_size
+        self._raw_typecodes = tuple(metric.typecode for metric in METRICS)
+        self._rollup_typecodes = tuple(_rollup_typecodes())
+        self._rollup_retention = tuple(
+            raw_retention if resolution < 3600 else self.retention for resolution in self.RESOLUTIONS
+        )
+        self._devices: Dict[str, DeviceSeries] = {}
+        self.samples = 0
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def _series(self, device_id: str) -> DeviceSeries:
+        series = self._devices.get(device_id)
+        if series is None:
+            raw = SegmentedSeries(1, self._raw_typecodes, self.raw_retention, self.segment_size)
+            rollups = [
+                SegmentedSeries(resolution, self._rollup_typecodes, retention, self.segment_size)
+                for resolution, retention in zip(self.RESOLUTIONS, self._rollup_retention)
+            ]
+            series = self._devices[device_id] = DeviceSeries(raw, rollups)
+        return series
+
+    def record(self, device_id: str, command: str, data: Dict, timestamp: float = None) -> bool:
+        """บันทึกค่าที่อ่านได้จากคำตอบ MQTT ของอุปกรณ์
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            command: ชื่อคำสั่งที่ตอบกลับ
+            data: ข้อมูล JSON ทั้งหมดของคำตอบ
+            timestamp: เวลาของค่า (ค่าเริ่มต้นคือเวลาปัจจุบัน)
+
+        Returns:
+            bool: True ถ้ามีค่าถูกบันทึก
+        """
+        if command not in RECORDED_COMMANDS or not data.get("success", False):
+            return False
+        device_data = data.get("data")
+        if not isinstance(device_data, dict):
+            return False
+        return self.add_sample(device_id, device_data, timestamp)
+
+    def add_sample(self, device_id: str, values: Dict, timestamp: float = None) -> bool:
+        """บันทึกค่าหนึ่งชุดของอุปกรณ์
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            values: ชื่อค่า -> ค่า (ค่าที่ไม่มีหรือไม่ใช่ตัวเลขจะถูกข้าม)
+            timestamp: เวลาของค่า (ค่าเริ่มต้นคือเวลาปัจจุบัน)
+
+        Returns:
+            bool: True ถ้ามีค่าถูกบันทึก
+        """
+        encoded = []
+        present = False
+        for metric in METRICS:
+            value = self._encode(metric, values.get(metric.name))
+            if value is None:
+                encoded.append(MISSING[metric.typecode])
+            else:
+                encoded.append(value)
+                present = True
+        if not present:
+            return False
+
+        series = self._series(device_id)
+        now = int(timestamp if timestamp is not None else time.time())
+        last = series.raw.last()
+        if last is not None and now < last.last_time():
+            # เวลาย้อนกลับ (เช่น นาฬิกาถูกปรับ): นับเป็นเวลาเดียวกับค่าล่าสุด
+            now = last.last_time()
+
+        series.raw.append(now, encoded)
+        for rollup in series.rollups:
+            self._update_rollup(rollup, now, encoded)
+        series.version += 1
+        self.samples += 1
+        return True
+
+    @staticmethod
+    def _encode(metric: Metric, value) -> Optional[int]:
+        """แปลงค่าเป็นจำนวนเต็มตาม scale (None ถ้าไม่มีค่าหรืออยู่นอกช่วงที่เก็บได้)"""
+        if value is None or isinstance(value, str):
+            return None
+        try:
+            encoded = int(round(float(value) * metric.scale))
+        except (TypeError, ValueError, OverflowError):
+            return None
+        low, high = LIMITS[metric.typecode]
+        if encoded < low or encoded > high:
+            return None
+        return encoded
+
+    def _update_rollup(self, rollup: SegmentedSeries, timestamp: int, encoded: Sequence[int]):
+        """รวมค่าเข้าช่วงเวลาของ rollup (อัปเดตช่วงล่าสุด หรือเพิ่มช่วงใหม่)"""
+        bucket = timestamp - timestamp % rollup.step
+        segment = rollup.last()
+        if segment is None or segment.last_time() < bucket:
+            row = []
+            for metric, value in zip(METRICS, encoded):
+                if value == MISSING[metric.typecode]:
+                    row.extend((value, value, 0, 0, value))
+                else:
+                    row.extend((value, value, value, 1, value))
+            rollup.append(bucket, row)
+            return
+
+        # ช่วงเวลาล่าสุด: อัปเดตแทนที่
+        columns = segment.columns
+        for index, (metric, value) in enumerate(zip(METRICS, encoded)):
+            if value == MISSING[metric.typecode]:
+                continue
+            low, high, total, count, last = columns[index * 5:index * 5 + 5]
+            if count[-1] == 0:
+                low[-1] = value
+                high[-1] = value
+            else:
+                if value < low[-1]:
+                    low[-1] = value
+                if value > high[-1]:
+                    high[-1] = value
+            total[-1] += value
+            count[-1] += 1
+            last[-1] = value
+
+    def summary(self, device_id: str, window: float, now: float = None) -> Optional[HistorySummary]:
+        """สรุป min/max/avg/last ของแต่ละค่าในช่วงเวลาย้อนหลังจาก rollup
+
+        ใช้ความละเอียดที่ละเอียดที่สุดที่ทำให้จำนวนช่วงไม่เกิน MAX_QUERY_BUCKETS
+        ขอบเขตของช่วงเวลาถูกปัดตามความละเอียดนั้น
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            window: ช่วงเวลาย้อนหลัง (วินาที)
+            now: เวลาปัจจุบัน (ค่าเริ่มต้นคือ time.time())
+
+        Returns:
+            Optional[HistorySummary]: ผลสรุป หรือ None ถ้าไม่มีข้อมูลในช่วงเวลานั้น
+        """
+        series = self._devices.get(device_id)
+        if series is None:
+            return None
+
+        level = self._level(window)
+        rollup = series.rollups[level]
+        resolution = self.RESOLUTIONS[level]
+
+        now = time.time() if now is None else now
+        lows: List[Optional[int]] = [None] * len(METRICS)
+        highs: List[Optional[int]] = [None] * len(METRICS)
+        totals = [0] * len(METRICS)
+        counts = [0] * len(METRICS)
+        lasts: List[Optional[int]] = [None] * len(METRICS)
+        first_time = last_time = None
+
+        for bucket, columns, row in self._buckets(rollup, now - window, now):
+            if last_time is None:
+                last_time = bucket
+            first_time = bucket
+            for index in range(len(METRICS)):
+                base = index * 5
+                count = columns[base + 3][row]
+                if not count:
+                    continue
+                low = columns[base][row]
+                high = columns[base + 1][row]
+                if lows[index] is None or low < lows[index]:
+                    lows[index] = low
+                if highs[index] is None or high > highs[index]:
+                    highs[index] = high
+                totals[index] += columns[base + 2][row]
+                counts[index] += count
+                if lasts[index] is None:
+                    lasts[index] = columns[base + 4][row]
+
+        metrics: Dict[str, MetricSummary] = {}
+        for index, metric in enumerate(METRICS):
+            count = counts[index]
+            if count:
+                scale = metric.scale
+                metrics[metric.name] = MetricSummary(
+                    lows[index] / scale, highs[index] / scale, totals[index] / count / scale,
+                    lasts[index] / scale, count
+                )
+        if not metrics:
+            return None
+        return HistorySummary(device_id, window, resolution, first_time, last_time + resolution, metrics)
+
+    def points(self, device_id: str, metric: str, window: float, now: float = None) -> Optional[SeriesPoints]:
+        """ดึง min/avg/max ของค่าหนึ่งค่าแยกตามช่วงของ rollup (เช่น สำหรับวาดกราฟ)
+
+        ใช้ความละเอียดเดียวกับ summary() จึงได้ไม่เกิน MAX_QUERY_BUCKETS จุด
+
+        Args:
+            device_id: Device ID ของอุปกรณ์
+            metric: ชื่อค่า (ใน METRIC_NAMES)
+            window: ช่วงเวลาย้อนหลัง (วินาที)
+            now: เวลาปัจจุบัน (ค่าเริ่มต้นคือ time.time())
+
+        Returns:
+            Optional[SeriesPoints]: จุดข้อมูล หรือ None ถ้าไม่มีข้อมูลในช่วงเวลานั้น
+        """
+        series = self._devices.get(device_id)
+        if series is None or metric not in METRIC_NAMES:
+            return None
+
+        level = self._level(window)
+        rollup = series.rollups[level]
+        index = METRIC_NAMES.index(metric)
+        base = index * 5
+        scale = METRICS[index].scale
+        now = time.time() if now is None else now
+
+        times: List[int] = []
+        minimums: List[float] = []
+        averages: List[float] = []
+        maximums: List[float] = []
+        for bucket, columns, row in self._buckets(rollup, now - window, now):
+            count = columns[base + 3][row]
+            if not count:
+                continue
+            times.append(bucket)
+            minimums.append(columns[base][row] / scale)
+            averages.append(columns[base + 2][row] / count / scale)
+            maximums.append(columns[base + 1][row] / scale)
+        if not times:
+            return None
+
+        for values in (times, minimums, averages, maximums):
+            values.reverse()
+        return SeriesPoints(device_id, metric, window, self.RESOLUTIONS[level], times, minimums, averages, maximums)
+
+    def version(self, device_id: str) -> int:
+        """หมายเลขเวอร์ชันของข้อมูลอุปกรณ์ (เปลี่ยนเมื่อได้รับค่าใหม่เท่านั้น)"""
+        series = self._devices.get(device_id)
+        return series.version if series is not None else 0
+
+    def _level(self, window: float) -> int:
+        """เลือก rollup ที่ละเอียดที่สุดที่ครอบคลุม window ได้ในไม่เกิน MAX_QUERY_BUCKETS ช่วง"""
+        for index, resolution in enumerate(self.RESOLUTIONS):
+            if window <= resolution * MAX_QUERY_BUCKETS and window <= self._rollup_retention[index]:
+                return index
+        return len(self.RESOLUTIONS) - 1
+
+    @staticmethod
+    def _buckets(rollup: SegmentedSeries, start: float, now: float) -> Iterator[Tuple[int, tuple, int]]:
+        """ไล่ช่วงของ rollup ที่ทับกับ [start, now] จากใหม่ไปเก่า (เวลาเริ่มของช่วง, คอลัมน์, แถว)"""
+        step = rollup.step
+        for segment in reversed(rollup.segments):
+            columns = segment.columns
+            for row in range(len(segment) - 1, -1, -1):
+                bucket = segment.time_at(row)
+                if bucket + step <= start:
+                    return
+                if bucket <= now:
+                    yield bucket, columns, row
+
+    def stats(self) -> Dict[str, int]:
+        """ดึงสถิติของที่เก็บข้อมูล"""
+        raw_samples = sum(len(series.raw) for series in self._devices.values())
+        raw_bytes = sum(series.raw.nbytes() for series in self._devices.values())
+        rollup_bytes = sum(
+            rollup.nbytes() for series in self._devices.values() for rollup in series.rollups
+        )
+        return {
+            "devices": len(self._devices),
+            "samples": self.samples,
+            "raw_samples": raw_samples,
+            "raw_bytes": raw_bytes,
+            "rollup_bytes": rollup_bytes,
+        }
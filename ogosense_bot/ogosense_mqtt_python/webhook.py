@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Webhook module สำหรับรับ update จาก Telegram ผ่าน HTTP แทนการ polling
+
+Telegram ส่ง update แต่ละรายการมาที่ URL ที่ลงทะเบียนด้วย setWebhook ทันทีที่มีข้อความ
+พร้อม header X-Telegram-Bot-Api-Secret-Token เพื่อยืนยันว่ามาจาก Telegram จริง
+update ถูกส่งเข้า update_queue ของ Application จึงใช้ handler ชุดเดียวกับโหมด polling
+"""
+
+import hmac
+import secrets
+import logging
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import HTTPServer, HTTPRequest, HTTPResponse
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class TelegramWebhook:
+    """HTTP endpoint สำหรับรับ update ของ Telegram"""
+
+    def __init__(self, url: str, host: str = "0.0.0.0", port: int = 8443, path: str = "/telegram",
+                 secret_token: Optional[str] = None, max_connections: int = 40):
+        """
+        Args:
+            url: URL สาธารณะที่ Telegram เรียก (เช่น https://bot.example.com/telegram ผ่าน reverse proxy)
+            host: address ที่ HTTP server รับการเชื่อมต่อ
+            port: port ที่ HTTP server รับการเชื่อมต่อ
+            path: path ของ endpoint บน HTTP server
+            secret_token: ค่าที่ Telegram ต้องส่งมาใน header (สุ่มใหม่ถ้าไม่ระบุ ใช้ได้เฉพาะเมื่อมี process เดียว
+                เพราะ Telegram จำเฉพาะ secret ที่ลงทะเบียนล่าสุด)
+            max_connections: จำนวนการเชื่อมต่อพร้อมกันสูงสุดที่ Telegram ใช้ส่ง update (1-100)
+        """
+        self.url = url
+        self.path = path
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.max_connections = max(1, min(100, max_connections))
+        self.server = HTTPServer(host, port)
+        self.server.route(path, self._handle_update, methods=("POST",))
+        self.application: Optional[Application] = None
+        self.running = False
+
+        # สถิติ
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self, application: Application, drop_pending_updates: bool = True):
+        """เริ่ม HTTP server แล้วลงทะเบียน webhook กับ Telegram
+
+        Args:
+            application: Application ที่เริ่มทำงานแล้ว (รับ update ผ่าน update_queue)
+            drop_pending_updates: ทิ้ง update ที่ค้างอยู่ที่ Telegram
+        """
+        self.application = application
+        await self.server.start()
+        self.running = True
+        await application.bot.set_webhook(
+            url=self.url,
+            secret_token=self.secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=drop_pending_updates,
+            max_connections=self.max_connections,
+        )
+        logger.info(f"ลงทะเบียน webhook {self.url} (รับที่ {self.server.host}:{self.server.port}{self.path})")
+
+    async def stop(self):
+        """หยุด HTTP server
+
+        ไม่ลบ webhook ที่ Telegram เพื่อให้ Telegram เก็บ update ไว้ส่งใหม่เมื่อกลับมาทำงาน
+        """
+        if not self.running:
+            return
+        self.running = False
+        await self.server.stop()
+        logger.info("หยุดรับ update ผ่าน webhook")
+
+    async def _handle_update(self, request: HTTPRequest) -> HTTPResponse:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            self.rejected += 1
+            logger.warning("ได้รับ webhook ที่ secret token ไม่ถูกต้อง")
+            return HTTPResponse.error(403)
+
+        application = self.application
+        if application is None or not application.running:
+            # ให้ Telegram ส่งใหม่ภายหลัง
+            return HTTPResponse.error(503)
+
+        try:
+            update = Update.de_json(request.json(), application.bot)
+        except Exception as e:
+            logger.error(f"ไม่สามารถแปลง update จาก webhook ได้: {e}")
+            return HTTPResponse.error(400)
+
+        self.received += 1
+        # ตอบ Telegram ทันที การประมวลผลทำโดย Application (จำนวนพร้อมกันตาม concurrent_updates)
+        await application.update_queue.put(update)
+        return HTTPResponse(200)